@@ -125,6 +125,9 @@ import logging
 import os
 import re
 import sys
+import threading
+import time
+from collections import defaultdict, deque
 
 from py.path import local
 from riggerlib import Rigger, RiggerBasePlugin, RiggerClient
@@ -132,6 +135,9 @@ from riggerlib import Rigger, RiggerBasePlugin, RiggerClient
 from cfme.utils.net import random_port
 from cfme.utils.path import log_path
 
+# not a cfme sublogger, the cfme log records are shipped through the ArtifactorClient itself
+client_logger = logging.getLogger(__name__)
+
 
 class Artifactor(Rigger):
     """A sub from Rigger"""
@@ -176,7 +182,107 @@ class Artifactor(Rigger):
 
 
 class ArtifactorClient(RiggerClient):
-    pass
+    """A RiggerClient which can also fire hooks without waiting for them
+
+    Hooks fired with :py:meth:`fire_hook_async` are queued and a background thread sends them to
+    the server one by one, in the order they were fired. The server runs the hooks in the order it
+    receives them, so the hooks of a test still run in order while the test run goes on.
+    :py:meth:`barrier` waits until all the queued hooks are sent, :py:meth:`fire_hook` calls it
+    before firing, so a synchronous hook never overtakes the queued ones.
+
+    The ``log_messages`` batches of :py:class:`cfme.utils.log.ArtifactorHandler` are not let to
+    pile up while a hook holds the queue: at most :py:attr:`log_batches` of them wait in it, the
+    oldest one is dropped to make room for a new one and its records are reported as dropped with
+    the new batch. The dropped batches and records are counted in :py:attr:`stats`.
+    """
+
+    #: Maximum number of ``log_messages`` batches waiting in the queue
+    log_batches = 20
+
+    def __init__(self, *args, **kwargs):
+        super(ArtifactorClient, self).__init__(*args, **kwargs)
+        self.stats = defaultdict(int)
+        # [hook_name, kwargs] items, the name of a dropped one is set to None
+        self._queue = deque()
+        # the items of the log batches still in the queue, oldest first
+        self._log_items = deque()
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._thread = None
+
+    def fire_hook_async(self, hook_name, **kwargs):
+        """Queues the hook and returns right away, ``wait_for_task`` only holds the queue"""
+        item = [hook_name, kwargs]
+        with self._cond:
+            if hook_name == 'log_messages':
+                self._drop_log_batches(kwargs)
+                self._log_items.append(item)
+            self._queue.append(item)
+            self._pending += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='artifactor-hooks')
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _drop_log_batches(self, kwargs):
+        # called with the condition held
+        while len(self._log_items) >= self.log_batches:
+            item = self._log_items.popleft()
+            _, dropped_kwargs = item
+            item[0] = None
+            records = len(dropped_kwargs.get('log_records', ()))
+            kwargs['dropped'] = kwargs.get('dropped', 0) + dropped_kwargs.get('dropped', 0)
+            kwargs['dropped'] += records
+            self.stats['dropped_batches'] += 1
+            self.stats['dropped_records'] += records
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                hook_name, kwargs = self._queue.popleft()
+                if hook_name == 'log_messages':
+                    self._log_items.popleft()
+                elif hook_name is None:
+                    self._pending -= 1
+                    self._cond.notify_all()
+                    continue
+            try:
+                super(ArtifactorClient, self).fire_hook(hook_name, **kwargs)
+                self.stats['fired'] += 1
+            except Exception:
+                # the server went away, the test run must go on
+                self.stats['failed'] += 1
+                client_logger.exception('Failed to fire the artifactor hook %s', hook_name)
+            finally:
+                with self._cond:
+                    self._pending -= 1
+                    self._cond.notify_all()
+
+    def barrier(self, timeout=None):
+        """Waits until all the queued hooks are sent
+
+        Returns:
+            ``True`` if they were, ``False`` if the timeout ran out first
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def fire_hook(self, hook_name, **kwargs):
+        self.barrier()
+        return super(ArtifactorClient, self).fire_hook(hook_name, **kwargs)
+
+    def terminate(self):
+        self.barrier()
+        return super(ArtifactorClient, self).terminate()
 
 
 class ArtifactorBasePlugin(RiggerBasePlugin):
@@ -11,10 +11,11 @@ artifactor:
             plugin: logger
             level: DEBUG
 """
+import logging
 import os
 from logging import makeLogRecord
 from artifactor import ArtifactorBasePlugin
-from cfme.utils.log import make_file_handler
+from cfme.utils.log import LOG_RECORD_FIELDS, make_file_handler
 
 
 class Logger(ArtifactorBasePlugin):
@@ -29,6 +30,7 @@ class Logger(ArtifactorBasePlugin):
         self.register_plugin_hook('start_test', self.start_test)
         self.register_plugin_hook('finish_test', self.finish_test)
         self.register_plugin_hook('log_message', self.log_message)
+        self.register_plugin_hook('log_messages', self.log_messages)
 
     def configure(self):
         self.configured = True
@@ -77,3 +79,17 @@ class Logger(ArtifactorBasePlugin):
             handler = self.store[slaveid].handler
             if handler and record.levelno >= handler.level:
                 handler.handle(record)
+
+    @ArtifactorBasePlugin.check_configured
+    def log_messages(self, log_records, slaveid, dropped=0):
+        # batches from the ArtifactorHandler, the messages are already formatted
+        if dropped:
+            self.log_message(
+                dict(name='cfme', levelno=logging.WARNING, levelname='WARNING', args=(),
+                     msg='{} log records dropped, the log shipping could not keep up'.format(
+                         dropped)),
+                slaveid)
+        for values in log_records:
+            log_record = dict(zip(LOG_RECORD_FIELDS, values))
+            log_record['args'] = ()
+            self.log_message(log_record, slaveid)
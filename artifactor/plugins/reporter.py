@@ -11,6 +11,11 @@ artifactor:
             enabled: True
             plugin: reporter
             only_failed: False #Only show faled tests in the report
+            run_history: /path/to/run_history.sqlite #Optional, previous results source
+            render_interval: 30 #Seconds between the renders of the report during the session
+
+While the session runs, the report is kept up to date by an :py:class:`IncrementalReport`, which
+only rebuilds the rows of the tests that changed, and renders at most once per render interval.
 """
 import csv
 import datetime
@@ -18,6 +23,7 @@ import difflib
 import math
 import shutil
 import time
+from collections import OrderedDict
 from copy import deepcopy
 
 import os
@@ -29,6 +35,7 @@ from artifactor import ArtifactorBasePlugin
 from cfme.utils import process_pytest_path
 from cfme.utils.conf import cfme_data  # Only for the provider specific reports
 from cfme.utils.path import template_path
+from cfme.utils.run_history import RunHistory
 import six
 
 _tests_tpl = {
@@ -48,6 +55,14 @@ _tests_tpl = {
 # Does not cover all the cases, but rather only those we can
 URL = re.compile(r"https?://[^/\s]+(?:/[^/\s?]+)*/?(?:\?(?:[^&\s=]+(?:=[^&\s]+)?&?)*)?")
 
+STATUS_COLORS = {
+    'passed': 'success',
+    'failed': 'warning',
+    'error': 'danger',
+    'xpassed': 'danger',
+    'xfailed': 'success',
+    'skipped': 'info'}
+
 
 def overall_test_status(statuses):
     # Handle some logic for when to count certain tests as which state
@@ -65,15 +80,40 @@ def overall_test_status(statuses):
     return "passed"
 
 
-class ReporterBase(object):
-    def _run_report(self, old_artifacts, artifact_dir, version=None, fw_version=None):
-        template_data = self.process_data(old_artifacts, artifact_dir, version, fw_version)
+def skipped_type(test):
+    """The type of the skip of a test (``provider``, ``blocker``, ...), or None"""
+    if 'skipped' in test:
+        return test['skipped'].get('type')
+    return None
 
-        if hasattr(self, 'only_failed') and self.only_failed:
-            template_data['tests'] = [x for x in template_data['tests']
-                                  if x['outcomes']['overall'] not in ['passed']]
 
-        self.render_report(template_data, 'report', artifact_dir, 'test_report.html')
+def _signature(test):
+    # cheap summary of everything in the artifacts of a test that the report shows
+    return (
+        tuple(sorted(test.get('statuses', {}).items())),
+        len(test.get('files', ())),
+        test.get('start_time'),
+        test.get('finish_time'),
+        test.get('slaveid'),
+        repr(test.get('skipped')),
+        'composite' in test,
+        test.get('old', False))
+
+
+class ReporterBase(object):
+    _previous_results = None
+
+    def previous_results(self):
+        """Latest results of previous runs from the run history, keyed by test ident"""
+        if self._previous_results is None:
+            try:
+                history = RunHistory(getattr(self, 'run_history', None))
+                self._previous_results = history.latest_results(
+                    key='ident', before_run=history.last_run())
+                history.close()
+            except Exception:
+                self._previous_results = {}
+        return self._previous_results
 
     def _run_provider_report(self, old_artifacts, artifact_dir, version=None, fw_version=None):
         for mgmt in cfme_data['management_systems'].keys():
@@ -83,11 +123,16 @@ class ReporterBase(object):
             self.render_report(template_data, "report_{}".format(mgmt), artifact_dir,
                 'test_report_provider.html')
 
+    @property
+    def template_env(self):
+        if getattr(self, '_template_env', None) is None:
+            self._template_env = Environment(
+                loader=FileSystemLoader(template_path.strpath)
+            )
+        return self._template_env
+
     def render_report(self, report, filename, log_dir, template):
-        template_env = Environment(
-            loader=FileSystemLoader(template_path.strpath)
-        )
-        data = template_env.get_template(template).render(**report)
+        data = self.template_env.get_template(template).render(**report)
 
         with open(os.path.join(log_dir, '{}.html'.format(filename)), "w") as f:
             f.write(data)
@@ -104,111 +149,26 @@ class ReporterBase(object):
         template_data['version'] = version
         template_data['fw_version'] = fw_version
         log_dir = local(log_dir).strpath + "/"
-        counts = {
-            'passed': 0,
-            'failed': 0,
-            'skipped': 0,
-            'error': 0,
-            'xfailed': 0,
-            'xpassed': 0}
-        current_counts = {
-            'passed': 0,
-            'failed': 0,
-            'skipped': 0,
-            'error': 0,
-            'xfailed': 0,
-            'xpassed': 0}
-        colors = {
-            'passed': 'success',
-            'failed': 'warning',
-            'error': 'danger',
-            'xpassed': 'danger',
-            'xfailed': 'success',
-            'skipped': 'info'}
+        counts = dict.fromkeys(STATUS_COLORS, 0)
+        current_counts = dict.fromkeys(STATUS_COLORS, 0)
+        previous_results = self.previous_results()
         # Iterate through the tests and process the counts and durations
         for test_name, test in artifacts.items():
             if not test.get('statuses'):
                 continue
-            overall_status = overall_test_status(test['statuses'])
+            test_data = self.test_data(test_name, test, log_dir, previous_results)
+            overall_status = test_data['outcomes']['overall']
             counts[overall_status] += 1
             if not test.get('old', False):
                 current_counts[overall_status] += 1
-            color = colors[overall_status]
-            # This was removed previously but is needed as the overall is not generated
-            # until the test finishes. So this is here as a shim.
-            test['statuses']['overall'] = overall_status
-            test_data = {'name': test_name, 'outcomes': test['statuses'],
-                         'slaveid': test.get('slaveid', "Unknown"), 'color': color}
-            if 'composite' in test:
-                test_data['composite'] = test['composite']
-
-            if 'skipped' in test:
-                if test['skipped'].get('type') == 'provider':
-                    provider_skip_count += 1
-                    test_data['skip_provider'] = test['skipped'].get('reason')
-                if test['skipped'].get('type') == 'blocker':
-                    blocker_skip_count += 1
-                    test_data['skip_blocker'] = test['skipped'].get('reason')
-
-            if 'skip_blocker' in test_data:
-                # Fix the inconveniently long list of repeated blockers until we sort out sets
-                # in riggerlib somehow.
-                test_data['skip_blocker'] = sorted(set(test_data['skip_blocker']))
-
-            if test.get('old', False):
-                test_data['old'] = True
-
-            if test.get('start_time'):
-                if test.get('finish_time'):
-                    test_data['in_progress'] = False
-                    test_data['duration'] = test['finish_time'] - test['start_time']
-                else:
-                    test_data['duration'] = time.time() - test['start_time']
-                    test_data['in_progress'] = True
-
-            # Set up destinations for the files
-            test_data["file_groups"] = []
-            test_data['qa_contact'] = []
-            processed_groups = {}
-            order = 0
-            for file_dict in test.get('files', []):
-                group = file_dict["group_id"]
-                if group not in processed_groups:
-                    processed_groups[group] = (order, [])
-                    order += 1
-                processed_groups[group][-1].append(file_dict)
-            # Current structure:
-            # {groupid: (group_order, [{filedict1}, {filedict2}])}
-            # Sorting by group_order
-            processed_groups = sorted(processed_groups.items(), key=lambda kv: kv[1][0])
-            # And now make it [(groupid, [{filedict1}, {filedict2}, ...])]
-            processed_groups = [(group_name, files) for group_name, (_, files) in processed_groups]
-            for group_name, file_dicts in processed_groups:
-                group_file_list = []
-                for file_dict in file_dicts:
-                    if file_dict["file_type"] == "qa_contact":
-                        with open(file_dict["os_filename"], 'rb') as qafile:
-                            qareader = csv.reader(qafile, delimiter=',', quotechar='"')
-                            for qacontact in qareader:
-                                test_data['qa_contact'].append(qacontact)
-                                if qacontact[0] not in template_data['qa']:
-                                    template_data['qa'].append(qacontact[0])
-                        continue  # Do not store, handled a different way :)
-                    elif file_dict["file_type"] == "short_tb":
-                        with open(file_dict["os_filename"], 'r') as short_tb:
-                            test_data["short_tb"] = short_tb.read()
-                        continue
-                    file_dict["filename"] = file_dict["os_filename"].replace(log_dir, "")
-                    group_file_list.append(file_dict)
-
-                test_data["file_groups"].append((group_name, group_file_list))
-            # Snd remove groups that are left empty because of eg. traceback or qa contact
-            test_data["file_groups"] = filter(
-                lambda group: len(group[1]) > 0, test_data["file_groups"])
-            if "short_tb" in test_data and test_data["short_tb"]:
-                urls = [url for url in URL.findall(test_data["short_tb"])]
-                if urls:
-                    test_data["urls"] = urls
+            skip_type = skipped_type(test)
+            if skip_type == 'provider':
+                provider_skip_count += 1
+            elif skip_type == 'blocker':
+                blocker_skip_count += 1
+            for qacontact in test_data['qa_contact']:
+                if qacontact[0] not in template_data['qa']:
+                    template_data['qa'].append(qacontact[0])
             template_data['tests'].append(test_data)
         template_data['top10'] = self.top10(tb_errors)
         template_data['counts'] = counts
@@ -237,6 +197,93 @@ class ReporterBase(object):
 
         return template_data
 
+    def test_data(self, test_name, test, log_dir, previous_results):
+        """Builds the row of a test in the report from its artifacts
+
+        Args:
+            test_name: ident of the test
+            test: artifacts of the test
+            log_dir: artifact dir, ending with a slash, the file links are relative to it
+            previous_results: as returned by :py:meth:`previous_results`
+        """
+        overall_status = overall_test_status(test['statuses'])
+        # This was removed previously but is needed as the overall is not generated
+        # until the test finishes. So this is here as a shim.
+        test['statuses']['overall'] = overall_status
+        test_data = {'name': test_name, 'outcomes': test['statuses'],
+                     'slaveid': test.get('slaveid', "Unknown"),
+                     'color': STATUS_COLORS[overall_status]}
+        if 'composite' in test:
+            test_data['composite'] = test['composite']
+
+        skip_type = skipped_type(test)
+        if skip_type == 'provider':
+            test_data['skip_provider'] = test['skipped'].get('reason')
+        elif skip_type == 'blocker':
+            # Fix the inconveniently long list of repeated blockers until we sort out sets
+            # in riggerlib somehow.
+            test_data['skip_blocker'] = sorted(set(test['skipped'].get('reason')))
+
+        if test.get('old', False):
+            test_data['old'] = True
+
+        previous = previous_results.get(test_name)
+        if previous is not None:
+            test_data['previous_outcome'] = previous.outcome
+            test_data['previous_duration'] = str(datetime.timedelta(
+                seconds=math.ceil(previous.duration)))
+
+        if test.get('start_time'):
+            if test.get('finish_time'):
+                test_data['in_progress'] = False
+                test_data['duration'] = test['finish_time'] - test['start_time']
+            else:
+                test_data['duration'] = time.time() - test['start_time']
+                test_data['in_progress'] = True
+
+        # Set up destinations for the files
+        test_data["file_groups"] = []
+        test_data['qa_contact'] = []
+        processed_groups = {}
+        order = 0
+        for file_dict in test.get('files', []):
+            group = file_dict["group_id"]
+            if group not in processed_groups:
+                processed_groups[group] = (order, [])
+                order += 1
+            processed_groups[group][-1].append(file_dict)
+        # Current structure:
+        # {groupid: (group_order, [{filedict1}, {filedict2}])}
+        # Sorting by group_order
+        processed_groups = sorted(processed_groups.items(), key=lambda kv: kv[1][0])
+        # And now make it [(groupid, [{filedict1}, {filedict2}, ...])]
+        processed_groups = [(group_name, files) for group_name, (_, files) in processed_groups]
+        for group_name, file_dicts in processed_groups:
+            group_file_list = []
+            for file_dict in file_dicts:
+                if file_dict["file_type"] == "qa_contact":
+                    with open(file_dict["os_filename"], 'rb') as qafile:
+                        qareader = csv.reader(qafile, delimiter=',', quotechar='"')
+                        for qacontact in qareader:
+                            test_data['qa_contact'].append(qacontact)
+                    continue  # Do not store, handled a different way :)
+                elif file_dict["file_type"] == "short_tb":
+                    with open(file_dict["os_filename"], 'r') as short_tb:
+                        test_data["short_tb"] = short_tb.read()
+                    continue
+                file_dict["filename"] = file_dict["os_filename"].replace(log_dir, "")
+                group_file_list.append(file_dict)
+
+            test_data["file_groups"].append((group_name, group_file_list))
+        # Snd remove groups that are left empty because of eg. traceback or qa contact
+        test_data["file_groups"] = [
+            group for group in test_data["file_groups"] if len(group[1]) > 0]
+        if "short_tb" in test_data and test_data["short_tb"]:
+            urls = [url for url in URL.findall(test_data["short_tb"])]
+            if urls:
+                test_data["urls"] = urls
+        return test_data
+
     def top10(self, tb_errors):
         sets = []
         for entry in tb_errors:
@@ -249,7 +296,7 @@ class ReporterBase(object):
             else:
                 sets.append([entry])
 
-        return sorted(sets, lambda p, q: cmp(len(p), len(q)), reverse=True)[:10]
+        return sorted(sets, key=len, reverse=True)[:10]
 
     def build_dict(self, path, container, contents):
         """
@@ -338,12 +385,151 @@ class ReporterBase(object):
         return list_string
 
 
+class IncrementalReport(object):
+    """The test report, kept up to date between renders
+
+    Rebuilding the report from all the artifacts reads the files of every test and renders all
+    of them again, which is too slow to do after every test phase of a long session. This keeps
+    the rows of the tests, the counts and the panels of each test module, and only rebuilds the
+    rows whose artifacts changed since the last render, and the panels of their modules. The
+    panels of each module are also written into ``report_fragments`` in the artifact dir, when
+    they change.
+
+    Args:
+        reporter: the :py:class:`ReporterBase` building the rows and rendering the report
+        render_interval: :py:meth:`due` returns False for this many seconds after a render
+    """
+    def __init__(self, reporter, render_interval=30):
+        self.reporter = reporter
+        self.render_interval = render_interval
+        self.last_render = None
+        self.rows = {}
+        self.signatures = {}
+        # ident -> (overall status, old, skip type), what the test added to the counts
+        self.tallies = {}
+        # module -> idents of its tests, in the order they showed up
+        self.modules = OrderedDict()
+        self.fragments = {}
+        self.counts = dict.fromkeys(STATUS_COLORS, 0)
+        self.current_counts = dict.fromkeys(STATUS_COLORS, 0)
+        self.skip_counts = {'provider': 0, 'blocker': 0}
+        self.qa = []
+
+    def due(self):
+        """Whether the render interval passed since the last render"""
+        return (self.last_render is None or
+                time.time() - self.last_render >= self.render_interval)
+
+    def _tally(self, tally, sign):
+        overall_status, old, skip_type = tally
+        self.counts[overall_status] += sign
+        if not old:
+            self.current_counts[overall_status] += sign
+        if skip_type in self.skip_counts:
+            self.skip_counts[skip_type] += sign
+
+    def update(self, artifacts, log_dir, rebuild=False):
+        """Rebuilds the rows of the tests whose artifacts changed
+
+        Tests in progress are always rebuilt, their duration changes.
+
+        Returns:
+            set of the modules of the changed tests
+        """
+        log_dir = local(log_dir).strpath + "/"
+        previous_results = self.reporter.previous_results()
+        changed = set()
+        for ident, test in artifacts.items():
+            if not test.get('statuses'):
+                continue
+            row = self.rows.get(ident)
+            if (row is not None and not rebuild and not row.get('in_progress') and
+                    self.signatures[ident] == _signature(test)):
+                continue
+            row = self.reporter.test_data(ident, test, log_dir, previous_results)
+            self.rows[ident] = row
+            self.signatures[ident] = _signature(test)
+            if ident in self.tallies:
+                self._tally(self.tallies[ident], -1)
+            tally = (row['outcomes']['overall'], test.get('old', False), skipped_type(test))
+            self._tally(tally, 1)
+            for qacontact in row['qa_contact']:
+                if qacontact[0] not in self.qa:
+                    self.qa.append(qacontact[0])
+            module = test.get('test_module') or '/'.join(process_pytest_path(ident)[:-1])
+            if ident not in self.tallies:
+                self.modules.setdefault(module, []).append(ident)
+            self.tallies[ident] = tally
+            changed.add(module)
+        return changed
+
+    def _shown(self, row):
+        if getattr(self.reporter, 'only_failed', False):
+            return row['outcomes']['overall'] not in ['passed']
+        return True
+
+    def _render_fragment(self, module, artifact_dir):
+        test_panel = self.reporter.template_env.get_template('test_report_panel.html').module
+        panels = []
+        for ident in self.modules[module]:
+            row = self.rows[ident]
+            if not self._shown(row):
+                continue
+            if row.get('duration'):
+                row = dict(row, duration=str(datetime.timedelta(
+                    seconds=math.ceil(row['duration']))))
+            panels.append(six.text_type(test_panel.test_panel(row)))
+        fragment = u''.join(panels)
+        if fragment != self.fragments.get(module):
+            self.fragments[module] = fragment
+            fragment_dir = os.path.join(artifact_dir, 'report_fragments')
+            if not os.path.isdir(fragment_dir):
+                os.makedirs(fragment_dir)
+            fragment_file = os.path.join(
+                fragment_dir, '{}.html'.format(re.sub(r'[^\w.-]', '_', module)))
+            with open(fragment_file, 'w') as f:
+                f.write(fragment.encode('utf-8') if six.PY2 else fragment)
+
+    def render(self, artifacts, artifact_dir, version=None, fw_version=None, rebuild=False):
+        """Brings the rows up to date and renders the report
+
+        Args:
+            rebuild: rebuild all the rows, not only those that changed
+        """
+        for module in self.update(artifacts, artifact_dir, rebuild=rebuild):
+            self._render_fragment(module, artifact_dir)
+
+        rows = [self.rows[ident] for idents in self.modules.values() for ident in idents]
+        # Create the tree dict that is used for js tree
+        tests = deepcopy(_tests_tpl)
+        tests['_sub']['tests'] = deepcopy(_tests_tpl)
+        for row in rows:
+            self.reporter.build_dict(row['name'].replace('cfme/', ''), tests, row)
+        template_data = {
+            'version': version,
+            'fw_version': fw_version,
+            'qa': self.qa,
+            'top10': self.reporter.top10([]),
+            'counts': self.counts,
+            'current_counts': self.current_counts,
+            'blocker_skip_count': self.skip_counts['blocker'],
+            'provider_skip_count': self.skip_counts['provider'],
+            'ndata': self.reporter.build_li(tests),
+            # the skip tables are the only other use of the rows in the template
+            'tests': [row for row in rows
+                      if self._shown(row) and ('skip_blocker' in row or 'skip_provider' in row)],
+            'panels': u''.join(self.fragments[module] for module in self.modules),
+        }
+        self.reporter.render_report(template_data, 'report', artifact_dir, 'test_report.html')
+        self.last_render = time.time()
+
+
 class Reporter(ArtifactorBasePlugin, ReporterBase):
     def plugin_initialize(self):
         self.register_plugin_hook('report_test', self.report_test)
         self.register_plugin_hook('finish_session', self.run_report)
         self.register_plugin_hook('finish_session', self.run_provider_report)
-        self.register_plugin_hook('build_report', self.run_report)
+        self.register_plugin_hook('build_report', self.build_report)
         self.register_plugin_hook('start_test', self.start_test)
         self.register_plugin_hook('skip_test', self.skip_test)
         self.register_plugin_hook('finish_test', self.finish_test)
@@ -353,6 +539,8 @@ class Reporter(ArtifactorBasePlugin, ReporterBase):
 
     def configure(self):
         self.only_failed = self.data.get('only_failed', False)
+        self.run_history = self.data.get('run_history')
+        self.report = IncrementalReport(self, self.data.get('render_interval', 30))
         self.configured = True
 
     @ArtifactorBasePlugin.check_configured
@@ -415,9 +603,15 @@ class Reporter(ArtifactorBasePlugin, ReporterBase):
                 {'file_line': file_line, 'exception': exception, 'short_tb': short_tb}
         }}}
 
+    @ArtifactorBasePlugin.check_configured
+    def build_report(self, old_artifacts, artifact_dir, version=None, fw_version=None):
+        if self.report.due():
+            self.report.render(old_artifacts, artifact_dir, version, fw_version)
+
     @ArtifactorBasePlugin.check_configured
     def run_report(self, old_artifacts, artifact_dir, version=None, fw_version=None):
-        self._run_report(old_artifacts, artifact_dir, version, fw_version)
+        # the final report, every row is rebuilt once more in case anything was missed
+        self.report.render(old_artifacts, artifact_dir, version, fw_version, rebuild=True)
 
     @ArtifactorBasePlugin.check_configured
     def run_provider_report(self, old_artifacts, artifact_dir, version=None, fw_version=None):
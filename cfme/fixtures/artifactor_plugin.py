@@ -22,8 +22,10 @@ already been used, it will die
 """
 import atexit
 import subprocess
+import time
 from threading import RLock
 
+import attr
 import diaper
 import os
 import pytest
@@ -64,6 +66,12 @@ class DummyClient(object):
     def fire_hook(self, *args, **kwargs):
         return
 
+    def fire_hook_async(self, *args, **kwargs):
+        return
+
+    def barrier(self, timeout=None):
+        return True
+
     def terminate(self):
         return
 
@@ -105,6 +113,40 @@ session_ver = None
 session_build = None
 session_stream = None
 session_fw_version = None
+# the same for the whole session, read once for the ostriz_send hook of the first test
+session_jenkins_data = None
+session_browser_env = None
+
+
+@attr.s
+class HookLatency(object):
+    """Time the artifactor hooks add to the tests
+
+    Hooks are queued and sent in the background, so only the time to queue them and to flush the
+    log records counts, unless a hook grabs a result.
+    """
+    current = attr.ib(default=0.0)
+    tests = attr.ib(default=attr.Factory(dict))
+
+    def add(self, seconds):
+        self.current += seconds
+
+    def finish_test(self, nodeid):
+        self.tests[nodeid], self.current = self.current, 0.0
+        return self.tests[nodeid]
+
+    def summary(self):
+        if not self.tests:
+            return None
+        total = sum(self.tests.values())
+        slowest = max(self.tests, key=self.tests.get)
+        return (
+            'artifactor hooks added {:.2f}s to {} tests, {:.3f}s per test on average, '
+            'at most {:.3f}s to {}'.format(
+                total, len(self.tests), total / len(self.tests), self.tests[slowest], slowest))
+
+
+hook_latency = HookLatency()
 
 
 def pytest_addoption(parser):
@@ -150,12 +192,39 @@ def fire_art_hook(config, hook, **hook_args):
     if client is None:
         assert UNDER_TEST, 'missing artifactor is only valid for inprocess tests'
     else:
-        client.fire_hook(hook, **hook_args)
+        from cfme.utils.log import artifactor_handler
+        starttime = time.time()
+        try:
+            # log records queued before the hook belong to it, e.g. to the test being finished
+            with artifactor_handler.flushed():
+                if hook_args.get('grab_result'):
+                    # waits for the queued hooks first, the result may depend on them
+                    return client.fire_hook(hook, **hook_args)
+                client.fire_hook_async(hook, **hook_args)
+        finally:
+            hook_latency.add(time.time() - starttime)
+
+
+def wait_for_art_hooks(config, timeout=None):
+    """Waits until the artifactor got all the hooks fired so far
+
+    Hooks are sent in the background, use this before relying on what the artifactor plugins
+    did, e.g. before reading the artifacts of a test.
+
+    Returns:
+        ``False`` if the timeout ran out first, ``True`` otherwise
+    """
+    client = getattr(config, '_art_client', None)
+    if client is None:
+        return True
+    from cfme.utils.log import artifactor_handler
+    artifactor_handler.flush()
+    return client.barrier(timeout)
 
 
 def fire_art_test_hook(node, hook, **hook_args):
     name, location = get_test_idents(node)
-    fire_art_hook(
+    return fire_art_hook(
         node.config, hook,
         test_name=name,
         test_location=location,
@@ -225,37 +294,52 @@ def pytest_runtest_protocol(item):
         slaveid=store.slaveid, ip=ip,
         tier=tier, requirement=requirement, param_dict=param_dict, issues=blockers)
     yield
+    latency = hook_latency.finish_test(item.nodeid)
+    logger.debug('artifactor hooks added %.3fs to %s', latency, item.nodeid)
+
+
+def get_browser_env(app):
+    """The browser of the session, read once it is up"""
+    global session_browser_env
+    if session_browser_env is None:
+        try:
+            caps = app.browser.widgetastic.selenium.capabilities
+            session_browser_env = {
+                'browserName': caps['browserName'],
+                'browserPlatform': caps['platform'],
+                'browserVersion': caps['version']
+            }
+        except Exception as e:
+            # no browser yet, tried again with the next test
+            logger.error("Couldn't grab browser env_vars")
+            logger.error(e)
+    return session_browser_env
+
+
+def get_jenkins_data():
+    global session_jenkins_data
+    if session_jenkins_data is None:
+        session_jenkins_data = {
+            'build_url': os.environ.get('BUILD_URL'),
+            'build_number': os.environ.get('BUILD_NUMBER'),
+            'git_commit': os.environ.get('GIT_COMMIT'),
+            'job_name': os.environ.get('JOB_NAME')
+        }
+    return session_jenkins_data
 
 
 def pytest_runtest_teardown(item, nextitem):
     name, location = get_test_idents(item)
     app = find_appliance(item)
     ip = app.hostname
+    # the artifactor runs the hooks in order, the test run doesn't wait for them
     fire_art_test_hook(
         item, 'finish_test',
         slaveid=store.slaveid, ip=ip, wait_for_task=True)
     fire_art_test_hook(item, 'sanitize', words=words)
-    jenkins_data = {
-        'build_url': os.environ.get('BUILD_URL'),
-        'build_number': os.environ.get('BUILD_NUMBER'),
-        'git_commit': os.environ.get('GIT_COMMIT'),
-        'job_name': os.environ.get('JOB_NAME')
-    }
-    try:
-        caps = app.browser.widgetastic.selenium.capabilities
-        param_dict = {
-            'browserName': caps['browserName'],
-            'browserPlatform': caps['platform'],
-            'browserVersion': caps['version']
-        }
-    except Exception as e:
-        logger.error("Couldn't grab browser env_vars")
-        logger.error(e)
-        param_dict = None
-
     fire_art_test_hook(
-        item, 'ostriz_send', env_params=param_dict,
-        slaveid=store.slaveid, polarion_ids=extract_polarion_ids(item), jenkins=jenkins_data)
+        item, 'ostriz_send', env_params=get_browser_env(app),
+        slaveid=store.slaveid, polarion_ids=extract_polarion_ids(item), jenkins=get_jenkins_data())
 
 
 def pytest_runtest_logreport(report):
@@ -285,6 +369,12 @@ def pytest_runtest_logreport(report):
     fire_art_hook(config, 'build_report')
 
 
+def pytest_terminal_summary(terminalreporter):
+    summary = hook_latency.summary()
+    if summary is not None:
+        terminalreporter.write_line(summary)
+
+
 @pytest.mark.hookwrapper
 def pytest_unconfigure(config):
     yield
@@ -306,7 +396,10 @@ def shutdown(config):
                 fire_art_hook(config, 'teardown_merkyl',
                               ip=app.hostname)
                 if not store.slave_manager:
+                    wait_for_art_hooks(config)
                     config._art_client.terminate()
                     proc = config._art_proc
                     if proc:
                         proc.wait()
+    # the hooks of the slaves must reach the artifactor before they exit
+    wait_for_art_hooks(config)
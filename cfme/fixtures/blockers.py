@@ -14,6 +14,9 @@ import pytest
 
 from cfme.fixtures.pytest_store import store
 from cfme.utils.blockers import Blocker, BZ, GH
+from cfme.utils.disk_cache import DiskCache
+from cfme.utils.log import logger
+from cfme.utils.path import log_path
 
 
 @pytest.fixture(scope="function")
@@ -61,25 +64,50 @@ def pytest_addoption(parser):
                     default=False,
                     dest='list_blockers',
                     help='Specify to list the blockers (takes some time though).')
+    group.addoption('--blockers-cache-ttl',
+                    type=int,
+                    default=3600,
+                    dest='blockers_cache_ttl',
+                    help='Seconds the blocker data is cached on disk for, shared by the master and '
+                         'the slaves. 0 disables the cache.')
+    group.addoption('--no-blockers-prefetch',
+                    action='store_false',
+                    default=True,
+                    dest='blockers_prefetch',
+                    help='Do not load the data of all the collected blockers in bulk.')
+
+
+def pytest_configure(config):
+    ttl = config.getoption('blockers_cache_ttl')
+    if ttl > 0:
+        Blocker.cache = DiskCache(log_path.join('blockers_cache'), ttl=ttl)
+
+
+def _parse_blockers(items):
+    for item in items:
+        for blocker in getattr(item, '_metadata', {}).get("blockers", []):
+            if isinstance(blocker, int):
+                yield Blocker.parse("BZ#{}".format(blocker))
+            else:
+                yield Blocker.parse(blocker)
 
 
 @pytest.mark.trylast
 def pytest_collection_modifyitems(session, config, items):
+    if config.getoption('blockers_prefetch'):
+        # The master prefetches into the disk cache, the slaves then find it all there
+        try:
+            Blocker.prefetch_all(_parse_blockers(items))
+        except Exception:
+            # the blockers get looked up one by one when the tests need them
+            logger.exception('Could not prefetch the blockers')
     if not config.getvalue("list_blockers"):
         return
     store.terminalreporter.write("Loading blockers ...\n", bold=True)
     blocking = set([])
-    for item in items:
-        if "blockers" not in item._metadata:
-            continue
-        for blocker in item._metadata["blockers"]:
-            if isinstance(blocker, int):
-                # TODO: DRY
-                blocker_object = Blocker.parse("BZ#{}".format(blocker))
-            else:
-                blocker_object = Blocker.parse(blocker)
-            if blocker_object.blocks:
-                blocking.add(blocker_object)
+    for blocker_object in _parse_blockers(items):
+        if blocker_object.blocks:
+            blocking.add(blocker_object)
     if blocking:
         store.terminalreporter.write("Known blockers:\n", bold=True)
         for blocker in blocking:
@@ -7,11 +7,17 @@ The Workflow
 - py.test config.option.appliances and the related --appliance cmdline flag are used to count
   the number of needed slaves
 - Slaves are started
+- If the appliance holder has a feed of appliances (``--sprout-progressive``), the master polls it
+  in the background and starts a slave for every appliance as soon as it is ready, slaves whose
+  appliance died get their appliance replaced through the feed
 - Master runs collection, blocks until slaves report their collections
-- Slaves each run collection and submit them to the master, then block inside their runtest loop,
-  waiting for tests to run
+- Master shares what ``pytest_generate_tests`` did during its collection with the slaves, see
+  :py:mod:`cfme.fixtures.parallelizer.collection_cache`
+- Slaves each run collection, replaying the shared parametrization where they can, and submit
+  them to the master, then block inside their runtest loop, waiting for tests to run
 - Master diffs slave collections against its own; the test ids are verified to match
-  across all nodes
+  across all nodes. A slave which replayed the parametrization only reports a digest of its
+  test ids, if it doesn't match, the slave is respawned to collect on its own
 - Master enters main runtest loop, uses a generator to build lists of test groups which are then
   sent to slaves, one group at a time
 - For each phase of each test, the slave serializes test reports, which are then unserialized on
@@ -40,15 +46,17 @@ from itertools import count
 
 import attr
 
-from threading import Thread
+from threading import Event, Thread
 from time import sleep, time
 
 import pytest
-import zmq
 from _pytest import runner
 
 from cfme.fixtures import terminalreporter
-from cfme.fixtures.parallelizer import remote
+from cfme.fixtures.parallelizer import collection_cache, remote
+from cfme.fixtures.parallelizer.protocol import MasterChannel, PROTOCOLS
+from cfme.fixtures.parallelizer.scheduler import DEFAULT_CLEANUP_COST, DurationScheduler
+from cfme.fixtures.run_history import get_history
 from cfme.fixtures.pytest_store import store
 from cfme.utils import at_exit, conf
 from cfme.utils.log import create_sublogger
@@ -63,6 +71,28 @@ if not conf.runtime['env'].get('ts'):
     conf.runtime['env']['ts'] = ts
 
 
+def pytest_addoption(parser):
+    group = parser.getgroup('cfme')
+    group.addoption('--parallel-scheduler', dest='parallel_scheduler', default='modscope',
+                    choices=['modscope', 'duration'],
+                    help='How tests are distributed to slaves; "modscope" hands out groups in '
+                         'collection order, "duration" packs groups using the test durations '
+                         'recorded in previous runs (default: %(default)s)')
+    group.addoption('--parallel-protocol', dest='parallel_protocol', default='json',
+                    choices=PROTOCOLS,
+                    help='Master/slave protocol; "json" acknowledges every event, "batched" '
+                         'sends test reports in compact batches without acknowledgements '
+                         '(default: %(default)s)')
+    group.addoption('--parallel-cleanup-cost', dest='parallel_cleanup_cost', type=float,
+                    default=DEFAULT_CLEANUP_COST,
+                    help='Estimated seconds needed to re-home an appliance to another provider, '
+                         'used by the duration scheduler (default: %(default)s)')
+    group.addoption('--no-collection-cache', dest='collection_cache', action='store_false',
+                    default=True,
+                    help='Make every slave run its own pytest_generate_tests, instead of '
+                         'rebuilding the parametrization shared by the master')
+
+
 def pytest_addhooks(pluginmanager):
     from . import hooks
     pluginmanager.add_hookspecs(hooks)
@@ -75,15 +105,21 @@ def pytest_configure(config):
     holder = config.pluginmanager.get_plugin(APPLIANCE_PLUGIN)
 
     appliances = holder.appliances
+    feed = holder.feed
 
-    if len(appliances) > 1:
-        session = ParallelSession(config, appliances)
+    if len(appliances) > 1 or (feed is not None and feed.expected > len(appliances)):
+        session = ParallelSession(config, appliances, feed)
         config.pluginmanager.register(session, "parallel_session")
         store.parallelizer_role = 'master'
         reporter.write_line(
             'As a parallelizer master kicking off parallel session for these {} appliances'.format(
                 len(appliances)),
             green=True)
+        if feed is not None and not feed.exhausted:
+            reporter.write_line(
+                'More appliances join the session as they become ready, {} expected'.format(
+                    feed.expected),
+                green=True)
         config.hook.pytest_parallel_configured(parallel_session=session)
     else:
         reporter.write_line('No parallelization required', green=True)
@@ -94,6 +130,7 @@ def handle_end_session(signal, frame):
     # when signaled, end the current test session immediately
     if store.parallel_session:
         store.parallel_session.session_finished = True
+        store.parallel_session.channel.wakeup()
 
 
 signal.signal(signal.SIGQUIT, handle_end_session)
@@ -113,20 +150,24 @@ class SlaveDetail(object):
     process = attr.ib(default=None, repr=False)
 
     provider_allocation = attr.ib(default=attr.Factory(list), repr=False)
+    # set when the collection rebuilt from the master's didn't match
+    full_collection = attr.ib(default=False, init=False)
 
     def start(self):
         if self.forbid_restart:
             return
         devnull = open(os.devnull, 'w')
-        # worker output redirected to null; useful info comes via messages and logs
-        self.process = subprocess.Popen([
+        args = [
             'python', remote.__file__,
             '--worker', self.id,
             '--appliance', self.appliance.as_json,
             '--ts', conf.runtime['env']['ts'],
             '--config', json.dumps(self.worker_config)
-
-        ], stdout=devnull)
+        ]
+        if self.full_collection:
+            args.append('--full-collection')
+        # worker output redirected to null; useful info comes via messages and logs
+        self.process = subprocess.Popen(args, stdout=devnull)
         at_exit(self.process.kill)
 
     def poll(self):
@@ -135,12 +176,13 @@ class SlaveDetail(object):
 
 
 class ParallelSession(object):
-    def __init__(self, config, appliances):
+    def __init__(self, config, appliances, feed=None):
         self.config = config
         self.session = None
         self.session_finished = False
         self.countfailures = 0
         self.collection = []
+        self.collection_digest = None
         self.sent_tests = 0
         self.log = create_sublogger('master')
         self.maxfail = config.getvalue("maxfail")
@@ -155,18 +197,26 @@ class ParallelSession(object):
         self.provs = sorted(set(cfme_data['management_systems'].keys()),
                             key=len, reverse=True)
         self.used_prov = set()
+        self.scheduler = None
 
         self.failed_slave_test_groups = deque()
         self.slave_spawn_count = 0
         self.appliances = appliances
+        self.feed = feed
+        # appliances delivered by the feed thread, not used by a slave yet
+        self._new_appliances = deque()
+        self._feed_thread = None
+        self._feed_stop = None
+        self._awaiting_since = None
 
         # set up the ipc socket
 
         zmq_endpoint = 'ipc://{}'.format(
             config.cache.makedir('parallelize').join(str(os.getpid())))
-        ctx = zmq.Context.instance()
-        self.sock = ctx.socket(zmq.ROUTER)
-        self.sock.bind(zmq_endpoint)
+        self.channel = MasterChannel(zmq_endpoint, config.getoption('parallel_protocol'))
+        if self.channel.batched:
+            # the master blocks in recv, make sure dying slaves get audited right away
+            signal.signal(signal.SIGCHLD, lambda signum, frame: self.channel.wakeup())
 
         # clean out old slave config if it exists
 
@@ -180,18 +230,87 @@ class ParallelSession(object):
             'appliance_data': getattr(self, "slave_appliances_data", {})
         }
 
+        if config.getoption('collection_cache'):
+            self.collection_recorder = collection_cache.CollectionRecorder()
+            config.pluginmanager.register(self.collection_recorder, 'collection_recorder')
+        else:
+            self.collection_recorder = None
+
         for appliance in self.appliances:
-            slave_data = SlaveDetail(appliance=appliance, worker_config=self.worker_config)
-            self.slaves[slave_data.id] = slave_data
+            self.add_slave(appliance)
+
+    def add_slave(self, appliance):
+        """Adds a slave using the appliance, it is started by the runtest loop"""
+        slave = SlaveDetail(appliance=appliance, worker_config=self.worker_config)
+        self.slaves[slave.id] = slave
+        self.print_message("using appliance {}".format(appliance.url), slave, green=True)
+        return slave
 
-        for slave in sorted(self.slaves):
-            self.print_message("using appliance {}".format(self.slaves[slave].appliance.url),
-                slave, green=True)
+    def _start_feed(self):
+        if self.feed is None or self.feed.exhausted:
+            return
+        self._feed_stop = Event()
+        self._feed_thread = Thread(target=self._feed_t, args=(self._feed_stop,),
+                                   name='parallelizer-appliance-feed')
+        self._feed_thread.daemon = True
+        self._feed_thread.start()
+
+    def _stop_feed(self):
+        if self._feed_stop is not None:
+            self._feed_stop.set()
+
+    def _feed_t(self, stop_event):
+        # replacements make the feed expect more appliances, keep polling until the end
+        while not stop_event.wait(self.feed.interval):
+            if self.feed.exhausted:
+                continue
+            try:
+                appliances = self.feed.poll()
+            except Exception as e:
+                self.log.exception('Polling the appliance feed failed: {}'.format(e))
+                continue
+            if appliances:
+                self._new_appliances.extend(appliances)
+                # sent through a wakeup socket of this thread, see MasterChannel.wakeup
+                self.channel.wakeup()
+
+    def _tests_left(self):
+        return bool(self.failed_slave_test_groups) or self.sent_tests < len(self.collection)
+
+    def _add_fed_slaves(self):
+        while self._new_appliances:
+            self._awaiting_since = None
+            appliance = self._new_appliances.popleft()
+            if not self._tests_left():
+                self.print_message(
+                    'all tests were sent, not using appliance {}'.format(appliance.url))
+                continue
+            self.appliances.append(appliance)
+            slave = self.add_slave(appliance)
+            slave.start()
+
+    def _awaiting_appliances(self):
+        """Whether to wait for the feed to deliver appliances for the tests left, without slaves"""
+        if self.feed is None or self.feed.exhausted or not self._tests_left():
+            return False
+        if self._awaiting_since is None:
+            self._awaiting_since = time()
+            self.print_message('no slaves left, waiting for appliances', yellow=True)
+        return time() - self._awaiting_since < self.feed.timeout
+
+    def _replace_appliance(self, slave):
+        try:
+            self.feed.replace(slave.appliance)
+        except Exception as e:
+            self.log.exception('Replacing the appliance of {} failed'.format(slave.id))
+            self.print_message('could not replace the appliance: {}'.format(e), slave, red=True)
+        else:
+            self.print_message('replacing the appliance {}'.format(slave.appliance.url),
+                slave, purple=True)
 
     def _slave_audit(self):
-        # XXX: There is currently no mechanism to add or remove slave_urls, short of
-        #      firing up the debugger and doing it manually. This is making room for
-        #      planned future abilities to dynamically add and remove slaves via automation
+        # start slaves for the appliances the feed delivered
+        self._add_fed_slaves()
 
         # check for unexpected slave shutdowns and redistribute tests
         for slave in self.slaves.values():
@@ -216,9 +335,14 @@ class ParallelSession(object):
         for slave in list(self.slaves.values()):
             if slave.forbid_restart:
                 if slave.process is None:
+                    if self.feed is not None:
+                        # before the shutdown hook, it would destroy the appliance
+                        self._replace_appliance(slave)
                     self.config.hook.pytest_miq_node_shutdown(
                         config=self.config, nodeinfo=slave.appliance.url)
                     del self.slaves[slave.id]
+                    if self.scheduler is not None:
+                        self.scheduler.retire(slave.id)
                 else:
                     # no hook call here, a future audit will handle the fallout
                     self.print_message(
@@ -232,23 +356,16 @@ class ParallelSession(object):
     def send(self, slave, event_data):
         """Send data to slave.
 
-        ``event_data`` will be serialized as JSON, and so must be JSON serializable
+        ``event_data`` will be serialized as JSON (or msgpack), and so must be JSON serializable
 
         """
-        event_json = json.dumps(event_data)
-        if not isinstance(event_json, bytes):
-            event_json = event_json.encode('utf-8')
-        self.sock.send_multipart([slave.id, b'', event_json])
+        self.channel.send(slave.id, event_data)
 
     def recv(self):
-        # poll the zmq socket, populate the recv queue deque with responses
-
-        events = zmq.zmq_poll([(self.sock, zmq.POLLIN)], 50)
-        if not events:
+        # poll the zmq socket, batched events are unpacked and returned one at a time
+        slaveid, event_data, event_name = self.channel.recv()
+        if slaveid is None:
             return None, None, None
-        slaveid, _, event_json = self.sock.recv_multipart(flags=zmq.NOBLOCK)
-        event_data = json.loads(event_json)
-        event_name = event_data.pop('_event_name')
         if slaveid not in self.slaves:
             self.log.error("message from terminated worker %s %s %s",
                            slaveid, event_name, event_data)
@@ -277,8 +394,9 @@ class ParallelSession(object):
             '({})[{}] '.format(prefix, stamp), message, **markup)
 
     def ack(self, slave, event_name):
-        """Acknowledge a slave's message"""
-        self.send(slave, 'ack {}'.format(event_name))
+        """Acknowledge a slave's message, unless the protocol doesn't expect it"""
+        if self.channel.needs_ack(event_name):
+            self.send(slave, 'ack {}'.format(event_name))
 
     def monitor_shutdown(self, slave):
         # non-daemon so slaves get every opportunity to shut down cleanly
@@ -392,12 +510,16 @@ class ParallelSession(object):
         """
         # Build master collection for slave diffing and distribution
         self.collection = [item.nodeid for item in self.session.items]
+        self.collection_digest = collection_cache.collection_digest(self.collection)
+        if self.collection_recorder is not None:
+            self._share_collection()
 
         # Fire up the workers after master collection is complete
         # master and the first slave share an appliance, this is a workaround to prevent a slave
         # from altering an appliance while master collection is still taking place
         for slave in self.slaves.values():
             slave.start()
+        self._start_feed()
 
         try:
             self.print_message("Waiting for {} slave collections".format(len(self.slaves)),
@@ -410,7 +532,7 @@ class ParallelSession(object):
                 # spawn/kill/replace slaves if needed
                 self._slave_audit()
 
-                if not self.slaves:
+                if not self.slaves and not self._awaiting_appliances():
                     # All slaves are killed or errored, we're done with tests
                     self.print_message('all slaves have exited', yellow=True)
                     self.session_finished = True
@@ -425,6 +547,18 @@ class ParallelSession(object):
                     # messages are special, handle them immediately
                     self.print_message(message, slave, **markup)
                     self.ack(slave, event_name)
+                elif event_name == 'collectionfinish' and 'node_ids_digest' in event_data:
+                    # the slave rebuilt the collection from ours, it only needs to match
+                    if event_data['node_ids_digest'] == self.collection_digest:
+                        self.ack(slave, event_name)
+                    else:
+                        self.print_message(
+                            'rebuilt collection differs, respawning to collect in full',
+                            slave.id, purple=True)
+                        self.log.error('{} rebuilt collection differs'.format(slave.id))
+                        slave.full_collection = True
+                        # the audit sees the kill and respawns the slave
+                        slave.process.kill()
                 elif event_name == 'collectionfinish':
                     slave_collection = event_data['node_ids']
                     # compare slave collection to the master, all test ids must be the same
@@ -480,11 +614,20 @@ class ParallelSession(object):
             self.print_message(str(ex))
             raise
         finally:
+            self._stop_feed()
             terminalreporter.enable()
 
         # Suppress other runtestloop calls
         return True
 
+    def _share_collection(self):
+        # the slaves compute the key from the same args and options to find it
+        cache = collection_cache.cache_for(self.config)
+        key = collection_cache.collection_key(
+            self.worker_config['args'], self.worker_config['options'])
+        self.collection_recorder.store(cache, key, self.collection)
+        self.worker_config['collection_cache'] = str(cache.path)
+
     def _test_item_generator(self):
         for tests in self._modscope_item_generator():
             yield tests
@@ -523,14 +666,60 @@ class ParallelSession(object):
                 self.log.info('sent tests with param {} {!r}'.format(id, tests))
                 yield tests
 
-    def get(self, slave):
+    def provs_of_tests(self, test_group):
+        found = set()
+        for test in test_group:
+            found.update(pv for pv in self.provs
+                         if '[' in test and pv in test)
+        return sorted(found)
 
-        def provs_of_tests(test_group):
-            found = set()
-            for test in test_group:
-                found.update(pv for pv in self.provs
-                             if '[' in test and pv in test)
-            return sorted(found)
+    def _cleanse_appliance(self, slave):
+        self.print_message(
+            'cleansing appliance', slave, purple=True)
+        try:
+            slave.appliance.delete_all_providers()
+        except Exception as e:
+            self.print_message(
+                'cloud not cleanse', slave, red=True)
+            self.print_message('error: {}'.format(e), red=True)
+
+    def _get_scheduled(self, slave):
+        if self.scheduler is None:
+            def provider_of(tests):
+                provs = self.provs_of_tests(tests)
+                return provs[0] if provs else None
+
+            history = get_history(self.config)
+            if history is not None:
+                durations = history.durations(before_run=self.config.option.run_history_run)
+            else:
+                self.print_message('no run history recorded, assuming equal durations', red=True)
+                durations = {}
+            self.scheduler = DurationScheduler(
+                self.test_groups, sorted(self.slaves), durations, provider_of,
+                cleanup_cost=self.config.getoption('parallel_cleanup_cost'))
+            self.print_message('planned {} test groups on {} slaves'.format(
+                len(self.scheduler.groups), len(self.slaves)))
+            for slave_id in sorted(self.scheduler.queues):
+                self.log.info('{} planned backlog: {:.0f}s'.format(
+                    slave_id, self.scheduler.backlog(slave_id)))
+        stolen = self.scheduler.stats['stolen']
+        group = self.scheduler.next_group(slave.id, slave.provider_allocation)
+        if group is None:
+            return []
+        if self.scheduler.stats['stolen'] > stolen:
+            self.print_message('stole {} tests, estimated {:.0f}s'.format(
+                len(group.tests), group.duration), slave)
+        if group.provider and group.provider not in slave.provider_allocation:
+            if slave.provider_allocation:
+                self._cleanse_appliance(slave)
+            slave.provider_allocation = [group.provider]
+        return list(group.tests)
+
+    def get(self, slave):
+        if self.config.getoption('parallel_scheduler') == 'duration':
+            return self._get_scheduled(slave)
+        provs_of_tests = self.provs_of_tests
 
         if not self._pool:
             for test_group in self.test_groups:
@@ -572,15 +761,7 @@ class ParallelSession(object):
             if provs:
                 prov = provs[0]
                 # Already too many slaves with provider
-                app = slave.appliance
-                self.print_message(
-                    'cleansing appliance', slave, purple=True)
-                try:
-                    app.delete_all_providers()
-                except Exception as e:
-                    self.print_message(
-                        'cloud not cleanse', slave, red=True)
-                    self.print_message('error:', e, red=True)
+                self._cleanse_appliance(slave)
             slave.provider_allocation = [prov]
             self._pool.remove(test_group)
             return test_group
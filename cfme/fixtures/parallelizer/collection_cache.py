@@ -0,0 +1,224 @@
+"""Sharing the master collection with the slaves
+
+Collecting the tests is slow mostly because of ``pytest_generate_tests``: the provider
+parametrization filters every configured provider for every test function. The master collects
+anyway, so while it does, :py:class:`CollectionRecorder` records what the generation did to each
+test function:
+
+- the ``metafunc.parametrize`` calls, with their arguments
+- the fixture names added to ``metafunc.fixturenames``
+- the marks applied to the test function (``uncollect``, ``uses_testgen``, ...)
+
+The records are stored with the master node ids in a :py:class:`cfme.utils.disk_cache.DiskCache`
+under a key hashing the sources, the configuration yamls and the pytest args and options. A slave
+computing the same key loads them into a :py:class:`CollectionReplay`, which builds the test
+items by replaying the records instead of calling ``pytest_generate_tests``. Test functions whose
+records could not be stored (arguments that can't be pickled, ...) are generated as usual.
+
+The slave then only reports a digest of its node ids. If it doesn't match the master
+collection, the slave is respawned to collect everything on its own and the node ids are diffed
+as they always were.
+"""
+import hashlib
+import json
+import pickle
+from inspect import isclass, isfunction
+from io import BytesIO
+
+import pytest
+import six
+from _pytest import fixtures
+from _pytest.compat import is_generator
+from _pytest.mark import MarkDecorator, get_unpacked_marks
+from _pytest.python import Metafunc, transfer_markers
+
+from cfme.utils.disk_cache import DiskCache
+from cfme.utils.log import logger
+from cfme.utils.path import conf_path, project_path
+
+#: Bump when the format of the records changes
+FORMAT_VERSION = 1
+#: Seconds the stored collections stay valid for
+CACHE_TTL = 24 * 3600
+
+
+def collection_key(args, options):
+    """Hash of everything the collection of the slaves depends on
+
+    Args:
+        args: pytest args, as passed to the slaves
+        options: dict of the pytest options, as passed to the slaves
+    """
+    digest = hashlib.sha1()
+    digest.update(json.dumps([FORMAT_VERSION, args, options], sort_keys=True).encode('utf-8'))
+    sources = list(project_path.join('cfme').visit(fil='*.py', rec=lambda p: p.basename[0] != '.'))
+    if conf_path.check(dir=True):
+        sources.extend(conf_path.listdir(fil=lambda p: '.yaml' in p.basename))
+    for source in sorted(sources):
+        digest.update(source.relto(project_path).encode('utf-8'))
+        digest.update(source.read_binary())
+    return digest.hexdigest()
+
+
+def collection_digest(node_ids):
+    """Order independent digest of a collection, for the slaves to report instead of node ids"""
+    digest = hashlib.sha1()
+    for node_id in sorted(node_ids):
+        if isinstance(node_id, six.text_type):
+            node_id = node_id.encode('utf-8')
+        digest.update(node_id + b'\n')
+    return digest.hexdigest()
+
+
+def function_key(module, cls, function):
+    return '{}::{}::{}'.format(
+        module.__name__, cls.__name__ if cls is not None else '', function.__name__)
+
+
+class _Pickler(pickle.Pickler):
+    # providers are stored by their key, they are looked up again when loaded
+    provider_class = None
+
+    def persistent_id(self, obj):
+        if isinstance(obj, self.provider_class):
+            return obj.key
+        return None
+
+
+class _Unpickler(pickle.Unpickler):
+    def persistent_load(self, pid):
+        from cfme.utils.providers import get_crud
+        return get_crud(pid)
+
+
+def dumps(record):
+    from cfme.common.provider import BaseProvider
+    buf = BytesIO()
+    pickler = _Pickler(buf, 2)
+    pickler.provider_class = BaseProvider
+    pickler.dump(record)
+    return buf.getvalue()
+
+
+def loads(data):
+    return _Unpickler(BytesIO(data)).load()
+
+
+def cache_for(config):
+    return DiskCache(config.cache.makedir('parallelize_collection'), ttl=CACHE_TTL)
+
+
+class CollectionRecorder(object):
+    """Master plugin recording what ``pytest_generate_tests`` does to each test function"""
+    def __init__(self):
+        # function key -> pickled record, or None if it can't be replayed
+        self.functions = {}
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_generate_tests(self, metafunc):
+        key = function_key(metafunc.module, metafunc.cls, metafunc.function)
+        function = metafunc.function
+        fixturenames = list(metafunc.fixturenames)
+        marks = get_unpacked_marks(function)
+        calls = []
+        parametrize = metafunc.parametrize
+
+        def recording_parametrize(*args, **kwargs):
+            calls.append((args, kwargs))
+            return parametrize(*args, **kwargs)
+
+        metafunc.parametrize = recording_parametrize
+        try:
+            yield
+        finally:
+            metafunc.parametrize = parametrize
+        record = (
+            metafunc.fixturenames[len(fixturenames):],
+            get_unpacked_marks(function)[len(marks):],
+            calls)
+        try:
+            data = dumps(record)
+        except Exception as e:
+            logger.debug('Generated tests of %s will not be shared: %s', key, e)
+            data = None
+        if key in self.functions and self.functions[key] != data:
+            # the same function generated differently in two places, can't tell them apart
+            data = None
+        self.functions[key] = data
+
+    def store(self, cache, key, node_ids):
+        """Store the records and the master collection for the slaves computing the same key"""
+        cache.set(key, {'functions': self.functions, 'node_ids': list(node_ids)})
+        replayable = sum(1 for data in self.functions.values() if data is not None)
+        logger.info('Shared the collection of %d/%d test functions under %s',
+                    replayable, len(self.functions), key)
+
+
+class CollectionReplay(object):
+    """Slave plugin building the test items from the records of the master
+
+    Args:
+        functions: function key to pickled record, as recorded by :py:class:`CollectionRecorder`
+        node_ids: the master collection
+    """
+    def __init__(self, functions, node_ids):
+        self.functions = functions
+        self.node_ids = node_ids
+        self.stats = {'replayed': 0, 'generated': 0}
+
+    @classmethod
+    def load(cls, cache, key):
+        """Returns the replay of the collection stored under the key, or None if there is none"""
+        stored = cache.get(key)
+        if stored is None:
+            return None
+        return cls(stored['functions'], stored['node_ids'])
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_pycollect_makeitem(self, collector, name, obj):
+        if isclass(obj) or not collector.istestfunction(obj, name):
+            return None
+        obj = getattr(obj, '__func__', obj)
+        if not isfunction(obj) or is_generator(obj):
+            return None
+        module = collector.getparent(pytest.Module).obj
+        clscol = collector.getparent(pytest.Class)
+        cls = clscol and clscol.obj or None
+        data = self.functions.get(function_key(module, cls, obj))
+        if data is None:
+            self.stats['generated'] += 1
+            return None
+        try:
+            record = loads(data)
+        except Exception as e:
+            logger.warning('Could not replay the generated tests of %s: %s', name, e)
+            self.stats['generated'] += 1
+            return None
+        self.stats['replayed'] += 1
+        return list(self._genfunctions(collector, name, obj, module, cls, record))
+
+    def _genfunctions(self, collector, name, funcobj, module, cls, record):
+        # PyCollector._genfunctions, replaying the record instead of pytest_generate_tests
+        transfer_markers(funcobj, cls, module)
+        fm = collector.session._fixturemanager
+        fixtureinfo = fm.getfixtureinfo(collector, funcobj, cls)
+        metafunc = Metafunc(funcobj, fixtureinfo, collector.config, cls=cls, module=module)
+        fixturenames, marks, calls = record
+        metafunc.fixturenames.extend(fixturenames)
+        for mark in marks:
+            MarkDecorator(mark)(funcobj)
+        for args, kwargs in calls:
+            metafunc.parametrize(*args, **kwargs)
+
+        Function = collector._getcustomclass("Function")
+        if not metafunc._calls:
+            yield Function(name, parent=collector, fixtureinfo=fixtureinfo)
+        else:
+            fixtures.add_funcarg_pseudo_fixture_def(collector, metafunc, fm)
+            for callspec in metafunc._calls:
+                subname = "%s[%s]" % (name, callspec.id)
+                yield Function(name=subname, parent=collector,
+                               callspec=callspec, callobj=funcobj,
+                               fixtureinfo=fixtureinfo,
+                               keywords={callspec.id: True},
+                               originalname=name)
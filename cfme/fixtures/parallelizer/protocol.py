@@ -0,0 +1,230 @@
+"""Master/slave wire protocol for the parallelizer
+
+Two protocol modes are supported, selected with ``--parallel-protocol``:
+
+``json``
+    The original lockstep protocol. The slave uses a REQ socket, every event is a JSON document
+    and the master acknowledges every single one of them.
+
+``batched``
+    Idempotent events (``message``, ``runtest_logstart``, ``runtest_logreport``) are buffered on
+    the slave and sent as one ``_batch`` event, either when the buffer fills up or when the slave
+    flushes it at a test boundary. The master never acknowledges them. Events that need a reply
+    (``need_tests``, ``collectionfinish``, ...) flush the buffer first, so ordering is preserved.
+    Payloads are serialized with msgpack when it is available, and the master blocks in its poll
+    until a slave event arrives or it is explicitly woken up, instead of polling every 50ms.
+
+"""
+import json
+import threading
+from collections import deque
+
+import zmq
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+PROTOCOLS = ('json', 'batched')
+#: events the master does not acknowledge in batched mode
+BATCHED_EVENTS = frozenset(['message', 'runtest_logstart', 'runtest_logreport'])
+#: maximum number of events buffered on a slave before they are sent
+BATCH_SIZE = 64
+#: milliseconds the master waits for events per poll, per protocol
+#: the batched protocol gets woken up explicitly, the timeout there is only a safety net
+POLL_TIMEOUT = {'json': 50, 'batched': 5000}
+
+
+class JSONCodec(object):
+    name = 'json'
+
+    @staticmethod
+    def dumps(data):
+        data = json.dumps(data)
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        return data
+
+    @staticmethod
+    def loads(data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return json.loads(data)
+
+
+class MsgpackCodec(object):
+    name = 'msgpack'
+
+    @staticmethod
+    def dumps(data):
+        return msgpack.packb(data, use_bin_type=True)
+
+    @staticmethod
+    def loads(data):
+        return msgpack.unpackb(data, raw=False)
+
+
+def get_codec(protocol):
+    """Return the codec used by a protocol mode, json is used if msgpack is not installed"""
+    if protocol == 'batched' and msgpack is not None:
+        return MsgpackCodec
+    return JSONCodec
+
+
+class MasterChannel(object):
+    """The master side of the protocol, a ROUTER socket all slaves connect to
+
+    Args:
+        endpoint: zmq endpoint to bind to
+        protocol: one of :py:data:`PROTOCOLS`
+    """
+    def __init__(self, endpoint, protocol='json'):
+        self.protocol = protocol
+        self.batched = protocol == 'batched'
+        self.codec = get_codec(protocol)
+        self.poll_timeout = POLL_TIMEOUT[protocol]
+        self.pending = deque()
+
+        ctx = zmq.Context.instance()
+        self.sock = ctx.socket(zmq.ROUTER)
+        self.sock.bind(endpoint)
+
+        # wakeup pipe, lets signal handlers and other threads interrupt a blocking poll
+        # zmq sockets must not be shared between threads, every thread pushes through its own
+        self._wakeup_endpoint = 'inproc://parallelizer-wakeup-{}'.format(id(self))
+        self._wakeup_rx = ctx.socket(zmq.PULL)
+        self._wakeup_rx.bind(self._wakeup_endpoint)
+        self._wakeup_local = threading.local()
+        self._wakeup_lock = threading.Lock()
+        self._wakeup_txs = []
+        # created right away for the signal handlers, which run in this thread
+        self._wakeup_tx()
+
+        self.poller = zmq.Poller()
+        self.poller.register(self.sock, zmq.POLLIN)
+        self.poller.register(self._wakeup_rx, zmq.POLLIN)
+
+    def needs_ack(self, event_name):
+        return not (self.batched and event_name in BATCHED_EVENTS)
+
+    def send(self, slave_id, event_data):
+        self.sock.send_multipart([slave_id, b'', self.codec.dumps(event_data)])
+
+    def _wakeup_tx(self):
+        """The wakeup socket of the calling thread"""
+        tx = getattr(self._wakeup_local, 'tx', None)
+        if tx is None:
+            tx = zmq.Context.instance().socket(zmq.PUSH)
+            tx.set_hwm(1)
+            tx.connect(self._wakeup_endpoint)
+            with self._wakeup_lock:
+                self._wakeup_txs.append(tx)
+            self._wakeup_local.tx = tx
+            self._wakeup_local.sending = False
+        return tx
+
+    def wakeup(self):
+        """Interrupt a blocking :py:meth:`recv`, safe to call from any thread or signal handler"""
+        tx = self._wakeup_tx()
+        if self._wakeup_local.sending:
+            # a signal handler interrupted a wakeup of this thread, which wakes the poll anyway
+            return
+        self._wakeup_local.sending = True
+        try:
+            tx.send(b'', zmq.NOBLOCK)
+        except zmq.Again:
+            # a wakeup is already pending
+            pass
+        finally:
+            self._wakeup_local.sending = False
+
+    def recv(self):
+        """Return the next ``(slave_id, event_data, event_name)``, or Nones if nothing arrived"""
+        if self.pending:
+            return self.pending.popleft()
+        events = dict(self.poller.poll(self.poll_timeout))
+        if self._wakeup_rx in events:
+            while self._wakeup_rx.poll(0):
+                self._wakeup_rx.recv()
+        if self.sock not in events:
+            return None, None, None
+        slave_id, _, payload = self.sock.recv_multipart(flags=zmq.NOBLOCK)
+        event_data = self.codec.loads(payload)
+        event_name = event_data.pop('_event_name')
+        if event_name != '_batch':
+            return slave_id, event_data, event_name
+        for event in event_data['events']:
+            self.pending.append((slave_id, event, event.pop('_event_name')))
+        if self.pending:
+            return self.pending.popleft()
+        return None, None, None
+
+    def close(self):
+        with self._wakeup_lock:
+            sockets = [self.sock, self._wakeup_rx] + self._wakeup_txs
+            self._wakeup_txs = []
+        for sock in sockets:
+            sock.close(linger=0)
+
+
+class SlaveChannel(object):
+    """The slave side of the protocol
+
+    Args:
+        endpoint: zmq endpoint of the master
+        slaveid: identity of this slave
+        protocol: one of :py:data:`PROTOCOLS`
+    """
+    def __init__(self, endpoint, slaveid, protocol='json'):
+        self.protocol = protocol
+        self.batched = protocol == 'batched'
+        self.codec = get_codec(protocol)
+        self.buffer = []
+
+        ctx = zmq.Context.instance()
+        if self.batched:
+            # DEALER lets us send batches without waiting for a reply to each of them
+            self.sock = ctx.socket(zmq.DEALER)
+        else:
+            self.sock = ctx.socket(zmq.REQ)
+            self.sock.set_hwm(1)
+        self.sock.setsockopt_string(zmq.IDENTITY, u'{}'.format(slaveid))
+        self.sock.connect(endpoint)
+
+    def send_event(self, name, **kwargs):
+        """Send an event, returning the master's reply, or None if the event was buffered"""
+        kwargs['_event_name'] = name
+        if self.batched and name in BATCHED_EVENTS:
+            self.buffer.append(kwargs)
+            if len(self.buffer) >= BATCH_SIZE:
+                self.flush()
+            return None
+        self.flush()
+        self._send(kwargs)
+        return self._recv()
+
+    def flush(self):
+        """Send all buffered events to the master"""
+        if not self.buffer:
+            return
+        events, self.buffer = self.buffer, []
+        self._send({'_event_name': '_batch', 'events': events})
+
+    def _send(self, data):
+        payload = self.codec.dumps(data)
+        if self.batched:
+            # mimic the REQ envelope so the master sees the same frames either way
+            self.sock.send_multipart([b'', payload])
+        else:
+            self.sock.send(payload)
+
+    def _recv(self):
+        if self.batched:
+            _, payload = self.sock.recv_multipart()
+        else:
+            payload = self.sock.recv()
+        return self.codec.loads(payload)
+
+    def close(self):
+        self.sock.close(linger=0)
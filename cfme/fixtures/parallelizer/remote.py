@@ -1,12 +1,15 @@
 import json
 import signal
 
-import zmq
 from py.path import local
 
 import cfme.utils
+from cfme.fixtures.parallelizer.collection_cache import (
+    CACHE_TTL, CollectionReplay, collection_digest, collection_key)
+from cfme.fixtures.parallelizer.protocol import SlaveChannel
 from cfme.utils import log
 from cfme.utils.appliance import find_appliance
+from cfme.utils.disk_cache import DiskCache
 from cfme.fixtures.log import _test_status, _format_nodeid
 
 SLAVEID = None
@@ -14,31 +17,30 @@ SLAVEID = None
 
 class SlaveManager(object):
     """SlaveManager which coordinates with the master process for parallel testing"""
-    def __init__(self, config, slaveid, zmq_endpoint):
+    def __init__(self, config, slaveid, zmq_endpoint, collection_replay=None):
         self.config = config
         self.session = None
         self.collection = None
+        self.collection_replay = collection_replay
         self.slaveid = conf.runtime['env']['slaveid'] = slaveid
         self.log = cfme.utils.log.logger
         conf.clear()
         # Override the logger in utils.log
 
-        ctx = zmq.Context.instance()
-        self.sock = ctx.socket(zmq.REQ)
-        self.sock.set_hwm(1)
-        self.sock.setsockopt_string(zmq.IDENTITY, u'{}'.format(self.slaveid))
-        self.sock.connect(zmq_endpoint)
+        self.channel = SlaveChannel(
+            zmq_endpoint, self.slaveid, getattr(config.option, 'parallel_protocol', 'json'))
 
         self.messages = {}
 
         self.quit_signaled = False
 
     def send_event(self, name, **kwargs):
-        kwargs['_event_name'] = name
         self.log.debug("sending {} {!r}".format(name, kwargs))
-        self.sock.send_json(kwargs)
-        recv = self.sock.recv_json()
-        if recv == 'die':
+        recv = self.channel.send_event(name, **kwargs)
+        if recv is None:
+            # buffered by the batched protocol, the master doesn't reply to it
+            return
+        elif recv == 'die':
             self.log.info('Slave instructed to die by master; shutting down')
             raise SystemExit()
         else:
@@ -60,7 +62,20 @@ class SlaveManager(object):
         self.session = session
         self.collection = {item.nodeid: item for item in session.items}
         terminalreporter.disable()
-        self.send_event("collectionfinish", node_ids=list(self.collection.keys()))
+        node_ids = list(self.collection.keys())
+        replay = self.collection_replay
+        if replay is None:
+            self.send_event("collectionfinish", node_ids=node_ids)
+            return
+        self.log.info('rebuilt the parametrization of {replayed} test functions, '
+                      'generated {generated}'.format(**replay.stats))
+        # the package imports this module, so not at the top
+        from cfme.fixtures.parallelizer import report_collection_diff
+        diff_err = report_collection_diff(self.slaveid, replay.node_ids, node_ids)
+        if diff_err:
+            # the master only gets the digest, keep the details here
+            self.log.error(diff_err)
+        self.send_event("collectionfinish", node_ids_digest=collection_digest(node_ids))
 
     def pytest_runtest_logstart(self, nodeid, location):
         """pytest runtest logstart hook
@@ -78,6 +93,8 @@ class SlaveManager(object):
         """
         self.send_event("runtest_logreport", report=serialize_report(report))
         if report.when == 'teardown':
+            # test boundary, let the master report this test without waiting for a full batch
+            self.channel.flush()
             path, lineno, domaininfo = report.location
             test_status = _test_status(_format_nodeid(report.nodeid, False))
             if test_status == "failed":
@@ -207,6 +224,8 @@ if __name__ == '__main__':
     parser.add_argument('--ts', help='The timestap to use for collections')
 
     parser.add_argument('--config', help='The timestap to use for collections')
+    parser.add_argument('--full-collection', action='store_true',
+                        help='Collect without the parametrization shared by the master')
     args = parser.parse_args()
 
     # TODO: clean the logic up here
@@ -248,8 +267,19 @@ if __name__ == '__main__':
         template_name, provider_name = appliance_data[ip_address]
         conf.runtime["cfme_data"]["basic_info"]["appliance_template"] = template_name
         conf.runtime["cfme_data"]["basic_info"]["appliances_provider"] = provider_name
+    collection_replay = None
+    if config.get('collection_cache') and not args.full_collection:
+        # keyed by the args and options as the master sent them, before the slave changes any
+        collection_replay = CollectionReplay.load(
+            DiskCache(config['collection_cache'], ttl=CACHE_TTL),
+            collection_key(slave_args, slave_options))
+        if collection_replay is None:
+            slave_log.warning('No matching collection shared by the master, collecting in full')
     pytest_config = _init_config(slave_options, slave_args)
-    slave_manager = SlaveManager(pytest_config, args.worker, config['zmq_endpoint'])
+    if collection_replay is not None:
+        pytest_config.pluginmanager.register(collection_replay, 'collection_replay')
+    slave_manager = SlaveManager(
+        pytest_config, args.worker, config['zmq_endpoint'], collection_replay)
     pytest_config.pluginmanager.register(slave_manager, 'slave_manager')
     pytest_config.hook.pytest_cmdline_main(config=pytest_config)
     signal.signal(signal.SIGQUIT, slave_manager.handle_quit)
@@ -0,0 +1,184 @@
+"""Duration-aware scheduling for the parallelizer
+
+The default parallelizer distribution hands out module/param groups in collection order. When
+``--parallel-scheduler=duration`` is used, the master instead builds a :py:class:`TestGroup` for
+every group, estimates its runtime from the durations recorded in previous runs and plans the
+whole session up front (see :py:mod:`cfme.utils.run_history`):
+
+- groups are packed onto slaves longest-processing-time first, so the long groups are spread
+  out before the short ones fill the gaps
+- a group whose provider is already planned on a slave stays there, unless placing it elsewhere
+  saves more than the estimated cost of cleansing an appliance of its providers
+- each slave's queue is clustered by provider, so an appliance is re-homed as rarely as possible
+- once a slave has emptied its own queue it takes the groups left behind by retired slaves, then
+  steals whole groups from the other queues, preferring the group that would otherwise wait the
+  longest for its slave compared to what re-homing the thief costs
+- a group is only stolen if that pays off: it must wait longer than re-homing the thief takes,
+  unless the thief has its provider set up already (or it has none); a slave finding nothing worth
+  stealing is told to stop, slaves joining after the plan only steal
+
+"""
+from collections import defaultdict, deque
+
+import attr
+
+#: Estimated runtime (seconds) of a test that has never been seen before
+DEFAULT_TEST_DURATION = 30.
+#: Estimated cost (seconds) of removing all providers from an appliance and setting up a new one
+DEFAULT_CLEANUP_COST = 300.
+
+
+@attr.s
+class TestGroup(object):
+    """A group of node ids that are always sent to a slave together"""
+    tests = attr.ib()
+    provider = attr.ib(default=None)
+    duration = attr.ib(default=0.)
+
+
+class DurationScheduler(object):
+    """Plans and hands out :py:class:`TestGroup` instances to slaves
+
+    Args:
+        groups: iterable of lists of node ids, as yielded by the parallelizer group generator
+        slave_ids: ids of the slaves taking part in the session
+        durations: dict of node id to its recorded duration in seconds, as returned by
+            :py:meth:`cfme.utils.run_history.RunHistory.durations`
+        provider_of: callable returning the provider key of a group of node ids, or ``None``
+        cleanup_cost: estimated seconds needed to re-home an appliance to another provider
+        default_duration: estimated seconds for tests with no recorded duration, defaults to
+            the median of the known durations
+    """
+    def __init__(self, groups, slave_ids, durations, provider_of,
+                 cleanup_cost=DEFAULT_CLEANUP_COST, default_duration=None):
+        self.cleanup_cost = cleanup_cost
+        if default_duration is None:
+            default_duration = _median(durations.values()) or DEFAULT_TEST_DURATION
+        self.default_duration = default_duration
+        self.groups = [
+            TestGroup(
+                tests=list(tests),
+                provider=provider_of(tests),
+                duration=sum(durations.get(test, default_duration) for test in tests))
+            for tests in groups]
+        self.queues = {slave_id: deque() for slave_id in slave_ids}
+        # groups of retired slaves, taken by whoever asks first
+        self.orphans = deque()
+        # slave id -> the group it is running
+        self.running = {}
+        self.retired = set()
+        self.stats = defaultdict(int)
+        self._plan()
+
+    def _plan(self):
+        loads = dict.fromkeys(self.queues, 0.)
+        planned_providers = {slave_id: set() for slave_id in self.queues}
+        assigned = {slave_id: [] for slave_id in self.queues}
+
+        def cost(slave_id, group):
+            providers = planned_providers[slave_id]
+            rehome = group.provider and providers and group.provider not in providers
+            return loads[slave_id] + group.duration + (self.cleanup_cost if rehome else 0.)
+
+        # LPT: biggest groups first, each onto the slave that would finish it the earliest
+        for group in sorted(self.groups, key=lambda group: group.duration, reverse=True):
+            slave_id = min(sorted(self.queues), key=lambda slave_id: cost(slave_id, group))
+            loads[slave_id] = cost(slave_id, group)
+            if group.provider:
+                planned_providers[slave_id].add(group.provider)
+            assigned[slave_id].append(group)
+
+        # cluster each queue by provider in planned order, provider-less groups go last as they
+        # are the cheapest ones for other slaves to steal
+        for slave_id, groups in assigned.items():
+            order = []
+            for group in groups:
+                if group.provider not in order:
+                    order.append(group.provider)
+            rank = {provider: i for i, provider in enumerate(order)}
+            groups.sort(key=lambda group: rank[group.provider] if group.provider else len(order))
+            self.queues[slave_id].extend(groups)
+
+    def backlog(self, slave_id):
+        """Estimated seconds of work remaining in a slave's queue"""
+        return sum(group.duration for group in self.queues[slave_id])
+
+    @property
+    def remaining(self):
+        return len(self.orphans) + sum(len(queue) for queue in self.queues.values())
+
+    def retire(self, slave_id):
+        """Mark a slave as gone, its queued groups go to the shared pool of the others"""
+        self.retired.add(slave_id)
+        self.running.pop(slave_id, None)
+        queue = self.queues.get(slave_id)
+        if queue:
+            self.orphans.extend(queue)
+            queue.clear()
+
+    def next_group(self, slave_id, providers=()):
+        """Return the next :py:class:`TestGroup` for a slave, or ``None`` if it should stop
+
+        Args:
+            slave_id: id of the slave asking for tests
+            providers: provider keys currently set up on the slave's appliance
+        """
+        self.retired.discard(slave_id)
+        queue = self.queues.setdefault(slave_id, deque())
+        if queue:
+            group = queue.popleft()
+        else:
+            group = self._adopt(providers) or self._steal(slave_id, providers)
+        if group is None:
+            self.running.pop(slave_id, None)
+        else:
+            self.running[slave_id] = group
+        return group
+
+    def _adopt(self, providers):
+        """A group of a retired slave, one of the providers set up already if there is one"""
+        if not self.orphans:
+            return None
+        for index, group in enumerate(self.orphans):
+            if group.provider and group.provider in providers:
+                break
+        else:
+            index = 0
+        group = self.orphans[index]
+        del self.orphans[index]
+        self.stats['adopted'] += 1
+        return group
+
+    def _steal(self, thief_id, providers):
+        best = None
+        for victim_id, queue in self.queues.items():
+            if victim_id == thief_id or not queue:
+                continue
+            # a group waits for the one its slave is running and for the ones queued before it
+            running = self.running.get(victim_id)
+            wait = running.duration if running is not None else 0.
+            for index, group in enumerate(queue):
+                rehome = group.provider and providers and group.provider not in providers
+                gain = wait - (self.cleanup_cost if rehome else 0.)
+                # a group of a provider set up on the thief costs nothing extra, it can always go
+                if (gain > 0 or not rehome) and (best is None or gain > best[0]):
+                    best = gain, victim_id, index
+                wait += group.duration
+        if best is None:
+            return None
+        _, victim_id, index = best
+        queue = self.queues[victim_id]
+        group = queue[index]
+        del queue[index]
+        self.stats['stolen'] += 1
+        return group
+
+
+def _median(values):
+    values = sorted(values)
+    if not values:
+        return None
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.
@@ -0,0 +1,121 @@
+"""Records test durations and outcomes into the :py:mod:`cfme.utils.run_history` store
+
+The master (or the only) process records every finished test. Slaves only annotate their reports
+with the appliance and provider that were used, the annotations travel to the master together
+with the serialized reports.
+
+``--durations-budget`` uses the recorded durations to trim the collection down to the tests that
+fit in the given number of seconds of total test time. Only runs that started before the current
+one are taken into account, so the master and all slaves arrive at the same selection.
+
+"""
+from collections import defaultdict
+
+import pytest
+
+from cfme.fixtures.pytest_store import store
+from cfme.utils.appliance import find_appliance
+from cfme.utils.log import logger
+from cfme.utils.run_history import DEFAULT_HISTORY_PATH, RunHistory, overall_outcome
+
+PLUGIN_KEY = 'run-history'
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('cfme')
+    group.addoption('--run-history', dest='run_history', default=DEFAULT_HISTORY_PATH.strpath,
+                    help='Path of the test duration/outcome history database '
+                         '(default: %(default)s)')
+    group.addoption('--no-run-history', dest='no_run_history', action='store_true',
+                    default=False, help='Do not record this run into the history database')
+    group.addoption('--durations-budget', dest='durations_budget', type=float, default=None,
+                    help='Only collect the tests that fit in this many seconds of total test '
+                         'time, according to the durations in the history database')
+
+
+def get_history(config):
+    """Return the :py:class:`RunHistory` of the session, or None if it isn't recorded"""
+    recorder = config.pluginmanager.get_plugin(PLUGIN_KEY)
+    if recorder is not None:
+        return recorder.history
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    if store.parallelizer_role == 'slave' or config.getoption('no_run_history'):
+        return
+    history = RunHistory(config.getoption('run_history'))
+    # slaves receive the option values of the master, this is how they learn the run
+    config.option.run_history_run = history.start_run(config.getoption('run_id'))
+    config.pluginmanager.register(
+        RunHistoryRecorder(history, config.option.run_history_run), PLUGIN_KEY)
+
+
+def pytest_collection_modifyitems(session, config, items):
+    budget = config.getoption('durations_budget')
+    if budget is None:
+        return
+    history = RunHistory(config.getoption('run_history'))
+    durations = history.durations(before_run=getattr(config.option, 'run_history_run', None))
+    history.close()
+    default = sorted(durations.values())[len(durations) // 2] if durations else 0.
+
+    selected, deselected, total = [], [], 0.
+    for item in items:
+        duration = durations.get(item.nodeid, default)
+        if total + duration <= budget:
+            total += duration
+            selected.append(item)
+        else:
+            deselected.append(item)
+    if deselected:
+        config.hook.pytest_deselected(items=deselected)
+        items[:] = selected
+    store.uncollection_stats['durations_budget'] = len(deselected)
+    logger.info('durations budget %ss: selected %s tests estimated at %.0fs',
+                budget, len(selected), total)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+    appliance = find_appliance(item, require=False)
+    try:
+        provider = item.callspec.params.get('provider')
+    except AttributeError:
+        provider = None
+    # extra report attributes are serialized to the master by the parallelizer
+    report.history_keys = {
+        'appliance': getattr(appliance, 'hostname', None),
+        'provider': getattr(provider, 'key', None),
+    }
+
+
+class RunHistoryRecorder(object):
+    """Collects the phase reports of each test and records the test once it's torn down"""
+    def __init__(self, history, run):
+        self.history = history
+        self.run = run
+        self.reports = defaultdict(list)
+
+    def pytest_runtest_logreport(self, report):
+        self.reports[report.nodeid].append(report)
+        if report.when != 'teardown':
+            return
+        reports = self.reports.pop(report.nodeid)
+        keys = getattr(report, 'history_keys', None) or {}
+        path, _, domain = report.location
+        try:
+            self.history.record(
+                self.run, report.nodeid,
+                duration=sum(rep.duration for rep in reports),
+                outcome=overall_outcome(reports),
+                ident='{}/{}'.format(path, domain),
+                appliance=keys.get('appliance'), provider=keys.get('provider'))
+        except Exception:
+            # history is a nice to have, it must never break the run
+            logger.exception('Failed to record %s into the run history', report.nodeid)
+
+    def pytest_unconfigure(self):
+        self.history.close()
@@ -8,7 +8,7 @@ from distutils.version import LooseVersion
 from cfme.markers.env import EnvironmentMarker
 from cfme.utils import conf
 from cfme.utils.log import logger
-from cfme.utils.providers import ProviderFilter, list_providers, all_types
+from cfme.utils.providers import FilterSpec, ProviderFilter, list_providers, all_types
 from cfme.utils.pytest_shortcuts import fixture_filter
 from cfme.utils.version import Version
 
@@ -69,8 +69,14 @@ class DPFilter(ProviderFilter):
         """ Filters by provider (base) classes """
         if self.classes is None:
             return None
-        return any([prov_class in all_types()[provider.type_name].__mro__
-                    for prov_class in self.classes])
+        return issubclass(all_types()[provider.type_name], tuple(self.classes))
+
+    def spec(self):
+        """ The criteria this filter applies to the real providers in :py:func:`list_providers` """
+        return FilterSpec(
+            keys=None, classes=self.classes, required_fields=self.required_fields or None,
+            required_tags=self.required_tags or None, required_flags=self.required_flags or None,
+            restrict_version=False, inverted=self.inverted, conjunctive=self.conjunctive)
 
 
 def _param_check(metafunc, argnames, argvalues):
@@ -7,7 +7,8 @@ from cfme.infrastructure.provider.rhevm import RHEVMProvider
 from cfme.infrastructure.provider.virtualcenter import VMwareProvider
 from cfme.utils import version
 from cfme.utils.log import logger
-from cfme.utils.rest import create_resource
+from cfme.utils.rest import (
+    create_resource, delete_resources_by_id, query_resources, wait_for_resources)
 from cfme.utils.virtual_machines import deploy_template
 from cfme.utils.wait import wait_for
 from cfme.fixtures.provider import setup_one_by_class_or_skip
@@ -275,17 +276,12 @@ def service_templates_ui(request, appliance, service_dialog=None, service_catalo
 
     collection = appliance.rest_api.collections.service_templates
 
-    for new_name in new_names:
-        wait_for(lambda: collection.find_by(name=new_name) or False, num_sec=180, delay=10)
-
-    s_tpls = [ent for ent in collection if ent.name in new_names]
+    wait_for_resources(collection, 'name', new_names)
+    s_tpls = query_resources(collection, 'name', new_names)
 
     @request.addfinalizer
     def _finished():
-        collection.reload()
-        to_delete = [ent for ent in collection if ent.name in new_names]
-        if to_delete:
-            collection.action.delete(*to_delete)
+        delete_resources_by_id(collection, [ent.id for ent in s_tpls])
 
     return s_tpls
 
@@ -461,11 +457,7 @@ def _creating_skeleton(request, rest_api, col_name, col_data, col_action='create
     @request.addfinalizer
     def _finished():
         collection = getattr(rest_api.collections, col_name)
-        collection.reload()
-        ids = [e.id for e in original_entities]
-        delete_entities = [e for e in collection if e.id in ids]
-        if delete_entities:
-            collection.action.delete(*delete_entities)
+        delete_resources_by_id(collection, [e.id for e in original_entities])
 
     return entities
 
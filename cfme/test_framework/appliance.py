@@ -45,6 +45,7 @@ def appliances_from_cli(cli_appliances):
 def pytest_configure(config):
 
     reporter = terminalreporter.reporter()
+    feed = None
     if config.getoption('--dummy-appliance'):
         appliances = [DummyAppliance.from_config(config)]
         reporter.write_line('Retrieved Dummy Appliance', red=True)
@@ -56,7 +57,7 @@ def pytest_configure(config):
     elif config.getoption('--use-sprout'):
         from .sprout.plugin import mangle_in_sprout_appliances
 
-        mangle_in_sprout_appliances(config)
+        feed = mangle_in_sprout_appliances(config)
         appliances = appliances_from_cli(config.option.appliances)
         reporter.write_line('Retrieved these appliances from the --sprout-* parameters', red=True)
     else:
@@ -70,7 +71,7 @@ def pytest_configure(config):
     if not appliance.is_dev:
         appliance.set_session_timeout(86400)
     stack.push(appliance)
-    plugin = ApplianceHolderPlugin(appliance, appliances)
+    plugin = ApplianceHolderPlugin(appliance, appliances, feed)
     config.pluginmanager.register(plugin, PLUGIN_KEY)
 
 
@@ -83,6 +84,8 @@ def pytest_unconfigure():
 class ApplianceHolderPlugin(object):
     held_appliance = attr.ib()
     appliances = attr.ib(default=attr.Factory(list))
+    # delivers more appliances while the tests run, see the sprout plugin
+    feed = attr.ib(default=None)
 
     @pytest.fixture(scope="session")
     def appliance(self):
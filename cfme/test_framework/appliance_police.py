@@ -1,11 +1,7 @@
 import attr
 import pytest
 
-
-import requests
-
-from cfme.utils import ports
-from cfme.utils.net import net_check
+from cfme.utils.log import logger
 from cfme.utils.wait import TimedOutError
 from cfme.utils.conf import rdb
 
@@ -13,6 +9,9 @@ from cfme.fixtures.pytest_store import store
 
 from cfme.fixtures.rdb import Rdb
 
+#: health monitors started by the fixture
+_monitors = []
+
 
 @attr.s
 class AppliancePoliceException(Exception):
@@ -27,30 +26,24 @@ class AppliancePoliceException(Exception):
 def appliance_police(appliance):
     if not store.slave_manager:
         return
+    monitor = appliance.health_monitor
     try:
-        available_ports = {
-            'ssh': (appliance.hostname, appliance.ssh_port),
-            'https': (appliance.hostname, appliance.ui_port),
-            'postgres': (appliance.db_host or appliance.hostname, appliance.db_port)}
-        port_results = {pn: net_check(addr=p_addr, port=p_port, force=True)
-                        for pn, (p_addr, p_port) in available_ports.items()}
-        for port, result in port_results.items():
-            if port == 'ssh' and appliance.is_pod:
-                # ssh is not available for podified appliance
-                continue
-            if not result:
-                raise AppliancePoliceException('Unable to connect', available_ports[port][1])
-
-        try:
-            status_code = requests.get(appliance.url, verify=False,
-                                       timeout=120).status_code
-        except Exception:
-            raise AppliancePoliceException('Getting status code failed',
-                                           available_ports['https'][1])
-
-        if status_code != 200:
-            raise AppliancePoliceException('Status code was {}, should be 200'.format(
-                status_code), available_ports['https'][1])
+        if not monitor.running:
+            monitor.start()
+            _monitors.append(monitor)
+        # the state published by the monitor, or a fresh probe if it is stale or unhealthy
+        state = monitor.current()
+        if state.api_only:
+            # the UI works, restarting evm for the API workers would do more harm than good
+            result = state.probes['api']
+            msg = 'The API of appliance {} is failing: {}'.format(appliance.url, result.error)
+            logger.warning(msg)
+            store.write_line(msg, purple=True)
+            return
+        for result in state.failures:
+            raise AppliancePoliceException(
+                result.error if result.name in ('web', 'api') else 'Unable to connect',
+                result.port)
         return
     except AppliancePoliceException as e:
         # special handling for known failure conditions
@@ -60,6 +53,7 @@ def appliance_police(appliance):
             appliance.restart_evm_service(rude=True)
             try:
                 appliance.wait_for_web_ui(900)
+                monitor.invalidate()
                 store.write_line('EVM was frozen and had to be restarted.', purple=True)
                 return
             except TimedOutError:
@@ -81,3 +75,14 @@ def appliance_police(appliance):
         rdb_kwargs = {}
     Rdb(msg).set_trace(**rdb_kwargs)
     store.slave_manager.message('Resuming testing following remote debugging')
+
+
+def pytest_sessionfinish(session, exitstatus):
+    for monitor in _monitors:
+        monitor.stop()
+        for name, stats in monitor.latency_stats().items():
+            logger.info(
+                '%r %s probe: %d probes, %d failed, latency min %.3fs avg %.3fs max %.3fs',
+                monitor, name, stats['count'], stats['failures'], stats['min'], stats['avg'],
+                stats['max'])
+    del _monitors[:]
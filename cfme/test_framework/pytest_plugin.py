@@ -48,6 +48,7 @@ pytest_plugins = (
     'cfme.markers.polarion',  # before artifactor
     'cfme.markers.env',
     'cfme.fixtures.artifactor_plugin',
+    'cfme.fixtures.run_history',
     'cfme.fixtures.parallelizer',
 
     'cfme.fixtures.prov_filter',
@@ -47,6 +47,10 @@ def pytest_addoption(parser):
         help="Sprout provider type - openshift, etc")
     group._addoption('--sprout-template-type', dest='sprout_template_type', default=None,
         help="Specifies which template type to use openshift_pod, virtual_machine, docker_vm")
+    group._addoption('--sprout-progressive', dest='sprout_progressive', action='store_true',
+                     default=False,
+                     help="Start testing on the first ready appliance of the pool, the others "
+                          "join the parallel session as they become ready")
     group._addoption('--sprout-ignore-preconfigured', dest='sprout_template_preconfigured',
                      default=True, action="store_false",
                      help="Allows to use not preconfigured templates")
@@ -65,43 +69,52 @@ def dump_pool_info(log, pool_data):
             log.info("\t\t%s: %s", key, appliance[key])
 
 
+def sprout_appliance_args(appliance):
+    """The ``--appliance`` data of an appliance as returned by Sprout"""
+    appliance_args = {'hostname': appliance['url']}
+    provider_data = conf.cfme_data['management_systems'].get(appliance['provider'])
+    if provider_data and provider_data['type'] == 'openshift':
+        ocp_creds = conf.credentials[provider_data['credentials']]
+        ssh_creds = conf.credentials[provider_data['ssh_creds']]
+        extra_args = {
+            'container': appliance['container'],
+            'db_host': appliance['db_host'],
+            'project': appliance['project'],
+            'openshift_creds': {
+                'hostname': provider_data['hostname'],
+                'username': ocp_creds['username'],
+                'password': ocp_creds['password'],
+                'ssh': {
+                    'username': ssh_creds['username'],
+                    'password': ssh_creds['password'],
+                }
+            }
+        }
+        appliance_args.update(extra_args)
+    return appliance_args
+
+
 def mangle_in_sprout_appliances(config):
     """
     this helper function resets the appliances option of the config and mangles in
     the sprout ones
 
     its a hopefully temporary hack until we make a correctly ordered hook for obtaining appliances
+
+    Returns:
+        a :py:class:`SproutApplianceFeed` of the appliances which are not ready yet when
+        ``--sprout-progressive`` is used, None otherwise
     """
     provision_request = SproutProvisioningRequest.from_config(config)
 
     mgr = config._sprout_mgr = SproutManager()
-    requested_appliances = mgr.request_appliances(provision_request)
+    progressive = config.getoption('sprout_progressive')
+    requested_appliances = mgr.request_appliances(provision_request, progressive=progressive)
     config.option.appliances[:] = []
     appliances = config.option.appliances
     log.info("Appliances were provided:")
     for appliance in requested_appliances:
-
-        appliance_args = {'hostname': appliance['url']}
-        provider_data = conf.cfme_data['management_systems'].get(appliance['provider'])
-        if provider_data and provider_data['type'] == 'openshift':
-            ocp_creds = conf.credentials[provider_data['credentials']]
-            ssh_creds = conf.credentials[provider_data['ssh_creds']]
-            extra_args = {
-                'container': appliance['container'],
-                'db_host': appliance['db_host'],
-                'project': appliance['project'],
-                'openshift_creds': {
-                    'hostname': provider_data['hostname'],
-                    'username': ocp_creds['username'],
-                    'password': ocp_creds['password'],
-                    'ssh': {
-                        'username': ssh_creds['username'],
-                        'password': ssh_creds['password'],
-                    }
-                }
-            }
-            appliance_args.update(extra_args)
-        appliances.append(appliance_args)
+        appliances.append(sprout_appliance_args(appliance))
         log.info("- %s is %s", appliance['url'], appliance['name'])
 
     mgr.reset_timer()
@@ -113,6 +126,10 @@ def mangle_in_sprout_appliances(config):
     log.info("Sprout setup finished.")
 
     config.pluginmanager.register(ShutdownPlugin())
+    if progressive:
+        return SproutApplianceFeed(
+            mgr, expected=provision_request.count,
+            timeout=provision_request.provision_timeout * 60)
 
 
 @attr.s
@@ -159,16 +176,26 @@ class SproutManager(object):
     pool = attr.ib(init=False, default=None)
     lease_time = attr.ib(init=False, default=None, repr=False)
     timer = attr.ib(init=False, default=None, repr=False)
+    # ids of the appliances handed out by ready_appliances
+    received = attr.ib(init=False, default=attr.Factory(set), repr=False)
 
-    def request_appliances(self, provision_request):
+    def request_appliances(self, provision_request, progressive=False):
+        """Requests the pool and waits for its appliances
+
+        Args:
+            provision_request: the :py:class:`SproutProvisioningRequest`
+            progressive: only wait for the first ready appliances, the others are handed out by
+                :py:meth:`ready_appliances` as they become ready
+        """
         self.request_pool(provision_request)
 
         try:
             result = wait_for(
-                self.check_fullfilled,
+                self.check_ready if progressive else self.check_fullfilled,
                 num_sec=provision_request.provision_timeout * 60,
                 delay=5,
-                message="requesting appliances was fulfilled"
+                message="requesting appliances was {}".format(
+                    "partially fulfilled" if progressive else "fulfilled")
             )
         except Exception:
             pool = self.request_check()
@@ -182,6 +209,8 @@ class SproutManager(object):
             dump_pool_info(log, pool)
 
         log.info("Provisioning took %.1f seconds", result.duration)
+        if progressive:
+            return result.out
         return pool["appliances"]
 
     def request_pool(self, provision_request):
@@ -236,6 +265,27 @@ class SproutManager(object):
         log.debug("fulfilled at %f %%", result['progress'])
         return result["fulfilled"]
 
+    def check_ready(self):
+        try:
+            return self.ready_appliances()
+        except SproutException as e:
+            self.destroy_pool()
+            log.error("sprout pool could not be fulfilled\n%s", str(e))
+            pytest.exit(1)
+
+    def ready_appliances(self):
+        """The appliances of the pool which became ready since the previous call"""
+        result = self.client.request_ready_appliances(self.pool, known=sorted(self.received))
+        log.debug("fulfilled at %f %%, %d appliances pending",
+                  result['progress'], len(result['pending']))
+        self.received.update(appliance['id'] for appliance in result['appliances'])
+        return result['appliances']
+
+    def replace_appliance(self, address):
+        """Destroys the appliance, Sprout provisions another one into the pool"""
+        log.info("Replacing the appliance %s in the pool %s", address, self.pool)
+        return self.client.replace_appliance(address, minutes=self.lease_time)
+
     def clean_jenkins_job(self, jenkins_job):
         try:
             log.info(
@@ -297,6 +347,40 @@ def pytest_addhooks(pluginmanager):
     pluginmanager.add_hookspecs(NewHooks)
 
 
+@attr.s
+class SproutApplianceFeed(object):
+    """Hands the appliances of a progressive Sprout pool to the parallelizer as they get ready
+
+    Args:
+        manager: the :py:class:`SproutManager` of the pool
+        expected: number of appliances the feed should deliver, including the ones handed out
+            before it was created
+    """
+    manager = attr.ib()
+    expected = attr.ib()
+    #: seconds between two checks of the pool
+    interval = attr.ib(default=30)
+    #: seconds the parallelizer waits for appliances when it has no slaves left
+    timeout = attr.ib(default=3600)
+
+    @property
+    def exhausted(self):
+        return len(self.manager.received) >= self.expected
+
+    def poll(self):
+        """Appliance objects for the appliances which became ready"""
+        from cfme.test_framework.appliance import appliances_from_cli
+        ready = self.manager.ready_appliances()
+        for appliance in ready:
+            log.info("- %s is %s, ready now", appliance['url'], appliance['name'])
+        return appliances_from_cli([sprout_appliance_args(appliance) for appliance in ready])
+
+    def replace(self, appliance):
+        """Asks Sprout for another appliance instead of the failed one, it comes through poll"""
+        self.manager.replace_appliance(appliance.hostname)
+        self.expected += 1
+
+
 class ShutdownPlugin(object):
 
     def pytest_miq_node_shutdown(self, config, nodeinfo):
@@ -908,6 +908,23 @@ class IPAppliance(object):
                 value = None
             return value
 
+    @cached_property
+    def event_hub(self):
+        """The :py:class:`cfme.utils.event_hub.EventHub` shared by all the event listeners"""
+        # There is no REST API for event streams on versions < 5.9
+        if self.version <= '5.9':
+            from cfme.utils.events_db import DbEventHub
+            return DbEventHub(self)
+        else:
+            from cfme.utils.events import RestEventHub
+            return RestEventHub(self)
+
+    @cached_property
+    def health_monitor(self):
+        """The :py:class:`cfme.utils.health_monitor.HealthMonitor` probing this appliance"""
+        from cfme.utils.health_monitor import HealthMonitor
+        return HealthMonitor(self)
+
     def event_listener(self):
         """Returns an instance of the event listening class pointed to this appliance."""
         # There is no REST API for event streams on versions < 5.9
@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
 import json
 import time
+import weakref
+from collections import defaultdict
 from inspect import isclass
 from time import sleep
 
+import attr
 import os
+import six
 from cached_property import cached_property
 from jsmin import jsmin
 from navmazing import Navigate, NavigateStep
@@ -12,6 +16,7 @@ from selenium.common.exceptions import (
     ErrorInResponseException, InvalidSwitchToTargetException,
     InvalidElementStateException, WebDriverException, UnexpectedAlertPresentException,
     NoSuchElementException, StaleElementReferenceException)
+from six.moves.urllib.parse import urlparse
 from widgetastic.browser import Browser, DefaultPlugin
 from widgetastic.utils import VersionPick
 from widgetastic.widget import Text, View
@@ -52,6 +57,32 @@ class ErrorView(View):
         return None
 
 
+@attr.s
+class PageHealth(object):
+    """State of the page found by :py:meth:`MiqBrowserPlugin.page_health` in one round trip
+
+    The checks the probe could not do are None.
+    """
+    #: Whether ``miqSparkleOff`` was there to be called
+    sparkle_off = attr.ib()
+    #: Whether the page is covered by the blocker div, a notification or a modal backdrop
+    blocked = attr.ib()
+    #: Whether a large modal window is open
+    modal = attr.ib()
+    #: Whether jQuery is loaded
+    jquery = attr.ib()
+    #: Rails error displayed on the page, same as :py:meth:`ErrorView.get_rails_error`
+    rails_error = attr.ib()
+    #: Seconds the probe took, including the WebDriver round trip
+    elapsed = attr.ib()
+
+    @classmethod
+    def unknown(cls, elapsed):
+        """Health of a page the probe failed on, nothing to act upon"""
+        return cls(sparkle_off=None, blocked=None, modal=None, jquery=None, rails_error=None,
+                   elapsed=elapsed)
+
+
 class MiqBrowserPlugin(DefaultPlugin):
     # Here we dismiss notifications as they obscure lower elements which need to be clicked on
     # We don't bother iterating and instead choose [0] and [1] to simplify the codepath
@@ -104,6 +135,60 @@ class MiqBrowserPlugin(DefaultPlugin):
         }
         ''')
 
+    # Everything CFMENavigateStep.pre_badness_check looks at, in one script
+    PAGE_HEALTH = jsmin('''\
+        function isDisplayed(el) {
+            if (!el) return false;
+            var style = window.getComputedStyle(el);
+            return style.display !== "none" && style.visibility !== "hidden" &&
+                el.getClientRects().length > 0;
+        }
+        function byXpath(xpath) {
+            var result = document.evaluate(
+                xpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+            var nodes = [];
+            for (var i = 0; i < result.snapshotLength; i++) nodes.push(result.snapshotItem(i));
+            return nodes;
+        }
+        function anyDisplayed(nodes) {
+            for (var i = 0; i < nodes.length; i++) if (isDisplayed(nodes[i])) return true;
+            return false;
+        }
+        function text(xpath) {
+            var nodes = byXpath(xpath);
+            return nodes.length ? nodes[0].innerText.trim() : null;
+        }
+
+        var sparkleOff = false;
+        try {
+            miqSparkleOff();
+            sparkleOff = true;
+        } catch(err) {
+        }
+
+        var railsError = null;
+        if (anyDisplayed(byXpath("//body[./h1 and ./p and ./hr and ./address]"))) {
+            var title = text("//body/h1"), body = text("//body/p");
+            if (title !== null && body !== null) railsError = title + ": " + body;
+        } else if (anyDisplayed(
+                byXpath("//h1[normalize-space(.)='Unexpected error encountered']"))) {
+            railsError = text(
+                "//h1[normalize-space(.)='Unexpected error encountered']" +
+                "/following-sibling::h3[not(fieldset)]");
+        }
+
+        return {
+            sparkle_off: sparkleOff,
+            blocked: (
+                anyDisplayed(byXpath("//div[@id='blocker_div' or @id='notification']")) ||
+                anyDisplayed(document.querySelectorAll(".modal-backdrop.fade.in"))),
+            modal: anyDisplayed(byXpath(
+                "//div[contains(@class, 'modal-dialog') and contains(@class, 'modal-lg')]")),
+            jquery: typeof jQuery !== "undefined",
+            rails_error: railsError
+        };
+        ''')
+
     OBSERVED_FIELD_MARKERS = (
         'data-miq_observe',
         'data-miq_observe_date',
@@ -142,6 +227,27 @@ class MiqBrowserPlugin(DefaultPlugin):
                   """
         return self.browser.selenium.execute_script(js_code)
 
+    def page_health(self):
+        """Checks the state of the page before navigating, in a single WebDriver round trip
+
+        Returns:
+            :py:class:`PageHealth`, unknown if the script failed
+
+        Raises:
+            :py:class:`selenium.common.exceptions.UnexpectedAlertPresentException`: an alert
+            blocks the script, dismiss it and probe again
+        """
+        start = time.time()
+        try:
+            result = self.browser.execute_script(self.PAGE_HEALTH, silent=True)
+        except UnexpectedAlertPresentException:
+            raise
+        except WebDriverException as e:
+            # the page is being replaced, the script timed out, ...
+            logger.warning('Could not check the page health: %s', e)
+            return PageHealth.unknown(elapsed=time.time() - start)
+        return PageHealth(elapsed=time.time() - start, **result)
+
     def make_document_focused(self):
         if self.browser.browser_type != 'firefox':
             return
@@ -176,8 +282,8 @@ class MiqBrowserPlugin(DefaultPlugin):
 
     def after_keyboard_input(self, element, keyboard_input):
         observed_field_attr = None
-        for attr in self.OBSERVED_FIELD_MARKERS:
-            observed_field_attr = self.browser.get_attribute(attr, element)
+        for marker in self.OBSERVED_FIELD_MARKERS:
+            observed_field_attr = self.browser.get_attribute(marker, element)
             if observed_field_attr is not None:
                 break
         else:
@@ -256,8 +362,102 @@ def can_skip_badness_test(fn):
     return fn
 
 
+@attr.s
+class NavigationShortcuts(object):
+    """Destination URLs learned from full navigations, so the next navigation can jump there
+
+    The URLs are kept per appliance, navigation step and object. The object is identified by its
+    ``id`` if it already knows it, a collection by its class, parent and filters, as new
+    collection objects are created all the time. Other objects are identified by the object itself
+    for as long as it lives. ``stats`` counts the ``learned`` URLs, the ``hits`` that needed no
+    further navigation, the ``stale`` URLs which did not lead to the destination and the seconds
+    of navigation saved (``time_saved``). A destination with a stale URL is not learned again, its
+    URL depends on more than the object. The explorer pages are not learned at all, their URL is
+    the same for everything in their trees.
+    """
+    _entries = attr.ib(default=attr.Factory(dict), repr=False)
+    _refs = attr.ib(default=attr.Factory(dict), repr=False)
+    # ident of an object referenced weakly -> keys depending on it
+    _dependents = attr.ib(default=attr.Factory(lambda: defaultdict(set)), repr=False)
+    stats = attr.ib(default=attr.Factory(lambda: defaultdict(int)))
+
+    def key(self, step):
+        weak_idents = []
+        try:
+            ident = self._ident(step.obj, weak_idents)
+        except TypeError:
+            # neither identified by its values nor weakly referenceable
+            return None
+        key = step.appliance.hostname, type(step), ident
+        for weak_ident in weak_idents:
+            self._dependents[weak_ident].add(key)
+        return key
+
+    def _ident(self, obj, weak_idents):
+        from cfme.modeling.base import BaseCollection, BaseEntity
+        if obj is None or isclass(obj) or isinstance(
+                obj, six.string_types + six.integer_types + (float, bool)):
+            return obj
+        if isinstance(obj, (list, tuple)):
+            return tuple(self._ident(item, weak_idents) for item in obj)
+        if isinstance(obj, BaseCollection):
+            # the appliance is in the key already
+            parent = (self._ident(obj.parent, weak_idents)
+                      if isinstance(obj.parent, BaseEntity) else None)
+            return type(obj), parent, tuple(sorted(
+                (name, self._ident(value, weak_idents)) for name, value in obj.filters.items()))
+        # Only use an id that is already known, looking it up can mean a REST call
+        obj_id = getattr(obj, '__dict__', {}).get('id')
+        if obj_id is not None:
+            return type(obj), obj_id
+        ident = ('object', id(obj))
+        if ident not in self._refs:
+            self._refs[ident] = weakref.ref(obj, lambda ref, ident=ident: self._forget(ident))
+        weak_idents.append(ident)
+        return ident
+
+    def _forget(self, ident):
+        self._refs.pop(ident, None)
+        for key in self._dependents.pop(ident, ()):
+            self._entries.pop(key, None)
+
+    def get(self, key):
+        """Returns the ``(url, duration)`` learned for the key, or None"""
+        return self._entries.get(key)
+
+    def learn(self, key, url, duration):
+        if key in self._entries and self._entries[key] is None:
+            return
+        if urlparse(url).path.rstrip('/').endswith('/explorer'):
+            # the trees of the explorer are not in its URL
+            self._entries[key] = None
+            return
+        if key not in self._entries:
+            self.stats['learned'] += 1
+        self._entries[key] = (url, duration)
+
+    def hit(self, key, duration):
+        self.stats['hits'] += 1
+        self.stats['time_saved'] += max(self._entries[key][1] - duration, 0)
+
+    def stale(self, key):
+        self.stats['stale'] += 1
+        self._entries[key] = None
+
+    def clear(self):
+        self._entries.clear()
+        self._refs.clear()
+        self._dependents.clear()
+
+
+navigation_shortcuts = NavigationShortcuts()
+
+
 class CFMENavigateStep(NavigateStep):
     VIEW = None
+    #: Whether the destination can be reached by its URL, see :py:class:`NavigationShortcuts`.
+    #: None enables it for the ``All`` and ``Details`` destinations.
+    URL_SHORTCUT = None
 
     @cached_property
     def view(self):
@@ -278,6 +478,34 @@ class CFMENavigateStep(NavigateStep):
         except (AttributeError, NoSuchElementException):
             return False
 
+    def shortcut_key(self, *args, **kwargs):
+        """Key of the destination in :py:data:`navigation_shortcuts`, None when not applicable"""
+        enabled = self.URL_SHORTCUT
+        if enabled is None:
+            enabled = self._name in ('All', 'Details')
+        # arguments may change the destination, so those navigations are not shortcut
+        if (not enabled or args or kwargs or self.VIEW is None or
+                os.environ.get('DISABLE_NAVIGATE_SHORTCUTS', False)):
+            return None
+        return navigation_shortcuts.key(self)
+
+    def jump_to_shortcut(self, *args, **kwargs):
+        """Opens the URL learned for the destination, returns whether it got there"""
+        key = self.shortcut_key(*args, **kwargs)
+        if key is None or navigation_shortcuts.get(key) is None:
+            return False
+        url, _ = navigation_shortcuts.get(key)
+        start_time = time.time()
+        self.appliance.browser.widgetastic.url = url
+        self.appliance.browser.widgetastic.plugin.ensure_page_safe()
+        if self.am_i_here():
+            navigation_shortcuts.hit(key, time.time() - start_time)
+            self.log_message("Jumped to the destination by URL {}".format(url))
+            return True
+        self.log_message("URL {} did not lead to the destination".format(url), level="warning")
+        navigation_shortcuts.stale(key)
+        return False
+
     def pre_badness_check(self, _tries, *args, **go_kwargs):
         # check for MiqQE javascript patch on first try and patch the appliance if necessary
         if self.appliance.is_miqqe_patch_candidate and not self.appliance.miqqe_patch_applied:
@@ -289,41 +517,28 @@ class CFMENavigateStep(NavigateStep):
         br = self.appliance.browser
 
         try:
-            br.widgetastic.execute_script('miqSparkleOff();', silent=True)
-        except:  # noqa
-            # miqSparkleOff undefined, so it's definitely off.
-            # Or maybe it is alerts? Let's only do this when we get an exception.
+            health = br.widgetastic.plugin.page_health()
+        except UnexpectedAlertPresentException:
+            # Alerts block any javascript, dismiss them and look again
             self.appliance.browser.widgetastic.dismiss_any_alerts()
-            # If we went so far, let's put diapers on one more miqSparkleOff just to be sure
-            # It can be spinning in the back
-            try:
-                br.widgetastic.execute_script('miqSparkleOff();', silent=True)
-            except:  # noqa
-                pass
+            health = br.widgetastic.plugin.page_health()
+        self.log_message('Page health: {}'.format(health), level='debug')
 
         # Check if the page is blocked with blocker_div. If yes, let's headshot the browser right
         # here
-        if (
-                br.widgetastic.is_displayed("//div[@id='blocker_div' or @id='notification']") or
-                br.widgetastic.is_displayed(".modal-backdrop.fade.in")):
+        if health.blocked:
             logger.warning("Page was blocked with blocker div on start of navigation, recycling.")
             self.appliance.browser.quit_browser()
             self.go(_tries, *args, **go_kwargs)
 
         # Check if modal window is displayed
-        if (br.widgetastic.is_displayed(
-                "//div[contains(@class, 'modal-dialog') and contains(@class, 'modal-lg')]")):
+        if health.modal:
             logger.warning("Modal window was open; closing the window")
             br.widgetastic.click(
                 "//button[contains(@class, 'close') and contains(@data-dismiss, 'modal')]")
 
-        # Check if jQuery present
-        try:
-            br.widgetastic.execute_script("jQuery", silent=True)
-        except Exception as e:
-            if "jQuery" not in str(e):
-                logger.error("Checked for jQuery but got something different.")
-                logger.exception(e)
+        # Check if jQuery present, an unknown page health is not reason enough to restart
+        if health.jquery is False:
             # Restart some workers
             logger.warning("Restarting UI and VimBroker workers!")
             with self.appliance.ssh_client as ssh:
@@ -337,8 +552,7 @@ class CFMENavigateStep(NavigateStep):
             self.go(_tries, *args, **go_kwargs)
 
         # Same with rails errors
-        view = br.widgetastic.create_view(ErrorView)
-        rails_e = view.get_rails_error()
+        rails_e = health.rails_error
 
         if rails_e is not None:
             logger.warning("Page was blocked by rails error, renavigating.")
@@ -380,10 +594,17 @@ class CFMENavigateStep(NavigateStep):
         restart_evmserverd = False
 
         try:
+            start = time.time()
             self.pre_badness_check(_tries, *args, **go_kwargs)
+            checked = time.time()
             self.log_message(
                 "Invoking {}, with {} and {}".format(fn.__name__, args, kwargs), level="debug")
-            return fn(*args, **kwargs)
+            result = fn(*args, **kwargs)
+            self.log_message(
+                "{} took {:.3f}s, the checks before it {:.3f}s".format(
+                    fn.__name__, time.time() - checked, checked - start),
+                level="debug")
+            return result
         except (KeyboardInterrupt, ValueError):
             # KeyboardInterrupt: Don't block this while navigating
             raise
@@ -532,7 +753,17 @@ class CFMENavigateStep(NavigateStep):
         except Exception as e:
             self.log_message(
                 "Exception raised [{}] whilst checking if already here".format(e), level="error")
-        if not here:
+        shortcut_key = self.shortcut_key(*args, **kwargs)
+        shortcut_used = False
+        if not here and shortcut_key is not None:
+            try:
+                shortcut_used = self.check_for_badness(
+                    self.jump_to_shortcut, _tries, nav_args, *args, **kwargs)
+            except Exception as e:
+                self.log_message(
+                    "Exception raised [{}] whilst jumping to the destination".format(e),
+                    level="error")
+        if not here and not shortcut_used:
             self.log_message("Prerequisite Needed")
             self.prerequisite_view = self.prerequisite()
             try:
@@ -549,6 +780,9 @@ class CFMENavigateStep(NavigateStep):
             self.check_for_badness(self.resetter, _tries, nav_args, *args, **kwargs)
         self.check_for_badness(self.post_navigate, _tries, nav_args, *args, **kwargs)
         view = self.view if self.VIEW is not None else None
+        if not here and not shortcut_used and shortcut_key is not None:
+            navigation_shortcuts.learn(
+                shortcut_key, self.appliance.browser.widgetastic.url, time.time() - start_time)
         duration = int((time.time() - start_time) * 1000)
         if view and nav_args['wait_for_view'] and not os.environ.get(
                 'DISABLE_NAVIGATE_ASSERT', False):
@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
 import re
+from collections import defaultdict
+from concurrent import futures
+
 import six
 import six.moves.xmlrpc_client
 from github import Github
+from github.Issue import Issue
 from six.moves.urllib.parse import urlparse
 
 from cfme.fixtures.pytest_store import store
@@ -20,6 +24,8 @@ class Blocker(object):
     """
     blocks = False
     kwargs = {}
+    #: :py:class:`cfme.utils.disk_cache.DiskCache` for the blocker data, None to not cache on disk
+    cache = None
 
     def __init__(self, **kwargs):
         self.forced_streams = kwargs.pop("forced_streams", [])
@@ -42,6 +48,19 @@ class Blocker(object):
             'JIRA': JIRA,
         }
 
+    @classmethod
+    def prefetch(cls, blockers):
+        """Loads the data of the blockers of this engine in bulk, so checking them is cheap"""
+
+    @classmethod
+    def prefetch_all(cls, blockers):
+        """Loads the data of the blockers of all engines in bulk"""
+        per_engine = defaultdict(list)
+        for blocker in blockers:
+            per_engine[type(blocker)].append(blocker)
+        for engine, engine_blockers in per_engine.items():
+            engine.prefetch(engine_blockers)
+
     @classmethod
     def parse(cls, blocker, **kwargs):
         """Create a blocker object from some representation"""
@@ -70,6 +89,8 @@ class Blocker(object):
 
 class GH(Blocker):
     DEFAULT_REPOSITORY = conf.env.get("github", {}).get("default_repo")
+    #: GitHub has no bulk issue lookup, so many issues are fetched by this many threads
+    FETCH_WORKERS = 8
     _issue_cache = {}
 
     @classproperty
@@ -113,12 +134,43 @@ class GH(Blocker):
         else:
             raise ValueError("GH issue specified wrong")
 
+    @property
+    def identifier(self):
+        return "{}:{}".format(self.repo, self.issue)
+
+    @classmethod
+    def _load(cls, repo, issue):
+        identifier = "{}:{}".format(repo, issue)
+        if identifier not in cls._issue_cache:
+            raw_data = cls.cache.get("gh-" + identifier) if cls.cache is not None else None
+            if raw_data is not None:
+                data = cls.github.create_from_raw_data(Issue, raw_data)
+            else:
+                data = cls.github.get_repo(repo).get_issue(issue)
+                if cls.cache is not None:
+                    cls.cache.set("gh-" + identifier, data.raw_data)
+            cls._issue_cache[identifier] = data
+        return cls._issue_cache[identifier]
+
+    @classmethod
+    def prefetch(cls, blockers):
+        issues = {(blocker.repo, blocker.issue) for blocker in blockers
+                  if blocker.identifier not in cls._issue_cache}
+        if not issues:
+            return
+        # get the client ready before the threads need it
+        cls.github
+        with futures.ThreadPoolExecutor(cls.FETCH_WORKERS) as executor:
+            for future in [executor.submit(cls._load, repo, issue) for repo, issue in issues]:
+                try:
+                    future.result()
+                except Exception as e:
+                    # the issue gets looked up again when the test needs it
+                    logger.warning("Could not prefetch a GitHub issue: %s", e)
+
     @property
     def data(self):
-        identifier = "{}:{}".format(self.repo, self.issue)
-        if identifier not in self._issue_cache:
-            self._issue_cache[identifier] = self.github.get_repo(self.repo).get_issue(self.issue)
-        return self._issue_cache[identifier]
+        return self._load(self.repo, self.issue)
 
     @property
     def blocks(self):
@@ -158,7 +210,7 @@ class BZ(Blocker):
     def bugzilla(cls):
         if not hasattr(cls, "_bugzilla"):
             try:
-                cls._bugzilla = Bugzilla.from_config()
+                cls._bugzilla = Bugzilla.from_config(cache=cls.cache)
             except KeyError:
                 return None
         return cls._bugzilla
@@ -168,6 +220,12 @@ class BZ(Blocker):
         super(BZ, self).__init__(**kwargs)
         self.bug_id = int(bug_id)
 
+    @classmethod
+    def prefetch(cls, blockers):
+        if cls.bugzilla is None:
+            return
+        cls.bugzilla.prefetch(blocker.bug_id for blocker in blockers)
+
     @property
     def data(self):
         return self.bugzilla.resolve_blocker(
@@ -217,6 +275,10 @@ class BZ(Blocker):
 
 
 class JIRA(Blocker):
+    #: Most issues looked up in one search
+    FETCH_BATCH = 100
+    _status_cache = {}
+
     @classproperty
     def jira(cls):  # noqa
         if not hasattr(cls, "_jira"):
@@ -231,6 +293,39 @@ class JIRA(Blocker):
         super(JIRA, self).__init__(**kwargs)
         self.jira_id = jira_id
 
+    @classmethod
+    def _set_status(cls, jira_id, status):
+        cls._status_cache[jira_id] = status
+        if cls.cache is not None:
+            cls.cache.set("jira-" + jira_id, status)
+
+    @classmethod
+    def _cached_status(cls, jira_id):
+        if jira_id not in cls._status_cache and cls.cache is not None:
+            status = cls.cache.get("jira-" + jira_id)
+            if status is not None:
+                cls._status_cache[jira_id] = status
+        return cls._status_cache.get(jira_id)
+
+    @classmethod
+    def prefetch(cls, blockers):
+        missing = sorted({blocker.jira_id for blocker in blockers
+                          if cls._cached_status(blocker.jira_id) is None})
+        # connecting takes a request, do not bother if everything is cached
+        jira = cls.jira if missing else None
+        if jira is None:
+            return
+        for start in range(0, len(missing), cls.FETCH_BATCH):
+            jql = "key in ({})".format(", ".join(missing[start:start + cls.FETCH_BATCH]))
+            try:
+                issues = jira.search_issues(jql, fields='status', maxResults=False)
+            except Exception as e:
+                # e.g. one of the keys does not exist, they get looked up one by one when needed
+                logger.warning("Could not prefetch the JIRA issues: %s", e)
+                continue
+            for issue in issues:
+                cls._set_status(issue.key, issue.fields.status.name)
+
     @property
     def url(self):
         try:
@@ -245,8 +340,11 @@ class JIRA(Blocker):
         if jira is None:
             # JIRA unspecified, shut up and don't block
             return False
-        issue = jira.issue(self.jira_id, fields='status')
-        return issue.fields.status.name.lower() != 'done'
+        status = self._cached_status(self.jira_id)
+        if status is None:
+            status = jira.issue(self.jira_id, fields='status').fields.status.name
+            self._set_status(self.jira_id, status)
+        return status.lower() != 'done'
 
     def __str__(self):
         return 'Jira card {}'.format(self.url)
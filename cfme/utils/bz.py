@@ -12,6 +12,8 @@ from cfme.utils.log import logger
 from cfme.utils.version import current_version, appliance_build_datetime, appliance_is_downstream
 
 NONE_FIELDS = {"---", "undefined", "unspecified"}
+#: Most bugs fetched in one XML-RPC call
+FETCH_BATCH = 100
 
 
 class Product(object):
@@ -47,9 +49,27 @@ class Product(object):
         return self.versions[-1]
 
 
+class _LazyConnection(object):
+    """Stands in for the connection of the bugs loaded from the cache, connects when needed"""
+    def __init__(self, bugzilla, url):
+        self._bugzilla = bugzilla
+        self.url = url
+
+    def __getattr__(self, attr):
+        return getattr(self._bugzilla.bugzilla, attr)
+
+
 class Bugzilla(object):
+    """Wrapper of the Bugzilla connection caching the bugs
+
+    Args:
+        product: name of the default product
+        cache: :py:class:`cfme.utils.disk_cache.DiskCache` for the bugs, shared between processes
+        **kwargs: passed to the connection
+    """
     def __init__(self, **kwargs):
         self.__product = kwargs.pop("product", None)
+        self.cache = kwargs.pop("cache", None)
         self.__kwargs = kwargs
         self.__bug_cache = {}
         self.__product_cache = {}
@@ -68,7 +88,13 @@ class Bugzilla(object):
 
     def product(self, product):
         if product not in self.__product_cache:
-            self.__product_cache[product] = self.products(product)[0]
+            key = "bz-product-{}".format(product)
+            data = self.cache.get(key) if self.cache is not None else None
+            if data is None:
+                data = self.bugzilla._proxy.Product.get({"names": [product]})["products"][0]
+                if self.cache is not None:
+                    self.cache.set(key, data)
+            self.__product_cache[product] = Product(data)
         return self.__product_cache[product]
 
     @property
@@ -78,7 +104,7 @@ class Bugzilla(object):
         return self.product(self.__product)
 
     @classmethod
-    def from_config(cls):
+    def from_config(cls, cache=None):
         bz_conf = env.get('bugzilla', {})  # default empty so we can call .get() later
         url = bz_conf.get('url')
         if url is None:
@@ -90,7 +116,8 @@ class Bugzilla(object):
                    password=credentials.get(cred_key, {}).get("password"),
                    cookiefile=None,
                    tokenfile=None,
-                   product=bz_conf.get("bugzilla", {}).get("product"))
+                   product=bz_conf.get("bugzilla", {}).get("product"),
+                   cache=cache)
 
     @cached_property
     def bugzilla(self):
@@ -111,12 +138,71 @@ class Bugzilla(object):
         else:
             return Version(cfme_data.get("bugzilla", {}).get("upstream_version", "9.9"))
 
+    def _cache_key(self, id):
+        return "bz-{}".format(id)
+
+    def _from_cache(self, ids):
+        """Loads the bugs found in the disk cache into the memory one"""
+        if self.cache is None:
+            return
+        cached = self.cache.get_many(self._cache_key(id) for id in ids)
+        for id in ids:
+            bug = cached.get(self._cache_key(id))
+            if bug is not None:
+                bug.bugzilla = _LazyConnection(self, self.__kwargs.get("url"))
+                self.__bug_cache[id] = BugWrapper(self, bug)
+
+    def _add_bug(self, bug):
+        if self.cache is not None:
+            self.cache.set(self._cache_key(bug.id), bug)
+        self.__bug_cache[int(bug.id)] = BugWrapper(self, bug)
+
     def get_bug(self, id):
         id = int(id)
         if id not in self.__bug_cache:
-            self.__bug_cache[id] = BugWrapper(self, self.bugzilla.getbug(id))
+            self._from_cache([id])
+        if id not in self.__bug_cache:
+            self._add_bug(self.bugzilla.getbug(id))
         return self.__bug_cache[id]
 
+    def get_bugs(self, ids):
+        """Loads the bugs into the cache, fetching those not cached yet in batches.
+
+        Bugs that cannot be fetched are left out, :py:meth:`get_bug` raises for them.
+        """
+        missing = sorted({int(id) for id in ids} - set(self.__bug_cache))
+        self._from_cache(missing)
+        missing = [id for id in missing if id not in self.__bug_cache]
+        for start in range(0, len(missing), FETCH_BATCH):
+            for bug in self.bugzilla.getbugs(missing[start:start + FETCH_BATCH]):
+                if bug is not None:
+                    self._add_bug(bug)
+        return {int(id): self.__bug_cache[int(id)] for id in ids if int(id) in self.__bug_cache}
+
+    def prefetch(self, ids):
+        """Loads the bugs and everything :py:meth:`get_bug_variants` looks at, in bulk.
+
+        The variant graph is walked level by level, every level takes a batched fetch of the
+        duplicates and originals and one of the bugs blocked, which may be copies.
+        """
+        expanded = set()
+        pending = {int(id) for id in ids}
+        while pending:
+            found = self.get_bugs(pending)
+            expanded.update(pending)
+            blocked = set()
+            next_pending = set()
+            for bug in found.values():
+                if bug.status == "CLOSED" and bug.resolution == "DUPLICATE":
+                    next_pending.add(int(bug.dupe_of))
+                if bug.copy_of:
+                    next_pending.add(bug.copy_of)
+                blocked.update(int(bug_id) for bug_id in bug._bug.blocks)
+            for bug_id, bug in self.get_bugs(blocked).items():
+                if bug.copy_of in found:
+                    next_pending.add(bug_id)
+            pending = next_pending - expanded
+
     def get_bug_variants(self, id):
         if isinstance(id, BugWrapper):
             bug = id
@@ -211,11 +297,11 @@ def check_fixed_in(fixed_in, version_series):
 
 
 class BugWrapper(object):
-    _copy_matchers = map(re.compile, [
+    _copy_matchers = list(map(re.compile, [
         r'^[+]{3}\s*This bug is a CFME zstream clone. The original bug is:\s*[+]{3}\n[+]{3}\s*'
         'https://bugzilla.redhat.com/show_bug.cgi\?id=(\d+)\.\s*[+]{3}',
         r"^\+\+\+ This bug was initially created as a clone of Bug #([0-9]+) \+\+\+"
-    ])
+    ]))
 
     def __init__(self, bugzilla, bug):
         self._bug = bug
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""A simple on-disk cache shared between processes, with values expiring after a while.
+
+Every value is pickled into its own file, named after its key, so processes writing different
+keys never step on each other and a value is replaced atomically. A value is considered expired
+``ttl`` seconds after it was written.
+"""
+import os
+import re
+import tempfile
+from time import time
+
+import attr
+from py.path import local
+from six.moves import cPickle as pickle
+
+from cfme.utils.log import logger
+
+
+@attr.s
+class DiskCache(object):
+    """Cache of picklable values in the ``path`` directory
+
+    Args:
+        path: directory of the cache, created when the first value is written
+        ttl: seconds the values stay valid for
+    """
+    path = attr.ib(converter=local)
+    ttl = attr.ib(default=3600)
+
+    def _file(self, key):
+        return self.path.join(re.sub(r'[^\w.-]', '_', str(key)))
+
+    def get(self, key, default=None):
+        """Returns the value stored under the key, or ``default`` if there is no valid one"""
+        cache_file = self._file(key)
+        try:
+            if time() - cache_file.mtime() > self.ttl:
+                return default
+            with cache_file.open('rb') as f:
+                return pickle.load(f)
+        except Exception:
+            # missing, written by an older version or by a process that got killed meanwhile
+            return default
+
+    def get_many(self, keys):
+        """Returns a dict of the keys which have a valid value stored"""
+        missing = object()
+        result = {}
+        for key in keys:
+            value = self.get(key, missing)
+            if value is not missing:
+                result[key] = value
+        return result
+
+    def set(self, key, value):
+        # written aside and renamed, so the readers never see a half-written value
+        tmp_name = None
+        try:
+            self.path.ensure(dir=True)
+            fd, tmp_name = tempfile.mkstemp(dir=str(self.path), prefix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=2)
+            os.rename(tmp_name, str(self._file(key)))
+        except Exception as e:
+            # the cache only saves time, never fail because of it
+            logger.warning('Could not write %s into the cache %s: %s', key, self.path, e)
+            if tmp_name is not None and os.path.exists(tmp_name):
+                os.remove(tmp_name)
+
+    def clear(self):
+        if self.path.check(dir=True):
+            self.path.remove(rec=1, ignore_errors=True)
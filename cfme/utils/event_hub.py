@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""Appliance-wide ingestion of ``event_streams`` rows.
+
+Every appliance has one :py:class:`EventHub` (``appliance.event_hub``), shared by all the event
+listeners created in the process. While at least one listener is subscribed, the hub runs a
+single background thread which fetches each new range of event ids exactly once and hands the
+rows to the listeners waiting for them, instead of every listener polling on its own.
+
+Pending expectations are indexed by their ``event_type`` and ``target_type``, so a row is only
+compared with the expectations that can possibly match it. Expectations with a custom
+``cmp_func`` (or without those attributes) go to the wildcard bucket of the index. Rows that
+arrive before an expectation can be matched, e.g. before its target is known, are kept and
+matched once it can.
+
+The source of the rows (REST API or database) is implemented by the subclasses:
+:py:class:`cfme.utils.events.RestEventHub` and :py:class:`cfme.utils.events_db.DbEventHub`.
+"""
+import threading
+from collections import defaultdict
+
+from cfme.utils.log import create_sublogger
+
+logger = create_sublogger('events')
+
+#: event attributes expectations are indexed by
+INDEX_ATTRS = ('event_type', 'target_type')
+
+
+def index_key(event):
+    """Index key of an expected event, ``None`` stands for any value"""
+    key = []
+    for name in INDEX_ATTRS:
+        attr = event.event_attrs.get(name)
+        if attr is None or not attr.value or attr.cmp_func:
+            key.append(None)
+        else:
+            key.append(attr.value)
+    return tuple(key)
+
+
+def candidate_keys(event_type, target_type):
+    """All index keys an event of this type and target type can match"""
+    return {(event_type, target_type), (event_type, None), (None, target_type), (None, None)}
+
+
+class EventHub(object):
+    """Fetches new ``event_streams`` rows once and fans them out to the subscribed listeners
+
+    All the public methods are thread-safe. Callbacks of the expectations are called from the
+    hub thread.
+
+    Args:
+        appliance: appliance to listen to
+    """
+    #: seconds between two fetches
+    interval = 1
+
+    def __init__(self, appliance):
+        self.appliance = appliance
+        self.stats = defaultdict(int)
+        self._lock = threading.RLock()
+        # (event_type, target_type) -> list of (listener, expectation dict)
+        self._index = defaultdict(list)
+        # listener -> id of the last row that happened before it subscribed
+        self._subscribers = {}
+        self._last_id = None
+        # (row, listener, expectation dict) waiting for the expectation to be prepared
+        self._deferred = []
+        self._thread = None
+        self._stop_event = None
+
+    # Source specific part
+    def latest_id(self):
+        """Id of the most recent row, 0 if there is none"""
+        raise NotImplementedError
+
+    def fetch(self, last_id):
+        """Return all the rows with id greater than ``last_id``, ordered by id"""
+        raise NotImplementedError
+
+    def row_id(self, row):
+        raise NotImplementedError
+
+    def row_keys(self, row):
+        """``(event_type, target_type)`` of a row"""
+        raise NotImplementedError
+
+    def build_event(self, row):
+        """Build the event object the expectations are matched with"""
+        raise NotImplementedError
+
+    def prepare(self, exp_event):
+        """Called before the expected event is matched, returns False if it can't match yet
+
+        It is called without holding the hub lock, so it may do lookups on the appliance. The rows
+        an expectation could not be matched with yet are kept and matched once it is prepared.
+        """
+        return True
+
+    def wait(self, stop_event):
+        """Block until the next fetch is due"""
+        stop_event.wait(self.interval)
+
+    def close(self):
+        """Release what the source set up for waiting, called when the hub thread stops"""
+
+    # Subscriptions
+    def subscribe(self, listener):
+        """Start delivering events to the listener, starts the hub thread if needed"""
+        latest_id = self.latest_id()
+        with self._lock:
+            self._subscribers[listener] = latest_id
+            if self._thread is None:
+                self._last_id = latest_id
+                self._start()
+        logger.info('%r subscribed to the event hub of %s', listener, self.appliance)
+
+    def unsubscribe(self, listener):
+        """Stop delivering events to the listener, stops the hub thread if it was the last one"""
+        with self._lock:
+            self.discard(listener)
+            self._subscribers.pop(listener, None)
+            thread = None
+            if not self._subscribers and self._thread is not None:
+                thread = self._thread
+                self._stop_event.set()
+                self._thread = self._stop_event = None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        logger.info('%r unsubscribed from the event hub of %s', listener, self.appliance)
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def add(self, listener, exp_event):
+        """Register an expectation (a listener's ``_events_to_listen`` item)"""
+        with self._lock:
+            self._index[index_key(exp_event['event'])].append((listener, exp_event))
+
+    def discard(self, listener):
+        """Forget all the expectations of the listener"""
+        with self._lock:
+            for key in list(self._index):
+                self._index[key] = [entry for entry in self._index[key] if entry[0] is not listener]
+                if not self._index[key]:
+                    del self._index[key]
+
+    # Ingestion
+    def _start(self):
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(self._stop_event,), name='event-hub-{}'.format(id(self)))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, stop_event):
+        try:
+            while not stop_event.is_set():
+                try:
+                    self.poll()
+                except Exception:
+                    logger.exception('An exception occurred while ingesting events')
+                self.wait(stop_event)
+        finally:
+            try:
+                self.close()
+            except Exception:
+                logger.exception('An exception occurred while closing the event hub')
+
+    def _prepare_all(self):
+        """Prepare the registered expectations, returns the ids of the ready ones"""
+        with self._lock:
+            expectations = [exp_event for entries in self._index.values()
+                            for _, exp_event in entries]
+        ready = set()
+        for exp_event in expectations:
+            try:
+                if self.prepare(exp_event['event']):
+                    ready.add(id(exp_event))
+            except Exception:
+                logger.exception('An exception occurred while preparing %r', exp_event['event'])
+        return ready
+
+    def poll(self):
+        """Fetch the new rows and dispatch them, returns the number of rows fetched"""
+        rows = self.fetch(self._last_id)
+        self.stats['fetches'] += 1
+        self.stats['rows'] += len(rows)
+        ready = self._prepare_all() if rows or self._deferred else set()
+        with self._lock:
+            self._retry_deferred(ready)
+            for row in rows:
+                self._dispatch(row, ready)
+                self._last_id = self.row_id(row)
+        return len(rows)
+
+    def _registered(self, listener, exp_event):
+        return listener in self._subscribers and any(
+            entry is exp_event for _, entry in self._index.get(index_key(exp_event['event']), ()))
+
+    def _retry_deferred(self, ready):
+        deferred, self._deferred = self._deferred, []
+        built = {}
+        for row, listener, exp_event in deferred:
+            if not self._registered(listener, exp_event):
+                continue
+            if id(exp_event) not in ready:
+                self._deferred.append((row, listener, exp_event))
+                continue
+            self._match(row, built, exp_event)
+
+    def _dispatch(self, row, ready):
+        row_id = self.row_id(row)
+        candidates = []
+        for key in candidate_keys(*self.row_keys(row)):
+            candidates.extend(self._index.get(key, ()))
+        built = {}
+        for listener, exp_event in candidates:
+            if row_id <= self._subscribers.get(listener, row_id):
+                # happened before the listener subscribed
+                continue
+            if id(exp_event) not in ready:
+                # e.g. the target is not known yet, the row is matched once it is
+                self._deferred.append((row, listener, exp_event))
+                self.stats['deferred'] += 1
+                continue
+            self._match(row, built, exp_event)
+
+    def _match(self, row, built, exp_event):
+        if exp_event['first_event'] and exp_event['matched_events']:
+            return
+        row_id = self.row_id(row)
+        if row_id not in built:
+            built[row_id] = self.build_event(row)
+        got_event = built[row_id]
+        try:
+            if not exp_event['event'].matches(got_event):
+                return
+            if exp_event['callback']:
+                exp_event['callback'](exp_event=exp_event['event'], got_event=got_event)
+        except Exception:
+            logger.exception('An exception during matching events occurred.')
+            return
+        exp_event['matched_events'].append(got_event)
+        self.stats['matches'] += 1
+
+
+class HubEventListener(object):
+    """Base of the event listeners, keeps the expected events of one consumer
+
+    The listener itself does not poll anything, it subscribes to the ``appliance.event_hub`` when
+    started and the hub fills the ``matched_events`` of its expectations.
+    """
+    def __init__(self, appliance):
+        self._appliance = appliance
+        self._events_to_listen = []
+        self._started = False
+
+    @property
+    def hub(self):
+        return self._appliance.event_hub
+
+    def new_event(self, *attrs, **kwattrs):
+        raise NotImplementedError
+
+    def _add_expectation(self, evt, callback, first_event):
+        exp_event = {'event': evt,
+                     'callback': callback,
+                     'matched_events': [],
+                     'first_event': first_event}
+        self._events_to_listen.append(exp_event)
+        if self._started:
+            self.hub.add(self, exp_event)
+        logger.info("event {} is added to listening queue.".format(evt))
+
+    def start(self):
+        self.hub.subscribe(self)
+        for exp_event in self._events_to_listen:
+            self.hub.add(self, exp_event)
+        self._started = True
+        logger.info('Event Listener has been started')
+
+    def stop(self):
+        self._started = False
+        self.hub.unsubscribe(self)
+        logger.info('Event Listener has been stopped')
+
+    @property
+    def started(self):
+        return self._started
+
+    @property
+    def got_events(self):
+        """ Returns dict with expected events and all the events matched to expected ones."""
+        evts = [(evt['event'], len(evt['matched_events'])) for evt in self._events_to_listen]
+        logger.info(evts)
+        return self._events_to_listen
+
+    def reset_events(self):
+        self.hub.discard(self)
+        self._events_to_listen = []
+
+    def check_expected_events(self):
+        """ Checks that all expected events has arrived."""
+        return all([len(event['matched_events']) for event in self.got_events])
+
+    def __call__(self, *args, **kwargs):
+        """
+        it is called by register_event fixture.
+        bad idea, to replace register_event by object later
+        """
+        if 'first_event' in kwargs:
+            first_event = kwargs.pop('first_event')
+        else:
+            first_event = True
+        evt = self.new_event(*args, **kwargs)
+        logger.info("registering event: {}".format(evt))
+        self.listen_to(evt, callback=None, first_event=first_event)
@@ -4,9 +4,7 @@
 
 """
 
-from time import sleep
-from threading import Thread, Event as ThreadEvent
-
+from cfme.utils.event_hub import EventHub, HubEventListener
 from cfme.utils.log import create_sublogger
 from manageiq_client.filters import Q
 
@@ -22,7 +20,7 @@ class EventAttr(object):
         if len(attrs) > 1:
             raise ValueError('event attribute can have only one key=value pair')
 
-        self.name, self.value = attrs.items()[0]
+        (self.name, self.value), = attrs.items()
         self.type = attr_type or type(self.value)
         self.cmp_func = cmp_func
 
@@ -93,8 +91,8 @@ class Event(object):
                 self.event_attrs['target_id'] = EventAttr(**{'target_id': o[0].id})
 
             except ValueError:
-                # Target isn't added yet. Need to wait
-                sleep(1)
+                # Target isn't added yet, it is resolved again with the next event
+                pass
 
     def matches(self, evt):
         """ Compares common attributes of expected event and passed event."""
@@ -118,31 +116,56 @@ class Event(object):
         return self
 
 
-class RestEventListener(Thread):
-    """ EventListener accepts "expected" events, listens to db events and compares matched events
-    with expected events. Runs callback function if expected events have it.
+class RestEventHub(EventHub):
+    """ :py:class:`cfme.utils.event_hub.EventHub` reading the ``event_streams`` REST collection.
 
-    :var FILTER_ATTRS: List of filters used in REST API call
+    New events are fetched in pages of :py:attr:`page_size` rows with one expanded query each,
+    so neither the number of listeners nor the number of their expected events adds requests.
     """
-    FILTER_ATTRS = ['event_type', 'target_type', 'target_id', 'source']
-
-    def __init__(self, appliance):
-        super(RestEventListener, self).__init__()
-        self._appliance = appliance
-        self._events_to_listen = []
-        self._last_processed_id = 0  # this is used to filter out old or processed events
-        self._stop_event = ThreadEvent()
-
-        self.event_streams = appliance.rest_api.collections.event_streams
-
-    def set_last_record(self):
-        """ Sets last_processed_id to the latest event."""
-        last_event_stream = self.event_streams.query_string(limit=1,
-                                                            sort_order='desc',
-                                                            sort_by='id')
-        if len(last_event_stream):
-            self._last_processed_id = last_event_stream[0].id
+    page_size = 500
 
+    @property
+    def event_streams(self):
+        return self.appliance.rest_api.collections.event_streams
+
+    def _query(self, **params):
+        # expanded resources carry their data, iterating the result would GET each of them
+        return self.event_streams.query_string(expand='resources', **params).resources
+
+    def latest_id(self):
+        resources = self._query(limit=1, sort_order='desc', sort_by='id')
+        return self.row_id(resources[0]) if resources else 0
+
+    def fetch(self, last_id):
+        rows = []
+        while True:
+            page = self._query(limit=self.page_size, sort_order='asc', sort_by='id',
+                               **{'filter[]': Q('id', '>', last_id).as_filters})
+            rows.extend(page)
+            if len(page) < self.page_size:
+                return rows
+            last_id = self.row_id(page[-1])
+
+    def row_id(self, row):
+        return int(row._data['id'])
+
+    def row_keys(self, row):
+        return row._data.get('event_type'), row._data.get('target_type')
+
+    def build_event(self, row):
+        return Event(self.appliance).build_from_entity(row)
+
+    def prepare(self, exp_event):
+        # an expectation with an unresolved target_name would match events of any target
+        exp_event.process_id()
+        return 'target_name' not in exp_event.event_attrs or 'target_id' in exp_event.event_attrs
+
+
+class RestEventListener(HubEventListener):
+    """ EventListener accepts "expected" events and collects the events matched with them by the
+    appliance's :py:class:`RestEventHub`. The hub runs callback functions if expected events
+    have them.
+    """
     def new_event(self, *attrs, **kwattrs):
         """ This method simplifies "expected" event creation.
 
@@ -180,108 +203,6 @@ class RestEventListener(Thread):
 
         for evt in evts:
             if isinstance(evt, Event):
-                exp_event = {'event': evt,
-                             'callback': callback,
-                             'matched_events': [],
-                             'first_event': first_event}
-                self._events_to_listen.append(exp_event)
-                logger.info("event {} is added to listening queue.".format(evt))
+                self._add_expectation(evt, callback, first_event)
             else:
                 raise ValueError("one of events doesn't belong to Event class")
-
-    def start(self):
-        self.set_last_record()
-        self._stop_event.clear()
-        super(RestEventListener, self).start()
-        logger.info('Event Listener has been started')
-
-    def stop(self):
-        self._stop_event.set()
-        logger.info('Event Listener has been stopped')
-
-    @property
-    def started(self):
-        return super(RestEventListener, self).is_alive()
-
-    def run(self):
-        """ Overrides ThreadEvent run to continuously process events"""
-        self.process_events()
-
-    def process_events(self):
-        """ Processes all new events and compares them with expected events.
-
-        Processed events are ignored next time.
-        """
-        while not self._stop_event.is_set():
-            sleep(1)
-            for exp_event in self._events_to_listen:
-
-                # Skip if event has occurred
-                if exp_event['first_event'] and len(exp_event['matched_events']):
-                    continue
-
-                matched_events = self.get_next_portion(exp_event['event'])
-
-                if not matched_events:
-                    continue
-
-                # Match events
-                try:
-                    for event_entity in matched_events:
-                            got_event = Event(self._appliance).build_from_entity(event_entity)
-                            if exp_event['event'].matches(got_event):
-                                if exp_event['callback']:
-                                    exp_event['callback'](exp_event=exp_event['event'],
-                                                          got_event=got_event)
-                                exp_event['matched_events'].append(got_event)
-                    self._last_processed_id = got_event.event_attrs['id'].value
-                except Exception:
-                    logger.exception("An exception during matching events occurred.")
-
-                if self._stop_event.is_set():
-                    break
-
-    def get_next_portion(self, evt):
-        """ Returns list with one or more events matched with expected event.
-
-        Returns None if there is no matched events."""
-        evt.process_id()
-
-        q = Q('id', '>', self._last_processed_id)  # ensure we get only new events
-
-        used_filters = set(self.FILTER_ATTRS).intersection(set(evt.event_attrs))
-        for filter_attr in used_filters:
-            evt_attr = evt.event_attrs[filter_attr]
-            if evt_attr.value:
-                q &= Q(filter_attr, '=', evt_attr.value)
-        result = self.event_streams.filter(q)
-
-        if len(result):
-            return result
-
-    @property
-    def got_events(self):
-        """ Returns dict with expected events and all the events matched to expected ones."""
-        evts = [(evt['event'], len(evt['matched_events'])) for evt in self._events_to_listen]
-        logger.info(evts)
-        return self._events_to_listen
-
-    def reset_events(self):
-        self._events_to_listen = []
-
-    def check_expected_events(self):
-        """ Checks that all expected events has arrived."""
-        return all([len(event['matched_events']) for event in self.got_events])
-
-    def __call__(self, *args, **kwargs):
-        """
-        it is called by register_event fixture.
-        bad idea, to replace register_event by object later
-        """
-        if 'first_event' in kwargs:
-            first_event = kwargs.pop('first_event')
-        else:
-            first_event = True
-        evt = self.new_event(*args, **kwargs)
-        logger.info("registering event: {}".format(evt))
-        self.listen_to(evt, callback=None, first_event=first_event)
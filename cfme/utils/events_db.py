@@ -3,15 +3,16 @@
 """Library for event testing.
 """
 
+import select
+
 from cached_property import cached_property
 from contextlib import contextmanager
 from collections import Iterable
 from datetime import datetime
 from numbers import Number
 from sqlalchemy.sql.expression import func
-from time import sleep
-from threading import Thread, Event as ThreadEvent
 
+from cfme.utils.event_hub import EventHub, HubEventListener
 from cfme.utils.log import create_sublogger
 
 logger = create_sublogger('events')
@@ -156,7 +157,7 @@ class EventAttr(object):
         if len(attrs) > 1:
             raise ValueError('event attribute can have only one key=value pair')
 
-        self.name, self.value = attrs.items()[0]
+        (self.name, self.value), = attrs.items()
         self.type = attr_type or type(self.value)
         self.cmp_func = cmp_func
 
@@ -281,33 +282,147 @@ class Event(object):
         return self
 
 
-class DbEventListener(Thread):
+class DbEventHub(EventHub):
     """
-     accepts "expected" events, listens to db events and compares showed up events with expected
-     events. Runs callback function if expected events have it.
+    :py:class:`cfme.utils.event_hub.EventHub` reading the ``event_streams`` table.
+
+    All the new rows are fetched with one query per poll. If the database allows it, a trigger
+    notifying the hub's channel of every inserted row is installed and the hub sleeps in
+    ``LISTEN`` until a row arrives, otherwise it polls every :py:attr:`poll_interval` seconds.
+    The trigger and its function are named after the backend pid of the listening connection and
+    dropped when the hub stops. The ones left behind by a process which died are dropped by the
+    next hub listening, once their backend is gone.
     """
-    def __init__(self, appliance):
-        super(DbEventListener, self).__init__()
-        self._appliance = appliance
-        self._tool = EventTool(self._appliance)
-
-        self._events_to_listen = []
-        # last_id is used to ignore already arrived messages the database
-        # When database is "cleared" the id of the last event is placed here. That is then used
-        # in queries to prevent events of this id and earlier to get in.
-        self._last_processed_id = None
-        self._stop_event = ThreadEvent()
-
-    def set_last_record(self, evt=None):
-        if evt:
-            self._last_processed_id = evt.event_attrs['id'].value
-        else:
+    NOTIFY_SQL = """
+        CREATE OR REPLACE FUNCTION {name}() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('{name}', NEW.id::text);
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+        CREATE TRIGGER {name} AFTER INSERT ON event_streams
+            FOR EACH ROW EXECUTE PROCEDURE {name}();
+    """
+    UNNOTIFY_SQL = """
+        DROP TRIGGER IF EXISTS {name} ON event_streams;
+        DROP FUNCTION IF EXISTS {name}();
+    """
+    #: the notify triggers whose listening connection is closed
+    STALE_SQL = """
+        SELECT tgname FROM pg_trigger
+        WHERE tgrelid = 'event_streams'::regclass AND tgname LIKE 'cfme_tests_notify%'
+            AND coalesce(substring(tgname from '^cfme_tests_notify_([0-9]+)$')::int, 0)
+                NOT IN (SELECT pid FROM pg_stat_activity)
+    """
+    #: seconds between two fetches when notifications are not available
+    poll_interval = 0.2
+
+    def __init__(self, appliance, notify=True):
+        super(DbEventHub, self).__init__(appliance)
+        self.tool = EventTool(appliance)
+        self.notify = notify
+        self._notify_conn = None
+        #: name of the trigger, its function and the channel, set once listening
+        self.notify_name = None
+
+    def latest_id(self):
+        return self.tool.query(func.max(self.tool.event_streams.id)).scalar() or 0
+
+    def fetch(self, last_id):
+        logger.debug("obtaining next portion of events")
+        table = self.tool.event_streams
+        return self.tool.query(table).filter(table.id > last_id).order_by(table.id).all()
+
+    def row_id(self, row):
+        return row.id
+
+    def row_keys(self, row):
+        return row.event_type, row.target_type
+
+    def build_event(self, row):
+        return Event(event_tool=self.tool).build_from_raw_event(row)
+
+    def prepare(self, exp_event):
+        # resolved here rather than in Event.matches, which runs under the hub lock
+        attrs = exp_event.event_attrs
+        if 'target_name' in attrs and 'target_id' not in attrs:
+            try:
+                target_id = self.tool.process_id(attrs['target_type'].value,
+                                                 attrs['target_name'].value)
+            except ValueError:
+                # the vm or host is not in the db yet
+                return False
+            except TypeError:
+                # such a target is never resolved, the rows are matched (and fail) right away
+                # rather than wait forever
+                logger.error('Cannot resolve the target of %r', exp_event, exc_info=True)
+                return True
+            attrs['target_id'] = EventAttr(**{'target_id': target_id})
+        return True
+
+    def _listen(self):
+        conn = self.appliance.db.client.engine.raw_connection()
+        try:
+            conn.connection.autocommit = True
+            cursor = conn.connection.cursor()
+            cursor.execute('SELECT pg_backend_pid()')
+            self.notify_name = 'cfme_tests_notify_{}'.format(cursor.fetchone()[0])
+            self._drop_stale(cursor)
+            cursor.execute(self.NOTIFY_SQL.format(name=self.notify_name))
+            cursor.execute('LISTEN {}'.format(self.notify_name))
+        except Exception:
+            self._unlisten(conn)
+            raise
+        return conn
+
+    def _drop_stale(self, cursor):
+        cursor.execute(self.STALE_SQL)
+        for name, in cursor.fetchall():
+            logger.info('Dropping the trigger %s left behind by a hub', name)
+            cursor.execute(self.UNNOTIFY_SQL.format(name=name))
+
+    def _unlisten(self, conn):
+        try:
+            if self.notify_name is not None:
+                conn.connection.cursor().execute(self.UNNOTIFY_SQL.format(name=self.notify_name))
+                self.notify_name = None
+        except Exception:
+            logger.warning('Could not drop the trigger %s', self.notify_name, exc_info=True)
+        finally:
+            # autocommit must not leak into the connection pool
+            conn.invalidate()
+
+    def wait(self, stop_event):
+        if self.notify and self._notify_conn is None:
             try:
-                self._last_processed_id = self._tool.query(
-                    func.max(self._tool.event_streams.id)).one()
-            except IndexError:
-                # No events yet, so do nothing
-                pass
+                self._notify_conn = self._listen()
+            except Exception:
+                logger.warning('Cannot LISTEN to new events, falling back to polling',
+                               exc_info=True)
+                self.notify = False
+        if self._notify_conn is None:
+            stop_event.wait(self.poll_interval)
+            return
+        connection = self._notify_conn.connection
+        # the timeout keeps the thread responsive to being stopped
+        if select.select([connection], [], [], self.interval)[0]:
+            connection.poll()
+            del connection.notifies[:]
+
+    def close(self):
+        if self._notify_conn is not None:
+            conn, self._notify_conn = self._notify_conn, None
+            self._unlisten(conn)
+
+
+class DbEventListener(HubEventListener):
+    """
+     accepts "expected" events and collects the events matched with them by the appliance's
+     :py:class:`DbEventHub`. The hub runs callback functions if expected events have them.
+    """
+    @property
+    def _tool(self):
+        return self.hub.tool
 
     def new_event(self, *attrs, **kwattrs):
         """
@@ -355,93 +470,12 @@ class DbEventListener(Thread):
         if isinstance(evts, Iterable):
             for evt in evts:
                 if isinstance(evt, Event):
-                    logger.info("event {} is added to listening queue".format(evt))
-                    self._events_to_listen.append({'event': evt,
-                                                   'callback': callback,
-                                                   'matched_events': [],
-                                                   'first_event': first_event})
+                    self._add_expectation(evt, callback, first_event)
                 else:
                     raise ValueError("one of events doesn't belong to Event class")
         else:
             raise ValueError('incorrect is passed')
 
-    def start(self):
-        logger.info('Event Listener has been started')
-        self.set_last_record()
-        self._stop_event.clear()
-        super(DbEventListener, self).start()
-
-    def stop(self):
-        logger.info('Event Listener has been stopped')
-        self._stop_event.set()
-
-    def run(self):
-        self.process_events()
-
-    @property
-    def started(self):
-        return super(DbEventListener, self).is_alive()
-
-    def process_events(self):
-        """
-        processes all new db events and compares them with expected events.
-        processed events are ignored next time
-        """
-        while not self._stop_event.is_set():
-            events = self.get_next_portion()
-            if len(events) == 0:
-                sleep(0.2)
-                continue
-            for got_event in events:
-                logger.debug("processing event id {}".format(got_event.id))
-                got_event = Event(event_tool=self._tool).build_from_raw_event(got_event)
-                for exp_event in self._events_to_listen:
-                    if exp_event['first_event'] and len(exp_event['matched_events']) > 0:
-                        continue
-
-                    if exp_event['event'].matches(got_event):
-                        if exp_event['callback']:
-                            exp_event['callback'](exp_event=exp_event['event'], got_event=got_event)
-                        exp_event['matched_events'].append(got_event)
-                self.set_last_record(got_event)
-
-                if self._stop_event.is_set():
-                    break
-
-    @property
-    def got_events(self):
-        """
-        returns dict with expected events and all the events matched to expected ones
-        """
-        evts = [(evt['event'], len(evt['matched_events'])) for evt in self._events_to_listen]
-        logger.info(evts)
-        return self._events_to_listen
-
     def reset_matches(self):
         for event in self._events_to_listen:
             event['matched_events'] = []
-
-    def reset_events(self):
-        self._events_to_listen = []
-
-    def get_next_portion(self):
-        logger.debug("obtaining next portion of events")
-        return self._tool.query(self._tool.event_streams)\
-            .filter(self._tool.event_streams.id > self._last_processed_id)\
-            .order_by(self._tool.event_streams.id).yield_per(100).all()
-
-    def check_expected_events(self):
-        return all([len(event['matched_events']) for event in self.got_events])
-
-    def __call__(self, *args, **kwargs):
-        """
-        it is called by register_event fixture.
-        bad idea, to replace register_event by object later
-        """
-        if 'first_event' in kwargs:
-            first_event = kwargs.pop('first_event')
-        else:
-            first_event = True
-        evt = self.new_event(*args, **kwargs)
-        logger.info("registering event: {}".format(evt))
-        self.listen_to(evt, callback=None, first_event=first_event)
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""Background health checks of an appliance.
+
+Every appliance has one :py:class:`HealthMonitor` (``appliance.health_monitor``). Once started,
+it probes the SSH, HTTPS and Postgres ports, the UI and the API of the appliance concurrently,
+every :py:attr:`HealthMonitor.interval` seconds, and publishes the result as a timestamped
+:py:class:`HealthState`. The ``appliance_police`` fixture only consults that state and blocks on
+a fresh probe when it is stale or unhealthy, instead of probing the appliance before every test.
+
+The UI workers are probed with the login page, the API workers with ``/api/ping``, both over a
+keep-alive session. A server answering with an authentication error is up, see
+:py:data:`HEALTHY_STATUS_CODES`. Appliances without the ping endpoint only get the UI probe.
+:py:attr:`HealthState.api_only` tells a failure of the API workers alone apart. The
+latencies of the last probes are kept for the diagnostics, see
+:py:meth:`HealthMonitor.latency_stats`.
+"""
+import socket
+import threading
+from collections import deque, OrderedDict
+from concurrent import futures
+from time import time
+
+import attr
+import requests
+
+from cfme.utils.log import create_sublogger
+
+logger = create_sublogger('health')
+
+#: seconds a TCP or API probe waits for the appliance
+PROBE_TIMEOUT = 10
+#: seconds the UI probe waits for the login page, which is slow to render on a busy appliance
+UI_PROBE_TIMEOUT = 120
+#: status codes of a working UI or API, an authentication error is an answer of the workers too
+HEALTHY_STATUS_CODES = (200, 401, 403)
+
+
+@attr.s(frozen=True)
+class ProbeResult(object):
+    """Outcome of one probe, ``latency`` in seconds"""
+    name = attr.ib()
+    port = attr.ib()
+    ok = attr.ib()
+    latency = attr.ib()
+    taken = attr.ib()
+    error = attr.ib(default=None)
+
+
+@attr.s(frozen=True)
+class HealthState(object):
+    """Results of the probes run at the same time, by probe name"""
+    taken = attr.ib()
+    probes = attr.ib()
+
+    @property
+    def healthy(self):
+        return all(result.ok for result in self.probes.values())
+
+    @property
+    def failures(self):
+        return [result for result in self.probes.values() if not result.ok]
+
+    @property
+    def api_only(self):
+        """Whether only the API probe failed, the UI and all the ports are fine"""
+        return [result.name for result in self.failures] == ['api']
+
+    def age(self, now=None):
+        return (now or time()) - self.taken
+
+
+def tcp_probe(addr, port, timeout=PROBE_TIMEOUT):
+    """Connects to the port and closes the connection again, raises if it is not reachable"""
+    sock = socket.create_connection((socket.gethostbyname(addr), int(port)), timeout=timeout)
+    sock.close()
+
+
+def status_error(status_code):
+    """The error of an HTTP probe answered with the status code, None if it is healthy"""
+    if status_code not in HEALTHY_STATUS_CODES:
+        return 'Status code was {}, should be 200'.format(status_code)
+    return None
+
+
+class HealthMonitor(object):
+    """Probes the appliance on a schedule and keeps the latest :py:class:`HealthState`
+
+    :py:meth:`current` and :py:meth:`probe` are thread-safe, probes requested while another one
+    is running wait for it and share its result.
+
+    Args:
+        appliance: appliance to monitor
+    """
+    #: seconds between two probes of the background thread
+    interval = 20
+    #: seconds after which :py:meth:`current` does not trust the state any more
+    max_age = 60
+    #: number of results kept per probe
+    history_size = 100
+
+    def __init__(self, appliance):
+        self.appliance = appliance
+        self.state = None
+        self.history = {}
+        self._session = requests.Session()
+        self._session.verify = False
+        # False once the API probe found out that there is no /api/ping
+        self._ping = None
+        self._probe_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = None
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self.appliance)
+
+    # Probes
+    def targets(self):
+        """Probe name to the ``(address, port)`` to connect to"""
+        appliance = self.appliance
+        targets = OrderedDict()
+        if not appliance.is_pod:
+            # ssh is not available for podified appliance
+            targets['ssh'] = (appliance.hostname, appliance.ssh_port)
+        targets['https'] = (appliance.hostname, appliance.ui_port)
+        targets['postgres'] = (appliance.db_host or appliance.hostname, appliance.db_port)
+        return targets
+
+    def _status_code(self, url, timeout=PROBE_TIMEOUT):
+        return self._session.get(url, timeout=timeout).status_code
+
+    def _run_probe(self, name, port, func, *args):
+        start = time()
+        try:
+            error = func(*args)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        return ProbeResult(name, port, ok=error is None, latency=time() - start, taken=start,
+                           error=error)
+
+    def _tcp(self, addr, port):
+        tcp_probe(addr, port)
+
+    def _web(self):
+        """The login page, served by the UI workers"""
+        try:
+            status_code = self._status_code(self.appliance.url, timeout=UI_PROBE_TIMEOUT)
+        except Exception as e:
+            return 'Getting status code failed: {}'.format(e)
+        return status_error(status_code)
+
+    def _api(self):
+        """``/api/ping``, served by the API workers"""
+        try:
+            status_code = self._status_code('{}/ping'.format(self.appliance.url_path('/api')))
+        except Exception as e:
+            return 'Getting status code failed: {}'.format(e)
+        if status_code == 404:
+            logger.info('%r: no /api/ping, not probing the API', self)
+            self._ping = False
+            return None
+        self._ping = True
+        return status_error(status_code)
+
+    def _probe(self):
+        targets = self.targets()
+        calls = [(name, port, self._tcp, addr, port) for name, (addr, port) in targets.items()]
+        calls.append(('web', targets['https'][1], self._web))
+        if self._ping is not False:
+            calls.append(('api', targets['https'][1], self._api))
+        with futures.ThreadPoolExecutor(len(calls)) as executor:
+            results = list(executor.map(lambda call: self._run_probe(*call), calls))
+        state = HealthState(time(), OrderedDict((result.name, result) for result in results))
+        with self._lock:
+            for result in results:
+                self.history.setdefault(
+                    result.name, deque(maxlen=self.history_size)).append(result)
+            self.state = state
+        if not state.healthy:
+            logger.warning('%r: unhealthy, %s', self, ', '.join(
+                '{} {}'.format(result.name, result.error) for result in state.failures))
+        return state
+
+    def probe(self):
+        """Probes the appliance now, returns the new :py:class:`HealthState`"""
+        requested = time()
+        with self._probe_lock:
+            state = self.state
+            if state is not None and state.taken >= requested:
+                # probed while we were waiting
+                return state
+            return self._probe()
+
+    def current(self, max_age=None):
+        """The published state if it is fresh and healthy, the state of a new probe otherwise"""
+        state = self.state
+        max_age = self.max_age if max_age is None else max_age
+        if state is None or not state.healthy or state.age() > max_age:
+            state = self.probe()
+        return state
+
+    def invalidate(self):
+        """Forget the published state, e.g. after the appliance was restarted"""
+        with self._lock:
+            self.state = None
+
+    # Diagnostics
+    def latency_stats(self):
+        """Probe name to the number of results, failures and min/avg/max latency kept"""
+        with self._lock:
+            history = {name: list(results) for name, results in self.history.items()}
+        stats = OrderedDict()
+        for name in sorted(history):
+            latencies = [result.latency for result in history[name]]
+            stats[name] = {
+                'count': len(latencies),
+                'failures': sum(1 for result in history[name] if not result.ok),
+                'min': min(latencies),
+                'avg': sum(latencies) / len(latencies),
+                'max': max(latencies)}
+        return stats
+
+    # Background thread
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        """Start probing in the background, does nothing if it already does"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop_event = threading.Event()
+            self._thread = threading.Thread(
+                target=self._run, args=(self._stop_event,),
+                name='health-monitor-{}'.format(id(self)))
+            self._thread.daemon = True
+            self._thread.start()
+        logger.info('%r: probing every %ss', self, self.interval)
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._stop_event.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _run(self, stop_event):
+        while not stop_event.is_set():
+            try:
+                self.probe()
+            except Exception:
+                logger.exception('%r: probing failed', self)
+            stop_event.wait(self.interval)
@@ -133,7 +133,10 @@ Members
 import inspect
 import logging
 import sys
+import threading
 import warnings
+from collections import defaultdict, deque
+from contextlib import contextmanager
 from time import time
 from traceback import extract_tb, format_tb
 
@@ -431,22 +434,139 @@ def nth_frame_info(n):
     return inspect.getframeinfo(inspect.stack(1)[n][0])
 
 
+#: Fields of the compact log records shipped to the artifactor ``log_messages`` hook, in order
+LOG_RECORD_FIELDS = (
+    'name', 'levelno', 'levelname', 'msg', 'created', 'msecs', 'pathname', 'lineno', 'exc_text')
+
+
 class ArtifactorHandler(logging.Handler):
-    """Logger handler that hands messages off to the artifactor"""
+    """Logger handler that hands messages off to the artifactor
+
+    Records are turned into compact lists (see :py:data:`LOG_RECORD_FIELDS`) and queued in a
+    bounded buffer, a background thread ships them to the artifactor in batches. :py:meth:`flush`
+    ships everything queued so far, it is called before every artifactor hook so the log lines
+    end up in the right test. The batches are queued on the artifactor client with the other
+    hooks, so they reach the artifactor in the same order. The client only keeps a bounded number
+    of batches waiting too, see :py:class:`artifactor.ArtifactorClient`.
+
+    Emitting never blocks on the artifactor. When the buffer is full, a record repeating the
+    newest queued one is coalesced with it, otherwise the oldest queued record is dropped. Both
+    are counted in :py:attr:`stats`, and the number of dropped records is reported to the
+    artifactor with the next batch.
+    """
 
     slaveid = artifactor = None
+    #: Maximum number of records waiting to be shipped
+    capacity = 10000
+    #: Maximum number of records shipped in one hook call
+    batch_size = 500
+    #: Seconds the background thread waits for a full batch before shipping what it has
+    flush_interval = 0.5
+
+    def __init__(self, *args, **kwargs):
+        super(ArtifactorHandler, self).__init__(*args, **kwargs)
+        self.stats = defaultdict(int)
+        self._buffer = deque()
+        self._buffer_lock = threading.Lock()
+        # taken while shipping, so the batches are shipped in order
+        self._ship_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._dropped = 0
+        self._thread = None
+        self._exc_formatter = logging.Formatter()
 
     def createLock(self):  # NOQA: false positive, base class override
-        # opt out of locking since artifactor hook calling is threadsave
+        # opt out of locking, the buffer has its own lock
         self.lock = None
 
+    def _compact(self, record):
+        exc_text = record.exc_text
+        if record.exc_info and not exc_text:
+            exc_text = self._exc_formatter.formatException(record.exc_info)
+        # the message is rendered right away, the arguments may change after the call
+        return [record.name, record.levelno, record.levelname, record.getMessage(),
+                record.created, record.msecs, record.pathname, record.lineno, exc_text, 0]
+
     def emit(self, record):
-        if self.artifactor:
-            self.artifactor.fire_hook(
-                'log_message',
-                log_record=record.__dict__,
-                slaveid=self.slaveid,
-            )
+        if not self.artifactor:
+            return
+        try:
+            compact = self._compact(record)
+        except Exception:
+            self.handleError(record)
+            return
+        with self._buffer_lock:
+            if len(self._buffer) >= self.capacity:
+                newest = self._buffer[-1]
+                if newest[1:4] == compact[1:4] and newest[6:8] == compact[6:8]:
+                    newest[-1] += 1
+                    self.stats['coalesced'] += 1
+                    return
+                self._buffer.popleft()
+                self._dropped += 1
+                self.stats['dropped'] += 1
+            self._buffer.append(compact)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='artifactor-log-shipper')
+                self._thread.daemon = True
+                self._thread.start()
+            if len(self._buffer) >= self.batch_size:
+                self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _take_batch(self):
+        with self._buffer_lock:
+            batch = [self._buffer.popleft()
+                     for _ in range(min(self.batch_size, len(self._buffer)))]
+            dropped, self._dropped = self._dropped, 0
+        return batch, dropped
+
+    def _ship(self):
+        while True:
+            batch, dropped = self._take_batch()
+            if not batch and not dropped:
+                return
+            for compact in batch:
+                repeats = compact.pop()
+                if repeats:
+                    compact[3] = '{} [repeated {} more times]'.format(compact[3], repeats)
+            try:
+                self.artifactor.fire_hook_async(
+                    'log_messages',
+                    log_records=batch,
+                    dropped=dropped,
+                    slaveid=self.slaveid,
+                )
+            except Exception:
+                # the artifactor went away, logging must not fail the test run
+                self.stats['failed_batches'] += 1
+                return
+            self.stats['shipped'] += len(batch)
+            self.stats['batches'] += 1
+
+    def flush(self):
+        """Ship all the queued records"""
+        if not self.artifactor:
+            return
+        with self._ship_lock:
+            self._ship()
+
+    @contextmanager
+    def flushed(self):
+        """Ship all the queued records and hold off the shipping while in the block
+
+        Used around the other artifactor hooks, so they are queued after all the records logged
+        before them and not in between the batches of the shipping thread.
+        """
+        with self._ship_lock:
+            if self.artifactor:
+                self._ship()
+            yield
 
 
 logger = setup_logger(logging.getLogger('cfme'))
@@ -27,6 +27,10 @@ class LogValidator(object):
         skip_patterns: array of skip regex patterns
         failure_patterns: array of failure regex patterns
         matched_patterns: array of expected regex patterns to be matched
+        prefilter: let ``grep -E`` on the appliance drop the lines no pattern can match before
+            they are transferred; ignored for patterns grep doesn't understand (e.g. ``\\d``)
+
+    After :py:meth:`validate_logs`, ``hits`` holds the number of lines each pattern matched.
 
     Usage:
         .. code-block:: python
@@ -42,24 +46,49 @@ class LogValidator(object):
         self.skip_patterns = kwargs.pop('skip_patterns', [])
         self.failure_patterns = kwargs.pop('failure_patterns', [])
         self.matched_patterns = kwargs.pop('matched_patterns', [])
+        self.prefilter = kwargs.pop('prefilter', False)
 
         self._remote_file_tail = SSHTail(remote_filename, **kwargs)
         self.matches = {}
+        # per pattern count of matched lines, collected in the same pass as the validation
+        self.hits = {}
+        patterns = self.skip_patterns + self.failure_patterns + self.matched_patterns
+        self._compiled = {pattern: re.compile(pattern) for pattern in patterns}
+        self._matcher = _combine(patterns)
 
     def fix_before_start(self):
         self._remote_file_tail.set_initial_file_end()
 
+    def _lines(self):
+        patterns = self.skip_patterns + self.failure_patterns + self.matched_patterns
+        if self.prefilter and patterns and all(_grep_compatible(p) for p in patterns):
+            try:
+                return self._remote_file_tail.grep_lines(
+                    '|'.join('({})'.format(pattern) for pattern in patterns))
+            except ValueError:
+                logger.exception('Prefiltering the log on the appliance failed')
+        return self._remote_file_tail
+
     def validate_logs(self):
-        for line in self._remote_file_tail:
+        for line in self._lines():
+            # most lines match nothing, one combined regex rejects them quickly
+            if self._matcher is not None and not self._matcher.match(line):
+                continue
             if self._check_skip_logs(line):
                 continue
             self._check_fail_logs(line)
             self._check_match_logs(line)
         self._verify_match_logs()
 
+    def _match(self, pattern, line):
+        if self._compiled[pattern].match(line):
+            self.hits[pattern] = self.hits.get(pattern, 0) + 1
+            return True
+        return False
+
     def _check_skip_logs(self, line):
         for pattern in self.skip_patterns:
-            if re.match(pattern, line):
+            if self._match(pattern, line):
                 logger.info('Skip pattern {} was matched on line {},\
                             so skipping this line'.format(pattern, line))
                 return True
@@ -67,12 +96,12 @@ class LogValidator(object):
 
     def _check_fail_logs(self, line):
         for pattern in self.failure_patterns:
-            if re.match(pattern, line):
+            if self._match(pattern, line):
                 pytest.fail('Failure pattern {} was matched on line {}'.format(pattern, line))
 
     def _check_match_logs(self, line):
         for pattern in self.matched_patterns:
-            if re.match(pattern, line):
+            if self._match(pattern, line):
                 logger.info('Expected pattern {} was matched on line {}'.format(pattern, line))
                 self.matches[pattern] = True
 
@@ -80,3 +109,22 @@ class LogValidator(object):
         for pattern in self.matched_patterns:
             if pattern not in self.matches:
                 pytest.fail('Expected pattern {} did not match'.format(pattern))
+
+
+def _combine(patterns):
+    """Compile patterns into one regex matching a line if any of them does, or None if they
+    can't be combined (e.g. because of backreferences or inline flags)"""
+    if not patterns:
+        return None
+    if any(re.search(r'\\\d|\(\?P=|\(\?[aiLmsux]', pattern) for pattern in patterns):
+        return None
+    try:
+        return re.compile('|'.join('(?:{})'.format(pattern) for pattern in patterns))
+    except re.error:
+        return None
+
+
+def _grep_compatible(pattern):
+    """Whether ``grep -E`` understands the pattern the way python does, at least loosely enough
+    to be used as a prefilter"""
+    return not re.search(r'\\[dDAZbB]|\(\?', pattern)
@@ -9,34 +9,31 @@ from cfme.utils.ssh import SSHClient, SSHTail
 def collect_log(ssh_client, log_prefix, local_file_name, strip_whitespace=False):
     """Collects all of the logs associated with a single log prefix (ex. evm or top_output) and
     combines to single gzip log file.  The log file is then scp-ed back to the host.
+
+    The rotated logs are decompressed concurrently over parallel ssh channels, then concatenated
+    in order and compressed in a single command.
     """
     log_dir = '/var/www/miq/vmdb/log/'
 
     log_file = '{}{}.log'.format(log_dir, log_prefix)
     dest_file = '{}{}.perf.log'.format(log_dir, log_prefix)
     dest_file_gz = '{}{}.perf.log.gz'.format(log_dir, log_prefix)
+    strip = (' | sed \'s/^ *//; s/ *$//; /^$/d; /^\s*$/d\''
+             if strip_whitespace else '')
 
-    ssh_client.run_command('rm -f {}'.format(dest_file_gz))
+    ssh_client.run_command('rm -f {} {}'.format(dest_file, dest_file_gz))
 
     result = ssh_client.run_command('ls -1 {}-*'.format(log_file))
-    if result.success:
-        files = result.output.strip().split('\n')
-        for lfile in sorted(files):
-            ssh_client.run_command('cp {} {}-2.gz'.format(lfile, lfile))
-            ssh_client.run_command('gunzip {}-2.gz'.format(lfile))
-            if strip_whitespace:
-                ssh_client.run_command('sed -i  \'s/^ *//; s/ *$//; /^$/d; /^\s*$/d\' '
-                    '{}-2'.format(lfile))
-            ssh_client.run_command('cat {}-2 >> {}'.format(lfile, dest_file))
-            ssh_client.run_command('rm {}-2'.format(lfile))
-
-    ssh_client.run_command('cp {} {}-2'.format(log_file, log_file))
-    if strip_whitespace:
-        ssh_client.run_command('sed -i  \'s/^ *//; s/ *$//; /^$/d; /^\s*$/d\' '
-            '{}-2'.format(log_file))
-    ssh_client.run_command('cat {}-2 >> {}'.format(log_file, dest_file))
-    ssh_client.run_command('rm {}-2'.format(log_file))
-    ssh_client.run_command('gzip {}{}.perf.log'.format(log_dir, log_prefix))
+    rotated = sorted(result.output.strip().split('\n')) if result.success else []
+    parts = ['{}-2'.format(lfile) for lfile in rotated + [log_file]]
+    commands = ['zcat {} {}> {}-2'.format(lfile, strip, lfile) for lfile in rotated]
+    commands.append('cat {} {}> {}-2'.format(log_file, strip, log_file))
+    for command, result in ssh_client.run_commands_parallel(commands):
+        if result.failed:
+            logger.warning('Preparing %s log part failed: %s', log_prefix, result.output)
+
+    ssh_client.run_command('cat {parts} > {dest}; rm -f {parts}; gzip {dest}'.format(
+        parts=' '.join(parts), dest=dest_file))
 
     ssh_client.get_file(dest_file_gz, local_file_name)
     ssh_client.run_command('rm -f {}'.format(dest_file_gz))
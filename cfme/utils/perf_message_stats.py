@@ -3,7 +3,12 @@
 appliance.
 """
 import csv
+import gzip
+import io
 import subprocess
+from array import array
+from collections import deque
+from concurrent import futures
 from datetime import datetime
 from datetime import timedelta
 from time import time
@@ -22,19 +27,6 @@ from cfme.utils.perf import generate_statistics
 
 # [----] I, [2014-03-04T08:11:14.320377 #3450:b15814]  INFO -- : ....
 log_stamp = re.compile(r'\[----\]\s[IWE],\s\[([0-9\-]+)T([0-9\:\.]+)\s#([0-9]+):[0-9a-z]+\]')
-# [----] .* MIQ( * )
-miqmsg = re.compile(r'\[----\].*MIQ\(([a-zA-Z0-9\._]*)\)')
-# Command: [ * ]
-miqmsg_cmd = re.compile(r'Command:\s\[([a-zA-Z0-9\._\:]*)\]')
-# Message id: [ * ]
-miqmsg_id = re.compile(r'Message\sid:\s\[([0-9]*)\]')
-# Args: [ *]
-miqmsg_args = re.compile(
-    r'Args:\s\[([A-Za-z0-9\{\}\(\)\[\]\s\\\-\:\"\'\,\=\<\>\_\/\.\@\?\%\&\#]*)\]')
-# Dequeued in: [ * ] seconds
-miqmsg_deq = re.compile(r'Dequeued\sin:\s\[([0-9\.]*)\]\sseconds')
-# Delivered in [ * ] seconds
-miqmsg_del = re.compile(r'Delivered\sin\s\[([0-9\.]*)\]\sseconds')
 
 # Worker related regular expressions:
 # MIQ(PriorityWorker) ID [15], PID [6461]
@@ -60,182 +52,476 @@ miq_top = re.compile(r'([0-9]+)\s+[0-9]+\s+[A-Za-z0-9]+\s+[0-9]+\s+[0-9\-]+\s+([
     r'([0-9\.mg]+)\s+([0-9\.mg]+)\s+[SRDZ]\s+([0-9\.]+)\s+([0-9\.]+)')
 
 
-def evm_to_messages(evm_file, filters):
-    test_start = ''
-    test_end = ''
-    line_count = 0
-    messages = {}
-    msg_cmds = {}
-
-    runningtime = time()
-    evmlogfile = open(evm_file, 'r')
-    evm_log_line = evmlogfile.readline()
-    while evm_log_line:
-        line_count += 1
-        evm_log_line = evm_log_line.strip()
-
-        miqmsg_result = miqmsg.search(evm_log_line)
-        if miqmsg_result:
-
-            # Obtains the first timestamp in the log file
-            if test_start == '':
-                ts, pid = get_msg_timestamp_pid(evm_log_line)
-                test_start = ts
-
-            # A message was first put on the queue, this starts its queuing time
-            if (miqmsg_result.group(1) == 'MiqQueue.put'):
-
-                msg_cmd = get_msg_cmd(evm_log_line)
-                msg_id = get_msg_id(evm_log_line)
-                if msg_id:
-                    ts, pid = get_msg_timestamp_pid(evm_log_line)
-                    test_end = ts
-                    messages[msg_id] = MiqMsgStat()
-                    messages[msg_id].msg_id = msg_id
-                    messages[msg_id].msg_id = '\'' + msg_id + '\''
-                    messages[msg_id].msg_cmd = msg_cmd
-                    messages[msg_id].pid_put = pid
-                    messages[msg_id].puttime = ts
-                    msg_args = get_msg_args(evm_log_line)
-                    if msg_args is False:
-                        logger.debug('Could not obtain message args line #: %s', line_count)
-                    else:
-                        messages[msg_id].msg_args = msg_args
-                else:
-                    logger.error('Could not obtain message id, line #: %s', line_count)
-
-            elif (miqmsg_result.group(1) == 'MiqQueue.get_via_drb'):
-                msg_id = get_msg_id(evm_log_line)
-                if msg_id:
-                    if msg_id in messages:
-                        ts, pid = get_msg_timestamp_pid(evm_log_line)
-                        test_end = ts
-                        messages[msg_id].pid_get = pid
-                        messages[msg_id].gettime = ts
-                        messages[msg_id].deq_time = get_msg_deq(evm_log_line)
-                    else:
-                        logger.error('Message ID not in dictionary: %s', msg_id)
-                else:
-                    logger.error('Could not obtain message id, line #: %s', line_count)
-
-            elif (miqmsg_result.group(1) == 'MiqQueue.delivered'):
-                msg_id = get_msg_id(evm_log_line)
-                if msg_id:
-                    ts, pid = get_msg_timestamp_pid(evm_log_line)
-                    test_end = ts
-                    if msg_id in messages:
-                        messages[msg_id].del_time = get_msg_del(evm_log_line)
-                        messages[msg_id].total_time = messages[msg_id].deq_time + \
-                            messages[msg_id].del_time
-                    else:
-                        logger.error('Message ID not in dictionary: %s', msg_id)
+# Streaming analysis
+# The functions below scan each line of the log once and keep the messages in array backed
+# columns. The scan is stateless, so a log can be split into chunks parsed in a process pool, the
+# records are then fed to a MessageAnalyzer in log order.
+
+# Everything needed from a MiqQueue line, in one regex
+miqqueue_line = re.compile(
+    r'\[----\]\s[IWE],\s\[([0-9\-]+)T([0-9\:\.]+)\s#([0-9]+):[0-9a-z]+\]'
+    r'.*?MIQ\(MiqQueue\.(?:'
+    r'(put)\)\sMessage\sid:\s\[([0-9]*)\](?:.*?Command:\s\[([a-zA-Z0-9\._\:]*)\])?'
+    r'(?:.*Args:\s\[([A-Za-z0-9\{\}\(\)\[\]\s\\\-\:\"\'\,\=\<\>\_\/\.\@\?\%\&\#]*)\])?'
+    r'|(get_via_drb)\)\sMessage\sid:\s\[([0-9]*)\].*Dequeued\sin:\s\[([0-9\.]*)\]\sseconds'
+    r'|(delivered)\)\sMessage\sid:\s\[([0-9]*)\].*Delivered\sin\s\[([0-9\.]*)\]\sseconds)')
+
+# Record kinds yielded by parse_evm_lines
+MSG_PUT, MSG_GET, MSG_DELIVERED, WORKER_START, WORKER_END, WORKER_INTERRUPT = range(6)
+# Worker termination reasons, in the order they are checked
+WORKER_REASONS = ('evm_worker_uptime_exceeded', 'evm_worker_memory_exceeded', 'evm_worker_stop')
+# Bytes of (decompressed) log per chunk handed to a parser process
+EVM_CHUNK_SIZE = 16 * 1024 * 1024
+
+_EPOCH = datetime(1970, 1, 1)
+_HOUR_US = 3600 * 1000000
+# caches of date -> days since the epoch and of hours since the epoch -> (date, hour)
+_epoch_days = {}
+_epoch_hours = {}
+
+
+def ts_to_us(date, clock):
+    """Convert an evm.log timestamp (``2014-03-04``, ``08:11:14.320377``) to microseconds since
+    the epoch"""
+    days = _epoch_days.get(date)
+    if days is None:
+        days = _epoch_days[date] = (datetime.strptime(date, '%Y-%m-%d') - _EPOCH).days
+    return ((days * 24 + int(clock[:2])) * 60 + int(clock[3:5])) * 60000000 + \
+        int(round(float(clock[6:]) * 1000000))
+
+
+def us_to_ts(us):
+    """Inverse of :py:func:`ts_to_us`, formatted like :py:func:`get_msg_timestamp_pid`"""
+    return (_EPOCH + timedelta(microseconds=us)).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def us_to_hour(us):
+    """The ``(date, hour)`` bucket of a :py:func:`ts_to_us` timestamp"""
+    hours = int(us // _HOUR_US)
+    if hours not in _epoch_hours:
+        ts = us_to_ts(hours * _HOUR_US)
+        _epoch_hours[hours] = ts[:10], ts[11:13]
+    return _epoch_hours[hours]
+
+
+def parse_evm_lines(lines, filters, keep_args=True):
+    """Scan evm.log lines once, yielding the queue and worker records found in them
+
+    Records are tuples, their first item is one of the ``MSG_*``/``WORKER_*`` kinds. Queue records
+    carry :py:func:`ts_to_us` timestamps, worker records the timestamp string. The command of a
+    put message already carries the suffix of the first matching ``filters`` pattern.
+    """
+    for line in lines:
+        if 'MiqQueue.' in line:
+            result = miqqueue_line.search(line)
+            if result:
+                (date, clock, pid, put, put_id, cmd, args, get, get_id, deq, delivered, del_id,
+                 dlv) = result.groups()
+                msg_id = put_id or get_id or del_id
+                if not msg_id:
+                    logger.error('Could not obtain message id: %s', line)
+                elif put:
+                    args = (args or '').strip()
+                    cmd = cmd or ''
+                    for p_filter in filters:
+                        if filters[p_filter].search(args):
+                            cmd = '{}{}'.format(cmd, p_filter)
+                            break
+                    yield (MSG_PUT, ts_to_us(date, clock), int(pid), int(msg_id), cmd,
+                           args if keep_args else '')
+                elif get:
+                    yield MSG_GET, ts_to_us(date, clock), int(pid), int(msg_id), float(deq or 0)
                 else:
-                    logger.error('Could not obtain message id, line #: %s', line_count)
-
-        if (line_count % 100000) == 0:
-            timediff = time() - runningtime
-            runningtime = time()
-            logger.info('Count {} : Parsed 100000 lines in %s', line_count, timediff)
-
-        evm_log_line = evmlogfile.readline()
-
-    # I tried to avoid two loops but this reduced the complexity of filtering on messages.
-    # By filtering over messages, we can better display what is occuring under the covers, as a
-    # daily rollup is picked up off the queue different than a hourly rollup, etc
-    for msg in sorted(messages.keys()):
-        msg_args = messages[msg].msg_args
-        # Determine if the pattern matches and append to the command if it does
-        for p_filter in filters:
-            results = filters[p_filter].search(msg_args.strip())
-            if results:
-                messages[msg].msg_cmd = '{}{}'.format(messages[msg].msg_cmd, p_filter)
+                    yield (MSG_DELIVERED, ts_to_us(date, clock), int(pid), int(msg_id),
+                           float(dlv or 0))
+
+        # plain substring checks, the same lines the grep of evm_to_workers picks
+        if not (') ID [' in line or '"evm_worker_' in line or 'Interrupt' in line or
+                'Worker exiting.' in line):
+            continue
+        miqwkr_result = miqwkr.search(line)
+        if miqwkr_result:
+            ts, pid = get_msg_timestamp_pid(line)
+            yield (WORKER_START, ts, int(miqwkr_result.group(2)), miqwkr_result.group(1),
+                   miqwkr_result.group(3))
+            continue
+        for reason in WORKER_REASONS:
+            if reason in line:
+                miqwkr_id_result = miqwkr_id.search(line)
+                if miqwkr_id_result:
+                    ts, pid = get_msg_timestamp_pid(line)
+                    yield WORKER_END, ts, int(miqwkr_id_result.group(1)), reason
                 break
-        msg_cmd = messages[msg].msg_cmd
-        if msg_cmd not in msg_cmds:
-            msg_cmds[msg_cmd] = {}
-            msg_cmds[msg_cmd]['total'] = []
-            msg_cmds[msg_cmd]['queue'] = []
-            msg_cmds[msg_cmd]['execute'] = []
-        if messages[msg].total_time != 0:
-            msg_cmds[msg_cmd]['total'].append(round(messages[msg].total_time, 2))
-            msg_cmds[msg_cmd]['queue'].append(round(messages[msg].deq_time, 2))
-            msg_cmds[msg_cmd]['execute'].append(round(messages[msg].del_time, 2))
+        else:
+            if 'Interrupt' in line:
+                ts, pid = get_msg_timestamp_pid(line)
+                yield WORKER_INTERRUPT, ts
+            elif 'Worker exiting.' in line:
+                miqwkr_id_2_result = miqwkr_id_2.search(line)
+                if miqwkr_id_2_result:
+                    ts, pid = get_msg_timestamp_pid(line)
+                    yield WORKER_END, ts, int(miqwkr_id_2_result.group(1)), 'Worker Exited'
+
+
+def parse_evm_chunk(chunk, filters, keep_args=True):
+    """Parse a chunk of evm.log (bytes ending with a newline), returns (records, line count)"""
+    lines = chunk.decode('utf-8', 'replace').splitlines()
+    return list(parse_evm_lines(lines, filters, keep_args)), len(lines)
+
+
+def iter_evm_chunks(evm_file, chunk_size=EVM_CHUNK_SIZE):
+    """Yield an evm.log, plain or gzipped, in chunks of whole lines"""
+    opener = gzip.open if str(evm_file).endswith('.gz') else io.open
+    with opener(str(evm_file), 'rb') as log_file:
+        rest = b''
+        while True:
+            data = log_file.read(chunk_size)
+            if not data:
+                break
+            data = rest + data
+            cut = data.rfind(b'\n') + 1
+            rest = data[cut:]
+            if cut:
+                yield data[:cut]
+        if rest:
+            yield rest
+
+
+def analyze_evm_log(evm_file, filters, processes=1, keep_args=True, chunk_size=EVM_CHUNK_SIZE):
+    """Analyze messages and workers of an evm.log in a single pass
+
+    Args:
+        evm_file: path of the log, may be gzipped
+        filters: dict of command suffix to a compiled pattern matched against the message args
+        processes: number of parser processes, the log is parsed in this process when 1
+        keep_args: keep the args of every message for the raw data csv
+        chunk_size: bytes of log parsed at once
+    Returns: :py:class:`MessageAnalyzer`
+    """
+    analyzer = MessageAnalyzer(keep_args)
+    runningtime = time()
+    chunks = iter_evm_chunks(evm_file, chunk_size)
+    if processes <= 1:
+        for chunk in chunks:
+            analyzer.feed(*parse_evm_chunk(chunk, filters, keep_args))
+            logger.info('Parsed %s lines in %s', analyzer.line_count, time() - runningtime)
+    else:
+        with futures.ProcessPoolExecutor(processes) as executor:
+            # bounded window, so the decompressed log is never held in memory as a whole
+            in_flight = deque()
+            for chunk in chunks:
+                in_flight.append(executor.submit(parse_evm_chunk, chunk, filters, keep_args))
+                if len(in_flight) >= 2 * processes:
+                    analyzer.feed(*in_flight.popleft().result())
+                    logger.info('Parsed %s lines in %s', analyzer.line_count, time() - runningtime)
+            while in_flight:
+                analyzer.feed(*in_flight.popleft().result())
+    analyzer.finish()
+    return analyzer
+
+
+class TimingColumn(object):
+    """Timings of one kind, running min/max/sum plus the samples for percentiles"""
+    __slots__ = ('values', 'minimum', 'maximum', 'total')
 
-    return messages, msg_cmds, test_start, test_end, line_count
+    def __init__(self):
+        self.values = array('d')
+        self.minimum = self.maximum = self.total = 0.0
 
+    def add(self, value):
+        if not self.values:
+            self.minimum = self.maximum = value
+        elif value < self.minimum:
+            self.minimum = value
+        elif value > self.maximum:
+            self.maximum = value
+        self.total += value
+        self.values.append(value)
 
-def evm_to_workers(evm_file):
-    # Use grep to reduce # of lines to sort through
-    p = subprocess.Popen(['grep', 'Interrupt\\|MIQ([A-Za-z]*) ID\\|"evm_worker_uptime_exceeded\\|'
-            '"evm_worker_memory_exceeded\\|"evm_worker_stop\\|Worker exiting.', evm_file],
-            stdout=subprocess.PIPE)
-    greppedevmlog, err = p.communicate()
-    greppedevmlog = greppedevmlog.strip()
-
-    evmlines = greppedevmlog.split('\n')
-
-    workers = {}
-    wkr_upt_exc = 0
-    wkr_mem_exc = 0
-    wkr_stp = 0
-    wkr_int = 0
-    wkr_ext = 0
-    for evm_log_line in evmlines:
-        ts, pid = get_msg_timestamp_pid(evm_log_line)
-
-        miqwkr_result = miqwkr.search(evm_log_line)
-        if miqwkr_result:
-            workerid = int(miqwkr_result.group(2))
-            if workerid not in workers:
-                workers[workerid] = MiqWorker()
-                workers[workerid].worker_type = miqwkr_result.group(1)
-                workers[workerid].pid = miqwkr_result.group(3)
-                workers[workerid].worker_id = int(workerid)
-                workers[workerid].start_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
-        elif 'evm_worker_uptime_exceeded' in evm_log_line:
-            miqwkr_id_result = miqwkr_id.search(evm_log_line)
-            if miqwkr_id_result:
-                workerid = int(miqwkr_id_result.group(1))
-                if workerid in workers:
-                    if not workers[workerid].terminated:
-                        wkr_upt_exc += 1
-                        workers[workerid].terminated = 'evm_worker_uptime_exceeded'
-                        workers[workerid].end_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
-        elif 'evm_worker_memory_exceeded' in evm_log_line:
-            miqwkr_id_result = miqwkr_id.search(evm_log_line)
-            if miqwkr_id_result:
-                workerid = int(miqwkr_id_result.group(1))
-                if workerid in workers:
-                    if not workers[workerid].terminated:
-                        wkr_mem_exc += 1
-                        workers[workerid].terminated = 'evm_worker_memory_exceeded'
-                        workers[workerid].end_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
-        elif 'evm_worker_stop' in evm_log_line:
-            miqwkr_id_result = miqwkr_id.search(evm_log_line)
-            if miqwkr_id_result:
-                workerid = int(miqwkr_id_result.group(1))
-                if workerid in workers:
-                    if not workers[workerid].terminated:
-                        wkr_stp += 1
-                        workers[workerid].terminated = 'evm_worker_stop'
-                        workers[workerid].end_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
-        elif 'Interrupt' in evm_log_line:
-            for workerid in workers:
-                if not workers[workerid].end_ts:
-                    wkr_int += 1
-                    workers[workerid].terminated = 'Interrupted'
-                    workers[workerid].end_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
-        elif 'Worker exiting.' in evm_log_line:
-            miqwkr_id_2_result = miqwkr_id_2.search(evm_log_line)
-            if miqwkr_id_2_result:
-                workerid = int(miqwkr_id_2_result.group(1))
-                if workerid in workers:
-                    if not workers[workerid].terminated:
-                        wkr_ext += 1
-                        workers[workerid].terminated = 'Worker Exited'
-                        workers[workerid].end_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
-
-    return workers, wkr_mem_exc, wkr_upt_exc, wkr_stp, wkr_int, wkr_ext, len(evmlines)
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def average(self):
+        return self.total / len(self.values) if self.values else 0.0
+
+    def statistics(self, decimals=2):
+        """See :py:func:`cfme.utils.perf.generate_statistics`"""
+        return generate_statistics(self.values, decimals)
+
+
+class CommandStats(object):
+    """Per command counters and timings, the streaming counterpart of :py:class:`MiqMsgLists`"""
+    __slots__ = ('cmd', 'puts', 'gets', 'deq_time', 'del_time', 'total_time')
+
+    def __init__(self, cmd):
+        self.cmd = cmd
+        self.puts = 0
+        self.gets = 0
+        self.deq_time = TimingColumn()
+        self.del_time = TimingColumn()
+        self.total_time = TimingColumn()
+
+
+class MessageColumns(object):
+    """All the queue messages of a log, one typed array per attribute instead of an object per
+    message. Commands are interned, timestamps are microseconds since the epoch (0 if unknown)
+
+    Ids and timestamps don't fit the 32 bit C long of some platforms and ``'q'`` arrays are py3
+    only, they are kept in doubles, exact up to 2 ** 53.
+    """
+    __slots__ = ('msg_id', 'cmd', 'pid_put', 'pid_get', 'put_us', 'get_us', 'deq_time',
+                 'del_time', 'args')
+
+    def __init__(self, keep_args=True):
+        for name in ('msg_id', 'put_us', 'get_us'):
+            setattr(self, name, array('d'))
+        # command indexes and pids
+        for name in ('cmd', 'pid_put', 'pid_get'):
+            setattr(self, name, array('l'))
+        self.deq_time = array('d')
+        self.del_time = array('d')
+        self.args = [] if keep_args else None
+
+    def __len__(self):
+        return len(self.msg_id)
+
+    def append(self, msg_id, cmd, pid_put, put_us, args):
+        self.msg_id.append(msg_id)
+        self.cmd.append(cmd)
+        self.pid_put.append(pid_put)
+        self.put_us.append(put_us)
+        self.pid_get.append(0)
+        self.get_us.append(0)
+        self.deq_time.append(0.0)
+        self.del_time.append(0.0)
+        if self.args is not None:
+            self.args.append(args)
+        return len(self.msg_id) - 1
+
+
+class MessageAnalyzer(object):
+    """Consumes the records of :py:func:`parse_evm_lines` in log order
+
+    Hourly buckets, per command statistics and workers are updated as the records arrive, only
+    the messages still waiting to be delivered are looked up by id.
+    """
+    def __init__(self, keep_args=True):
+        self.columns = MessageColumns(keep_args)
+        self.commands = []
+        self._command_index = {}
+        self.command_stats = {}
+        # msg_id -> row, until the message is delivered
+        self.pending = {}
+        # buckets[cmd][date][hour] = MiqMsgBucket(), messages never taken off the queue go
+        # to the '' date and hour
+        self.buckets = {}
+        self.workers = {}
+        self.worker_counts = dict.fromkeys(WORKER_REASONS + ('Interrupted', 'Worker Exited'), 0)
+        self.start_us = self.end_us = 0
+        self.line_count = 0
+        self._handlers = {
+            MSG_PUT: self._put, MSG_GET: self._get, MSG_DELIVERED: self._delivered,
+            WORKER_START: self._worker_start, WORKER_END: self._worker_end,
+            WORKER_INTERRUPT: self._worker_interrupt}
+
+    @property
+    def test_start(self):
+        return us_to_ts(self.start_us) if self.start_us else ''
+
+    @property
+    def test_end(self):
+        return us_to_ts(self.end_us) if self.end_us else ''
+
+    def feed(self, records, line_count=0):
+        handlers = self._handlers
+        for record in records:
+            handlers[record[0]](*record[1:])
+        self.line_count += line_count
+
+    def _bucket(self, cmd, date='', hour=''):
+        hours = self.buckets[cmd].setdefault(date, {})
+        bucket = hours.get(hour)
+        if bucket is None:
+            bucket = hours[hour] = MiqMsgBucket()
+        return bucket
+
+    def _put(self, us, pid, msg_id, cmd, args):
+        if not self.start_us:
+            self.start_us = us
+        self.end_us = us
+        index = self._command_index.get(cmd)
+        if index is None:
+            index = self._command_index[cmd] = len(self.commands)
+            self.commands.append(cmd)
+            self.command_stats[cmd] = CommandStats(cmd)
+            self.buckets[cmd] = {}
+        self.pending[msg_id] = self.columns.append(msg_id, index, pid, us, args)
+        self.command_stats[cmd].puts += 1
+        self._bucket(cmd, *us_to_hour(us)).total_put += 1
+
+    def _get(self, us, pid, msg_id, deq_time):
+        row = self.pending.get(msg_id)
+        if row is None:
+            logger.error('Message ID not in dictionary: %s', msg_id)
+            return
+        self.end_us = us
+        columns = self.columns
+        cmd = self.commands[columns.cmd[row]]
+        columns.pid_get[row] = pid
+        columns.get_us[row] = us
+        columns.deq_time[row] = deq_time
+        self.command_stats[cmd].deq_time.add(deq_time)
+
+        bk = self._bucket(cmd, *us_to_hour(columns.put_us[row]))
+        bk.sum_deq += deq_time
+        if bk.min_deq == 0 or bk.min_deq > deq_time:
+            bk.min_deq = deq_time
+        if bk.max_deq == 0 or bk.max_deq < deq_time:
+            bk.max_deq = deq_time
+        self._bucket(cmd, *us_to_hour(us)).total_get += 1
+
+    def _delivered(self, us, pid, msg_id, del_time):
+        row = self.pending.pop(msg_id, None)
+        if row is None:
+            logger.error('Message ID not in dictionary: %s', msg_id)
+            return
+        self.end_us = us
+        columns = self.columns
+        cmd = self.commands[columns.cmd[row]]
+        columns.del_time[row] = del_time
+        stats = self.command_stats[cmd]
+        if del_time > 0:
+            stats.gets += 1
+            stats.del_time.add(del_time)
+        stats.total_time.add(columns.deq_time[row] + del_time)
+
+        if columns.get_us[row]:
+            bk = self._bucket(cmd, *us_to_hour(columns.get_us[row]))
+        else:
+            bk = self._bucket(cmd)
+            bk.total_get += 1
+        bk.sum_del += del_time
+        if bk.min_del == 0 or bk.min_del > del_time:
+            bk.min_del = del_time
+        if bk.max_del == 0 or bk.max_del < del_time:
+            bk.max_del = del_time
+
+    def _worker_start(self, ts, worker_id, worker_type, pid):
+        if worker_id not in self.workers:
+            worker = self.workers[worker_id] = MiqWorker()
+            worker.worker_type = worker_type
+            worker.pid = pid
+            worker.worker_id = worker_id
+            worker.start_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
+
+    def _worker_end(self, ts, worker_id, reason):
+        worker = self.workers.get(worker_id)
+        if worker is not None and not worker.terminated:
+            self.worker_counts[reason] += 1
+            worker.terminated = reason
+            worker.end_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
+
+    def _worker_interrupt(self, ts):
+        for worker in self.workers.values():
+            if not worker.end_ts:
+                self.worker_counts['Interrupted'] += 1
+                worker.terminated = 'Interrupted'
+                worker.end_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
+
+    def finish(self):
+        """Account for the messages which were never taken off the queue"""
+        columns = self.columns
+        for row in self.pending.values():
+            if not columns.get_us[row]:
+                self._bucket(self.commands[columns.cmd[row]]).total_get += 1
+
+    def hourly_buckets(self):
+        """Hourly buckets, ``hr_bkt[cmd][date][hour]`` = :py:class:`MiqMsgBucket`
+
+        The averages are only computed here, the totals they divide by keep growing after the last
+        sample of a bucket.
+        """
+        hr_bkt = {}
+        for cmd, dates in self.buckets.items():
+            hr_bkt[cmd] = provision_hour_buckets(self.test_start, self.test_end)
+            for date, hours in dates.items():
+                for bk in hours.values():
+                    if bk.total_put:
+                        bk.avg_deq = bk.sum_deq / bk.total_put
+                    if bk.total_get:
+                        bk.avg_del = bk.sum_del / bk.total_get
+                hr_bkt[cmd].setdefault(date, {}).update(hours)
+        return hr_bkt
+
+    def msg_cmds(self):
+        """Timings of the delivered messages, as :py:func:`generate_total_time_charts` takes them"""
+        columns = self.columns
+        msg_cmds = {cmd: {'total': [], 'queue': [], 'execute': []} for cmd in self.commands}
+        for row in range(len(columns)):
+            total_time = columns.deq_time[row] + columns.del_time[row]
+            if total_time != 0:
+                timings = msg_cmds[self.commands[columns.cmd[row]]]
+                timings['total'].append(round(total_time, 2))
+                timings['queue'].append(round(columns.deq_time[row], 2))
+                timings['execute'].append(round(columns.del_time[row], 2))
+        return msg_cmds
+
+    def iter_messages(self):
+        """Yield the messages as :py:class:`MiqMsgStat`, one at a time"""
+        columns = self.columns
+        for row in range(len(columns)):
+            msg = MiqMsgStat()
+            msg.msg_id = '\'{}\''.format(int(columns.msg_id[row]))
+            msg.msg_cmd = self.commands[columns.cmd[row]]
+            if columns.args is not None:
+                msg.msg_args = columns.args[row]
+            msg.pid_put = str(columns.pid_put[row])
+            msg.puttime = us_to_ts(columns.put_us[row])
+            if columns.get_us[row]:
+                msg.pid_get = str(columns.pid_get[row])
+                msg.gettime = us_to_ts(columns.get_us[row])
+            msg.deq_time = columns.deq_time[row]
+            msg.del_time = columns.del_time[row]
+            msg.total_time = msg.deq_time + msg.del_time
+            yield msg
+
+
+def analyzer_to_raw_data_csv(analyzer, csv_file_name):
+    csv_rawdata_path = log_path.join('csv_output', csv_file_name)
+    output_file = csv_rawdata_path.open('w', ensure=True)
+    try:
+        csvwriter = csv.DictWriter(output_file, fieldnames=MiqMsgStat().headers,
+            delimiter=',', quotechar='\'', quoting=csv.QUOTE_MINIMAL)
+        csvwriter.writeheader()
+        for msg in analyzer.iter_messages():
+            csvwriter.writerow(dict(msg))
+    finally:
+        output_file.close()
+
+
+def analyzer_to_statistics_csv(analyzer, statistics_file_name):
+    csvdata_path = log_path.join('csv_output', statistics_file_name)
+    outputfile = csvdata_path.open('w', ensure=True)
+
+    try:
+        csvfile = csv.writer(outputfile)
+        metrics = ['samples', 'min', 'avg', 'median', 'max', 'std', '90', '99']
+        measurements = ['deq_time', 'del_time', 'total_time']
+        headers = ['cmd', 'puts', 'gets']
+        for measurement in measurements:
+            for metric in metrics:
+                headers.append('{}_{}'.format(measurement, metric))
+        csvfile.writerow(headers)
+
+        for cmd in sorted(analyzer.command_stats):
+            cmd_stats = analyzer.command_stats[cmd]
+            stats = [cmd, cmd_stats.puts, cmd_stats.gets]
+            for measurement in measurements:
+                stats.extend(getattr(cmd_stats, measurement).statistics(3))
+            csvfile.writerow(stats)
+    finally:
+        outputfile.close()
 
 
 def split_appliance_charts(top_appliance, charts_dir):
@@ -404,46 +690,6 @@ def get_first_miqtop(top_log_file):
     return miqtop_time, timezone_offset
 
 
-def get_msg_args(log_line):
-    miqmsg_args_result = miqmsg_args.search(log_line)
-    if miqmsg_args_result:
-        return miqmsg_args_result.group(1)
-    else:
-        return False
-
-
-def get_msg_cmd(log_line):
-    miqmsg_cmd_result = miqmsg_cmd.search(log_line)
-    if miqmsg_cmd_result:
-        return miqmsg_cmd_result.group(1)
-    else:
-        return False
-
-
-def get_msg_del(log_line):
-    miqmsg_del_result = miqmsg_del.search(log_line)
-    if miqmsg_del_result:
-        return float(miqmsg_del_result.group(1))
-    else:
-        return False
-
-
-def get_msg_deq(log_line):
-    miqmsg_deq_result = miqmsg_deq.search(log_line)
-    if miqmsg_deq_result:
-        return float(miqmsg_deq_result.group(1))
-    else:
-        return False
-
-
-def get_msg_id(log_line):
-    miqmsg_id_result = miqmsg_id.search(log_line)
-    if miqmsg_id_result:
-        return miqmsg_id_result.group(1)
-    else:
-        return False
-
-
 def get_msg_timestamp_pid(log_line):
     # Obtains the timestamp and pid
     ts_result = log_stamp.search(log_line)
@@ -479,111 +725,6 @@ def line_chart_render(title, xtitle, ytitle, x_labels, lines, fname, stacked=Fal
     line_chart.render_to_file(str(fname))
 
 
-def messages_to_hourly_buckets(messages, test_start, test_end):
-    hr_bkt = {}
-    # Hour buckets look like: hr_bkt[msg_cmd][msg_date][msg_hour] = MiqMsgBucket()
-    for msg in messages:
-        # put on queue, deals with queuing:
-        msg_cmd = messages[msg].msg_cmd
-        putdate = messages[msg].puttime[:10]
-        puthour = messages[msg].puttime[11:13]
-        if msg_cmd not in hr_bkt:
-            hr_bkt[msg_cmd] = provision_hour_buckets(test_start, test_end)
-
-        hr_bkt[msg_cmd][putdate][puthour].total_put += 1
-        hr_bkt[msg_cmd][putdate][puthour].sum_deq += messages[msg].deq_time
-        if (hr_bkt[msg_cmd][putdate][puthour].min_deq == 0 or
-                hr_bkt[msg_cmd][putdate][puthour].min_deq > messages[msg].deq_time):
-            hr_bkt[msg_cmd][putdate][puthour].min_deq = messages[msg].deq_time
-        if (hr_bkt[msg_cmd][putdate][puthour].max_deq == 0 or
-                hr_bkt[msg_cmd][putdate][puthour].max_deq < messages[msg].deq_time):
-            hr_bkt[msg_cmd][putdate][puthour].max_deq = messages[msg].deq_time
-        hr_bkt[msg_cmd][putdate][puthour].avg_deq = \
-            hr_bkt[msg_cmd][putdate][puthour].sum_deq / hr_bkt[msg_cmd][putdate][puthour].total_put
-
-        # Get time is when the message is delivered
-        getdate = messages[msg].gettime[:10]
-        gethour = messages[msg].gettime[11:13]
-
-        hr_bkt[msg_cmd][getdate][gethour].total_get += 1
-        hr_bkt[msg_cmd][getdate][gethour].sum_del += messages[msg].del_time
-        if (hr_bkt[msg_cmd][getdate][gethour].min_del == 0 or
-                hr_bkt[msg_cmd][getdate][gethour].min_del > messages[msg].del_time):
-            hr_bkt[msg_cmd][getdate][gethour].min_del = messages[msg].del_time
-        if (hr_bkt[msg_cmd][getdate][gethour].max_del == 0 or
-                hr_bkt[msg_cmd][getdate][gethour].max_del < messages[msg].del_time):
-            hr_bkt[msg_cmd][getdate][gethour].max_del = messages[msg].del_time
-
-        hr_bkt[msg_cmd][getdate][gethour].avg_del = \
-            hr_bkt[msg_cmd][getdate][gethour].sum_del / hr_bkt[msg_cmd][getdate][gethour].total_get
-    return hr_bkt
-
-
-def messages_to_statistics_csv(messages, statistics_file_name):
-    all_statistics = []
-    for msg_id in messages:
-        msg = messages[msg_id]
-
-        added = False
-        if len(all_statistics) > 0:
-            for msg_statistics in all_statistics:
-                if msg_statistics.cmd == msg.msg_cmd:
-
-                    if msg.del_time > 0:
-                        msg_statistics.delivertimes.append(float(msg.del_time))
-                        msg_statistics.gets += 1
-                    msg_statistics.dequeuetimes.append(float(msg.deq_time))
-                    msg_statistics.totaltimes.append(float(msg.total_time))
-                    msg_statistics.puts += 1
-                    added = True
-                    break
-
-        if not added:
-            msg_statistics = MiqMsgLists()
-            msg_statistics.cmd = msg.msg_cmd
-            if msg.del_time > 0:
-                msg_statistics.delivertimes.append(float(msg.del_time))
-                msg_statistics.gets = 1
-            msg_statistics.dequeuetimes.append(float(msg.deq_time))
-            msg_statistics.totaltimes.append(float(msg.total_time))
-            msg_statistics.puts = 1
-            all_statistics.append(msg_statistics)
-
-    csvdata_path = log_path.join('csv_output', statistics_file_name)
-    outputfile = csvdata_path.open('w', ensure=True)
-
-    try:
-        csvfile = csv.writer(outputfile)
-        metrics = ['samples', 'min', 'avg', 'median', 'max', 'std', '90', '99']
-        measurements = ['deq_time', 'del_time', 'total_time']
-        headers = ['cmd', 'puts', 'gets']
-        for measurement in measurements:
-            for metric in metrics:
-                headers.append('{}_{}'.format(measurement, metric))
-
-        csvfile.writerow(headers)
-
-        # Import here to allow perf to install numpy separately
-        import numpy
-
-        # Contents of CSV
-        for msg_statistics in sorted(all_statistics, key=lambda x: x.cmd):
-            if msg_statistics.gets > 1:
-                logger.debug('Samples/Avg/90th/Std: %s: %s : %s : %s,Cmd: %s',
-                    str(len(msg_statistics.totaltimes)).rjust(7),
-                    str(round(numpy.average(msg_statistics.totaltimes), 3)).rjust(7),
-                    str(round(numpy.percentile(msg_statistics.totaltimes, 90), 3)).rjust(7),
-                    str(round(numpy.std(msg_statistics.totaltimes), 3)).rjust(7),
-                    msg_statistics.cmd)
-            stats = [msg_statistics.cmd, msg_statistics.puts, msg_statistics.gets]
-            stats.extend(generate_statistics(msg_statistics.dequeuetimes, 3))
-            stats.extend(generate_statistics(msg_statistics.delivertimes, 3))
-            stats.extend(generate_statistics(msg_statistics.totaltimes, 3))
-            csvfile.writerow(stats)
-    finally:
-        outputfile.close()
-
-
 def provision_hour_buckets(test_start, test_end, init=True):
     buckets = {}
     start_date = datetime.strptime(test_start[:10], '%Y-%m-%d')
@@ -799,7 +940,13 @@ def top_to_workers(workers, top_file):
     return top_workers, len(top_lines)
 
 
-def perf_process_evm(evm_file, top_file):
+def perf_process_evm(evm_file, top_file, processes=1, keep_args=True):
+    """Generate the message/worker report of an evm.log (plain or gzipped) and top_output.log
+
+    Args:
+        processes: number of processes parsing the evm.log in parallel
+        keep_args: include message args in the raw data csv, costs memory on big logs
+    """
     msg_filters = {
         '-hourly': re.compile(r'\"[0-9\-]*T[0-9\:]*Z\",\s\"hourly\"'),
         '-daily': re.compile(r'\"[0-9\-]*T[0-9\:]*Z\",\s\"daily\"'),
@@ -812,22 +959,25 @@ def perf_process_evm(evm_file, top_file):
     starttime = time()
     initialtime = starttime
 
-    logger.info('----------- Parsing evm log file for messages -----------')
-    messages, msg_cmds, test_start, test_end, msg_lc = evm_to_messages(evm_file, msg_filters)
+    logger.info('----------- Parsing evm log file for messages and workers -----------')
+    analyzer = analyze_evm_log(evm_file, msg_filters, processes=processes, keep_args=keep_args)
+    messages = analyzer.columns
+    msg_cmds = analyzer.msg_cmds()
+    test_start, test_end = analyzer.test_start, analyzer.test_end
+    msg_lc = wkr_lc = analyzer.line_count
+    workers = analyzer.workers
+    wkr_mem_exc = analyzer.worker_counts['evm_worker_memory_exceeded']
+    wkr_upt_exc = analyzer.worker_counts['evm_worker_uptime_exceeded']
+    wkr_stp = analyzer.worker_counts['evm_worker_stop']
+    wkr_int = analyzer.worker_counts['Interrupted']
+    wkr_ext = analyzer.worker_counts['Worker Exited']
     timediff = time() - starttime
     logger.info('----------- Completed Parsing evm log file -----------')
-    logger.info('Parsed %s lines of evm log file for messages in %s', msg_lc, timediff)
+    logger.info('Parsed %s lines of evm log file in %s', msg_lc, timediff)
     logger.info('Total # of Messages: %d', len(messages))
     logger.info('Total # of Commands: %d', len(msg_cmds))
     logger.info('Start Time: %s', test_start)
     logger.info('End Time: %s', test_end)
-
-    logger.info('----------- Parsing evm log file for workers -----------')
-    starttime = time()
-    workers, wkr_mem_exc, wkr_upt_exc, wkr_stp, wkr_int, wkr_ext, wkr_lc = evm_to_workers(evm_file)
-    timediff = time() - starttime
-    logger.info('----------- Completed Parsing evm log for workers -----------')
-    logger.info('Parsed %s lines of evm log file for workers in %s', wkr_lc, timediff)
     logger.info('Total # of Workers: %d', len(workers))
     logger.info('# Workers Memory Exceeded: %s', wkr_mem_exc)
     logger.info('# Workers Uptime Exceeded: %s', wkr_upt_exc)
@@ -856,14 +1006,14 @@ def perf_process_evm(evm_file, top_file):
 
     logger.info('----------- Generating Raw Data csv files -----------')
     starttime = time()
-    generate_raw_data_csv(messages, 'queue-rawdata.csv')
+    analyzer_to_raw_data_csv(analyzer, 'queue-rawdata.csv')
     generate_raw_data_csv(workers, 'workers-rawdata.csv')
     timediff = time() - starttime
     logger.info('Generated Raw Data csv files in: %s', timediff)
 
     logger.info('----------- Generating Hourly Buckets -----------')
     starttime = time()
-    hr_bkt = messages_to_hourly_buckets(messages, test_start, test_end)
+    hr_bkt = analyzer.hourly_buckets()
     timediff = time() - starttime
     logger.info('Generated Hourly Buckets in: %s', timediff)
 
@@ -893,7 +1043,7 @@ def perf_process_evm(evm_file, top_file):
 
     logger.info('----------- Generating Message Statistics -----------')
     starttime = time()
-    messages_to_statistics_csv(messages, 'queue-statistics.csv')
+    analyzer_to_statistics_csv(analyzer, 'queue-statistics.csv')
     timediff = time() - starttime
     logger.info('Generated Message Statistics in: %s', timediff)
 
@@ -10,9 +10,11 @@ The main clue to know what is limited by the filters and what isn't is the 'filt
 """
 import operator
 import six
-from collections import Mapping, OrderedDict
+from collections import Mapping, OrderedDict, defaultdict
 from copy import copy
 
+import attr
+
 from cfme.common.provider import all_types
 
 from cfme.exceptions import UnknownProviderType
@@ -87,24 +89,23 @@ class ProviderFilter(object):
             return None
         return any(provider.one_of(prov_class) for prov_class in self.classes)
 
-    def _filter_required_fields(self, provider):
-        """ Filters by required yaml fields (specified usually during test parametrization) """
-        if self.required_fields is None:
-            return None
-        for field_or_fields in self.required_fields:
+    @staticmethod
+    def has_required_fields(data, required_fields):
+        """ Checks the yaml data of a provider for the required fields """
+        for field_or_fields in required_fields:
             if isinstance(field_or_fields, tuple):
                 field_ident, field_value = field_or_fields
             else:
                 field_ident, field_value = field_or_fields, None
             if isinstance(field_ident, six.string_types):
-                if field_ident not in provider.data:
+                if field_ident not in data:
                     return False
                 else:
                     if field_value:
-                        if provider.data[field_ident] != field_value:
+                        if data[field_ident] != field_value:
                             return False
             else:
-                o = provider.data
+                o = data
                 try:
                     for field in field_ident:
                         o = o[field]
@@ -115,6 +116,55 @@ class ProviderFilter(object):
                     return False
         return True
 
+    @staticmethod
+    def allowed_flags(data):
+        """ Test flags a provider with the yaml data can be used for """
+        defined_flags = conf.cfme_data.get('test_flags', '')
+        if isinstance(defined_flags, six.string_types):
+            defined_flags = defined_flags.split(',')
+        defined_flags = [flag.strip() for flag in defined_flags]
+
+        excluded_flags = data.get('excluded_test_flags', '')
+        if isinstance(excluded_flags, six.string_types):
+            excluded_flags = excluded_flags.split(',')
+        excluded_flags = [flag.strip() for flag in excluded_flags]
+
+        return set(defined_flags) - set(excluded_flags)
+
+    @staticmethod
+    def version_restrictions(data):
+        """ Version restrictions of a provider with the yaml data, ``[(comparator, version)]`` """
+        # TODO
+        # get rid of this since_version hotfix by translating since_version
+        # to restricted_version; in addition, restricted_version should turn into
+        # "version_restrictions" and it should be a sequence of restrictions with operators
+        # so that we can create ranges like ">= 5.6" and "<= 5.8"
+        version_restrictions = []
+        since_version = data.get('since_version')
+        if since_version:
+            version_restrictions.append('>= {}'.format(since_version))
+        restricted_version = data.get('restricted_version')
+        if restricted_version:
+            version_restrictions.append(restricted_version)
+        result = []
+        for restriction in version_restrictions:
+            for op, comparator in ProviderFilter._version_operator_map.items():
+                # split string by op; if the split works, version won't be empty
+                head, op, ver = restriction.partition(op)
+                if not ver:  # This means that the operator was not found
+                    continue
+                result.append((comparator, ver))
+                break
+            else:
+                raise Exception('Operator not found in {}'.format(restriction))
+        return result
+
+    def _filter_required_fields(self, provider):
+        """ Filters by required yaml fields (specified usually during test parametrization) """
+        if self.required_fields is None:
+            return None
+        return self.has_required_fields(provider.data, self.required_fields)
+
     def _filter_required_tags(self, provider):
         """ Filters by required yaml tags """
         prov_tags = provider.data.get('tags', [])
@@ -130,18 +180,7 @@ class ProviderFilter(object):
             return None
         if self.required_flags:
             test_flags = [flag.strip() for flag in self.required_flags]
-
-            defined_flags = conf.cfme_data.get('test_flags', '')
-            if isinstance(defined_flags, six.string_types):
-                defined_flags = defined_flags.split(',')
-            defined_flags = [flag.strip() for flag in defined_flags]
-
-            excluded_flags = provider.data.get('excluded_test_flags', '')
-            if isinstance(excluded_flags, six.string_types):
-                excluded_flags = excluded_flags.split(',')
-            excluded_flags = [flag.strip() for flag in excluded_flags]
-
-            allowed_flags = set(defined_flags) - set(excluded_flags)
+            allowed_flags = self.allowed_flags(provider.data)
 
             if set(test_flags) - allowed_flags:
                 logger.info("Filtering Provider %s out because it does not have the right flags, "
@@ -154,34 +193,14 @@ class ProviderFilter(object):
     def _filter_restricted_version(self, provider):
         """ Filters by yaml version restriction; not applied if SSH is not available """
         if self.restrict_version:
-            # TODO
-            # get rid of this since_version hotfix by translating since_version
-            # to restricted_version; in addition, restricted_version should turn into
-            # "version_restrictions" and it should be a sequence of restrictions with operators
-            # so that we can create ranges like ">= 5.6" and "<= 5.8"
-            version_restrictions = []
-            since_version = provider.data.get('since_version')
-            if since_version:
-                version_restrictions.append('>= {}'.format(since_version))
-            restricted_version = provider.data.get('restricted_version')
-            if restricted_version:
-                version_restrictions.append(restricted_version)
-            for restriction in version_restrictions:
-                for op, comparator in ProviderFilter._version_operator_map.items():
-                    # split string by op; if the split works, version won't be empty
-                    head, op, ver = restriction.partition(op)
-                    if not ver:  # This means that the operator was not found
-                        continue
-                    try:
-                        curr_ver = provider.appliance.version
-                    except:
-                        return True
-                    ver = type(curr_ver)(ver)
-                    if not comparator(curr_ver, ver):
-                        return False
-                    break
-                else:
-                    raise Exception('Operator not found in {}'.format(restriction))
+            for comparator, ver in self.version_restrictions(provider.data):
+                try:
+                    curr_ver = provider.appliance.version
+                except:
+                    return True
+                ver = type(curr_ver)(ver)
+                if not comparator(curr_ver, ver):
+                    return False
         return None
 
     def __call__(self, provider):
@@ -227,6 +246,202 @@ class ProviderFilter(object):
     def copy(self):
         return copy(self)
 
+    def spec(self):
+        """ Returns the :py:class:`FilterSpec` of this filter, or None if it has custom logic """
+        if type(self).__call__ is not ProviderFilter.__call__:
+            return None
+        return FilterSpec(
+            keys=self.keys, classes=self.classes, required_fields=self.required_fields,
+            required_tags=self.required_tags, required_flags=self.required_flags,
+            restrict_version=self.restrict_version, inverted=self.inverted,
+            conjunctive=self.conjunctive)
+
+
+def _freeze(value):
+    """ Hashable copy of a filter criterion, lists and tuples stay different """
+    if isinstance(value, Mapping):
+        return 'dict', tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return 'set', frozenset(_freeze(item) for item in value)
+    if isinstance(value, (list, tuple)) and not isinstance(value, six.string_types):
+        return type(value).__name__, tuple(_freeze(item) for item in value)
+    return value
+
+
+@attr.s(frozen=True)
+class FilterSpec(object):
+    """ Criteria of a :py:class:`ProviderFilter`, compared by value so results can be memoized """
+    keys = attr.ib(cmp=False)
+    classes = attr.ib(cmp=False)
+    required_fields = attr.ib(cmp=False)
+    required_tags = attr.ib(cmp=False)
+    required_flags = attr.ib(cmp=False)
+    restrict_version = attr.ib(cmp=False)
+    inverted = attr.ib(cmp=False)
+    conjunctive = attr.ib(cmp=False)
+    signature = attr.ib(init=False, repr=False)
+
+    @signature.default
+    def _signature(self):
+        return _freeze((
+            self.keys, self.classes, self.required_fields, self.required_tags,
+            self.required_flags, bool(self.restrict_version), bool(self.inverted),
+            bool(self.conjunctive)))
+
+
+class ProviderCatalog(object):
+    """ Indexes of the providers in the yamls, for filtering them without the crud objects
+
+    Built once from the provider data, it indexes the provider keys by type, tag, allowed test
+    flag and top level field. :py:class:`ProviderFilter` criteria are then resolved to set
+    operations on the indexes, the provider keys matching a list of filters are memoized per
+    :py:class:`FilterSpec` (and appliance version if it matters).
+
+    Args:
+        data: the ``management_systems`` yaml data
+        get_class: returns the provider class of a provider type
+    """
+    def __init__(self, data, get_class=None):
+        get_class = get_class or get_class_from_type
+        self.data = data
+        self.keys = list(data)
+        self.all_keys = frozenset(self.keys)
+        self.by_type = defaultdict(set)
+        self.by_tag = defaultdict(set)
+        self.by_field = defaultdict(set)
+        self.by_flag = defaultdict(set)
+        self.type_classes = {}
+        self.restricted = []
+        for key in self.keys:
+            prov_data = data[key]
+            prov_type = prov_data.get('type')
+            if prov_type not in self.type_classes:
+                self.type_classes[prov_type] = get_class(prov_type)
+            self.by_type[prov_type].add(key)
+            for tag in prov_data.get('tags', []):
+                self.by_tag[tag].add(key)
+            for field in prov_data:
+                self.by_field[field].add(key)
+            for flag in ProviderFilter.allowed_flags(prov_data):
+                self.by_flag[flag].add(key)
+            if prov_data.get('since_version') or prov_data.get('restricted_version'):
+                self.restricted.append(key)
+        self._class_cache = {}
+        self._memo = {}
+
+    def _keys_of_classes(self, classes):
+        if classes not in self._class_cache:
+            self._class_cache[classes] = frozenset(
+                key
+                for prov_type, prov_class in self.type_classes.items()
+                if issubclass(prov_class, classes)
+                for key in self.by_type[prov_type])
+        return self._class_cache[classes]
+
+    def _keys_with_fields(self, required_fields):
+        candidates = self.all_keys
+        for field_or_fields in required_fields:
+            field_ident = field_or_fields[0] if isinstance(field_or_fields, tuple) else (
+                field_or_fields)
+            if not isinstance(field_ident, six.string_types):
+                field_ident = field_ident[0] if field_ident else None
+            if field_ident is not None:
+                candidates = candidates & self.by_field[field_ident]
+        return {key for key in candidates
+                if ProviderFilter.has_required_fields(self.data[key], required_fields)}
+
+    def _keys_with_flags(self, required_flags):
+        if not required_flags:
+            return self.all_keys
+        matching = set(self.all_keys)
+        for flag in required_flags:
+            matching &= self.by_flag[flag.strip()]
+        test_flags = {flag.strip() for flag in required_flags}
+        for key in self.all_keys - matching:
+            allowed_flags = ProviderFilter.allowed_flags(self.data[key])
+            logger.info("Filtering Provider %s out because it does not have the right flags, "
+                        "%s does not contain %s",
+                        self.data[key].get('name'), list(allowed_flags),
+                        list(test_flags - allowed_flags))
+        return matching
+
+    def _version_results(self, version):
+        """ ``ProviderFilter._filter_restricted_version`` results which are not None """
+        results = {}
+        for key in self.restricted:
+            restrictions = ProviderFilter.version_restrictions(self.data[key])
+            if version is None:
+                results[key] = True
+                continue
+            for comparator, ver in restrictions:
+                if not comparator(version, type(version)(ver)):
+                    results[key] = False
+                    break
+        return results
+
+    def _matching(self, spec, version):
+        relevant = []
+        if spec.keys is not None:
+            relevant.append(self.all_keys & set(spec.keys))
+        if spec.classes is not None:
+            relevant.append(self._keys_of_classes(tuple(spec.classes)))
+        if spec.required_fields is not None:
+            relevant.append(self._keys_with_fields(spec.required_fields))
+        if spec.required_tags is not None:
+            relevant.append(set().union(*(self.by_tag[tag] for tag in spec.required_tags)))
+        if spec.required_flags is not None:
+            relevant.append(self._keys_with_flags(spec.required_flags))
+        version_results = self._version_results(version) if spec.restrict_version else {}
+        if spec.conjunctive:
+            matching = set(self.all_keys)
+            for keys in relevant:
+                matching &= keys
+            matching -= {key for key, result in version_results.items() if result is False}
+        else:
+            matching = set()
+            for keys in relevant:
+                matching |= keys
+            matching |= {key for key, result in version_results.items() if result is True}
+        if spec.inverted:
+            return self.all_keys - matching
+        return matching
+
+    def filter_keys(self, specs, version=None):
+        """ Returns the keys of the providers matching all the filter specs, in the yaml order
+
+        Args:
+            specs: list of :py:class:`FilterSpec`
+            version: appliance version for the ``restrict_version`` filters, None if unknown
+        """
+        specs = tuple(specs)
+        memo_key = (specs, str(version) if any(spec.restrict_version for spec in specs) else None)
+        if memo_key not in self._memo:
+            matching = set(self.all_keys)
+            for spec in specs:
+                matching &= self._matching(spec, version)
+            self._memo[memo_key] = [key for key in self.keys if key in matching]
+        return self._memo[memo_key]
+
+
+_catalog = None
+
+
+def provider_catalog():
+    """ Returns the :py:class:`ProviderCatalog` of the providers in the yamls """
+    global _catalog
+    if _catalog is None or _catalog.data is not providers_data:
+        _catalog = ProviderCatalog(providers_data)
+    return _catalog
+
+
+def _current_version():
+    """ Version of the current appliance, None if it cannot be found out (e.g. no SSH) """
+    from cfme.utils.appliance import get_or_create_current_appliance
+    try:
+        return get_or_create_current_appliance().version
+    except Exception:
+        return None
+
 
 # Only providers without the 'disabled' tag
 global_filters['enabled_only'] = ProviderFilter(required_tags=['disabled'], inverted=True)
@@ -252,8 +467,21 @@ def list_providers(filters=None, use_global_filters=True):
     filters = filters or []
     if use_global_filters:
         filters = filters + list(global_filters.values())
-    providers = [get_crud(prov_key) for prov_key in providers_data]
+    specs = []
+    custom_filters = []
     for prov_filter in filters:
+        spec = prov_filter.spec() if isinstance(prov_filter, ProviderFilter) else None
+        if spec is None:
+            custom_filters.append(prov_filter)
+        else:
+            specs.append(spec)
+    catalog = provider_catalog()
+    version = None
+    # the version only matters for the providers restricted to some versions
+    if catalog.restricted and any(spec.restrict_version for spec in specs):
+        version = _current_version()
+    providers = [get_crud(prov_key) for prov_key in catalog.filter_keys(specs, version)]
+    for prov_filter in custom_filters:
         providers = list(filter(prov_filter, providers))
     return providers
 
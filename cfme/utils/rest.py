@@ -2,9 +2,13 @@
 """Helper functions for tests using REST API."""
 import pytest
 from collections import namedtuple
+from functools import reduce
+from time import sleep, time
+
+from manageiq_client.filters import Q
 
 from cfme.exceptions import OptionNotAvailable
-from cfme.utils.wait import wait_for
+from cfme.utils.wait import TimedOutError, wait_for
 
 
 def assert_response(
@@ -125,6 +129,67 @@ def get_vms_in_service(service):
     return [rest_api.get_entity('vms', vm['id']) for vm in service.vms.all]
 
 
+def any_of(attr, values):
+    """Filter matching resources whose ``attr`` is any of the values, for ``filter[]``"""
+    return reduce(lambda q, value: q | Q(attr, '=', value), values[1:],
+                  Q(attr, '=', values[0])).as_filters
+
+
+def query_resources(collection, attr, values, attributes=None):
+    """Entities of the collection whose ``attr`` is any of the values, in one query
+
+    The entities come with their data expanded, limited to the ``attributes`` if given.
+    """
+    params = {'expand': 'resources', 'filter[]': any_of(attr, values)}
+    if attributes:
+        params['attributes'] = ','.join(attributes)
+    # iterating the search result would GET each of them
+    return collection.query_string(**params).resources
+
+
+def wait_for_resources(collection, attr, values, substr_search=False, num_sec=180, delay=0.5,
+                       max_delay=10):
+    """Waits until the collection has a resource for each of the values of ``attr``
+
+    All the values still missing are looked up in one filtered query per try, tried again with
+    the delay doubled each time, up to ``max_delay``.
+
+    Args:
+        collection: the collection to look the resources up in
+        attr: the attribute to match, e.g. ``name``
+        values: values of the resources to wait for
+        substr_search: if True, a value only needs to be a substring of the attribute
+        num_sec: seconds to wait for all the resources
+        delay: seconds to wait before the first retry
+        max_delay: seconds to wait between two tries at most
+
+    Raises:
+        :py:class:`wait_for.TimedOutError` if some are still missing after ``num_sec``
+    """
+    pending = list(values)
+    search_str = '%{}%' if substr_search else '{}'
+
+    def _all_found():
+        resources = query_resources(
+            collection, attr, [search_str.format(value) for value in pending], attributes=[attr])
+        found = [resource._data.get(attr) for resource in resources]
+        pending[:] = [
+            value for value in pending
+            if not any(value in f if substr_search else value == f
+                       for f in found if f is not None)]
+        return not pending
+
+    # wait_for(expo=True) would double the delay past the timeout
+    deadline = time() + num_sec
+    while not _all_found():
+        remaining = deadline - time()
+        if remaining <= 0:
+            raise TimedOutError('Could not find {} {} in {} in {} sec'.format(
+                attr, pending, collection.name, num_sec))
+        sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
+
 def create_resource(rest_api, col_name, col_data, col_action='create', substr_search=False):
     """Creates new resource in collection."""
     collection = getattr(rest_api.collections, col_name)
@@ -136,23 +201,38 @@ def create_resource(rest_api, col_name, col_data, col_action='create', substr_se
 
     entities = action(*col_data)
     action_response = rest_api.response
-    search_str = '%{}%' if substr_search else '{}'
-    for entity in col_data:
-        if entity.get('name'):
-            wait_for(lambda: collection.find_by(
-                name=search_str.format(entity.get('name'))) or False, num_sec=180, delay=10)
-        elif entity.get('description'):
-            wait_for(lambda: collection.find_by(
-                description=search_str.format(entity.get('description'))) or False,
-                num_sec=180, delay=10)
-        else:
-            raise NotImplementedError
+    names = [entity['name'] for entity in col_data if entity.get('name')]
+    descriptions = [entity['description'] for entity in col_data
+                    if entity.get('description') and not entity.get('name')]
+    if len(names) + len(descriptions) < len(col_data):
+        raise NotImplementedError
+    if names:
+        wait_for_resources(collection, 'name', names, substr_search=substr_search)
+    if descriptions:
+        wait_for_resources(collection, 'description', descriptions, substr_search=substr_search)
 
     # make sure action response is preserved
     rest_api.response = action_response
     return entities
 
 
+def delete_resources_by_id(collection, ids):
+    """Deletes the resources with the ids which still exist, with one bulk action
+
+    Neither the collection nor the resources are loaded, the resources still existing are looked
+    up with one filtered query.
+    """
+    ids = list(ids)
+    if not ids:
+        return
+    rest_api = collection._api
+    existing = [resource._data['id'] for resource in query_resources(
+        collection, 'id', ids, attributes=['id'])]
+    if existing:
+        rest_api.post(collection._href, action='delete',
+                      resources=[{'id': resource_id} for resource_id in existing])
+
+
 def delete_resources_from_collection(
         resources, collection=None, not_found=None, num_sec=10, delay=2, check_response=True):
     """Checks that delete from collection works as expected."""
@@ -0,0 +1,160 @@
+"""On-disk history of test durations and outcomes
+
+Every finished test is stored as one row in a local SQLite database, together with the appliance
+and provider it ran against. The data is written incrementally while the session runs, so even
+an interrupted run leaves usable history behind, and can be queried by anything that wants to
+know how long a test usually takes or how it did last time, without re-parsing old artifacts.
+
+Usage::
+
+    history = RunHistory()
+    run = history.start_run(run_id='1234')
+    history.record(run, 'cfme/tests/test_login.py::test_login', 12.3, 'passed')
+    history.durations()  # {'cfme/tests/test_login.py::test_login': 12.3}
+
+"""
+import sqlite3
+import time
+from collections import defaultdict, namedtuple
+
+from cfme.utils.path import log_path
+
+#: Default location of the history database
+DEFAULT_HISTORY_PATH = log_path.join('run_history.sqlite')
+
+HistoryResult = namedtuple(
+    'HistoryResult',
+    ['run', 'nodeid', 'ident', 'duration', 'outcome', 'appliance', 'provider', 'finished'])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT,
+    started REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    run INTEGER NOT NULL REFERENCES runs(id),
+    nodeid TEXT NOT NULL,
+    ident TEXT,
+    duration REAL NOT NULL,
+    outcome TEXT NOT NULL,
+    appliance TEXT,
+    provider TEXT,
+    finished REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_nodeid ON results (nodeid, run);
+CREATE INDEX IF NOT EXISTS results_ident ON results (ident, run);
+"""
+
+
+def overall_outcome(reports):
+    """Collapse the setup/call/teardown reports of one test into a single outcome
+
+    Uses the same vocabulary as the artifactor reporter:
+    passed, failed, skipped, error, xfailed and xpassed.
+    """
+    for report in reports:
+        xfail = hasattr(report, 'wasxfail')
+        if report.when == 'call' and xfail:
+            return 'xfailed' if report.outcome == 'skipped' else 'xpassed'
+        elif report.when in ('setup', 'teardown') and report.outcome == 'failed':
+            return 'error'
+        elif report.outcome == 'skipped':
+            return 'skipped'
+        elif report.when == 'call' and report.outcome == 'failed':
+            return 'failed'
+    return 'passed'
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.
+
+
+class RunHistory(object):
+    """Query and record API of the history database
+
+    Args:
+        path: path of the SQLite database, created if missing
+    """
+    def __init__(self, path=None):
+        self.path = str(path or DEFAULT_HISTORY_PATH)
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        # readers (report generation, slaves) must not block the recording master
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def start_run(self, run_id=None):
+        """Register a new run, returns its numeric id to be passed to :py:meth:`record`"""
+        with self.conn:
+            cursor = self.conn.execute(
+                'INSERT INTO runs (run_id, started) VALUES (?, ?)',
+                (None if run_id is None else str(run_id), time.time()))
+        return cursor.lastrowid
+
+    def last_run(self):
+        """Numeric id of the most recently started run, or None"""
+        return self.conn.execute('SELECT MAX(id) FROM runs').fetchone()[0]
+
+    def record(self, run, nodeid, duration, outcome, ident=None, appliance=None, provider=None):
+        """Store the result of one test, committed immediately"""
+        with self.conn:
+            self.conn.execute(
+                'INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (run, nodeid, ident, duration, outcome, appliance, provider, time.time()))
+
+    def results(self, nodeid=None, ident=None, before_run=None, limit=None):
+        """Return :py:class:`HistoryResult` rows, most recent first
+
+        Args:
+            nodeid: only return results of this node id
+            ident: only return results of this artifactor test ident (``location/name``)
+            before_run: only return results of runs started before this one
+            limit: maximum number of rows to return
+        """
+        query, args = 'SELECT * FROM results WHERE 1', []
+        for column, value in (('nodeid', nodeid), ('ident', ident)):
+            if value is not None:
+                query += ' AND {} = ?'.format(column)
+                args.append(value)
+        if before_run is not None:
+            query += ' AND run < ?'
+            args.append(before_run)
+        query += ' ORDER BY run DESC, finished DESC'
+        if limit is not None:
+            query += ' LIMIT ?'
+            args.append(limit)
+        return [HistoryResult(*row) for row in self.conn.execute(query, args)]
+
+    def durations(self, last=5, before_run=None):
+        """Estimated duration of every known test
+
+        Returns:
+            dict of node id to the median duration of its ``last`` most recent results
+        """
+        query, args = 'SELECT nodeid, duration FROM results', []
+        if before_run is not None:
+            query += ' WHERE run < ?'
+            args.append(before_run)
+        query += ' ORDER BY run DESC, finished DESC'
+        samples = defaultdict(list)
+        for nodeid, duration in self.conn.execute(query, args):
+            if len(samples[nodeid]) < last:
+                samples[nodeid].append(duration)
+        return {nodeid: _median(values) for nodeid, values in samples.items()}
+
+    def latest_results(self, key='nodeid', before_run=None):
+        """The most recent :py:class:`HistoryResult` of every test, keyed by ``nodeid`` or
+        ``ident``"""
+        latest = {}
+        for result in self.results(before_run=before_run):
+            latest.setdefault(getattr(result, key), result)
+        latest.pop(None, None)
+        return latest
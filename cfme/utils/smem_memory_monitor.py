@@ -1,21 +1,28 @@
 """Monitor Memory on a CFME/Miq appliance and builds report&graphs displaying usage per process."""
 import json
+import socket
 import time
 import traceback
+from array import array
+from bisect import bisect_left
 from collections import OrderedDict
 from datetime import datetime
 from threading import Thread
 
 import os
+import paramiko
 import six
 import yaml
 from yaycl import AttrDict
 
-from cfme.utils.conf import cfme_performance
+try:
+    from collections.abc import Mapping
+except ImportError:  # python 2
+    from collections import Mapping
+
 from cfme.utils.log import logger
 from cfme.utils.path import results_path
 from cfme.utils.version import current_version
-from cfme.utils.version import get_version
 
 miq_workers = [
     'MiqGenericWorker',
@@ -131,75 +138,310 @@ process_order.extend(['memcached', 'postgres', 'httpd', 'collectd'])
 # Timestamp created at first import, thus grouping all reports of like workload
 test_ts = time.strftime('%Y%m%d%H%M%S')
 
-# 10s sample interval (occasionally sampling can take almost 4s on an appliance doing a lot of work)
+# Default 10s sample interval (sampling used to take up to 4s on an appliance doing a lot of work)
 SAMPLE_INTERVAL = 10
 
 
+#: Smallest supported sample interval in seconds
+MIN_SAMPLE_INTERVAL = 1
+# Seconds between refreshes of the worker list while new ruby processes are unidentified
+WORKER_REFRESH_INTERVAL = 10
+# Errors of a collector that went silent or lost its connection, a new collector is started
+COLLECTOR_ERRORS = (socket.timeout, socket.error, EOFError, paramiko.SSHException)
+
+# Processes the collector reports, identified by their name (comm)
+named_processes = {
+    'httpd': 'httpd',
+    'postgres': 'postgres',
+    'postmaster': 'postgres',
+    'memcached': 'memcached',
+    'collectd': 'collectd',
+}
+# Non worker ruby processes, identified by a part of their command line
+ruby_commands = [
+    ('evm_server.rb', 'MIQ Server (evm_server.rb)'),
+    ('MIQ Server', 'MIQ Server (evm_server.rb)'),
+    ('evm_watchdog.rb', 'evm_watchdog.rb'),
+    ('appliance_console.rb', 'appliance_console.rb'),
+    ('evm:dbsync:replicate', 'evm:dbsync:replicate'),
+]
+
+# Per process measurements, in the order the collector prints them
+process_measurements = ('rss', 'pss', 'uss', 'vss', 'swap')
+# /proc/meminfo fields, in the order the collector prints them
+meminfo_fields = ('MemTotal', 'MemFree', 'Buffers', 'Cached', 'Slab', 'SwapTotal', 'SwapFree')
+
+# Runs on the appliance (python 2 or 3) for the whole test and prints a line per sample:
+#   M,<timestamp>,<meminfo_fields in kB...>,<1 if MemAvailable is present else 0>
+#   N,<pid>,<name>,<command line>        the first time a process (or a new command line) is seen
+#   S,<pid>,<process_measurements in kB...>
+# The S lines following an M line belong to its timestamp. smaps_rollup sums up the mappings in
+# the kernel; older kernels (RHEL 7) don't have it, so smaps is summed up instead.
+COLLECTOR_SCRIPT = r'''
+import os, sys, time
+
+interval = float(sys.argv[1])
+names = set(sys.argv[2:])
+meminfo_fields = %r
+smaps_fields = {'Rss': 0, 'Pss': 1, 'Private_Clean': 2, 'Private_Dirty': 2, 'Swap': 4}
+page_kb = os.sysconf('SC_PAGE_SIZE') // 1024
+seen = {}
+
+
+def read(path):
+    with open(path) as proc_file:
+        return proc_file.read()
+
+
+def sample_process(pid):
+    try:
+        data = read('/proc/%%s/smaps_rollup' %% pid)
+    except IOError:
+        data = read('/proc/%%s/smaps' %% pid)
+    values = [0, 0, 0, int(read('/proc/%%s/statm' %% pid).split()[0]) * page_kb, 0]
+    for line in data.splitlines():
+        index = smaps_fields.get(line.split(':', 1)[0])
+        if index is not None:
+            values[index] += int(line.split()[1])
+    return values
+
+
+while True:
+    start = time.time()
+    meminfo = dict(
+        (line.split(':')[0], line.split()[1]) for line in read('/proc/meminfo').splitlines())
+    out = ['M,%%.6f,%%s,%%d\n' %% (
+        start, ','.join(meminfo[field] for field in meminfo_fields), 'MemAvailable' in meminfo)]
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            cmd = ' '.join(read('/proc/%%s/cmdline' %% pid).replace('\0', ' ').split())
+            name = read('/proc/%%s/comm' %% pid).strip()
+            if name not in names:
+                if not cmd.startswith('MIQ'):
+                    continue
+                name = 'ruby'
+            values = sample_process(pid)
+        except (IOError, OSError, ValueError, IndexError):
+            # the process is gone (or a kernel thread)
+            continue
+        if seen.get(pid) != cmd:
+            seen[pid] = cmd
+            out.append('N,%%s,%%s,%%s\n' %% (pid, name, cmd))
+        out.append('S,%%s,%%s\n' %% (pid, ','.join(str(value) for value in values)))
+    sys.stdout.write(''.join(out))
+    sys.stdout.flush()
+    time.sleep(max(0, interval - (time.time() - start)))
+''' % (meminfo_fields, )
+
+
+def classify_process(pid, name, cmd, workers):
+    """Return the name the process is reported under, ``None`` if it is not (yet) known
+
+    Args:
+        pid: process id
+        name: process name (comm)
+        cmd: command line of the process
+        workers: dict of pid to the type of the MIQ worker
+    """
+    if pid in workers:
+        return workers[pid]
+    if name in named_processes:
+        return named_processes[name]
+    if name == 'ruby':
+        for part, process_name in ruby_commands:
+            if part in cmd:
+                return process_name
+    return None
+
+
+class ProcessSamples(Mapping):
+    """Samples of one process, ``timestamp -> {measurement: MiB}``
+
+    The samples are kept in arrays of kB and only turned into dicts when they are looked up, so
+    this can stand in for the nested dicts the report functions expect. The arrays are of doubles,
+    a C long is only 32 bits on some platforms.
+    """
+    def __init__(self, samples):
+        self._samples = samples
+        self._ticks = array('d')
+        self._values = array('d')
+
+    def append(self, tick, values):
+        self._ticks.append(tick)
+        self._values.extend(values)
+
+    def _position(self, ts):
+        tick = self._samples.tick_index[ts]
+        position = bisect_left(self._ticks, tick)
+        if position == len(self._ticks) or self._ticks[position] != tick:
+            raise KeyError(ts)
+        return position
+
+    def __getitem__(self, ts):
+        width = len(process_measurements)
+        position = self._position(ts) * width
+        return {measurement: value / 1024.0 for measurement, value in zip(
+            process_measurements, self._values[position:position + width])}
+
+    def __contains__(self, ts):
+        try:
+            self._position(ts)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        ticks = self._samples.ticks
+        for tick in self._ticks:
+            yield ticks[int(tick)]
+
+    def __len__(self):
+        return len(self._ticks)
+
+    def keys(self):
+        return list(self)
+
+
+class ApplianceSamples(Mapping):
+    """Appliance wide samples, ``timestamp -> {measurement: MiB}``, see :py:class:`ProcessSamples`
+    """
+    def __init__(self, samples):
+        self._samples = samples
+        self._meminfo = array('d')
+        self.use_slab = False
+
+    def append(self, meminfo, has_available):
+        self._meminfo.extend(meminfo)
+        # 5.5+ (RHEL/Centos 7): Application Memory Used : MemTotal - (MemFree + Slab + Cached)
+        # 5.4 (RHEL/Centos 6): Application Memory Used : MemTotal - (MemFree + Buffers + Cached)
+        self.use_slab = has_available
+
+    def __getitem__(self, ts):
+        width = len(meminfo_fields)
+        position = self._samples.tick_index[ts] * width
+        meminfo = dict(zip(meminfo_fields, self._meminfo[position:position + width]))
+        reclaimable = meminfo['Slab'] if self.use_slab else meminfo['Buffers']
+        used = meminfo['MemTotal'] - (meminfo['MemFree'] + reclaimable + meminfo['Cached'])
+        return {
+            'total': meminfo['MemTotal'] / 1024.0,
+            'free': meminfo['MemFree'] / 1024.0,
+            'used': used / 1024.0,
+            'buffers': meminfo['Buffers'] / 1024.0,
+            'cached': meminfo['Cached'] / 1024.0,
+            'slab': meminfo['Slab'] / 1024.0,
+            'swap_total': meminfo['SwapTotal'] / 1024.0,
+            'swap_free': meminfo['SwapFree'] / 1024.0,
+        }
+
+    def __iter__(self):
+        return iter(self._samples.ticks)
+
+    def __len__(self):
+        return len(self._samples.ticks)
+
+    def keys(self):
+        return list(self)
+
+
+class MemorySamples(object):
+    """Time series built from the lines printed by :py:data:`COLLECTOR_SCRIPT`
+
+    ``appliance_results`` and ``process_results`` have the shape of the results the report
+    functions take: ``appliance_results[timestamp][measurement]`` and
+    ``process_results[name][pid][timestamp][measurement]``.
+    """
+    def __init__(self):
+        self.ticks = []
+        self.tick_index = {}
+        self.workers = {}
+        # pid -> (name, cmd) of the ruby processes waiting for the worker list to be refreshed
+        self.unidentified = OrderedDict()
+        self.appliance_results = ApplianceSamples(self)
+        self.process_results = OrderedDict()
+        self._by_pid = {}
+
+    @property
+    def use_slab(self):
+        return self.appliance_results.use_slab
+
+    def feed(self, line):
+        """Process one line of the collector, returns its kind (``M``, ``N`` or ``S``)"""
+        kind, _, rest = line.rstrip('\n').partition(',')
+        if kind == 'M':
+            values = rest.split(',')
+            ts = datetime.fromtimestamp(float(values[0]))
+            self.tick_index[ts] = len(self.ticks)
+            self.ticks.append(ts)
+            self.appliance_results.append(
+                [int(value) for value in values[1:-1]], values[-1] == '1')
+        elif kind == 'N':
+            pid, name, cmd = rest.split(',', 2)
+            self._identify(pid, name, cmd)
+        elif kind == 'S' and self.ticks:
+            values = rest.split(',')
+            series = self._by_pid.get(values[0])
+            if series is not None:
+                series.append(len(self.ticks) - 1, [int(value) for value in values[1:]])
+        else:
+            logger.warning('Unexpected output from the memory collector: {}'.format(line))
+        return kind
+
+    def _identify(self, pid, name, cmd):
+        self._by_pid.pop(pid, None)
+        self.unidentified.pop(pid, None)
+        process_name = classify_process(pid, name, cmd, self.workers)
+        if process_name is None:
+            if name == 'ruby':
+                self.unidentified[pid] = (name, cmd)
+            return
+        pids = self.process_results.setdefault(process_name, OrderedDict())
+        if pid not in pids:
+            pids[pid] = ProcessSamples(self)
+        self._by_pid[pid] = pids[pid]
+
+    def update_workers(self, workers):
+        """Replace the pid -> worker type dict and identify the processes waiting for it"""
+        self.workers = workers
+        for pid, (name, cmd) in list(self.unidentified.items()):
+            self._identify(pid, name, cmd)
+
+
 class SmemMemoryMonitor(Thread):
-    def __init__(self, ssh_client, scenario_data):
+    """Samples the memory of the appliance and its processes until ``signal`` is set to False,
+    then creates the report
+
+    A collector script is started on the appliance once and streams the samples back over a
+    single SSH channel; it reads ``/proc/<pid>/smaps_rollup`` (``smaps`` on older kernels)
+    directly instead of running ``smem``. The worker list is only queried when a ruby process
+    shows up that is not known yet.
+
+    Args:
+        ssh_client: client connected to the appliance
+        scenario_data: scenario of the test, ``memory_sample_interval`` of the scenario overrides
+            the default :py:data:`SAMPLE_INTERVAL`
+        sample_interval: seconds between two samples, at least :py:data:`MIN_SAMPLE_INTERVAL`
+    """
+    def __init__(self, ssh_client, scenario_data, sample_interval=None):
         super(SmemMemoryMonitor, self).__init__()
+        if sample_interval is None:
+            sample_interval = scenario_data['scenario'].get(
+                'memory_sample_interval', SAMPLE_INTERVAL)
+        if sample_interval < MIN_SAMPLE_INTERVAL:
+            raise ValueError('Memory sample interval must be at least {}s, got {}'.format(
+                MIN_SAMPLE_INTERVAL, sample_interval))
         self.ssh_client = ssh_client
         self.scenario_data = scenario_data
+        self.sample_interval = sample_interval
+        self.samples = MemorySamples()
         self.grafana_urls = {}
         self.miq_server_id = ''
-        self.use_slab = False
         self.signal = True
 
-    def create_process_result(self, process_results, starttime, process_pid, process_name,
-            memory_by_pid):
-        if process_pid in memory_by_pid.keys():
-            if process_name not in process_results:
-                process_results[process_name] = OrderedDict()
-                process_results[process_name][process_pid] = OrderedDict()
-            if process_pid not in process_results[process_name]:
-                process_results[process_name][process_pid] = OrderedDict()
-            process_results[process_name][process_pid][starttime] = {}
-            rss_mem = memory_by_pid[process_pid]['rss']
-            pss_mem = memory_by_pid[process_pid]['pss']
-            uss_mem = memory_by_pid[process_pid]['uss']
-            vss_mem = memory_by_pid[process_pid]['vss']
-            swap_mem = memory_by_pid[process_pid]['swap']
-            process_results[process_name][process_pid][starttime]['rss'] = rss_mem
-            process_results[process_name][process_pid][starttime]['pss'] = pss_mem
-            process_results[process_name][process_pid][starttime]['uss'] = uss_mem
-            process_results[process_name][process_pid][starttime]['vss'] = vss_mem
-            process_results[process_name][process_pid][starttime]['swap'] = swap_mem
-            del memory_by_pid[process_pid]
-        else:
-            logger.warn('Process {} PID, not found: {}'.format(process_name, process_pid))
-
-    def get_appliance_memory(self, appliance_results, plottime):
-        # 5.5/5.6 - RHEL 7 / Centos 7
-        # Application Memory Used : MemTotal - (MemFree + Slab + Cached)
-        # 5.4 - RHEL 6 / Centos 6
-        # Application Memory Used : MemTotal - (MemFree + Buffers + Cached)
-        # Available memory could potentially be better metric
-        appliance_results[plottime] = {}
-
-        result = self.ssh_client.run_command('cat /proc/meminfo')
-        if result.failed:
-            logger.error('Exit_status nonzero in get_appliance_memory: {}, {}'
-                         .format(result.rc, result.output))
-            del appliance_results[plottime]
-        else:
-            meminfo_raw = result.output.replace('kB', '').strip()
-            meminfo = OrderedDict((k.strip(), v.strip()) for k, v in
-                (value.strip().split(':') for value in meminfo_raw.split('\n')))
-            appliance_results[plottime]['total'] = float(meminfo['MemTotal']) / 1024
-            appliance_results[plottime]['free'] = float(meminfo['MemFree']) / 1024
-            if 'MemAvailable' in meminfo:  # 5.5, RHEL 7/Centos 7
-                self.use_slab = True
-                mem_used = (float(meminfo['MemTotal']) - (float(meminfo['MemFree']) + float(
-                    meminfo['Slab']) + float(meminfo['Cached']))) / 1024
-            else:  # 5.4, RHEL 6/Centos 6
-                mem_used = (float(meminfo['MemTotal']) - (float(meminfo['MemFree']) + float(
-                    meminfo['Buffers']) + float(meminfo['Cached']))) / 1024
-            appliance_results[plottime]['used'] = mem_used
-            appliance_results[plottime]['buffers'] = float(meminfo['Buffers']) / 1024
-            appliance_results[plottime]['cached'] = float(meminfo['Cached']) / 1024
-            appliance_results[plottime]['slab'] = float(meminfo['Slab']) / 1024
-            appliance_results[plottime]['swap_total'] = float(meminfo['SwapTotal']) / 1024
-            appliance_results[plottime]['swap_free'] = float(meminfo['SwapFree']) / 1024
+    @property
+    def use_slab(self):
+        return self.samples.use_slab
 
     def get_evm_workers(self):
         result = self.ssh_client.run_command(
@@ -218,22 +460,6 @@ class SmemMemoryMonitor(Thread):
         else:
             return {}
 
-    # Old method of obtaining per process memory (Appliances without smem)
-    # def get_pids_memory(self):
-    #     result = self.ssh_client.run_command(
-    #         'ps -A -o pid,rss,vsz,comm,cmd | sed 1d')
-    #     pids_memory = result.output.strip().split('\n')
-    #     memory_by_pid = {}
-    #     for line in pids_memory:
-    #         values = [s for s in line.strip().split(' ') if s]
-    #         pid = values[0]
-    #         memory_by_pid[pid] = {}
-    #         memory_by_pid[pid]['rss'] = float(values[1]) / 1024
-    #         memory_by_pid[pid]['vss'] = float(values[2]) / 1024
-    #         memory_by_pid[pid]['name'] = values[3]
-    #         memory_by_pid[pid]['cmd'] = ' '.join(values[4:])
-    #     return memory_by_pid
-
     def get_miq_server_id(self):
         # Obtain the Miq Server GUID:
         result = self.ssh_client.run_command('cat /var/www/miq/vmdb/GUID')
@@ -245,113 +471,55 @@ class SmemMemoryMonitor(Thread):
         logger.info('Obtained miq_server_id: {}'.format(result.output.strip()))
         self.miq_server_id = result.output.strip()
 
-    def get_pids_memory(self):
-        result = self.ssh_client.run_command(
-            'smem -c \'pid rss pss uss vss swap name command\' | sed 1d')
-        pids_memory = result.output.strip().split('\n')
-        memory_by_pid = {}
-        for line in pids_memory:
-            if line.strip():
-                try:
-                    values = [s for s in line.strip().split(' ') if s]
-                    pid = values[0]
-                    int(pid)
-                    memory_by_pid[pid] = {}
-                    memory_by_pid[pid]['rss'] = float(values[1]) / 1024
-                    memory_by_pid[pid]['pss'] = float(values[2]) / 1024
-                    memory_by_pid[pid]['uss'] = float(values[3]) / 1024
-                    memory_by_pid[pid]['vss'] = float(values[4]) / 1024
-                    memory_by_pid[pid]['swap'] = float(values[5]) / 1024
-                    memory_by_pid[pid]['name'] = values[6]
-                    memory_by_pid[pid]['cmd'] = ' '.join(values[7:])
-                except Exception as e:
-                    logger.error('Processing smem output error: {}'.format(e.__class__.__name__, e))
-                    logger.error('Issue with pid: {} line: {}'.format(pid, line))
-                    logger.error('Complete smem output: {}'.format(result.output))
-        return memory_by_pid
+    def collector_lines(self):
+        """Start the collector on the appliance and yield its lines until ``signal`` is unset"""
+        # run in the container or pod and with sudo like any other command
+        session = self.ssh_client.exec_channel(
+            '"$(command -v python || command -v python3)" - {} {}'.format(
+                self.sample_interval, ' '.join(sorted(set(named_processes) | {'ruby'}))))
+        try:
+            # a missed sample or two is fine, a collector that went silent is not
+            session.settimeout(max(60, 5 * self.sample_interval))
+            session.sendall(COLLECTOR_SCRIPT)
+            session.shutdown_write()
+            for line in session.makefile('r'):
+                if not self.signal:
+                    break
+                yield line
+            else:
+                logger.error('Memory collector exited with {}: {}'.format(
+                    session.recv_exit_status(), session.makefile_stderr('r').read()))
+        finally:
+            # closing the channel makes the collector die on its next write
+            session.close()
 
     def _real_run(self):
-        """ Result dictionaries:
-        appliance_results[timestamp][measurement] = value
-        appliance_results[timestamp]['total'] = value
-        appliance_results[timestamp]['free'] = value
-        appliance_results[timestamp]['used'] = value
-        appliance_results[timestamp]['buffers'] = value
-        appliance_results[timestamp]['cached'] = value
-        appliance_results[timestamp]['slab'] = value
-        appliance_results[timestamp]['swap_total'] = value
-        appliance_results[timestamp]['swap_free'] = value
-        appliance measurements: total/free/used/buffers/cached/slab/swap_total/swap_free
-        process_results[name][pid][timestamp][measurement] = value
-        process_results[name][pid][timestamp]['rss'] = value
-        process_results[name][pid][timestamp]['pss'] = value
-        process_results[name][pid][timestamp]['uss'] = value
-        process_results[name][pid][timestamp]['vss'] = value
-        process_results[name][pid][timestamp]['swap'] = value
-        """
-        appliance_results = OrderedDict()
-        process_results = OrderedDict()
-        install_smem(self.ssh_client)
         self.get_miq_server_id()
-        logger.info('Starting Monitoring Thread.')
-        while self.signal:
-            starttime = time.time()
-            plottime = datetime.now()
-
-            self.get_appliance_memory(appliance_results, plottime)
-            workers = self.get_evm_workers()
-            memory_by_pid = self.get_pids_memory()
-
-            for worker_pid in workers:
-                self.create_process_result(process_results, plottime, worker_pid,
-                    workers[worker_pid], memory_by_pid)
-
-            for pid in sorted(memory_by_pid.keys()):
-                if memory_by_pid[pid]['name'] == 'httpd':
-                    self.create_process_result(process_results, plottime, pid, 'httpd',
-                        memory_by_pid)
-                elif memory_by_pid[pid]['name'] == 'postgres':
-                    self.create_process_result(process_results, plottime, pid, 'postgres',
-                        memory_by_pid)
-                elif memory_by_pid[pid]['name'] == 'postmaster':
-                    self.create_process_result(process_results, plottime, pid, 'postgres',
-                        memory_by_pid)
-                elif memory_by_pid[pid]['name'] == 'memcached':
-                    self.create_process_result(process_results, plottime, pid, 'memcached',
-                        memory_by_pid)
-                elif memory_by_pid[pid]['name'] == 'collectd':
-                    self.create_process_result(process_results, plottime, pid, 'collectd',
-                        memory_by_pid)
-                elif memory_by_pid[pid]['name'] == 'ruby':
-                    if 'evm_server.rb' in memory_by_pid[pid]['cmd']:
-                        self.create_process_result(process_results, plottime, pid,
-                            'MIQ Server (evm_server.rb)', memory_by_pid)
-                    elif 'MIQ Server' in memory_by_pid[pid]['cmd']:
-                        self.create_process_result(process_results, plottime, pid,
-                            'MIQ Server (evm_server.rb)', memory_by_pid)
-                    elif 'evm_watchdog.rb' in memory_by_pid[pid]['cmd']:
-                        self.create_process_result(process_results, plottime, pid,
-                            'evm_watchdog.rb', memory_by_pid)
-                    elif 'appliance_console.rb' in memory_by_pid[pid]['cmd']:
-                        self.create_process_result(process_results, plottime, pid,
-                            'appliance_console.rb', memory_by_pid)
-                    elif 'evm:dbsync:replicate' in memory_by_pid[pid]['cmd']:
-                        self.create_process_result(process_results, plottime, pid,
-                            'evm:dbsync:replicate', memory_by_pid)
-                    else:
-                        logger.debug('Unaccounted for ruby pid: {}'.format(pid))
-
-            timediff = time.time() - starttime
-            logger.debug('Monitoring sampled in {}s'.format(round(timediff, 4)))
-
-            # Sleep Monitoring interval
-            # Roughly 10s samples, accounts for collection of memory measurements
-            time_to_sleep = abs(SAMPLE_INTERVAL - timediff)
-            time.sleep(time_to_sleep)
-        logger.info('Monitoring CFME Memory Terminating')
-
-        create_report(self.scenario_data, appliance_results, process_results, self.use_slab,
-            self.grafana_urls)
+        self.samples.update_workers(self.get_evm_workers())
+        last_refresh = time.time()
+        logger.info('Starting Monitoring Thread ({}s samples).'.format(self.sample_interval))
+        try:
+            while self.signal:
+                try:
+                    for line in self.collector_lines():
+                        kind = self.samples.feed(line)
+                        if (kind == 'M' and self.samples.unidentified and
+                                time.time() - last_refresh >= WORKER_REFRESH_INTERVAL):
+                            self.samples.update_workers(self.get_evm_workers())
+                            last_refresh = time.time()
+                            for pid in self.samples.unidentified:
+                                logger.debug('Unaccounted for ruby pid: {}'.format(pid))
+                except COLLECTOR_ERRORS as e:
+                    logger.warning('Memory collector went silent or lost its connection: '
+                                   '{}'.format(e))
+                if self.signal:
+                    # the collector died, start a new one
+                    time.sleep(self.sample_interval)
+        finally:
+            # the samples collected so far are reported whatever happened
+            logger.info('Monitoring CFME Memory Terminating')
+            create_report(self.scenario_data, self.samples.appliance_results,
+                self.samples.process_results, self.use_slab, self.grafana_urls)
 
     def run(self):
         try:
@@ -361,18 +529,6 @@ class SmemMemoryMonitor(Thread):
             logger.error('{}'.format(traceback.format_exc()))
 
 
-def install_smem(ssh_client):
-    # smem is included by default in 5.6 appliances
-    logger.info('Installing smem.')
-    ver = get_version()
-    if ver == '55':
-        ssh_client.run_command('rpm -i {}'.format(cfme_performance['tools']['rpms']['epel7_rpm']))
-        ssh_client.run_command('yum install -y smem')
-    # Patch smem to display longer command line names
-    logger.info('Patching smem')
-    ssh_client.run_command('sed -i s/\.27s/\.200s/g /usr/bin/smem')
-
-
 def create_report(scenario_data, appliance_results, process_results, use_slab, grafana_urls):
     logger.info('Creating Memory Monitoring Report.')
     ver = current_version()
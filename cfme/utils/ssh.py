@@ -1,24 +1,27 @@
 # -*- coding: utf-8 -*-
+import codecs
 import gevent
+import hashlib
+import gevent.select
 import socket
 import sys
-from subprocess import check_call
+import threading
+from concurrent import futures
 
 import attr
 import diaper
-import fauxfactory
 import iso8601
 import paramiko
 import re
 from cached_property import cached_property
 from os import path as os_path
-from scp import SCPClient
 
 from cfme.utils import conf, ports, version
 from cfme.utils.log import logger
 from cfme.utils.net import net_check
 from cfme.utils.path import project_path
 from cfme.utils.quote import quote
+from cfme.utils.ssh_transfer import FileTransfer, TransferError
 from cfme.utils.timeutil import parsetime
 from cfme.utils.version import Version
 from cfme.fixtures.pytest_store import store
@@ -27,6 +30,11 @@ import six
 # Default blocking time before giving up on an ssh command execution,
 # in seconds (float)
 RUNCMD_TIMEOUT = 1200.0
+# Default number of commands run_commands_parallel runs at once; sshd's MaxSessions defaults to 10
+# channels per connection, leave a bit of room for other users of the shared transport
+MAX_PARALLEL_CHANNELS = 8
+# Bytes read from a channel at once
+RECV_BUFSIZE = 32768
 
 
 @attr.s(frozen=True)
@@ -97,6 +105,55 @@ _ssh_pubkey_file = project_path.join('.generated_ssh_key.pub')
 _client_session = []
 
 
+class TransportPool(object):
+    """Shares one authenticated paramiko transport between all clients of the same endpoint
+
+    Every :py:class:`SSHClient` connecting to the same host, port and user multiplexes its
+    channels over a single transport. The transport is only closed once the last client using it
+    is closed.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._transports = {}
+        self._users = {}
+
+    def acquire(self, key):
+        """Return an active transport for ``key`` and count one more user, or None"""
+        with self._lock:
+            transport = self._transports.get(key)
+            if transport is None:
+                return None
+            if not transport.is_active():
+                del self._transports[key]
+                self._users.pop(id(transport), None)
+                return None
+            self._users[id(transport)] += 1
+            return transport
+
+    def register(self, key, transport):
+        with self._lock:
+            self._transports[key] = transport
+            self._users[id(transport)] = 1
+
+    def release(self, transport):
+        """Count one user less, returns True if nobody else uses the transport anymore"""
+        with self._lock:
+            users = self._users.get(id(transport))
+            if users is None:
+                return True
+            if users > 1:
+                self._users[id(transport)] = users - 1
+                return False
+            del self._users[id(transport)]
+            for key, pooled in list(self._transports.items()):
+                if pooled is transport:
+                    del self._transports[key]
+            return True
+
+
+_transport_pool = TransportPool()
+
+
 class SSHClient(paramiko.SSHClient):
     """paramiko.SSHClient wrapper
 
@@ -197,13 +254,24 @@ class SSHClient(paramiko.SSHClient):
             raise Exception("SSH connection to {}:{} failed, port unavailable".format(
                 hostname, ports.SSH))
 
-    def _progress_callback(self, filename, size, sent):
-        if sent > 0:
-            logger.debug('scp progress for %r: %s of %s ', filename, sent, size)
+    def _progress_callback(self, progress):
+        if progress.done > 0:
+            logger.debug('transfer progress for %r: %s of %s, %.1f MB/s', progress.filename,
+                         progress.done, progress.size, progress.throughput / 1024 / 1024)
+
+    @property
+    def _pool_key(self):
+        return (self._connect_kwargs.get('hostname'), self._connect_kwargs.get('port'),
+                self._connect_kwargs.get('username'))
 
     def close(self):
         with diaper:
             _client_session.remove(self)
+        transport = getattr(self, '_transport', None)
+        if transport is not None and not _transport_pool.release(transport):
+            # other clients still multiplex their channels over this transport
+            self._transport = None
+            return
         super(SSHClient, self).close()
 
     @property
@@ -220,9 +288,19 @@ class SSHClient(paramiko.SSHClient):
 
         if not self.connected:
             self._connect_kwargs.update(kwargs)
-            self._check_port()
-            # Only install ssh keys if they aren't installed (or currently being installed)
-            conn = super(SSHClient, self).connect(**self._connect_kwargs)
+            if self._transport is not None:
+                # dead transport, let the pool forget about it
+                _transport_pool.release(self._transport)
+                self._transport = None
+            transport = _transport_pool.acquire(self._pool_key)
+            if transport is not None:
+                self._transport = transport
+                conn = None
+            else:
+                self._check_port()
+                # Only install ssh keys if they aren't installed (or currently being installed)
+                conn = super(SSHClient, self).connect(**self._connect_kwargs)
+                _transport_pool.register(self._pool_key, self._transport)
         else:
             conn = None
 
@@ -286,29 +364,68 @@ class SSHClient(paramiko.SSHClient):
             logger.error("command %s couldn't finish in given timeout %s", command, timeout)
             raise
 
-    def _run_command(self, command, timeout=RUNCMD_TIMEOUT, reraise=False, ensure_host=False,
-                     ensure_user=False, container=None):
-        if isinstance(command, dict):
-            command = version.pick(command, active_version=self.vmdb_version)
-        original_command = command
+    def _wrap_command(self, command, ensure_host=False, ensure_user=False, container=None,
+                      stdin=False):
+        """Returns the command run in the container or pod and with sudo if needed, and whether
+        sudo is used. ``stdin`` keeps the stdin of the container open for the command."""
         uses_sudo = False
-        logger.info("Running command %r", command)
         container = container or self._container
+        interactive = '-i ' if stdin else ''
         if self.is_pod and not ensure_host:
             # This command will be executed in the context of the host provider
             command_to_run = '[[ -f /etc/default/evm ]] && source /etc/default/evm; ' + command
-            oc_cmd = 'oc exec --namespace={proj} {pod} -- bash -c {cmd}'.format(
-                proj=self._project, pod=container, cmd=quote(command_to_run))
-            command = oc_cmd
-            ensure_host = True
+            command = 'oc exec {i}--namespace={proj} {pod} -- bash -c {cmd}'.format(
+                i=interactive, proj=self._project, pod=container, cmd=quote(command_to_run))
         elif self.is_container and not ensure_host:
-            command = 'docker exec {} bash -c {}'.format(container, quote(
+            command = 'docker exec {}{} bash -c {}'.format(interactive, container, quote(
                 'source /etc/default/evm; ' + command))
 
         if self.username != 'root' and not ensure_user:
-            # We need sudo
-            command = 'sudo -i bash -c {command}'.format(command=quote(command))
+            # We need sudo, without a pseudo-tty it must not ask for a password
+            command = 'sudo {n}-i bash -c {command}'.format(
+                n='-n ' if stdin else '', command=quote(command))
             uses_sudo = True
+        return command, uses_sudo
+
+    @cached_property
+    def sudo_without_tty(self):
+        """Whether sudo runs without a pseudo-tty and without a password, see
+        :py:meth:`exec_channel`"""
+        session = self.get_transport().open_session()
+        try:
+            session.exec_command('sudo -n true')
+            return session.recv_exit_status() == 0
+        finally:
+            session.close()
+
+    def exec_channel(self, command, ensure_host=False, container=None):
+        """Starts the command in a new channel and returns the channel, for streaming binary data
+        through its stdin and stdout. The command runs in the container or pod like
+        :py:meth:`run_command` does, but without a pseudo-tty, which would mangle the data. A user
+        other than root therefore needs sudo without ``requiretty`` and without a password.
+
+        Raises:
+            :py:class:`cfme.utils.ssh_transfer.TransferError` if sudo is needed and it can not
+            run like that
+        """
+        command, uses_sudo = self._wrap_command(
+            command, ensure_host=ensure_host, container=container, stdin=True)
+        if uses_sudo and not self.sudo_without_tty:
+            raise TransferError(
+                'sudo of {} needs a tty or a password, can not stream through {!r}'.format(
+                    self.username, command))
+        logger.debug("Streaming through command %r", command)
+        channel = self.get_transport().open_session()
+        channel.exec_command(command)
+        return channel
+
+    def _run_command(self, command, timeout=RUNCMD_TIMEOUT, reraise=False, ensure_host=False,
+                     ensure_user=False, container=None):
+        if isinstance(command, dict):
+            command = version.pick(command, active_version=self.vmdb_version)
+        original_command = command
+        logger.info("Running command %r", command)
+        command, uses_sudo = self._wrap_command(command, ensure_host, ensure_user, container)
 
         if command != original_command:
             logger.info("> Actually running command %r", command)
@@ -324,55 +441,45 @@ class SSHClient(paramiko.SSHClient):
                 session.settimeout(float(timeout))
 
             session.exec_command(command)
-            stdout = session.makefile()
-            stderr = session.makefile_stderr()
-
-            def write_output(line, file):
-                output.append(line)
-                if self._streaming:
-                    file.write(line)
-
-            while True:
-                if session.exit_status_ready():
-                    break
-                no_data = 0
-                # While the program is running loop through collecting line by line so that we don't
-                # fill the buffers up without a newline.
-                # Also, note that for long running programs if we try to read output when there
-                # is none (and in the case of stderr may never be any)
-                # we risk blocking so long that the write buffer on the remote side will fill
-                # and the remote program will block on a write.
-                # The blocking on our side occurs in paramiko's buffered_pipe.py's read() call,
-                # which will block if its internal buffer is empty.
-                if session.recv_ready():
-                    try:
-                        line = next(stdout)
-                        write_output(line, self.f_stdout)
-                    except StopIteration:
-                        pass
-                else:
-                    no_data += 1
-
-                if session.recv_stderr_ready():
-                    try:
-                        line = next(stdout)
-                        write_output(line, self.f_stderr)
-                    except StopIteration:
-                        pass
-                else:
-                    no_data += 1
-
-                if no_data == 2:
+            streams = {
+                'stdout': (self.f_stdout, codecs.getincrementaldecoder('utf-8')('replace')),
+                'stderr': (self.f_stderr, codecs.getincrementaldecoder('utf-8')('replace'))}
+
+            def write_output(data, stream, final=False):
+                file, decoder = streams[stream]
+                data = decoder.decode(data, final)
+                if data:
+                    output.append(data)
+                    if self._streaming:
+                        file.write(data)
+
+            def read_available():
+                got_data = False
+                while session.recv_ready():
+                    write_output(session.recv(RECV_BUFSIZE), 'stdout')
+                    got_data = True
+                while session.recv_stderr_ready():
+                    write_output(session.recv_stderr(RECV_BUFSIZE), 'stderr')
+                    got_data = True
+                return got_data
+
+            # The channel's fileno becomes readable when data (or EOF) arrives on stdout or stderr,
+            # so we sleep until there is something to do instead of polling. gevent's select keeps
+            # the gevent.Timeout watchdog in run_command working.
+            while not session.exit_status_ready():
+                gevent.select.select([session], [], [], timeout or None)
+                if not read_available() and not session.exit_status_ready():
+                    # EOF was received before the exit status, it won't take long
                     gevent.sleep(0.01)
 
             # When the program finishes, we need to grab the rest of the output that is left.
-            # Also, we don't have the issue of blocking reads because since the command is
-            # finished, any pending reads of SSH encrypted data will finish shortly and put in
-            # the buffer or for an empty file EOF will be reached as it will be closed.
-            for line in stdout:
-                write_output(line, self.f_stdout)
-            for line in stderr:
-                write_output(line, self.f_stderr)
+            # Any pending reads will finish shortly, for an empty stream EOF is reached right away.
+            for data in iter(lambda: session.recv(RECV_BUFSIZE), b''):
+                write_output(data, 'stdout')
+            for data in iter(lambda: session.recv_stderr(RECV_BUFSIZE), b''):
+                write_output(data, 'stderr')
+            for stream in streams:
+                write_output(b'', stream, final=True)
 
             exit_status = session.recv_exit_status()
             if exit_status != 0:
@@ -394,6 +501,28 @@ class SSHClient(paramiko.SSHClient):
         # Return whatever we have in the output
         return SSHResult(rc=1, output=''.join(output), command=command)
 
+    def run_commands_parallel(self, commands, max_channels=MAX_PARALLEL_CHANNELS, **kwargs):
+        """Run several commands concurrently, each in its own channel of this client's transport.
+
+        Args:
+            commands: Iterable of commands, see :py:meth:`run_command`.
+            max_channels: How many commands may run at the same time.
+            **kwargs: Passed to :py:meth:`run_command` for every command.
+        Yields:
+            ``(command, result)`` tuples in the order the commands finish, where ``result`` is a
+            :py:class:`SSHResult` instance.
+        """
+        commands = list(commands)
+        if not commands:
+            return
+        self.connect()
+        with futures.ThreadPoolExecutor(max_workers=min(max_channels, len(commands))) as executor:
+            running = {
+                executor.submit(self.run_command, command, **kwargs): command
+                for command in commands}
+            for future in futures.as_completed(running):
+                yield running[future], future.result()
+
     def cpu_spike(self, seconds=60, cpus=2, **kwargs):
         """Creates a CPU spike of specific length and processes.
 
@@ -432,94 +561,37 @@ class SSHClient(paramiko.SSHClient):
             'cd /var/www/miq/vmdb; {pre}bin/rake -f /var/www/miq/vmdb/Rakefile {command}'.format(
                 command=command, pre=prefix), timeout=timeout, **kwargs)
 
+    def _file_transfer(self, **kwargs):
+        kwargs.setdefault('progress', self._progress_callback)
+        return FileTransfer(self, **kwargs)
+
     def put_file(self, local_file, remote_file='.', **kwargs):
+        """Sends a local file, see :py:class:`cfme.utils.ssh_transfer.FileTransfer`
+
+        Args:
+            local_file: Path of the local file.
+            remote_file: Remote path, or a remote directory to put the file in.
+            **kwargs: ``channels``, ``range_size``, ``compress``, ``verify`` and ``progress`` of
+                the :py:class:`cfme.utils.ssh_transfer.FileTransfer`.
+        Returns:
+            The remote path of the file.
+        """
         logger.info("Transferring local file %r to remote %r", local_file, remote_file)
-        if self.is_container:
-            tempfilename = '/share/temp_{}'.format(fauxfactory.gen_alpha())
-            logger.info('For this purpose, temporary file name is %r', tempfilename)
-            scp = SCPClient(self.get_transport(), progress=self._progress_callback).put(
-                local_file, tempfilename, **kwargs)
-            self.run_command('mv {} {}'.format(tempfilename, remote_file))
-            return scp
-        elif self.is_pod:
-            tmp_folder_name = 'automation-{}'.format(fauxfactory.gen_alpha().lower())
-            logger.info('For this purpose, temporary folder name is /tmp/%s', tmp_folder_name)
-            # Clean up container's temporary folder
-            self.run_command('rm -rf /tmp/{0}'.format(tmp_folder_name))
-            # Create/Clean up the host's temporary folder
-            self.run_command(
-                'rm -rf /tmp/{0}; mkdir -p /tmp/{0}'.format(tmp_folder_name), ensure_host=True)
-            # Now upload the file to the openshift host
-            tmp_file_name = 'file-{}'.format(fauxfactory.gen_alpha().lower())
-            tmp_full_name = '/tmp/{}/{}'.format(tmp_folder_name, tmp_file_name)
-            scp = SCPClient(self.get_transport(), progress=self._progress_callback).put(
-                local_file, tmp_full_name, **kwargs)
-            # use oc rsync to put the file in the container
-            rsync_cmd = 'oc rsync --namespace={proj} /tmp/{file} {pod}:/tmp/'
-            assert self.run_command(rsync_cmd.format(proj=self._project, file=tmp_folder_name,
-                                                     pod=self._container),
-                                    ensure_host=True)
-            # Move the file onto correct place
-            assert self.run_command('mv {} {}'.format(tmp_full_name, remote_file))
-            return scp
-        else:
-            if self.username == 'root':
-                return SCPClient(self.get_transport(), progress=self._progress_callback).put(
-                    local_file, remote_file, **kwargs)
-            # scp client is not sudo, may not work for non sudo
-            tempfilename = '/home/{user_name}/temp_{random_alpha}'.format(
-                user_name=self.username, random_alpha=fauxfactory.gen_alpha())
-            logger.info('For this purpose, temporary file name is %r', tempfilename)
-            scp = SCPClient(self.get_transport(), progress=self._progress_callback).put(
-                local_file, tempfilename, **kwargs)
-            self.run_command('mv {temp_file} {remote_file}'.format(temp_file=tempfilename,
-                                                                   remote_file=remote_file))
-            return scp
+        return self._file_transfer(**kwargs).put(local_file, remote_file)
 
     def get_file(self, remote_file, local_path='', **kwargs):
+        """Fetches a remote file, see :py:class:`cfme.utils.ssh_transfer.FileTransfer`
+
+        Args:
+            remote_file: Remote path of the file.
+            local_path: Local path, or a local directory to put the file in, the current one by
+                default.
+            **kwargs: Same as for :py:meth:`put_file`.
+        Returns:
+            The local path of the file.
+        """
         logger.info("Transferring remote file %r to local %r", remote_file, local_path)
-        base_name = os_path.basename(remote_file)
-        if self.is_container:
-            tmp_file_name = 'temp_{}'.format(fauxfactory.gen_alpha())
-            tempfilename = '/share/{}'.format(tmp_file_name)
-            logger.info('For this purpose, temporary file name is %r', tempfilename)
-            self.run_command('cp {} {}'.format(remote_file, tempfilename))
-            scp = SCPClient(self.get_transport(), progress=self._progress_callback).get(
-                tempfilename, local_path, **kwargs)
-            self.run_command('rm {}'.format(tempfilename))
-            check_call([
-                'mv',
-                os_path.join(local_path, tmp_file_name),
-                os_path.join(local_path, base_name)])
-            return scp
-        elif self.is_pod:
-            tmp_folder_name = 'automation-{}'.format(fauxfactory.gen_alpha().lower())
-            tmp_file_name = 'file-{}'.format(fauxfactory.gen_alpha().lower())
-            tmp_full_name = '/tmp/{}/{}'.format(tmp_folder_name, tmp_file_name)
-            logger.info('For this purpose, temporary file name is %r', tmp_full_name)
-            # Clean up container's temporary folder
-            self.run_command('rm -rf /tmp/{0}; mkdir -p /tmp/{0}'.format(tmp_folder_name))
-            # Create/Clean up the host's temporary folder
-            self.run_command(
-                'rm -rf /tmp/{0}; mkdir -p /tmp/{0}'.format(tmp_folder_name), ensure_host=True)
-            # Now copy the file in container to the tmp folder
-            assert self.run_command('cp {} {}'.format(remote_file, tmp_full_name))
-            # Use the oc rsync to pull the file onto the host
-            rsync_cmd = 'oc rsync --namespace={proj} {pod}:/tmp/{file} /tmp'
-            assert self.run_command(rsync_cmd.format(proj=self._project, pod=self._container,
-                                                     file=tmp_folder_name),
-                                    ensure_host=True)
-            # Now download the file to the openshift host
-            scp = SCPClient(self.get_transport(), progress=self._progress_callback).get(
-                tmp_full_name, local_path, **kwargs)
-            check_call([
-                'mv',
-                os_path.join(local_path, tmp_file_name),
-                os_path.join(local_path, base_name)])
-            return scp
-        else:
-            return SCPClient(self.get_transport(), progress=self._progress_callback).get(
-                remote_file, local_path, **kwargs)
+        return self._file_transfer(**kwargs).get(remote_file, local_path)
 
     def patch_file(self, local_path, remote_path, md5=None):
         """ Patches a single file on the appliance
@@ -687,28 +759,119 @@ class SSHClient(paramiko.SSHClient):
 
 
 class SSHTail(SSHClient):
+    """Reads the lines appended to a remote file since the last read
+
+    The offset of the last complete line read is remembered between reads. The file is read in
+    large chunks over SFTP. If it shrinks (it was truncated) or its first bytes changed (it was
+    rotated, even if the new file grew past the old offset already) it is read again from the
+    start.
+    """
+    #: bytes requested from the remote file at once
+    CHUNK_SIZE = 1024 * 1024
+    #: bytes at the start of the file compared between reads to notice it was rotated
+    HEAD_SIZE = 512
 
     def __init__(self, remote_filename, **connect_kwargs):
         super(SSHTail, self).__init__(stream_output=False, **connect_kwargs)
         self._remote_filename = remote_filename
         self._sftp_client = None
         self._remote_file_size = None
+        # (length, md5) of the start of the file, up to HEAD_SIZE bytes of what was read already
+        self._remote_file_head = None
 
     def __iter__(self):
         for line in self.raw_lines():
             yield line.rstrip()
 
+    def _read_head(self, remote_file, size):
+        length = min(self.HEAD_SIZE, size)
+        remote_file.seek(0, 0)
+        return length, hashlib.md5(remote_file.read(length)).hexdigest()
+
+    def _seed(self, size):
+        self._remote_file_size = size
+        remote_file = self._sftp_client.open(self._remote_filename, 'rb')
+        try:
+            self._remote_file_head = self._read_head(remote_file, size)
+        finally:
+            remote_file.close()
+
+    def _rotated(self):
+        logger.info('%s was rotated, reading it from the start', self._remote_filename)
+        self._remote_file_size = 0
+        self._remote_file_head = None
+
     def raw_lines(self):
         with self as sshtail:
             fstat = sshtail._sftp_client.stat(self._remote_filename)
-            if self._remote_file_size is not None:
-                if self._remote_file_size < fstat.st_size:
-                    remote_file = self._sftp_client.open(self._remote_filename, 'r')
-                    remote_file.seek(self._remote_file_size, 0)
-                    while (remote_file.tell() < fstat.st_size):
-                        line = remote_file.readline()  # Note the  missing rstrip() here!
-                        yield line
-            self._remote_file_size = fstat.st_size
+            if self._remote_file_size is None:
+                self._seed(fstat.st_size)
+                return
+            if fstat.st_size < self._remote_file_size:
+                self._rotated()
+            elif fstat.st_size == self._remote_file_size:
+                return
+            remote_file = sshtail._sftp_client.open(self._remote_filename, 'rb')
+            try:
+                head = self._remote_file_head
+                if head is not None and self._read_head(remote_file, head[0]) != head:
+                    self._rotated()
+                remote_file.seek(self._remote_file_size, 0)
+                remote_file.prefetch(fstat.st_size)
+                position, pending = self._remote_file_size, b''
+                while position < fstat.st_size:
+                    chunk = remote_file.read(min(self.CHUNK_SIZE, fstat.st_size - position))
+                    if not chunk:
+                        break
+                    position += len(chunk)
+                    lines = (pending + chunk).split(b'\n')
+                    # an incomplete last line is read again once it's finished
+                    pending = lines.pop()
+                    for line in lines:
+                        yield (line + b'\n').decode('utf-8', 'replace')
+                    self._remote_file_size = position - len(pending)
+                head = self._remote_file_head
+                if head is None or head[0] < min(self.HEAD_SIZE, self._remote_file_size):
+                    self._remote_file_head = self._read_head(remote_file, self._remote_file_size)
+            finally:
+                remote_file.close()
+
+    def grep_lines(self, pattern):
+        """Like :py:meth:`raw_lines`, but only the new lines matching ``pattern`` are returned
+
+        The filtering is done by ``grep -E`` on the remote host, so only the matching lines are
+        transferred. ``pattern`` therefore has to be a POSIX extended regular expression.
+
+        Raises:
+            ValueError: if grep fails, e.g. because of an invalid pattern
+        """
+        if self._remote_file_size is None:
+            self.set_initial_file_end()
+            return []
+        head_length, head_digest = self._remote_file_head or (0, None)
+        script = (
+            'f={file}; size=$(stat -c %s "$f") || exit 2; start={start}; '
+            '[ "$size" -lt "$start" ] && start=0; '
+            'h=$(head -c {head_length} "$f" | md5sum); [ {check} ] || start=0; '
+            'n=$((size < {head_size} ? size : {head_size})); '
+            'echo "$size $start $n $(head -c $n "$f" | md5sum)"; '
+            'tail -c +$((start + 1)) "$f" | head -c $((size - start)) | grep -E -e {pattern}; '
+            '[ $? -le 1 ]').format(
+                file=quote(self._remote_filename), start=self._remote_file_size,
+                head_length=head_length, head_size=self.HEAD_SIZE,
+                check='"${{h%% *}}" = {}'.format(head_digest) if head_digest else '1',
+                pattern=quote(pattern))
+        result = self.run_command(script)
+        if result.failed:
+            raise ValueError('grep -E {!r} on {} failed: {}'.format(
+                pattern, self._remote_filename, result.output))
+        lines = result.output.replace('\r', '').split('\n')
+        size, start, head_length, head_digest = lines.pop(0).split()[:4]
+        if int(start) < self._remote_file_size:
+            self._rotated()
+        self._remote_file_size = int(size)
+        self._remote_file_head = int(head_length), head_digest
+        return [line for line in lines if line]
 
     def raw_string(self):
         return ''.join(self)
@@ -724,7 +887,7 @@ class SSHTail(SSHClient):
     def set_initial_file_end(self):
         with self as sshtail:
             fstat = sshtail._sftp_client.stat(self._remote_filename)
-            self._remote_file_size = fstat.st_size  # Seed initial size of file
+            self._seed(fstat.st_size)  # Seed initial size of file
 
     def lines_as_list(self):
         """Return lines as list"""
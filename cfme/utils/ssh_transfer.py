@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+"""Chunked, parallel and resumable file transfers over an :py:class:`cfme.utils.ssh.SSHClient`.
+
+:py:class:`FileTransfer` backs ``SSHClient.put_file`` and ``SSHClient.get_file``. A file on the
+host is split into ranges of :py:attr:`FileTransfer.range_size` bytes, sent over several SFTP
+channels of the shared transport at once. Files in a container or a pod, and compressed
+transfers, are streamed through a single exec channel (``cat``, ``gzip``) instead of being copied
+through temporary files and ``oc rsync``.
+
+The data is written into a ``.part`` file next to the destination, renamed once complete. The
+ranges already written are recorded in a journal, so a transfer that broke off is resumed
+instead of started over, both by the retries and by a later transfer of the same file. At the
+end the SHA256 digests of both sides are compared. The progress is reported as
+:py:class:`TransferProgress` to a callback, at most every :py:data:`PROGRESS_INTERVAL` seconds.
+"""
+import hashlib
+import os
+import socket
+import threading
+import zlib
+from concurrent import futures
+from time import time
+
+import attr
+import paramiko
+from six.moves import queue
+
+from cfme.utils.disk_cache import DiskCache
+from cfme.utils.log import logger
+from cfme.utils.path import log_path
+from cfme.utils.quote import quote
+
+#: bytes of a range sent over one SFTP channel
+RANGE_SIZE = 32 * 1024 * 1024
+#: SFTP channels transferring ranges at once
+TRANSFER_CHANNELS = 4
+#: bytes read, written and hashed at once
+BLOCK_SIZE = 1024 * 1024
+#: attempts to finish a transfer, each one resumes the previous one
+NUM_OF_TRIES = 3
+#: seconds between two progress reports
+PROGRESS_INTERVAL = 1
+#: seconds the journal of a partial transfer is kept for
+JOURNAL_TTL = 24 * 3600
+
+
+class TransferError(Exception):
+    pass
+
+
+#: errors a broken off transfer raises
+TRANSFER_ERRORS = (
+    TransferError, EnvironmentError, EOFError, socket.error, paramiko.SSHException)
+
+
+@attr.s(frozen=True)
+class TransferProgress(object):
+    """State of a transfer, ``elapsed`` in seconds since it (or its resumption) started"""
+    filename = attr.ib()
+    size = attr.ib()
+    done = attr.ib()
+    elapsed = attr.ib()
+    resumed = attr.ib(default=0)
+
+    @property
+    def throughput(self):
+        """Bytes per second transferred by this run, the resumed bytes are not counted"""
+        return (self.done - self.resumed) / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def split_ranges(size, range_size):
+    """``(offset, length)`` of the ranges of a file of ``size`` bytes"""
+    return [(offset, min(range_size, size - offset)) for offset in range(0, size, range_size)]
+
+
+@attr.s
+class FileTransfer(object):
+    """Transfers files between this machine and the target of the client, see the module docstring
+
+    Args:
+        client: the :py:class:`cfme.utils.ssh.SSHClient`
+        channels: SFTP channels transferring ranges at once
+        range_size: bytes of a range
+        compress: gzip the data on the wire, streamed through a single channel
+        verify: compare the SHA256 digests of both sides at the end
+        progress: called with a :py:class:`TransferProgress`
+    """
+    client = attr.ib()
+    channels = attr.ib(default=TRANSFER_CHANNELS)
+    range_size = attr.ib(default=RANGE_SIZE)
+    compress = attr.ib(default=False)
+    verify = attr.ib(default=True)
+    progress = attr.ib(default=None)
+    journals = attr.ib(default=attr.Factory(
+        lambda: DiskCache(log_path.join('ssh_transfers'), ttl=JOURNAL_TTL)))
+    _lock = attr.ib(init=False, repr=False, default=attr.Factory(threading.Lock))
+
+    @property
+    def streamed(self):
+        """Whether the data goes through an exec channel instead of SFTP"""
+        return self.compress or self.client.is_container or self.client.is_pod
+
+    def _remote(self, command, **kwargs):
+        result = self.client.run_command(command, **kwargs)
+        if result.failed:
+            raise TransferError('{} failed: {}'.format(command, result.output))
+        return result.output.strip()
+
+    def _remote_part(self, remote_file):
+        if self.streamed or self.client.username == 'root':
+            return '{}.part'.format(remote_file)
+        # sftp is not sudo, the part is put aside and moved with sudo
+        return '/home/{}/.transfer-{}.part'.format(
+            self.client.username, hashlib.sha256(remote_file.encode('utf-8')).hexdigest()[:16])
+
+    def _journal_key(self, direction, source, destination, size, mtime):
+        key = '{}-{}-{}-{}-{}-{}-{}'.format(
+            direction, self.client._connect_kwargs.get('hostname'), self.client._container,
+            source, destination, size, int(mtime))
+        # paths may be longer than a file name can be
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def _report(self, state, force=False):
+        now = time()
+        if self.progress is None or (not force and now - state['reported'] < PROGRESS_INTERVAL):
+            return
+        state['reported'] = now
+        self.progress(TransferProgress(
+            filename=state['filename'], size=state['size'], done=state['done'],
+            elapsed=now - state['start'], resumed=state['resumed']))
+
+    def _advance(self, state, length):
+        with self._lock:
+            state['done'] += length
+            self._report(state)
+
+    def _run(self, transfer, state):
+        for attempt in range(1, NUM_OF_TRIES + 1):
+            try:
+                return transfer(state)
+            except TRANSFER_ERRORS as e:
+                logger.warning('Transfer of %s broke off (attempt %d): %s',
+                               state['filename'], attempt, e)
+        raise TransferError('Could not transfer {}'.format(state['filename']))
+
+    def _new_state(self, filename, size, key):
+        return {'filename': filename, 'size': size, 'key': key, 'done': 0, 'resumed': 0,
+                'start': time(), 'reported': 0}
+
+    def put(self, local_file, remote_file='.'):
+        """Sends the local file, returns its remote path. A remote directory gets the file in it.
+        """
+        if self._remote('test -d {0} && echo dir || echo file'.format(quote(remote_file))) == 'dir':
+            remote_file = '{}/{}'.format(remote_file.rstrip('/'), os.path.basename(local_file))
+        local_stat = os.stat(local_file)
+        part = self._remote_part(remote_file)
+        state = self._new_state(local_file, local_stat.st_size, self._journal_key(
+            'put', local_file, remote_file, local_stat.st_size, local_stat.st_mtime))
+        state.update(source=local_file, part=part)
+        self._run(self._put_stream if self.streamed else self._put_ranges, state)
+        self._finish(state, local_file, part)
+        self._remote('mv -f {} {}'.format(quote(part), quote(remote_file)))
+        self.journals.set(state['key'], None)
+        return remote_file
+
+    def get(self, remote_file, local_path=''):
+        """Fetches the remote file, returns its local path. A local directory gets the file in it.
+        """
+        local_file = local_path or os.getcwd()
+        if os.path.isdir(local_file):
+            local_file = os.path.join(local_file, os.path.basename(remote_file))
+        size, mtime = self._remote('stat -L -c "%s %Y" {}'.format(quote(remote_file))).split()
+        part = '{}.part'.format(local_file)
+        state = self._new_state(remote_file, int(size), self._journal_key(
+            'get', remote_file, local_file, size, mtime))
+        state.update(source=remote_file, part=part)
+        self._run(self._get_stream if self.streamed else self._get_ranges, state)
+        self._finish(state, part, remote_file)
+        os.rename(part, local_file)
+        self.journals.set(state['key'], None)
+        return local_file
+
+    def _finish(self, state, local_data, remote_data):
+        """Reports the transfer and compares the digests of the transferred data"""
+        with self._lock:
+            self._report(state, force=True)
+        elapsed = time() - state['start']
+        logger.info('Transferred %s (%d bytes, %d resumed) in %.1fs, %.1f MB/s', state['filename'],
+                    state['size'], state['resumed'], elapsed,
+                    (state['size'] - state['resumed']) / max(elapsed, 0.001) / 1024 / 1024)
+        if not self.verify:
+            return
+        with futures.ThreadPoolExecutor(1) as executor:
+            remote_digest = executor.submit(
+                self._remote, 'sha256sum {}'.format(quote(remote_data)))
+            local_digest = file_digest(local_data)
+            remote_digest = remote_digest.result().split()[0]
+        if local_digest != remote_digest:
+            self.journals.set(state['key'], None)
+            raise TransferError('SHA256 of {} does not match: {} here, {} on the remote'.format(
+                state['filename'], local_digest, remote_digest))
+
+    # Ranges over SFTP
+
+    def _resume_ranges(self, state, part_size):
+        """The ranges left to transfer, resetting the journal if the part does not match it"""
+        ranges = split_ranges(state['size'], self.range_size)
+        done = self.journals.get(state['key'])
+        if not isinstance(done, set) or part_size != state['size']:
+            return ranges, False
+        state['resumed'] = state['done'] = sum(
+            length for offset, length in ranges if offset in done)
+        state['finished'] = set(done)
+        if done:
+            logger.info('Resuming the transfer of %s, %d of %d bytes are there',
+                        state['filename'], state['done'], state['size'])
+        return [(offset, length) for offset, length in ranges if offset not in done], True
+
+    def _range_done(self, state, offset):
+        with self._lock:
+            state['finished'].add(offset)
+            self.journals.set(state['key'], set(state['finished']))
+
+    def _transfer_ranges(self, state, ranges, transfer_range):
+        if not ranges:
+            return
+        sftps = queue.Queue()
+        opened = []
+        try:
+            for _ in range(min(self.channels, len(ranges))):
+                sftp = self.client.open_sftp()
+                opened.append(sftp)
+                sftps.put(sftp)
+
+            def run(offset, length):
+                sftp = sftps.get()
+                try:
+                    transfer_range(sftp, offset, length)
+                finally:
+                    sftps.put(sftp)
+                self._range_done(state, offset)
+
+            with futures.ThreadPoolExecutor(len(opened)) as executor:
+                for future in [executor.submit(run, offset, length) for offset, length in ranges]:
+                    future.result()
+        finally:
+            for sftp in opened:
+                sftp.close()
+
+    def _put_ranges(self, state):
+        part = state['part']
+        sftp = self.client.open_sftp()
+        try:
+            try:
+                part_size = sftp.stat(part).st_size
+            except IOError:
+                part_size = None
+            ranges, resumed = self._resume_ranges(state, part_size)
+            if not resumed:
+                # the part gets its full size first, the ranges are written into it in any order
+                sftp.open(part, 'wb').close()
+                sftp.truncate(part, state['size'])
+                state.update(done=0, resumed=0, finished=set())
+                self.journals.set(state['key'], set())
+        finally:
+            sftp.close()
+
+        def put_range(sftp, offset, length):
+            with open(state['source'], 'rb') as source, sftp.open(part, 'r+b') as target:
+                source.seek(offset)
+                target.seek(offset)
+                target.set_pipelined(True)
+                left = length
+                while left:
+                    block = source.read(min(BLOCK_SIZE, left))
+                    if not block:
+                        raise TransferError('{} got shorter'.format(state['source']))
+                    target.write(block)
+                    left -= len(block)
+                    self._advance(state, len(block))
+
+        self._transfer_ranges(state, ranges, put_range)
+
+    def _get_ranges(self, state):
+        part = state['part']
+        part_size = os.path.getsize(part) if os.path.isfile(part) else None
+        ranges, resumed = self._resume_ranges(state, part_size)
+        if not resumed:
+            with open(part, 'wb') as f:
+                f.truncate(state['size'])
+            state.update(done=0, resumed=0, finished=set())
+            self.journals.set(state['key'], set())
+
+        def get_range(sftp, offset, length):
+            with sftp.open(state['source'], 'rb') as source, open(part, 'r+b') as target:
+                target.seek(offset)
+                blocks = [(block_offset, min(BLOCK_SIZE, offset + length - block_offset))
+                          for block_offset in range(offset, offset + length, BLOCK_SIZE)]
+                for block in source.readv(blocks):
+                    target.write(block)
+                    self._advance(state, len(block))
+
+        self._transfer_ranges(state, ranges, get_range)
+
+    # Streams through an exec channel
+
+    def _resume_stream(self, state, part_size):
+        """The offset to continue from, the part is only trusted if the journal knows it"""
+        if self.journals.get(state['key']) == 'stream' and part_size and \
+                part_size <= state['size']:
+            logger.info('Resuming the transfer of %s at %d bytes', state['filename'], part_size)
+            state['resumed'] = state['done'] = part_size
+            return part_size
+        self.journals.set(state['key'], 'stream')
+        state['resumed'] = state['done'] = 0
+        return 0
+
+    @staticmethod
+    def _check_exit(channel, command):
+        rc = channel.recv_exit_status()
+        if rc != 0:
+            errors = b''.join(iter(lambda: channel.recv_stderr(BLOCK_SIZE), b''))
+            raise TransferError('{} failed with {}: {}'.format(
+                command, rc, errors.decode('utf-8', 'replace')))
+
+    def _put_stream(self, state):
+        part = state['part']
+        part_size = int(self._remote('stat -c %s {0} 2>/dev/null || echo 0'.format(quote(part))))
+        offset = self._resume_stream(state, part_size)
+        command = '{} {} {}'.format(
+            'gzip -dc' if self.compress else 'cat', '>>' if offset else '>', quote(part))
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) \
+            if self.compress else None
+        channel = self.client.exec_channel(command)
+        try:
+            with open(state['source'], 'rb') as source:
+                source.seek(offset)
+                for block in iter(lambda: source.read(BLOCK_SIZE), b''):
+                    channel.sendall(compressor.compress(block) if compressor else block)
+                    self._advance(state, len(block))
+            if compressor:
+                channel.sendall(compressor.flush())
+            channel.shutdown_write()
+            self._check_exit(channel, command)
+        finally:
+            channel.close()
+
+    def _get_stream(self, state):
+        part = state['part']
+        part_size = os.path.getsize(part) if os.path.isfile(part) else 0
+        offset = self._resume_stream(state, part_size)
+        command = 'tail -c +{} {}{}'.format(
+            offset + 1, quote(state['source']), ' | gzip -c' if self.compress else '')
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if self.compress else None
+        channel = self.client.exec_channel(command)
+        try:
+            with open(part, 'ab' if offset else 'wb') as target:
+                for data in iter(lambda: channel.recv(BLOCK_SIZE), b''):
+                    block = decompressor.decompress(data) if decompressor else data
+                    target.write(block)
+                    self._advance(state, len(block))
+                if decompressor:
+                    block = decompressor.flush()
+                    target.write(block)
+                    self._advance(state, len(block))
+            self._check_exit(channel, command)
+        finally:
+            channel.close()
+        if state['done'] != state['size']:
+            raise TransferError('Got {} of {} bytes of {}'.format(
+                state['done'], state['size'], state['source']))
@@ -1,5 +1,7 @@
+from collections import OrderedDict
 from contextlib import closing
 from threading import Lock
+from time import time
 
 from six.moves.urllib.request import urlopen
 from six.moves.urllib.error import URLError
@@ -30,7 +32,11 @@ def log_wrap(process_message):
             template_name = args[0].template_name
             logger.info("(template-upload) [%s:%s:%s] BEGIN %s",
                         log_name, provider, template_name, process_message)
-            result = func(*args, **kwargs)
+            start = time()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                args[0].timings[process_message] = time() - start
             if result:
                 logger.info("(template-upload) [%s:%s:%s] END %s",
                             log_name, provider, template_name, process_message)
@@ -51,10 +57,13 @@ class ProviderTemplateUpload(object):
         :var provider_type: type of initiated provider -- to be removed
         :var log_name: string to be displayed in logs.
         :var image_patters: regex to be matched when stream URL is used
+        :var needs_local_image: whether the image is uploaded from this machine, instead of
+            being downloaded by the provider or a client close to it
     """
     provider_type = None
     log_name = None
     image_pattern = None
+    needs_local_image = False
 
     def __init__(self, stream=None, provider=None, template_name=None,
                  cmd_line_args=None, **kwargs):
@@ -68,6 +77,7 @@ class ProviderTemplateUpload(object):
             :param stream_url: custom URL to image directory of a stream
             :param image_url: custom URL to exact image file
             :param provider_data: custom AttrDict with provider data
+            :param local_image: path of the image already downloaded to this machine
 
         Default values for custom parameters:
             :param stream_url: cfme_data.basic_info.cfme_images_url[stream]
@@ -77,6 +87,7 @@ class ProviderTemplateUpload(object):
         self._stream_url = kwargs.get('stream_url')
         self._image_url = kwargs.get('image_url')
         self._provider_data = kwargs.get('provider_data')
+        self.local_image = kwargs.get('local_image')
 
         self._cmd_line_args = cmd_line_args
 
@@ -85,6 +96,8 @@ class ProviderTemplateUpload(object):
         self.template_name = template_name
 
         self.kwargs = kwargs
+        # stage of the upload to its duration in seconds, see log_wrap
+        self.timings = OrderedDict()
 
     @property
     def stream_url(self):
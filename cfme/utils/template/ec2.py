@@ -13,6 +13,7 @@ class EC2TemplateUpload(ProviderTemplateUpload):
     log_name = 'EC2'
     provider_type = 'ec2'
     image_pattern = re.compile(r'<a href="?\'?([^"\']*ec2[^"\'>]*)')
+    needs_local_image = True
 
     def get_creds(self, creds_type=None, **kwargs):
         host_default = self.from_credentials('host_default')
@@ -29,10 +30,16 @@ class EC2TemplateUpload(ProviderTemplateUpload):
 
     @property
     def file_path(self):
+        if self.local_image:
+            return str(self.local_image)
         return os.path.abspath(self.image_name)
 
     @log_wrap("download image")
     def download_image(self):
+        if self.local_image:
+            logger.info("(template-upload) [%s:%s:%s] Using the cached image %s.",
+                        self.log_name, self.provider, self.template_name, self.local_image)
+            return True
         try:
             u = six.moves.urllib.request.urlopen(self.image_url)
             meta = u.info()
@@ -134,7 +141,8 @@ class EC2TemplateUpload(ProviderTemplateUpload):
     def teardown(self):
         self.mgmt.delete_objects_from_s3_bucket(bucket_name=self.bucket_name,
                                                 object_keys=[self.template_name])
-        if os.path.exists(self.file_path):
+        # the cached image stays for the next uploads
+        if not self.local_image and os.path.exists(self.file_path):
             os.remove(self.file_path)
 
         return True
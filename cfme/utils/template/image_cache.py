@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""Local content-addressed cache of the appliance images uploaded as templates.
+
+An image is downloaded once, streamed into a partial file while its SHA256 digest is computed,
+and stored under its digest. A download that broke off is resumed with a range request, the
+digest of the part already there is computed first. The request carries the ``ETag`` or the
+``Last-Modified`` of the first response in ``If-Range``, so an image replaced on the server in the
+meantime is downloaded again from the start; a part without a validator is never resumed. The
+digests published next to the images, in the ``SHA256SUM`` file of the image directory, are
+verified when the download finishes.
+
+The images not used for ``max_age`` seconds are evicted, and the least recently used ones while
+the cache takes more than ``max_size`` bytes. The images this cache handed out are kept.
+"""
+import hashlib
+import os
+import threading
+from collections import defaultdict
+from time import time
+
+import attr
+import requests
+from py.path import local
+
+from cfme.utils.disk_cache import DiskCache
+from cfme.utils.log import logger
+from cfme.utils.path import log_path
+from cfme.utils.template.base import TemplateUploadException
+
+#: bytes read and hashed at once
+CHUNK_SIZE = 1024 * 1024
+#: name of the file with the digests of the images in an image directory
+CHECKSUM_FILE = 'SHA256SUM'
+#: attempts to finish a download, each one resumes the previous one
+NUM_OF_TRIES = 3
+#: seconds the digest of an image URL without a published digest is trusted for
+URL_TTL = 24 * 3600
+#: seconds an image or a partial download is kept for after its last use
+MAX_AGE = 30 * 24 * 3600
+#: bytes the images in the cache may take, the least recently used ones are evicted
+MAX_SIZE = 100 * 1024 ** 3
+
+
+def parse_checksums(text):
+    """File name to SHA256 digest, from the lines of a ``sha256sum`` output"""
+    checksums = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) == 2:
+            digest, name = parts
+            checksums[name.lstrip('*')] = digest.lower()
+    return checksums
+
+
+def response_validator(response):
+    """The ``If-Range`` validator of the response, its strong ETag or its Last-Modified"""
+    etag = response.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('Last-Modified')
+
+
+def file_digest(path, chunk_size=CHUNK_SIZE):
+    """SHA256 object of the content of the file"""
+    sha = hashlib.sha256()
+    with open(str(path), 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha
+
+
+@attr.s
+class ImageCache(object):
+    """Images by their SHA256 digest, in the ``path`` directory
+
+    All the methods are thread-safe, uploaders of the same image share a single download.
+
+    Args:
+        path: directory of the cache
+        chunk_size: bytes read and hashed at once
+        max_age: seconds an image is kept for after its last use, None to keep them
+        max_size: bytes the images may take, None for no limit
+    """
+    path = attr.ib(default=log_path.join('template_images'), converter=local)
+    chunk_size = attr.ib(default=CHUNK_SIZE)
+    max_age = attr.ib(default=MAX_AGE)
+    max_size = attr.ib(default=MAX_SIZE)
+    _session = attr.ib(init=False, repr=False, default=attr.Factory(requests.Session))
+    _checksums = attr.ib(init=False, repr=False, default=attr.Factory(dict))
+    _locks = attr.ib(init=False, repr=False, default=attr.Factory(
+        lambda: defaultdict(threading.Lock)))
+    _lock = attr.ib(init=False, repr=False, default=attr.Factory(threading.Lock))
+    # digests handed out, in use by the uploads
+    _fetched = attr.ib(init=False, repr=False, default=attr.Factory(set))
+
+    @property
+    def urls(self):
+        """Digests of the downloaded image URLs"""
+        return DiskCache(self.path.join('urls'), ttl=URL_TTL)
+
+    def image_path(self, digest):
+        return self.path.join('sha256', digest)
+
+    def _url_lock(self, url):
+        with self._lock:
+            return self._locks[url]
+
+    def checksum(self, image_url):
+        """The published SHA256 digest of the image, None if its directory does not have one"""
+        directory, name = image_url.rsplit('/', 1)
+        with self._url_lock(directory):
+            if directory not in self._checksums:
+                checksum_url = '{}/{}'.format(directory, CHECKSUM_FILE)
+                try:
+                    response = self._session.get(checksum_url, timeout=60)
+                    response.raise_for_status()
+                except requests.RequestException as e:
+                    logger.warning('No checksums at %s: %s', checksum_url, e)
+                    self._checksums[directory] = {}
+                else:
+                    self._checksums[directory] = parse_checksums(response.text)
+        return self._checksums[directory].get(name)
+
+    def fetch(self, image_url, digest=None):
+        """Local path of the image, downloaded unless the cache has it
+
+        Args:
+            image_url: URL of the image
+            digest: expected SHA256 digest, the published one if None
+
+        Raises:
+            :py:class:`cfme.utils.template.base.TemplateUploadException` if the download does not
+            match the digest or does not finish
+        """
+        digest = digest or self.checksum(image_url)
+        with self._url_lock(image_url):
+            known = digest or self.urls.get(image_url)
+            if known and self.image_path(known).check(file=True):
+                logger.info('Image %s is cached as %s', image_url, known)
+                return self._hand_out(known)
+            part = self.path.join(
+                'partial', '{}.part'.format(hashlib.sha256(image_url.encode('utf-8')).hexdigest()))
+            part.dirpath().ensure(dir=True)
+            downloaded = self._download(image_url, part)
+            if digest and downloaded != digest:
+                part.remove()
+                self._validator_path(part).remove(ignore_errors=True)
+                raise TemplateUploadException('Image {} does not match its SHA256 {}'.format(
+                    image_url, digest))
+            target = self.image_path(downloaded)
+            target.dirpath().ensure(dir=True)
+            os.rename(str(part), str(target))
+            self._validator_path(part).remove(ignore_errors=True)
+            self.urls.set(image_url, downloaded)
+            target = self._hand_out(downloaded)
+        self.evict()
+        return target
+
+    def _hand_out(self, digest):
+        path = self.image_path(digest)
+        # the modification time is the last use
+        path.setmtime()
+        with self._lock:
+            self._fetched.add(digest)
+        return path
+
+    def evict(self):
+        """Removes the images and partial downloads over the age and the size limits
+
+        Returns:
+            list of the removed paths
+        """
+        now = time()
+        removed = []
+        partial = self.path.join('partial')
+        if self.max_age is not None and partial.check(dir=True):
+            for path in partial.listdir():
+                if now - path.mtime() > self.max_age:
+                    path.remove(ignore_errors=True)
+                    removed.append(path)
+        directory = self.path.join('sha256')
+        if not directory.check(dir=True):
+            return removed
+        with self._lock:
+            fetched = set(self._fetched)
+        images = sorted(
+            (path for path in directory.listdir() if path.basename not in fetched),
+            key=lambda path: path.mtime())
+        size = sum(path.size() for path in directory.listdir())
+        for path in images:
+            too_old = self.max_age is not None and now - path.mtime() > self.max_age
+            too_big = self.max_size is not None and size > self.max_size
+            if not (too_old or too_big):
+                continue
+            logger.info('Evicting image %s from the cache', path.basename)
+            size -= path.size()
+            path.remove(ignore_errors=True)
+            removed.append(path)
+        return removed
+
+    @staticmethod
+    def _validator_path(part):
+        return part.new(ext='.validator')
+
+    def _download(self, image_url, part):
+        for attempt in range(1, NUM_OF_TRIES + 1):
+            try:
+                return self._download_once(image_url, part)
+            except requests.RequestException as e:
+                logger.warning('Download of %s broke off (attempt %d): %s', image_url, attempt, e)
+        raise TemplateUploadException('Could not download {}'.format(image_url))
+
+    def _download_once(self, image_url, part):
+        validator_path = self._validator_path(part)
+        validator = validator_path.read() if validator_path.check(file=True) else None
+        offset = part.size() if part.check(file=True) and validator else 0
+        headers = {}
+        if offset:
+            # the server sends the whole image instead if it changed since
+            headers = {'Range': 'bytes={}-'.format(offset), 'If-Range': validator}
+        response = self._session.get(image_url, stream=True, headers=headers, timeout=60)
+        with response:
+            if offset and response.status_code == 416:
+                # nothing left to download
+                return file_digest(part, self.chunk_size).hexdigest()
+            response.raise_for_status()
+            if offset and response.status_code == 206 and (
+                    response_validator(response) in (None, validator)):
+                logger.info('Resuming the download of %s at %d bytes', image_url, offset)
+                sha, mode = file_digest(part, self.chunk_size), 'ab'
+            elif response.status_code == 206:
+                # a range of something else, the If-Range was ignored
+                part.remove(ignore_errors=True)
+                validator_path.remove(ignore_errors=True)
+                raise requests.RequestException(
+                    'Image {} changed since the download started'.format(image_url))
+            else:
+                if offset:
+                    logger.info('Image %s changed since, downloading it again', image_url)
+                else:
+                    logger.info('Downloading %s', image_url)
+                sha, mode = hashlib.sha256(), 'wb'
+                validator = response_validator(response)
+                if validator:
+                    validator_path.write(validator)
+                else:
+                    validator_path.remove(ignore_errors=True)
+            with open(str(part), mode) as f:
+                for chunk in response.iter_content(self.chunk_size):
+                    sha.update(chunk)
+                    f.write(chunk)
+        return sha.hexdigest()
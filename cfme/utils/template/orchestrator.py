@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""Concurrent template uploads to many providers from one shared image cache.
+
+:py:class:`UploadOrchestrator` runs the uploaders of all the target providers concurrently, at
+most :py:attr:`UploadOrchestrator.limits` uploads per provider type at once. The images the
+uploaders need on this machine are downloaded once into the
+:py:class:`cfme.utils.template.image_cache.ImageCache` and shared. An upload that finished before
+for the same provider, template name and image digest is skipped. The duration of every stage of
+every upload is reported at the end.
+"""
+from collections import OrderedDict
+from concurrent import futures
+from threading import BoundedSemaphore
+from time import time
+
+import attr
+
+from cfme.utils.disk_cache import DiskCache
+from cfme.utils.log import logger
+from cfme.utils.template.image_cache import ImageCache
+
+#: uploads running at once per provider type, unless the limits say otherwise
+DEFAULT_LIMIT = 2
+#: seconds a finished upload is remembered for
+UPLOAD_RECORD_TTL = 30 * 24 * 3600
+
+
+@attr.s
+class UploadResult(object):
+    """Outcome of an uploader, ``status`` is one of uploaded, skipped or failed"""
+    uploader = attr.ib()
+    status = attr.ib()
+    digest = attr.ib(default=None)
+    timings = attr.ib(default=attr.Factory(OrderedDict))
+
+
+@attr.s
+class UploadOrchestrator(object):
+    """Runs the uploaders concurrently, see the module docstring
+
+    Args:
+        cache: the :py:class:`cfme.utils.template.image_cache.ImageCache` of the images
+        limits: provider type to the number of its uploads running at once
+    """
+    cache = attr.ib(default=attr.Factory(ImageCache))
+    limits = attr.ib(default=attr.Factory(dict))
+    _semaphores = attr.ib(init=False, repr=False, default=attr.Factory(dict))
+
+    @property
+    def uploads(self):
+        """Finished uploads, see :py:meth:`upload_key`"""
+        return DiskCache(self.cache.path.join('uploads'), ttl=UPLOAD_RECORD_TTL)
+
+    @staticmethod
+    def upload_key(uploader, digest):
+        return '{}-{}-{}'.format(uploader.provider, uploader.template_name, digest)
+
+    def _semaphore(self, provider_type):
+        if provider_type not in self._semaphores:
+            self._semaphores[provider_type] = BoundedSemaphore(
+                self.limits.get(provider_type, DEFAULT_LIMIT))
+        return self._semaphores[provider_type]
+
+    def _upload(self, uploader):
+        result = UploadResult(uploader, 'failed')
+        try:
+            start = time()
+            result.digest = self.cache.checksum(uploader.image_url)
+            result.timings['checksum'] = time() - start
+            if result.digest and self.uploads.get(self.upload_key(uploader, result.digest)):
+                logger.info("(template-upload) [%s:%s:%s] Already uploaded from image %s",
+                            uploader.log_name, uploader.provider, uploader.template_name,
+                            result.digest)
+                result.status = 'skipped'
+                return result
+            if uploader.needs_local_image:
+                start = time()
+                uploader.local_image = self.cache.fetch(uploader.image_url, result.digest)
+                result.timings['download to cache'] = time() - start
+            start = time()
+            with self._semaphore(uploader.provider_type):
+                result.timings['wait for a slot'] = time() - start
+                uploaded = uploader.main()
+        except Exception:
+            logger.exception("(template-upload) [%s:%s:%s] Upload failed",
+                             uploader.log_name, uploader.provider, uploader.template_name)
+            return result
+        finally:
+            result.timings.update(uploader.timings)
+        if uploaded:
+            result.status = 'uploaded'
+            if result.digest:
+                self.uploads.set(self.upload_key(uploader, result.digest), time())
+        return result
+
+    def run(self, uploaders):
+        """Runs the uploaders, returns their :py:class:`UploadResult` in the same order"""
+        # the semaphores are created before the threads race for them
+        for uploader in uploaders:
+            self._semaphore(uploader.provider_type)
+        if not uploaders:
+            return []
+        # a thread per uploader, the ones waiting for a slot don't hold up other provider types
+        with futures.ThreadPoolExecutor(len(uploaders)) as executor:
+            results = list(executor.map(self._upload, uploaders))
+        self.report(results)
+        return results
+
+    @staticmethod
+    def report(results):
+        for result in results:
+            uploader = result.uploader
+            logger.info("(template-upload) [%s:%s:%s] %s: %s", uploader.log_name,
+                        uploader.provider, uploader.template_name, result.status.upper(),
+                        ', '.join('{} {:.1f}s'.format(stage, duration)
+                                  for stage, duration in result.timings.items()) or '-')
@@ -1,6 +1,5 @@
 import argparse
 import sys
-from threading import Thread
 
 from miq_version import TemplateName
 
@@ -12,10 +11,12 @@ from cfme.utils.providers import list_provider_keys
 from cfme.utils.template.base import TemplateUploadException
 from cfme.utils.template.ec2 import EC2TemplateUpload
 from cfme.utils.template.gce import GoogleCloudTemplateUpload
+from cfme.utils.template.image_cache import ImageCache
 from cfme.utils.template.openstack import OpenstackTemplateUpload
 from cfme.utils.template.scvmm import SCVMMTemplateUpload
 from cfme.utils.template.virtualcenter import VMWareTemplateUpload
 from cfme.utils.template.openshift import OpenshiftTemplateUpload
+from cfme.utils.template.orchestrator import DEFAULT_LIMIT, UploadOrchestrator
 
 add_stdout_handler(logger)
 PROVIDER_TYPES = ['openstack', 'virtualcenter', 'scvmm', 'gce', 'ec2', 'openshift']
@@ -71,6 +72,12 @@ def parse_cmd_line():
     parser.add_argument(
         '--template-name', dest='template_name',
         help='Set the name of the template')
+    parser.add_argument(
+        '--image-cache', dest='image_cache',
+        help='Directory of the images downloaded for the uploads, log/template_images by default')
+    parser.add_argument(
+        '--uploads-per-type', dest='uploads_per_type', type=int, default=DEFAULT_LIMIT,
+        help='How many uploads run at once per provider type')
     parser.add_argument(
         '--print-name-only', dest='print_name_only', action="store_true",
         help='Only print the template name that will be generated without actually running it.')
@@ -143,7 +150,7 @@ if __name__ == '__main__':
     else:
         streams = ALL_STREAMS
 
-    thread_queue = []
+    uploaders = []
     for stream in streams:
         stream_url = ALL_STREAMS.get(stream)
         image_url = cmd_args.image_url
@@ -185,10 +192,12 @@ if __name__ == '__main__':
                         uploader.log_name, provider))
                     continue
 
-                thread = Thread(target=uploader.main)
-                thread.daemon = True
-                thread_queue.append(thread)
-                thread.start()
+                uploaders.append(uploader)
 
-    for thread in thread_queue:
-        thread.join()
+    image_cache = ImageCache(cmd_args.image_cache) if cmd_args.image_cache else ImageCache()
+    orchestrator = UploadOrchestrator(
+        cache=image_cache,
+        limits=dict.fromkeys(PROVIDER_TYPES, cmd_args.uploads_per_type))
+    results = orchestrator.run(uploaders)
+    if any(result.status == 'failed' for result in results):
+        sys.exit(1)
@@ -0,0 +1,105 @@
+import logging
+import threading
+import time
+
+import pytest
+from riggerlib import RiggerClient
+
+from artifactor import ArtifactorClient
+
+
+@pytest.fixture
+def fired(monkeypatch):
+    """The hooks the server got, in order, a hook named ``fail`` fails to be sent"""
+    fired = []
+
+    def fire_hook(self, hook_name, **kwargs):
+        # a slow server, so that the queue builds up
+        time.sleep(0.01)
+        if hook_name == 'fail':
+            raise IOError('connection refused')
+        fired.append(hook_name)
+
+    monkeypatch.setattr(RiggerClient, 'fire_hook', fire_hook)
+    monkeypatch.setattr(RiggerClient, 'terminate', lambda self: fired.append('terminate'))
+    return fired
+
+
+@pytest.fixture
+def client(fired):
+    return ArtifactorClient('127.0.0.1', 21212)
+
+
+def test_async_hooks_in_order(client, fired):
+    hooks = ['start_test', 'skip_test', 'finish_test'] * 3
+    for hook_name in hooks:
+        client.fire_hook_async(hook_name, wait_for_task=True)
+    assert client.barrier(timeout=5)
+    assert fired == hooks
+    assert client.stats['fired'] == len(hooks)
+
+
+def test_sync_hook_waits_for_queued(client, fired):
+    client.fire_hook_async('start_test')
+    client.fire_hook_async('finish_test')
+    client.fire_hook('build_report')
+    client.terminate()
+    assert fired == ['start_test', 'finish_test', 'build_report', 'terminate']
+
+
+def test_barrier_timeout(client, fired, monkeypatch):
+    release = threading.Event()
+    fire_hook = RiggerClient.fire_hook
+
+    def held_fire_hook(self, hook_name, **kwargs):
+        release.wait(5)
+        fire_hook(self, hook_name, **kwargs)
+
+    monkeypatch.setattr(RiggerClient, 'fire_hook', held_fire_hook)
+    client.fire_hook_async('start_test')
+    assert not client.barrier(timeout=0.05)
+    release.set()
+    assert client.barrier(timeout=5)
+    assert fired == ['start_test']
+
+
+def test_failed_hook_logged(client, fired, caplog):
+    with caplog.at_level(logging.ERROR, logger='artifactor'):
+        for hook_name in ['start_test', 'fail', 'finish_test']:
+            client.fire_hook_async(hook_name)
+        assert client.barrier(timeout=5)
+    # the queue goes on after a failure
+    assert fired == ['start_test', 'finish_test']
+    assert client.stats == {'fired': 2, 'failed': 1}
+    records = [record for record in caplog.records if record.name == 'artifactor']
+    assert [record.getMessage() for record in records] == [
+        'Failed to fire the artifactor hook fail']
+    assert 'connection refused' in caplog.text
+
+
+def test_log_batches_capped(client, fired, monkeypatch):
+    release = threading.Event()
+    sent = []
+
+    def held_fire_hook(self, hook_name, **kwargs):
+        release.wait(5)
+        sent.append((hook_name, kwargs))
+
+    monkeypatch.setattr(RiggerClient, 'fire_hook', held_fire_hook)
+    monkeypatch.setattr(client, 'log_batches', 3)
+    # holds the queue, like finish_test waiting for its task
+    client.fire_hook_async('finish_test', wait_for_task=True)
+    for i in range(6):
+        client.fire_hook_async('log_messages', log_records=[[i], [i]], dropped=1)
+    client.fire_hook_async('start_test')
+    client.fire_hook_async('log_messages', log_records=[[6]], dropped=0)
+    release.set()
+    assert client.barrier(timeout=5)
+    assert [hook_name for hook_name, _ in sent] == [
+        'finish_test', 'log_messages', 'log_messages', 'start_test', 'log_messages']
+    batches = [kwargs for hook_name, kwargs in sent if hook_name == 'log_messages']
+    assert [kwargs['log_records'] for kwargs in batches] == [[[4], [4]], [[5], [5]], [[6]]]
+    # the records of a dropped batch are reported with the batch that pushed it out
+    assert [kwargs['dropped'] for kwargs in batches] == [1 + 2 + 1, 1 + 2 + 1, 4 + 2 + 0]
+    assert client.stats['dropped_batches'] == 4
+    assert client.stats['dropped_records'] == 4 * 2
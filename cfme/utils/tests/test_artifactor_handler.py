@@ -0,0 +1,62 @@
+import logging
+
+from cfme.utils.log import LOG_RECORD_FIELDS, ArtifactorHandler
+
+
+class FakeArtifactor(object):
+    def __init__(self):
+        self.calls = []
+
+    def fire_hook_async(self, hook, **kwargs):
+        self.calls.append((hook, kwargs))
+
+
+def handler_and_logger(capacity=100):
+    handler = ArtifactorHandler()
+    handler.artifactor = FakeArtifactor()
+    handler.capacity = capacity
+    # keep the background thread from shipping, the tests flush on their own
+    handler.flush_interval = 3600
+    log = logging.getLogger('test_artifactor_handler.{}'.format(id(handler)))
+    log.propagate = False
+    log.setLevel(logging.DEBUG)
+    log.addHandler(handler)
+    return handler, log
+
+
+def shipped(handler):
+    return [dict(zip(LOG_RECORD_FIELDS, record))
+            for hook, kwargs in handler.artifactor.calls
+            for record in kwargs['log_records']]
+
+
+def test_records_shipped_in_order_on_flush():
+    handler, log = handler_and_logger()
+    args = ['mutable']
+    log.info('hello %s', args)
+    args.append('changed')
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        log.exception('failed')
+    with handler.flushed():
+        pass
+    records = shipped(handler)
+    assert [record['msg'] for record in records] == ["hello ['mutable']", 'failed']
+    assert records[0]['levelname'] == 'INFO'
+    assert 'ValueError: boom' in records[1]['exc_text']
+    assert handler.stats['shipped'] == 2
+
+
+def test_full_buffer_coalesces_and_drops():
+    handler, log = handler_and_logger(capacity=2)
+    log.info('first')
+    # repeated from the same place, like a message logged while waiting for something
+    for _ in range(3):
+        log.info('second')
+    log.info('third')
+    handler.flush()
+    assert [record['msg'] for record in shipped(handler)] == [
+        'second [repeated 2 more times]', 'third']
+    assert handler.artifactor.calls[0][1]['dropped'] == 1
+    assert (handler.stats['coalesced'], handler.stats['dropped']) == (2, 1)
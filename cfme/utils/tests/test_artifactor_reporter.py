@@ -0,0 +1,119 @@
+import pytest
+from riggerlib.tools import recursive_update
+
+from artifactor.plugins.reporter import Reporter
+
+MODULE_A = 'cfme/tests/test_a.py'
+MODULE_B = 'cfme/tests/test_b.py'
+
+
+class Session(object):
+    """Fires the hooks of the reporter and merges the artifacts they return, like the artifactor
+    """
+    def __init__(self, reporter, artifact_dir):
+        self.reporter = reporter
+        self.artifact_dir = artifact_dir
+        self.global_data = {'artifacts': {}}
+
+    @property
+    def artifacts(self):
+        return self.global_data['artifacts']
+
+    def fire(self, hook, **kwargs):
+        _, global_updates = getattr(self.reporter, hook)(**kwargs)
+        self.global_data = recursive_update(self.global_data, global_updates)
+
+    def start(self, location, name):
+        self.fire('start_test', test_location=location, test_name=name, slaveid='gw0')
+
+    def report(self, location, name, when, outcome):
+        self.fire('report_test', artifacts=self.artifacts, test_location=location, test_name=name,
+                  test_xfail=False, test_when=when, test_outcome=outcome, test_phase_duration=0.5)
+
+    def finish(self, location, name):
+        self.fire('finish_test', artifacts=self.artifacts, test_location=location,
+                  test_name=name, slaveid='gw0')
+
+    def run(self, location, name, *outcomes):
+        self.start(location, name)
+        for when, outcome in zip(['setup', 'call', 'teardown'], outcomes):
+            self.report(location, name, when, outcome)
+        self.finish(location, name)
+
+    def render(self):
+        self.reporter.report.render(self.artifacts, self.artifact_dir.strpath)
+
+    def fragment(self, module):
+        return self.artifact_dir.join(
+            'report_fragments', '{}.html'.format(module.replace('/', '_'))).read()
+
+
+@pytest.fixture
+def session(tmpdir):
+    reporter = Reporter('reporter', {'render_interval': 60}, None)
+    reporter.configure()
+    # no run history to compare with
+    reporter._previous_results = {}
+    return Session(reporter, tmpdir)
+
+
+def test_counts(session):
+    session.run(MODULE_A, 'test_passes', 'passed', 'passed', 'passed')
+    session.run(MODULE_A, 'test_fails', 'passed', 'failed', 'passed')
+    session.fire('skip_test', test_location=MODULE_B, test_name='test_blocked',
+                 skip_data={'type': 'blocker', 'reason': ['1234', '1234']})
+    session.run(MODULE_B, 'test_blocked', 'skipped')
+    # not reported on yet
+    session.start(MODULE_B, 'test_started')
+    session.render()
+    report = session.reporter.report
+    assert report.counts == dict(report.counts, passed=1, failed=1, skipped=1)
+    assert sum(report.counts.values()) == 3
+    assert report.skip_counts == {'provider': 0, 'blocker': 1}
+    # the same as a report built from scratch
+    assert report.counts == session.reporter.process_data(
+        session.artifacts, session.artifact_dir.strpath, None, None)['counts']
+
+    # a test changing its outcome moves between the counts
+    session.report(MODULE_A, 'test_passes', 'teardown', 'failed')
+    session.render()
+    assert report.counts == dict(report.counts, passed=0, failed=1, error=1, skipped=1)
+    assert sum(report.counts.values()) == 3
+    assert report.current_counts == report.counts
+
+
+def test_panels(session):
+    session.run(MODULE_A, 'test_passes', 'passed', 'passed', 'passed')
+    session.start(MODULE_B, 'test_running')
+    session.report(MODULE_B, 'test_running', 'setup', 'passed')
+    session.render()
+    panels = session.fragment(MODULE_B)
+    assert '{}/test_running'.format(MODULE_B) in panels
+    assert 'IN PROGRESS...' in panels
+    assert 'COMPLETE' in session.fragment(MODULE_A)
+    report_html = session.artifact_dir.join('report.html').read()
+    assert panels in report_html
+    assert session.fragment(MODULE_A) in report_html
+
+    # only the test in progress is rebuilt
+    assert session.reporter.report.update(
+        session.artifacts, session.artifact_dir.strpath) == {MODULE_B}
+
+    session.report(MODULE_B, 'test_running', 'call', 'failed')
+    session.finish(MODULE_B, 'test_running')
+    session.render()
+    panels = session.fragment(MODULE_B)
+    assert 'IN PROGRESS...' not in panels
+    assert 'panel-warning' in panels
+    assert panels in session.artifact_dir.join('report.html').read()
+    assert session.reporter.report.update(session.artifacts, session.artifact_dir.strpath) == set()
+
+
+def test_due(session):
+    report = session.reporter.report
+    assert report.due()
+    session.run(MODULE_A, 'test_passes', 'passed', 'passed', 'passed')
+    session.render()
+    assert not report.due()
+    report.render_interval = 0
+    assert report.due()
@@ -0,0 +1,76 @@
+import os
+from time import time
+
+from cfme.utils.bz import Bugzilla
+from cfme.utils.disk_cache import DiskCache
+
+
+class FakeBug(object):
+    def __init__(self, id, status='NEW', resolution='', dupe_of=None, blocks=(), clone_of=None):
+        self.id = id
+        self.status = status
+        self.resolution = resolution
+        self.dupe_of = dupe_of
+        self.blocks = list(blocks)
+        text = '+++ This bug was initially created as a clone of Bug #{} +++'.format(clone_of)
+        self.comments = [{'text': text if clone_of else 'Description'}]
+
+
+class FakeBugzillaConnection(object):
+    """Serves the bugs the way python-bugzilla does, recording the calls"""
+    def __init__(self, bugs):
+        self.bugs = {bug.id: bug for bug in bugs}
+        self.calls = []
+
+    def getbug(self, id):
+        self.calls.append(('getbug', id))
+        return self.bugs[id]
+
+    def getbugs(self, ids):
+        self.calls.append(('getbugs', sorted(ids)))
+        return [self.bugs.get(id) for id in ids]
+
+
+def make_bugzilla(cache, bugs):
+    bugzilla = Bugzilla(url='https://bugzilla.example.com/xmlrpc.cgi', cache=cache)
+    connection = FakeBugzillaConnection(bugs)
+    # skip the connection and the configuration
+    bugzilla.__dict__.update(bugzilla=connection, loose=[])
+    return bugzilla, connection
+
+
+BUGS = [
+    FakeBug(100, status='CLOSED', resolution='DUPLICATE', dupe_of=101),
+    FakeBug(101, blocks=[102, 103]),
+    FakeBug(102, clone_of=101),
+    FakeBug(103),
+]
+
+
+def test_disk_cache_shared_and_expiring(tmpdir):
+    writer = DiskCache(tmpdir.join('cache'), ttl=60)
+    reader = DiskCache(tmpdir.join('cache'), ttl=60)
+    writer.set('gh-owner/repo:1', {'state': 'open'})
+    assert reader.get('gh-owner/repo:1') == {'state': 'open'}
+    assert reader.get_many(['gh-owner/repo:1', 'gh-owner/repo:2']) == {
+        'gh-owner/repo:1': {'state': 'open'}}
+    path = str(writer._file('gh-owner/repo:1'))
+    os.utime(path, (time() - 120, time() - 120))
+    assert reader.get('gh-owner/repo:1', 'expired') == 'expired'
+
+
+def test_bugzilla_prefetch_in_bulk(tmpdir):
+    cache = DiskCache(tmpdir.join('cache'))
+    bugzilla, connection = make_bugzilla(cache, BUGS)
+    bugzilla.prefetch([100])
+    # one call per level of the variant graph, plus one for the bugs blocked by 101
+    assert connection.calls == [
+        ('getbugs', [100]), ('getbugs', [101]), ('getbugs', [102, 103])]
+    assert {bug.id for bug in bugzilla.get_bug_variants(100)} == {101, 102}
+    assert len(connection.calls) == 3
+
+    # another process finds everything in the disk cache
+    slave_bugzilla, slave_connection = make_bugzilla(cache, BUGS)
+    slave_bugzilla.prefetch([100])
+    assert {bug.id for bug in slave_bugzilla.get_bug_variants(100)} == {101, 102}
+    assert slave_connection.calls == []
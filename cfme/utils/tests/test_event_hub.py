@@ -0,0 +1,360 @@
+import threading
+
+from cfme.utils.event_hub import EventHub, HubEventListener
+from cfme.utils import events_db
+from cfme.utils.events import Event, EventAttr, RestEventHub
+from cfme.utils.events_db import DbEventHub
+
+
+class Attr(object):
+    def __init__(self, name, value, cmp_func=None):
+        self.name, self.value, self.cmp_func = name, value, cmp_func
+
+
+class FakeEvent(object):
+    def __init__(self, **attrs):
+        self.event_attrs = {name: Attr(name, value) for name, value in attrs.items()}
+
+    def matches(self, evt):
+        return all(evt.event_attrs[name].value == attr.value
+                   for name, attr in self.event_attrs.items() if name in evt.event_attrs)
+
+
+class FakeHub(EventHub):
+    def __init__(self):
+        super(FakeHub, self).__init__(appliance=None)
+        self.rows = []
+        self.built = 0
+
+    def latest_id(self):
+        return self.rows[-1]['id'] if self.rows else 0
+
+    def fetch(self, last_id):
+        return [row for row in self.rows if row['id'] > last_id]
+
+    def row_id(self, row):
+        return row['id']
+
+    def row_keys(self, row):
+        return row['event_type'], row['target_type']
+
+    def build_event(self, row):
+        self.built += 1
+        return FakeEvent(**row)
+
+    def _start(self):
+        # the tests drive the hub by calling poll
+        self._stop_event = threading.Event()
+        self._thread = threading.current_thread()
+
+    def add_row(self, event_type, target_type='VmOrTemplate', **kwargs):
+        kwargs.update(id=len(self.rows) + 1, event_type=event_type, target_type=target_type)
+        self.rows.append(kwargs)
+
+
+class FakeListener(HubEventListener):
+    def __init__(self, hub):
+        super(FakeListener, self).__init__(appliance=None)
+        self._hub = hub
+
+    @property
+    def hub(self):
+        return self._hub
+
+    def listen_to(self, *evts, **kwargs):
+        for evt in evts:
+            self._add_expectation(evt, kwargs.get('callback'), bool(kwargs.get('first_event')))
+
+
+def test_rows_fanned_out_to_all_listeners():
+    hub = FakeHub()
+    first, second = FakeListener(hub), FakeListener(hub)
+    first.listen_to(FakeEvent(event_type='vm_create'))
+    first.start()
+    second.start()
+    second.listen_to(FakeEvent(event_type='vm_create'), FakeEvent(event_type='vm_delete'))
+
+    hub.add_row('vm_create')
+    hub.add_row('vm_power_on')
+    hub.add_row('vm_create')
+    hub.poll()
+    assert hub.stats['fetches'] == 1
+    assert [len(exp['matched_events']) for exp in first.got_events] == [2]
+    assert [len(exp['matched_events']) for exp in second.got_events] == [2, 0]
+    # every row was built at most once, the unmatched one not at all
+    assert hub.built == 2
+    assert not second.check_expected_events()
+
+
+def test_rows_before_subscription_ignored():
+    hub = FakeHub()
+    early = FakeListener(hub)
+    early.start()
+    hub.add_row('vm_create')
+    late = FakeListener(hub)
+    late.start()
+    for listener in (early, late):
+        listener.listen_to(FakeEvent(event_type='vm_create'), first_event=True)
+    hub.add_row('vm_create')
+    hub.poll()
+    assert len(early.got_events[0]['matched_events']) == 1
+    assert late.got_events[0]['matched_events'][0].event_attrs['id'].value == 2
+
+
+def test_wildcard_and_reset():
+    hub = FakeHub()
+    listener = FakeListener(hub)
+    listener.start()
+    got = []
+    listener.listen_to(FakeEvent(source='AZURE'), callback=lambda **kw: got.append(kw))
+    hub.add_row('nsg_write', target_type='Host', source='AZURE')
+    hub.poll()
+    assert len(got) == 1
+    listener.reset_events()
+    hub.add_row('nsg_write', target_type='Host', source='AZURE')
+    hub.poll()
+    assert len(got) == 1
+    listener.stop()
+    assert not hub.running
+
+
+class ResolvingHub(FakeHub):
+    """Expectations with a target_name only match once the target is known"""
+    def __init__(self):
+        super(ResolvingHub, self).__init__()
+        self.targets = {}
+        self.locked_prepares = 0
+
+    def prepare(self, exp_event):
+        checker = threading.Thread(target=self._check_unlocked)
+        checker.start()
+        checker.join()
+        attrs = exp_event.event_attrs
+        if 'target_name' in attrs and 'target_id' not in attrs:
+            if attrs['target_name'].value not in self.targets:
+                return False
+            attrs['target_id'] = Attr('target_id', self.targets[attrs['target_name'].value])
+        return True
+
+    def _check_unlocked(self):
+        if self._lock.acquire(False):
+            self._lock.release()
+        else:
+            self.locked_prepares += 1
+
+
+def test_rows_kept_until_target_known():
+    hub = ResolvingHub()
+    listener = FakeListener(hub)
+    listener.start()
+    event = FakeEvent(event_type='vm_create')
+    event.event_attrs['target_name'] = Attr('target_name', 'vm1')
+    listener.listen_to(event)
+    hub.add_row('vm_create', target_id=7)
+    hub.add_row('vm_create', target_id=8)
+    hub.poll()
+    assert not listener.check_expected_events()
+    assert len(hub._deferred) == 2
+
+    hub.targets['vm1'] = 7
+    hub.poll()
+    matched = listener.got_events[0]['matched_events']
+    assert [got.event_attrs['id'].value for got in matched] == [1]
+    assert not hub._deferred
+    assert hub.locked_prepares == 0
+
+
+def test_deferred_rows_dropped_with_the_expectation():
+    hub = ResolvingHub()
+    listener = FakeListener(hub)
+    listener.start()
+    event = FakeEvent(event_type='vm_create')
+    event.event_attrs['target_name'] = Attr('target_name', 'vm1')
+    listener.listen_to(event)
+    hub.add_row('vm_create', target_id=7)
+    hub.poll()
+    listener.reset_events()
+    hub.targets['vm1'] = 7
+    hub.poll()
+    assert not hub._deferred
+
+
+class FakeResource(object):
+    def __init__(self, **data):
+        self._data = data
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+
+class FakeEventStreams(object):
+    """The ``event_streams`` collection, the REST API sends the ids as strings"""
+    def __init__(self):
+        self.resources = []
+        self.queries = 0
+
+    def add(self, event_type, target_type='VmOrTemplate'):
+        self.resources.append(FakeResource(
+            id=str(len(self.resources) + 1), event_type=event_type, target_type=target_type))
+
+    def query_string(self, expand, limit, sort_order, sort_by, **params):
+        self.queries += 1
+        resources = sorted(self.resources, key=lambda resource: int(resource._data['id']),
+                           reverse=sort_order == 'desc')
+        for condition in params.get('filter[]', ()):
+            name, op, value = condition.split()
+            assert (name, op) == ('id', '>')
+            resources = [resource for resource in resources
+                         if int(resource._data['id']) > int(value)]
+        result = FakeResource()
+        result.resources = resources[:limit]
+        return result
+
+
+class DrivenRestHub(RestEventHub):
+    page_size = 3
+    _start = FakeHub.__dict__['_start']
+
+    def __init__(self):
+        super(DrivenRestHub, self).__init__(appliance=None)
+        self.streams = FakeEventStreams()
+
+    @property
+    def event_streams(self):
+        return self.streams
+
+
+def test_rest_hub_string_ids():
+    hub = DrivenRestHub()
+    for _ in range(2):
+        hub.streams.add('vm_create')
+    listener = FakeListener(hub)
+    listener.start()
+    assert hub.latest_id() == 2
+    listener.listen_to(Event(None, EventAttr(event_type='vm_create')))
+    # past id 9, the ids do not sort as strings
+    for _ in range(9):
+        hub.streams.add('vm_create')
+    hub.streams.add('vm_delete')
+    queries = hub.streams.queries
+    assert hub.poll() == 10
+    # fetched in pages
+    assert hub.streams.queries - queries == 4
+    matched = listener.got_events[0]['matched_events']
+    assert [got.event_attrs['id'].value for got in matched] == [
+        str(row_id) for row_id in range(3, 12)]
+    assert hub.latest_id() == 12
+    assert hub.poll() == 0
+
+
+class FakeCursor(object):
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+
+    def execute(self, sql):
+        sql = ' '.join(sql.split())
+        self.db.executed.append(sql)
+        if sql == 'SELECT pg_backend_pid()':
+            self.rows = [(self.db.backend_pid,)]
+        elif 'FROM pg_trigger' in sql:
+            self.rows = [(name,) for name in self.db.stale]
+
+    def fetchone(self):
+        return self.rows[0]
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeDb(object):
+    """``appliance.db`` handing out raw connections to a database recording the statements"""
+    backend_pid = 4242
+
+    def __init__(self, stale=()):
+        self.stale = list(stale)
+        self.executed = []
+        self.invalidated = 0
+
+    @property
+    def client(self):
+        return self
+
+    @property
+    def engine(self):
+        return self
+
+    @property
+    def connection(self):
+        return self
+
+    def raw_connection(self):
+        return self
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def invalidate(self):
+        self.invalidated += 1
+
+
+class FakeAppliance(object):
+    def __init__(self, db):
+        self.db = db
+
+
+def test_db_hub_drops_stale_triggers():
+    db = FakeDb(stale=['cfme_tests_notify_17', 'cfme_tests_notify_1234_140000000'])
+    hub = DbEventHub(FakeAppliance(db))
+    hub._notify_conn = hub._listen()
+    assert db.autocommit
+    assert hub.notify_name == 'cfme_tests_notify_4242'
+    statements = [sql.split(' $$')[0] for sql in db.executed]
+    assert statements[:2] == ['SELECT pg_backend_pid()', ' '.join(DbEventHub.STALE_SQL.split())]
+    assert statements[2:] == [
+        'DROP TRIGGER IF EXISTS cfme_tests_notify_17 ON event_streams; '
+        'DROP FUNCTION IF EXISTS cfme_tests_notify_17();',
+        'DROP TRIGGER IF EXISTS cfme_tests_notify_1234_140000000 ON event_streams; '
+        'DROP FUNCTION IF EXISTS cfme_tests_notify_1234_140000000();',
+        'CREATE OR REPLACE FUNCTION cfme_tests_notify_4242() RETURNS trigger AS',
+        'LISTEN cfme_tests_notify_4242']
+
+    del db.executed[:]
+    hub.close()
+    assert db.executed == [
+        'DROP TRIGGER IF EXISTS cfme_tests_notify_4242 ON event_streams; '
+        'DROP FUNCTION IF EXISTS cfme_tests_notify_4242();']
+    assert db.invalidated == 1
+    assert hub.notify_name is None
+
+
+def test_db_hub_prepare(monkeypatch):
+    hub = DbEventHub(FakeAppliance(FakeDb()))
+    hub.tool.event_streams_attributes = [('target_type', str), ('target_id', int)]
+    lookup = hub.tool.process_id
+
+    def process_id(target_type, target_name):
+        if target_type != 'VmOrTemplate':
+            # not in the OBJECT_TABLE, raises TypeError before going to the db
+            return lookup(target_type, target_name)
+        if target_name != 'vm':
+            raise ValueError('not there yet')
+        return 7
+
+    monkeypatch.setattr(hub.tool, 'process_id', process_id)
+
+    def expected(target_type, target_name):
+        return events_db.Event(hub.tool).add_attrs(
+            events_db.EventAttr(target_type=target_type),
+            events_db.EventAttr(target_name=target_name))
+
+    exp_event = expected('VmOrTemplate', 'other_vm')
+    assert not hub.prepare(exp_event)
+    assert 'target_id' not in exp_event.event_attrs
+    exp_event = expected('VmOrTemplate', 'vm')
+    assert hub.prepare(exp_event)
+    assert exp_event.event_attrs['target_id'].value == 7
+    # never resolved, matched right away instead of kept back forever
+    exp_event = expected('MiqServer', 'server')
+    assert hub.prepare(exp_event)
+    assert 'target_id' not in exp_event.event_attrs
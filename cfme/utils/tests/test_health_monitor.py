@@ -0,0 +1,105 @@
+import socket
+
+from cfme.utils import health_monitor
+from cfme.utils.health_monitor import HealthMonitor
+
+
+class FakeAppliance(object):
+    hostname = 'appliance'
+    ssh_port = 22
+    ui_port = 443
+    db_host = None
+    db_port = 5432
+    url = 'https://appliance/'
+
+    def __init__(self, is_pod=False):
+        self.is_pod = is_pod
+
+    def url_path(self, path):
+        return 'https://appliance{}'.format(path)
+
+
+class FakeResponse(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakeSession(object):
+    """Answers with the status codes by URL, counts the requests and keeps their timeouts"""
+    def __init__(self, status_codes):
+        self.status_codes = status_codes
+        self.urls = []
+        self.timeouts = {}
+
+    def get(self, url, timeout=None):
+        self.urls.append(url)
+        self.timeouts[url] = timeout
+        return FakeResponse(self.status_codes[url])
+
+
+def make_monitor(monkeypatch, closed_ports=(), status_codes=None, is_pod=False):
+    probed = []
+
+    def tcp_probe(addr, port):
+        probed.append(port)
+        if port in closed_ports:
+            raise socket.error('Connection refused')
+
+    monkeypatch.setattr(health_monitor, 'tcp_probe', tcp_probe)
+    monitor = HealthMonitor(FakeAppliance(is_pod))
+    monitor._session = FakeSession(status_codes or {
+        'https://appliance/api/ping': 200, 'https://appliance/': 200})
+    return monitor, probed
+
+
+def test_current_uses_fresh_state(monkeypatch):
+    monitor, probed = make_monitor(monkeypatch)
+    state = monitor.current()
+    assert state.healthy and list(state.probes) == ['ssh', 'https', 'postgres', 'web', 'api']
+    assert sorted(probed) == [22, 443, 5432]
+    # fresh and healthy, no probe
+    assert monitor.current() is state
+    assert len(monitor._session.urls) == 2
+    # stale
+    assert monitor.current(max_age=-1) is not state
+    assert monitor.latency_stats()['web']['count'] == 2
+
+
+def test_unhealthy_state_is_probed_again(monkeypatch):
+    monitor, probed = make_monitor(monkeypatch, closed_ports=[5432], is_pod=True)
+    state = monitor.current()
+    assert [(result.name, result.port) for result in state.failures] == [('postgres', 5432)]
+    assert 22 not in probed
+    assert monitor.current() is not state
+    assert monitor.latency_stats()['postgres']['failures'] == 2
+
+
+def test_login_page_without_ping(monkeypatch):
+    monitor, probed = make_monitor(monkeypatch, status_codes={
+        'https://appliance/api/ping': 404, 'https://appliance/': 503})
+    state = monitor.probe()
+    assert [result.name for result in state.failures] == ['web']
+    assert not state.api_only
+    assert state.probes['web'].error == 'Status code was 503, should be 200'
+    assert 'api' not in monitor.probe().probes
+    assert sorted(monitor._session.urls) == [
+        'https://appliance/', 'https://appliance/', 'https://appliance/api/ping']
+
+
+def test_auth_errors_are_healthy(monkeypatch):
+    monitor, probed = make_monitor(monkeypatch, status_codes={
+        'https://appliance/api/ping': 401, 'https://appliance/': 403})
+    assert monitor.probe().healthy
+
+
+def test_api_probed_apart_from_ui(monkeypatch):
+    monitor, probed = make_monitor(monkeypatch, status_codes={
+        'https://appliance/api/ping': 503, 'https://appliance/': 200})
+    state = monitor.probe()
+    assert [(result.name, result.port, result.error) for result in state.failures] == [
+        ('api', 443, 'Status code was 503, should be 200')]
+    assert state.api_only
+    # rendering the login page may take long, the ping may not
+    assert monitor._session.timeouts == {
+        'https://appliance/': health_monitor.UI_PROBE_TIMEOUT,
+        'https://appliance/api/ping': health_monitor.PROBE_TIMEOUT}
@@ -0,0 +1,172 @@
+import io
+import os
+import subprocess
+
+import attr
+import pytest
+
+from cfme.utils.log_validator import LogValidator
+from cfme.utils.ssh import SSHTail
+
+
+class FakeTail(object):
+    def __init__(self, lines):
+        self.lines = lines
+        self.grepped = []
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def grep_lines(self, pattern):
+        self.grepped.append(pattern)
+        return [line for line in self.lines if 'ERROR' in line or 'Queued' in line]
+
+
+@pytest.fixture
+def validator():
+    def _validator(lines, **kwargs):
+        validator = LogValidator('/var/www/miq/vmdb/log/evm.log', hostname='localhost', **kwargs)
+        validator._remote_file_tail = FakeTail(lines)
+        return validator
+    return _validator
+
+
+LINES = [
+    'INFO -- : Queued the action: [Database GC] being run for user: admin',
+    'INFO -- : nothing to see here',
+    'ERROR -- : known harmless error',
+    'INFO -- : Queued the action: [Database GC] being run for user: admin',
+]
+
+
+def test_hits_counted_in_single_pass(validator):
+    log = validator(LINES,
+                    skip_patterns=['.*harmless.*'],
+                    failure_patterns=['.*ERROR.*'],
+                    matched_patterns=[r'.*Queued the action: \[Database GC\].*'])
+    log.validate_logs()
+    assert log.hits == {'.*harmless.*': 1, r'.*Queued the action: \[Database GC\].*': 2}
+
+
+def test_failure_pattern_fails(validator):
+    log = validator(LINES, failure_patterns=['.*ERROR.*'])
+    with pytest.raises(pytest.fail.Exception):
+        log.validate_logs()
+
+
+def test_missing_match_fails(validator):
+    log = validator(LINES, matched_patterns=['.*never logged.*'])
+    with pytest.raises(pytest.fail.Exception):
+        log.validate_logs()
+
+
+def test_prefilter_only_for_grep_compatible_patterns(validator):
+    log = validator(LINES, matched_patterns=['.*Queued.*'], prefilter=True)
+    log.validate_logs()
+    assert log._remote_file_tail.grepped == ['(.*Queued.*)']
+
+    log = validator(LINES, matched_patterns=[r'.*user: \w+\d*'], prefilter=True)
+    log.validate_logs()
+    assert log._remote_file_tail.grepped == []
+
+
+@attr.s
+class Result(object):
+    rc = attr.ib()
+    output = attr.ib()
+
+    @property
+    def failed(self):
+        return self.rc != 0
+
+
+class LocalSftpFile(io.FileIO):
+    def __init__(self, path, mode):
+        super(LocalSftpFile, self).__init__(path, mode.replace('b', ''))
+
+    def prefetch(self, file_size=None):
+        pass
+
+
+class LocalSftp(object):
+    def stat(self, path):
+        return os.stat(path)
+
+    def open(self, path, mode='r'):
+        return LocalSftpFile(path, mode)
+
+    def close(self):
+        pass
+
+
+def run_command(command):
+    process = subprocess.Popen(
+        command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.communicate()[0]
+    return Result(process.returncode, output.decode('utf-8'))
+
+
+@pytest.fixture
+def log_file(tmpdir):
+    log_file = tmpdir.join('evm.log')
+    log_file.write('[----] I, [2017-11-01T22:00:00.000000 #1000:2ac8a0a1f3f4] old\n')
+    return log_file
+
+
+@pytest.fixture
+def tail(log_file):
+    """An SSHTail reading and grepping the log file here"""
+    tail = SSHTail(log_file.strpath, hostname='localhost')
+    tail.connect = lambda **kwargs: None
+    tail.open_sftp = LocalSftp
+    tail.run_command = run_command
+    return tail
+
+
+def test_tail_lines_across_chunks(tail, log_file):
+    tail.set_initial_file_end()
+    # nothing new yet
+    assert list(tail) == []
+    tail.CHUNK_SIZE = 4
+    log_file.write('abc\ndefghijkl\nmn', mode='a')
+    assert list(tail) == ['abc', 'defghijkl']
+    # the unfinished line is read once it's finished
+    log_file.write('o\n', mode='a')
+    assert list(tail) == ['mno']
+    assert tail._remote_file_size == log_file.size()
+
+
+def test_tail_truncated(tail, log_file):
+    tail.set_initial_file_end()
+    log_file.write('new\n')
+    assert list(tail) == ['new']
+
+
+def test_tail_rotated_past_the_offset(tail, log_file):
+    tail.set_initial_file_end()
+    new_lines = ['[----] I, [2017-11-02T03:00:00.000000 #1000:2ac8a0a1f3f4] new {}'.format(i)
+                 for i in range(3)]
+    # the new file is longer than the old one already
+    log_file.write(''.join(line + '\n' for line in new_lines))
+    assert list(tail) == new_lines
+    log_file.write('appended\n', mode='a')
+    assert list(tail) == ['appended']
+
+
+def test_grep_lines(tail, log_file):
+    # the first call only seeds the offset
+    assert tail.grep_lines('ERROR|WARN') == []
+    log_file.write('INFO -- : fine\nERROR -- : broken\nWARN -- : odd\n', mode='a')
+    assert tail.grep_lines('ERROR|WARN') == ['ERROR -- : broken', 'WARN -- : odd']
+    assert tail.grep_lines('ERROR|WARN') == []
+    assert tail._remote_file_size == log_file.size()
+
+    # rotated, the new file grew past the offset
+    log_file.write('ERROR -- : rotated\n' + 'INFO -- : filler\n' * 20)
+    assert tail.grep_lines('ERROR') == ['ERROR -- : rotated']
+    # truncated
+    log_file.write('ERROR -- : truncated\n')
+    assert tail.grep_lines('ERROR') == ['ERROR -- : truncated']
+
+    with pytest.raises(ValueError):
+        tail.grep_lines('(')
@@ -0,0 +1,126 @@
+import pytest
+from _pytest.mark import MarkInfo
+
+from cfme.fixtures import parallelizer
+from cfme.fixtures.parallelizer.collection_cache import (
+    CollectionRecorder, CollectionReplay, collection_digest)
+
+pytest_plugins = 'pytester'
+
+conftest = """
+import pytest
+
+PROVIDERS = {providers!r}
+
+
+@pytest.fixture
+def provider_data():
+    return None
+
+
+def pytest_generate_tests(metafunc):
+    if 'provider' not in metafunc.fixturenames:
+        return
+    metafunc.fixturenames.append('provider_data')
+    metafunc.parametrize('provider', PROVIDERS, ids=PROVIDERS, scope='module')
+    if 'version' in metafunc.fixturenames:
+        metafunc.parametrize('version', [1, 2])
+    pytest.mark.uses_testgen(metafunc.function)
+"""
+
+test_file = """
+import pytest
+
+
+def test_plain():
+    pass
+
+
+@pytest.mark.tier(1)
+def test_provider(provider):
+    pass
+
+
+class TestVersions(object):
+    def test_provider_version(self, provider, version):
+        pass
+"""
+
+
+def collect(testdir, *plugins):
+    """Collects the test dir, returns the node ids and details of the items"""
+    rec = testdir.inline_run('--collect-only', plugins=list(plugins))
+    items = [call.item for call in rec.getcalls('pytest_itemcollected')]
+    details = {}
+    for item in items:
+        callspec = getattr(item, 'callspec', None)
+        details[item.nodeid] = (
+            callspec and callspec.params,
+            callspec and callspec.id,
+            sorted(name for name, value in item.keywords.items() if isinstance(value, MarkInfo)),
+            sorted(item.fixturenames))
+    return [item.nodeid for item in items], details
+
+
+@pytest.fixture
+def recorded(testdir):
+    testdir.makeconftest(conftest.format(providers=['rhv', 'vsphere']))
+    testdir.makepyfile(test_file)
+    recorder = CollectionRecorder()
+    node_ids, details = collect(testdir, recorder)
+    return recorder, node_ids, details
+
+
+def test_replay_matches_collection(testdir, recorded):
+    recorder, node_ids, details = recorded
+    assert len(node_ids) == 7
+    assert all(data is not None for data in recorder.functions.values())
+    replay = CollectionReplay(recorder.functions, node_ids)
+    replay_node_ids, replay_details = collect(testdir, replay)
+    assert replay.stats == {'replayed': 3, 'generated': 0}
+    assert replay_node_ids == node_ids
+    assert replay_details == details
+
+
+def test_replay_does_not_generate(testdir, recorded):
+    recorder, node_ids, details = recorded
+    # the records win over a generation that would differ now
+    testdir.makeconftest(conftest.format(providers=['rhv', 'vsphere', 'scvmm']))
+    replay = CollectionReplay(recorder.functions, node_ids)
+    replay_node_ids, replay_details = collect(testdir, replay)
+    assert replay_node_ids == node_ids
+    assert replay_details == details
+
+
+def test_replay_mismatch_falls_back(testdir, recorded, monkeypatch):
+    recorder, node_ids, details = recorded
+    testdir.makeconftest(conftest.format(providers=['rhv', 'vsphere', 'scvmm']))
+    # a record the master could not store, the slave generates that function on its own
+    functions = {key: (None if key.endswith('::test_provider') else data)
+                 for key, data in recorder.functions.items()}
+    replay = CollectionReplay(functions, node_ids)
+    replay_node_ids, _ = collect(testdir, replay)
+    assert replay.stats == {'replayed': 2, 'generated': 1}
+    assert collection_digest(replay_node_ids) != collection_digest(node_ids)
+
+    # the master flags the slave on a digest mismatch, the respawn collects in full
+    popen_args = []
+
+    class Process(object):
+        def __init__(self, args, **kwargs):
+            popen_args.append(args)
+
+        def kill(self):
+            pass
+
+    class Appliance(object):
+        as_json = '{}'
+
+    monkeypatch.setattr(parallelizer.subprocess, 'Popen', Process)
+
+    slave = parallelizer.SlaveDetail(appliance=Appliance(), worker_config={})
+    slave.start()
+    assert '--full-collection' not in popen_args[-1]
+    slave.full_collection = True
+    slave.start()
+    assert '--full-collection' in popen_args[-1]
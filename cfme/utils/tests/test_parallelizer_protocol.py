@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+from cfme.fixtures.parallelizer.protocol import MasterChannel, SlaveChannel
+
+
+@pytest.fixture(params=['json', 'batched'])
+def channels(request, tmpdir):
+    endpoint = 'ipc://{}'.format(tmpdir.join('master'))
+    master = MasterChannel(endpoint, request.param)
+    slave = SlaveChannel(endpoint, 'gw0', request.param)
+    yield master, slave
+    slave.close()
+    master.close()
+
+
+def test_events_and_replies(channels):
+    master, slave = channels
+    replies = []
+    thread = threading.Thread(
+        target=lambda: replies.append(slave.send_event('need_tests', count=1)))
+    thread.start()
+    slave_id, event_data, event_name = None, None, None
+    deadline = time.time() + 10
+    while event_name is None and time.time() < deadline:
+        slave_id, event_data, event_name = master.recv()
+    assert (slave_id, event_data, event_name) == (b'gw0', {'count': 1}, 'need_tests')
+    master.send(slave_id, ['test_a'])
+    thread.join(10)
+    assert replies == [['test_a']]
+
+
+def test_batched_events_arrive_in_order(tmpdir):
+    endpoint = 'ipc://{}'.format(tmpdir.join('master'))
+    master = MasterChannel(endpoint, 'batched')
+    slave = SlaveChannel(endpoint, 'gw0', 'batched')
+    try:
+        for i in range(3):
+            assert slave.send_event('message', message=str(i)) is None
+        slave.flush()
+        received = []
+        deadline = time.time() + 10
+        while len(received) < 3 and time.time() < deadline:
+            _, event_data, event_name = master.recv()
+            if event_name is not None:
+                received.append((event_name, event_data['message']))
+        assert received == [('message', '0'), ('message', '1'), ('message', '2')]
+        assert not master.needs_ack('message') and master.needs_ack('need_tests')
+    finally:
+        slave.close()
+        master.close()
+
+
+def test_wakeup_interrupts_recv_from_threads(tmpdir):
+    master = MasterChannel('ipc://{}'.format(tmpdir.join('master')), 'batched')
+    try:
+        # the batched poll would block for seconds, every wakeup cuts it short
+        for _ in range(3):
+            waker = threading.Timer(0.1, master.wakeup)
+            waker.start()
+            start = time.time()
+            assert master.recv() == (None, None, None)
+            assert time.time() - start < master.poll_timeout / 1000. / 2
+            waker.join()
+        # several threads wake up at once, each through its own socket
+        wakers = [threading.Thread(target=master.wakeup) for _ in range(5)]
+        for waker in wakers:
+            waker.start()
+        for waker in wakers:
+            waker.join()
+        master.wakeup()
+        assert len(master._wakeup_txs) == 9
+        start = time.time()
+        assert master.recv() == (None, None, None)
+        assert time.time() - start < 1
+    finally:
+        master.close()
@@ -0,0 +1,78 @@
+from cfme.fixtures.parallelizer.scheduler import DurationScheduler
+
+DURATIONS = {'a1': 100., 'a2': 100., 'b1': 300., 'c1': 50.}
+
+
+def provider_of(tests):
+    return tests[0][0]
+
+
+def make_scheduler(slave_ids=('gw0', 'gw1'), cleanup_cost=1000.):
+    return DurationScheduler(
+        [['a1', 'a2'], ['b1'], ['c1']], slave_ids, DURATIONS, provider_of,
+        cleanup_cost=cleanup_cost)
+
+
+def test_plan_balances_by_duration():
+    scheduler = make_scheduler()
+    # the biggest groups (b 300s and a 200s) each get their own slave, c fills the lighter one
+    assert scheduler.backlog('gw0') == 300.
+    assert scheduler.backlog('gw1') == 250.
+    assert [group.provider for group in scheduler.queues['gw1']] == ['a', 'c']
+    assert scheduler.remaining == 3
+
+
+def test_late_slave_steals_the_head_group():
+    scheduler = make_scheduler(slave_ids=('gw0',))
+    assert scheduler.next_group('gw0').provider == 'b'
+    # gw1 joined after the plan, its queue is empty, it steals instead of stopping
+    group = scheduler.next_group('gw1', providers=())
+    assert group is not None
+    assert scheduler.stats['stolen'] == 1
+    assert scheduler.remaining == 1
+
+
+def test_steal_weighs_wait_against_rehoming():
+    for providers, stolen in ((['a'], 'a'), (['c'], 'c'), ([], 'c')):
+        scheduler = make_scheduler(slave_ids=('gw0',))
+        assert scheduler.next_group('gw0').provider == 'b'
+        # a waits for b (300s), c for b and a (500s), re-homing costs 1000s
+        assert scheduler.next_group('gw1', providers=providers).provider == stolen
+
+
+def test_steal_only_when_it_pays_off():
+    scheduler = make_scheduler(slave_ids=('gw0',))
+    assert scheduler.next_group('gw0').provider == 'b'
+    # a would wait 300s and c 500s, re-homing an appliance set up for x costs 1000s
+    assert scheduler.next_group('gw1', providers=['x']) is None
+    assert scheduler.stats['stolen'] == 0
+    assert scheduler.remaining == 2
+
+    scheduler = make_scheduler(slave_ids=('gw0',), cleanup_cost=400.)
+    assert scheduler.next_group('gw0').provider == 'b'
+    # only c waits longer than the re-homing takes
+    assert scheduler.next_group('gw1', providers=['x']).provider == 'c'
+    assert scheduler.next_group('gw2', providers=['x']) is None
+    # a needs no re-homing of an appliance which has it already
+    assert scheduler.next_group('gw2', providers=['a']).provider == 'a'
+
+
+def test_retired_queue_goes_to_the_others():
+    scheduler = make_scheduler()
+    assert scheduler.next_group('gw1').provider == 'a'
+    scheduler.retire('gw1')
+    assert [group.provider for group in scheduler.orphans] == ['c']
+    assert scheduler.next_group('gw0', providers=['b']).provider == 'b'
+    assert scheduler.next_group('gw0', providers=['b']).provider == 'c'
+    assert scheduler.stats['adopted'] == 1
+    assert scheduler.next_group('gw0') is None
+    assert scheduler.remaining == 0
+
+
+def test_orphans_with_set_up_provider_first():
+    scheduler = make_scheduler(slave_ids=('gw0', 'gw1', 'gw2'))
+    for slave_id in ('gw0', 'gw1', 'gw2'):
+        scheduler.retire(slave_id)
+    # nothing was handed out, all the groups are in the pool
+    assert scheduler.remaining == 3
+    assert scheduler.next_group('gw3', providers=['c']).provider == 'c'
@@ -0,0 +1,98 @@
+import gzip
+import re
+
+import pytest
+
+from cfme.utils.perf_message_stats import MessageAnalyzer, analyze_evm_log, ts_to_us, us_to_ts
+
+PREFIX = '[----] I, [2017-11-01T{} #{}:2ac8a0a1f3f4]  INFO -- : '
+LOG = [
+    ('22:59:58.000001', 1000, 'MIQ(MiqPriorityWorker) ID [7], PID [2007], GUID [x]'),
+    ('22:59:59.000000', 1000, 'MIQ(MiqQueue.put) Message id: [1],  id: [], Zone: [default], '
+                              'Command: [Metric::Rollup.rollup], Priority: [100], '
+                              'Args: [["2017-11-01T22:00:00Z", "hourly"]]'),
+    ('23:00:00.500000', 1000, 'MIQ(MiqQueue.put) Message id: [2],  id: [], Zone: [default], '
+                              'Command: [EmsRefresh.refresh], Priority: [100], Args: []'),
+    ('23:00:01.000000', 1200, 'MIQ(MiqQueue.get_via_drb) Message id: [1], MiqWorker id: [7], '
+                              'Command: [x], Args: [], Dequeued in: [2.5] seconds'),
+    ('23:00:01.250000', 1200, 'MIQ(Refresher#refresh) Refreshing all targets...'),
+    ('23:00:04.000000', 1200, 'MIQ(MiqQueue.delivered) Message id: [1], State: [ok], '
+                              'Delivered in [3.0] seconds'),
+    ('23:10:00.000000', 1000, 'MIQ(MiqServer#validate_worker) Worker [MiqPriorityWorker] with '
+                              'ID: [7], PID: [2007] uptime has reached the interval, '
+                              'requesting worker to exit "evm_worker_uptime_exceeded"'),
+]
+FILTERS = {'-hourly': re.compile(r'\"[0-9\-]*T[0-9\:]*Z\",\s\"hourly\"')}
+
+
+@pytest.fixture(params=['evm.log', 'evm.log.gz'])
+def evm_log(request, tmpdir):
+    path = tmpdir.join(request.param)
+    data = ''.join(PREFIX.format(ts, pid) + text + '\n' for ts, pid, text in LOG).encode('utf-8')
+    opener = gzip.open if request.param.endswith('.gz') else open
+    with opener(str(path), 'wb') as log:
+        log.write(data)
+    return path
+
+
+def test_timestamp_roundtrip():
+    assert us_to_ts(ts_to_us('2017-11-01', '23:00:01.000250')) == '2017-11-01 23:00:01.000250'
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_analyzer(evm_log, processes):
+    analyzer = analyze_evm_log(evm_log, FILTERS, processes=processes, chunk_size=300)
+    assert analyzer.line_count == len(LOG)
+    assert analyzer.commands == ['Metric::Rollup.rollup-hourly', 'EmsRefresh.refresh']
+    assert analyzer.test_start == '2017-11-01 22:59:59.000000'
+    assert analyzer.test_end == '2017-11-01 23:00:04.000000'
+
+    stats = analyzer.command_stats['Metric::Rollup.rollup-hourly']
+    assert (stats.puts, stats.gets) == (1, 1)
+    assert list(stats.total_time.values) == [5.5]
+    assert analyzer.msg_cmds()['Metric::Rollup.rollup-hourly']['total'] == [5.5]
+
+    hr_bkt = analyzer.hourly_buckets()
+    # put at 22:xx, taken off the queue and delivered at 23:xx
+    assert hr_bkt['Metric::Rollup.rollup-hourly']['2017-11-01']['22'].avg_deq == 2.5
+    assert hr_bkt['Metric::Rollup.rollup-hourly']['2017-11-01']['23'].avg_del == 3.0
+    # never taken off the queue
+    assert hr_bkt['EmsRefresh.refresh'][''][''].total_get == 1
+
+    worker = analyzer.workers[7]
+    assert (worker.worker_type, worker.pid) == ('MiqPriorityWorker', '2007')
+    assert worker.terminated == 'evm_worker_uptime_exceeded'
+    assert analyzer.worker_counts['evm_worker_uptime_exceeded'] == 1
+
+    messages = sorted(analyzer.iter_messages(), key=lambda msg: msg.msg_id)
+    assert [(msg.msg_id, msg.msg_cmd, msg.msg_args, msg.pid_put, msg.pid_get, msg.puttime,
+             msg.gettime) for msg in messages] == [
+        ("'1'", 'Metric::Rollup.rollup-hourly', '["2017-11-01T22:00:00Z", "hourly"]', '1000',
+         '1200', '2017-11-01 22:59:59.000000', '2017-11-01 23:00:01.000000'),
+        ("'2'", 'EmsRefresh.refresh', '', '1000', '', '2017-11-01 23:00:00.500000', '')]
+
+
+def test_analyzer_large_ids():
+    # over the 32 bit C long of some platforms
+    analyzer = MessageAnalyzer()
+    us = ts_to_us('2038-01-20', '03:14:08.000001')
+    analyzer._put(us, 2 ** 22, 2 ** 40, 'EmsRefresh.refresh', '')
+    msg, = analyzer.iter_messages()
+    assert msg.msg_id == "'{}'".format(2 ** 40)
+    assert msg.puttime == '2038-01-20 03:14:08.000001'
+    assert msg.pid_put == str(2 ** 22)
+
+
+def test_bucket_averages_use_final_totals():
+    analyzer = MessageAnalyzer()
+    cmd = 'EmsRefresh.refresh'
+    analyzer._put(ts_to_us('2017-11-01', '22:10:00.000000'), 1000, 1, cmd, '')
+    analyzer._get(ts_to_us('2017-11-01', '22:11:00.000000'), 1200, 1, 2.0)
+    analyzer._delivered(ts_to_us('2017-11-01', '22:12:00.000000'), 1200, 1, 4.0)
+    # put and taken off the queue in the same hour after the samples above, never delivered
+    analyzer._put(ts_to_us('2017-11-01', '22:20:00.000000'), 1000, 2, cmd, '')
+    analyzer._get(ts_to_us('2017-11-01', '22:21:00.000000'), 1200, 2, 0.0)
+    analyzer.finish()
+    bk = analyzer.hourly_buckets()[cmd]['2017-11-01']['22']
+    assert (bk.total_put, bk.total_get) == (2, 2)
+    assert (bk.avg_deq, bk.avg_del) == (1.0, 2.0)
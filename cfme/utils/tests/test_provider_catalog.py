@@ -0,0 +1,131 @@
+import itertools
+import random
+
+import pytest
+
+from cfme.utils import providers
+from cfme.utils.providers import ProviderCatalog, ProviderFilter
+
+
+class Base(object):
+    pass
+
+
+class CloudBase(Base):
+    pass
+
+
+class InfraBase(Base):
+    pass
+
+
+class Ec2(CloudBase):
+    pass
+
+
+class Rhevm(InfraBase):
+    pass
+
+
+TYPES = {'ec2': Ec2, 'rhevm': Rhevm}
+
+
+class Ver(tuple):
+    def __new__(cls, version):
+        return super(Ver, cls).__new__(cls, map(int, str(version).split('.')))
+
+
+class FakeAppliance(object):
+    def __init__(self, version):
+        self._version = version
+
+    @property
+    def version(self):
+        if self._version is None:
+            raise Exception('no SSH')
+        return self._version
+
+
+class FakeProvider(object):
+    def __init__(self, key, data, version):
+        self.key, self.data, self.name = key, data, data['name']
+        self.appliance = FakeAppliance(version)
+
+    def one_of(self, *classes):
+        return issubclass(TYPES[self.data['type']], classes)
+
+
+def generate_data(count):
+    rnd = random.Random(7)
+    data = {}
+    for i in range(count):
+        prov = {'name': 'Provider {}'.format(i), 'type': rnd.choice(sorted(TYPES)),
+                'tags': rnd.sample(['default', 'disabled', 'complete', 'ha'], rnd.randint(0, 2))}
+        if rnd.random() < 0.5:
+            prov['provisioning'] = {'template': rnd.choice(['small', 'big'])}
+        if rnd.random() < 0.3:
+            prov['do_not_prefer'] = True
+        if rnd.random() < 0.3:
+            prov['excluded_test_flags'] = 'provision, retire'
+        if rnd.random() < 0.2:
+            prov['restricted_version'] = rnd.choice(['>= 5.9', '< 5.9'])
+        data['prov{}'.format(i)] = prov
+    return data
+
+
+FILTERS = [
+    ProviderFilter(required_tags=['disabled'], inverted=True),
+    ProviderFilter(keys=['prov1', 'complete'], required_tags=['prov1', 'complete'],
+                   conjunctive=False),
+    ProviderFilter(classes=[CloudBase]),
+    ProviderFilter(classes=[Rhevm], required_fields=[['provisioning', 'template']]),
+    ProviderFilter(required_fields=[('provisioning', {'template': 'small'}), 'do_not_prefer']),
+    ProviderFilter(required_fields=[("do_not_prefer", True)], inverted=True),
+    ProviderFilter(required_flags=['provision']),
+    ProviderFilter(required_flags=[]),
+    ProviderFilter(restrict_version=True),
+]
+
+
+@pytest.mark.parametrize('version', [Ver('5.9'), Ver('5.8'), None], ids=['59', '58', 'no_ssh'])
+def test_catalog_matches_filters(version):
+    data = generate_data(60)
+    catalog = ProviderCatalog(data, get_class=TYPES.get)
+    for filters in itertools.chain(
+            itertools.combinations(FILTERS, 1), itertools.combinations(FILTERS, 2)):
+        providers = [FakeProvider(key, data[key], version) for key in data]
+        expected = [prov.key for prov in providers if all(f(prov) for f in filters)]
+        assert catalog.filter_keys([f.spec() for f in filters], version) == expected, filters
+        # and once more from the memo
+        assert catalog.filter_keys([f.spec() for f in filters], version) == expected
+
+
+def test_specs_compared_by_value():
+    paths = ProviderFilter(required_fields=[['provisioning', 'template']])
+    value = ProviderFilter(required_fields=[('provisioning', 'template')])
+    assert paths.spec() == ProviderFilter(required_fields=[['provisioning', 'template']]).spec()
+    assert paths.spec() != value.spec()
+
+
+def test_version_fetched_only_for_restricted_providers(monkeypatch):
+    fetched = []
+
+    def current_version():
+        fetched.append(True)
+        return Ver('5.8')
+
+    data = {key: prov for key, prov in generate_data(30).items()
+            if 'restricted_version' not in prov}
+    monkeypatch.setattr(providers, 'providers_data', data)
+    monkeypatch.setattr(providers, '_catalog', None)
+    monkeypatch.setattr(providers, '_current_version', current_version)
+    monkeypatch.setattr(providers, 'get_class_from_type', TYPES.get)
+    monkeypatch.setattr(providers, 'get_crud', lambda key: key)
+    enabled = [key for key in data if 'disabled' not in data[key]['tags']]
+    assert providers.list_providers() == enabled
+    assert not fetched
+
+    data['prov0']['restricted_version'] = '>= 5.9'
+    monkeypatch.setattr(providers, 'providers_data', dict(data))
+    assert providers.list_providers() == [key for key in enabled if key != 'prov0']
+    assert fetched == [True]
@@ -0,0 +1,102 @@
+import re
+
+import pytest
+
+from cfme.utils import rest
+from cfme.utils.rest import delete_resources_by_id, wait_for_resources
+from cfme.utils.wait import TimedOutError
+
+
+class FakeEntity(object):
+    def __init__(self, data):
+        self._data = data
+
+
+class FakeSearchResult(object):
+    def __init__(self, resources):
+        self.resources = resources
+
+
+class FakeApi(object):
+    def __init__(self, collection):
+        self.collection = collection
+        self.posts = []
+
+    def post(self, url, **payload):
+        self.posts.append((url, payload))
+        for resource in payload['resources']:
+            self.collection.resources.pop(resource['id'])
+
+
+class FakeCollection(object):
+    """Serves the filtered queries, the resources show up one query after another"""
+    name = 'categories'
+    _href = 'https://appliance/api/categories'
+
+    def __init__(self, resources):
+        self.resources = {resource['id']: resource for resource in resources}
+        self.hidden = []
+        self.queries = []
+        self._api = FakeApi(self)
+
+    def query_string(self, **params):
+        self.queries.append(params)
+        if self.hidden:
+            resource = self.hidden.pop(0)
+            self.resources[resource['id']] = resource
+        attr, values = None, []
+        for expr in params['filter[]']:
+            attr, value = re.match(r'^(?:or )?(\w+) = "(.*)"$', expr).groups()
+            values.append(re.compile('^{}$'.format(value.replace('%', '.*'))))
+        return FakeSearchResult([
+            FakeEntity(resource) for resource in self.resources.values()
+            if any(value.match(resource[attr]) for value in values)])
+
+
+def test_wait_for_resources_batched():
+    collection = FakeCollection([{'id': '1', 'name': 'existing'}])
+    collection.hidden = [{'id': '2', 'name': '/managed/tag_a'}, {'id': '3', 'name': 'tag_b'}]
+    wait_for_resources(collection, 'name', ['tag_a', 'tag_b'], substr_search=True, delay=0.01)
+    # one query per try, for the values still missing
+    assert [query['filter[]'] for query in collection.queries] == [
+        ['name = "%tag_a%"', 'or name = "%tag_b%"'], ['name = "%tag_b%"']]
+    assert collection.queries[0]['attributes'] == 'name'
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Time passing only when the waits sleep, returns the delays slept"""
+    now = [0]
+    delays = []
+
+    def sleep(delay):
+        delays.append(delay)
+        now[0] += delay
+
+    monkeypatch.setattr(rest, 'time', lambda: now[0])
+    monkeypatch.setattr(rest, 'sleep', sleep)
+    return delays
+
+
+def test_wait_for_resources_delay_capped(clock):
+    collection = FakeCollection([])
+    collection.hidden = [{'id': str(i), 'name': 'tag_{}'.format(i)} for i in range(8)]
+    wait_for_resources(collection, 'name', ['tag_7'])
+    assert clock == [0.5, 1, 2, 4, 8, 10, 10]
+
+
+def test_wait_for_resources_timeout(clock):
+    collection = FakeCollection([])
+    with pytest.raises(TimedOutError):
+        wait_for_resources(collection, 'name', ['tag_a'], num_sec=30)
+    # the last wait ends at the deadline
+    assert clock == [0.5, 1, 2, 4, 8, 10, 4.5]
+
+
+def test_delete_resources_by_id_in_bulk():
+    collection = FakeCollection([{'id': '1'}, {'id': '2'}, {'id': '3'}])
+    # 4 is gone already, e.g. deleted by the test
+    delete_resources_by_id(collection, ['2', '3', '4'])
+    assert collection._api.posts == [
+        (collection._href, {'action': 'delete', 'resources': [{'id': '2'}, {'id': '3'}]})]
+    assert list(collection.resources) == ['1']
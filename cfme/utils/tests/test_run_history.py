@@ -0,0 +1,58 @@
+import pytest
+
+from cfme.utils.run_history import RunHistory, overall_outcome
+
+
+@pytest.fixture
+def history(tmpdir):
+    history = RunHistory(tmpdir.join('history.sqlite'))
+    yield history
+    history.close()
+
+
+class FakeReport(object):
+    def __init__(self, when, outcome, wasxfail=None):
+        self.when = when
+        self.outcome = outcome
+        if wasxfail is not None:
+            self.wasxfail = wasxfail
+
+
+def test_durations_median_of_last_runs(history):
+    for duration in (10, 20, 30, 400):
+        run = history.start_run()
+        history.record(run, 'test_a', duration, 'passed')
+    history.record(run, 'test_b', 5, 'failed')
+    assert history.durations() == {'test_a': 25, 'test_b': 5}
+    assert history.durations(last=1) == {'test_a': 400, 'test_b': 5}
+    assert history.durations(before_run=run) == {'test_a': 20}
+
+
+def test_results_and_latest(history):
+    first = history.start_run(run_id=1234)
+    history.record(first, 'mod.py::test_a', 1, 'failed', ident='mod.py/test_a',
+                   appliance='10.0.0.1', provider='vsphere65')
+    second = history.start_run()
+    history.record(second, 'mod.py::test_a', 2, 'passed', ident='mod.py/test_a')
+    assert history.last_run() == second
+    results = history.results(nodeid='mod.py::test_a')
+    assert [result.outcome for result in results] == ['passed', 'failed']
+    assert results[1].provider == 'vsphere65'
+    previous = history.latest_results(key='ident', before_run=second)
+    assert previous['mod.py/test_a'].appliance == '10.0.0.1'
+
+
+@pytest.mark.parametrize('reports, outcome', [
+    ([('setup', 'passed'), ('call', 'passed'), ('teardown', 'passed')], 'passed'),
+    ([('setup', 'passed'), ('call', 'failed'), ('teardown', 'passed')], 'failed'),
+    ([('setup', 'failed'), ('teardown', 'passed')], 'error'),
+    ([('setup', 'skipped'), ('teardown', 'passed')], 'skipped'),
+    ([('setup', 'passed'), ('call', 'passed'), ('teardown', 'failed')], 'error'),
+])
+def test_overall_outcome(reports, outcome):
+    assert overall_outcome([FakeReport(*report) for report in reports]) == outcome
+
+
+def test_overall_outcome_xfail():
+    reports = [FakeReport('setup', 'passed'), FakeReport('call', 'skipped', wasxfail='bz')]
+    assert overall_outcome(reports) == 'xfailed'
@@ -0,0 +1,141 @@
+import io
+import os
+import socket
+import subprocess
+import sys
+from datetime import datetime
+
+import pytest
+
+from cfme.utils import smem_memory_monitor
+from cfme.utils.smem_memory_monitor import (
+    COLLECTOR_SCRIPT, MemorySamples, compile_per_process_results, generate_raw_data_csv)
+
+MEMINFO = '6158152,4670112,62944,1102572,59336,1024,512'
+LINES = [
+    'M,1509577200.5,{},1'.format(MEMINFO),
+    'N,100,postmaster,/usr/bin/postgres -D /var/lib/pgsql/data',
+    'N,200,ruby,MIQ Server',
+    'N,300,ruby,MIQ: MiqGenericWorker id: 7, queue: generic',
+    'S,100,10240,5120,2048,20480,0',
+    'S,200,204800,102400,51200,409600,0',
+    'S,300,307200,153600,76800,614400,1024',
+    'M,1509577210.5,{},1'.format(MEMINFO),
+    'S,100,11264,5120,2048,20480,0',
+    'S,300,307200,153600,76800,614400,1024',
+]
+
+
+def test_samples_in_report_shape(tmpdir):
+    samples = MemorySamples()
+    for line in LINES:
+        samples.feed(line + '\n')
+    assert samples.use_slab
+    assert list(samples.unidentified) == ['300']
+    # samples taken before the worker is identified are dropped, like before
+    samples.update_workers({'300': 'MiqGenericWorker'})
+    samples.feed('S,300,409600,153600,76800,614400,1024\n')
+    assert not samples.unidentified
+
+    start, end = [datetime.fromtimestamp(ts) for ts in (1509577200.5, 1509577210.5)]
+    appliance_results = samples.appliance_results
+    assert appliance_results.keys() == [start, end]
+    assert appliance_results[end]['swap_free'] == 0.5
+    assert round(appliance_results[end]['used'], 2) == round(
+        (6158152 - 4670112 - 59336 - 1102572) / 1024., 2)
+
+    process_results = samples.process_results
+    assert list(process_results) == ['postgres', 'MIQ Server (evm_server.rb)', 'MiqGenericWorker']
+    postgres = process_results['postgres']['100']
+    assert postgres.keys() == [start, end]
+    assert postgres[end]['rss'] == 11.0
+    assert end not in process_results['MIQ Server (evm_server.rb)']['200']
+    assert process_results['MiqGenericWorker']['300'].keys() == [end]
+    with pytest.raises(KeyError):
+        process_results['MiqGenericWorker']['300'][start]
+
+    alive, recycled, rss = compile_per_process_results(
+        ['postgres', 'MIQ Server (evm_server.rb)'], process_results, end)[:3]
+    assert (alive, recycled, rss) == (1, 1, 11.0)
+    generate_raw_data_csv(tmpdir, appliance_results, process_results)
+    assert tmpdir.join('100-postgres.csv').readlines()[-1].startswith('{},11.0,5.0,'.format(end))
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/smaps'), reason='needs procfs')
+def test_collector_script():
+    name = open('/proc/self/comm').read().strip()
+    collector = subprocess.Popen([sys.executable, '-', '1', name], stdin=subprocess.PIPE,
+                                 stdout=subprocess.PIPE, universal_newlines=True)
+    try:
+        collector.stdin.write(COLLECTOR_SCRIPT)
+        collector.stdin.close()
+        samples = MemorySamples()
+        samples.update_workers({str(os.getpid()): 'pytest'})
+        for line in iter(collector.stdout.readline, ''):
+            if samples.feed(line) == 'M' and len(samples.appliance_results) == 3:
+                break
+    finally:
+        collector.kill()
+        collector.wait()
+    ts = samples.appliance_results.keys()[1]
+    assert samples.appliance_results[ts]['total'] > 0
+    sample = samples.process_results['pytest'][str(os.getpid())][ts]
+    assert 0 < sample['uss'] <= sample['pss'] <= sample['rss'] <= sample['vss']
+
+
+class FakeChannel(object):
+    def __init__(self, lines):
+        self.lines = lines
+        self.closed = False
+
+    def settimeout(self, timeout):
+        pass
+
+    def sendall(self, data):
+        pass
+
+    def shutdown_write(self):
+        pass
+
+    def makefile(self, mode):
+        for line in self.lines:
+            if isinstance(line, Exception):
+                raise line
+            yield line
+
+    def recv_exit_status(self):
+        return 0
+
+    def makefile_stderr(self, mode):
+        return io.StringIO(u'')
+
+    def close(self):
+        self.closed = True
+
+
+def test_monitor_survives_a_silent_collector(monkeypatch):
+    reports = []
+    monkeypatch.setattr(smem_memory_monitor, 'create_report',
+                        lambda scenario, appliance_results, *args: reports.append(
+                            list(appliance_results)))
+    monitor = smem_memory_monitor.SmemMemoryMonitor(
+        ssh_client=None, scenario_data={'scenario': {}}, sample_interval=1)
+    monkeypatch.setattr(monitor, 'get_miq_server_id', lambda: None)
+    monkeypatch.setattr(monitor, 'get_evm_workers', lambda: {})
+    monkeypatch.setattr(smem_memory_monitor.time, 'sleep', lambda seconds: None)
+    commands = []
+
+    class Client(object):
+        def exec_channel(self, command):
+            commands.append(command)
+            if len(commands) == 1:
+                return FakeChannel([LINES[0] + '\n', socket.timeout('timed out')])
+            if len(commands) == 3:
+                monitor.signal = False
+            return FakeChannel([LINES[7] + '\n'])
+
+    monitor.ssh_client = Client()
+    monitor._real_run()
+    # the collector was started again and the report has the samples of both
+    assert len(commands) == 3
+    assert len(reports) == 1 and len(reports[0]) == 2
@@ -0,0 +1,125 @@
+import json
+import threading
+
+import pytest
+from six.moves import BaseHTTPServer, socketserver
+
+from cfme.test_framework.sprout.client import SproutClient
+from cfme.test_framework.sprout.plugin import (
+    SproutApplianceFeed, SproutManager, SproutProvisioningRequest)
+
+
+class FakeSprout(object):
+    """The pool part of the Sprout API, an appliance gets ready with every check of the pool"""
+    def __init__(self):
+        self.appliances = []
+        self.calls = []
+        self.last_id = 0
+
+    def add(self, ready=False):
+        self.last_id += 1
+        appliance_id = self.last_id
+        self.appliances.append({
+            'id': appliance_id, 'name': 'appliance_{}'.format(appliance_id), 'ready': ready,
+            'url': 'https://10.0.0.{}'.format(appliance_id),
+            'ip_address': '10.0.0.{}'.format(appliance_id), 'provider': 'provider',
+            'template_name': 'template'})
+
+    def request_appliances(self, group, count=1, **kwargs):
+        self.add(ready=True)
+        for _ in range(count - 1):
+            self.add()
+        return 1
+
+    def request_ready_appliances(self, request_id, known=None):
+        pending = [appliance for appliance in self.appliances if not appliance['ready']]
+        if self.calls.count('request_ready_appliances') > 1 and pending:
+            pending.pop(0)['ready'] = True
+        return {
+            'fulfilled': not pending, 'finished': True, 'progress': 100,
+            'total_count': len(self.appliances),
+            'pending': [appliance['id'] for appliance in pending],
+            'appliances': [appliance for appliance in self.appliances
+                           if appliance['ready'] and appliance['id'] not in (known or [])]}
+
+    def request_check(self, request_id):
+        return {'fulfilled': False, 'finished': True, 'progress': 100,
+                'appliances': [appliance for appliance in self.appliances if appliance['ready']]}
+
+    def replace_appliance(self, address, minutes=60):
+        self.appliances = [appliance for appliance in self.appliances
+                           if appliance['ip_address'] != address]
+        self.add()
+
+    def destroy_pool(self, id):
+        pass
+
+
+class FakeSproutHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        data = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        sprout = self.server.sprout
+        sprout.calls.append(data['method'])
+        result = getattr(sprout, data['method'])(*data['args'], **data['kwargs'])
+        body = json.dumps({'status': 'success', 'result': result}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeSproutServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def sprout():
+    server = FakeSproutServer(('127.0.0.1', 0), FakeSproutHandler)
+    server.sprout = FakeSprout()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    # the manager destroys the pool at exit, refuse it instead of hanging
+    server.server_close()
+
+
+def provision_request(count):
+    return SproutProvisioningRequest(
+        group='downstream-59z', count=count, version=None, provider=None, provider_type=None,
+        template_type=None, preconfigured=True, date=None, lease_time=60, desc=None,
+        provision_timeout=1, cpu=None, ram=None)
+
+
+def test_progressive_pool(sprout):
+    manager = SproutManager(client=SproutClient(host='127.0.0.1', port=sprout.server_port))
+    appliances = manager.request_appliances(provision_request(3), progressive=True)
+    # testing starts with the first ready appliance
+    assert [appliance['name'] for appliance in appliances] == ['appliance_1']
+
+    feed = SproutApplianceFeed(manager, expected=3)
+    assert not feed.exhausted
+    assert [appliance['name'] for appliance in manager.ready_appliances()] == ['appliance_2']
+    assert [appliance['name'] for appliance in manager.ready_appliances()] == ['appliance_3']
+    assert feed.exhausted
+    assert manager.ready_appliances() == []
+
+
+def test_failed_appliance_replaced(sprout):
+    manager = SproutManager(client=SproutClient(host='127.0.0.1', port=sprout.server_port))
+    manager.request_appliances(provision_request(1), progressive=True)
+    feed = SproutApplianceFeed(manager, expected=1)
+    assert feed.exhausted
+
+    class Appliance(object):
+        hostname = '10.0.0.1'
+
+    feed.replace(Appliance())
+    assert not feed.exhausted
+    assert 'replace_appliance' in sprout.sprout.calls
+    assert [appliance['name'] for appliance in manager.ready_appliances()] == ['appliance_2']
+    assert feed.exhausted
@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import os
+
 import pytest
 from cfme.utils.appliance import DummyAppliance
 pytestmark = [
@@ -20,6 +22,28 @@ def test_ssh_client_run_command(appliance):
     assert 'Testing!' in result.output
 
 
+def test_ssh_client_run_commands_parallel(appliance):
+    # Results come back as the commands finish, all over the shared transport
+    commands = ['sleep 2; echo slow', 'echo fast', 'exit 3']
+    results = list(appliance.ssh_client.run_commands_parallel(commands))
+    assert [command for command, _ in results][0] != 'sleep 2; echo slow'
+    results = dict(results)
+    assert set(results) == set(commands)
+    assert 'slow' in results['sleep 2; echo slow'].output
+    assert results['echo fast'].success
+    assert results['exit 3'].rc == 3
+
+
+def test_ssh_clients_share_transport(appliance):
+    client = appliance.ssh_client(stream_output=False)
+    other = appliance.ssh_client(stream_output=False)
+    assert client.get_transport() is other.get_transport()
+    client.close()
+    # closing one client must not break the other
+    assert other.run_command('echo still here').success
+    other.close()
+
+
 def test_scp_client_can_put_a_file(appliance, tmpdir):
     # Make sure we can put a file, get a file, and they all match
     tmpfile = tmpdir.mkdir("sub").join("temp.txt")
@@ -32,3 +56,22 @@ def test_scp_client_can_put_a_file(appliance, tmpdir):
     assert "content" in tmpfile.read()
     # Clean up the server
     appliance.ssh_client.run_command("rm -f /tmp/{}".format(tmpfile.basename))
+
+
+@pytest.mark.parametrize('compress', [False, True], ids=['ranges', 'compressed'])
+def test_file_transfer_chunked(appliance, tmpdir, compress):
+    # Several ranges over parallel channels (or a compressed stream), checked by their digests
+    tmpfile = tmpdir.join('chunked.bin')
+    tmpfile.write_binary(os.urandom(3 * 1024 * 1024 + 17))
+    progress = []
+    remote = appliance.ssh_client.put_file(
+        tmpfile.strpath, '/tmp', range_size=1024 * 1024, compress=compress,
+        progress=progress.append)
+    assert remote == '/tmp/chunked.bin'
+    assert progress[-1].done == tmpfile.size()
+    local = appliance.ssh_client.get_file(
+        remote, tmpdir.join('back.bin').strpath, range_size=1024 * 1024, compress=compress)
+    assert tmpdir.join('back.bin').read_binary() == tmpfile.read_binary()
+    assert not tmpdir.join('back.bin.part').check()
+    assert local == tmpdir.join('back.bin').strpath
+    appliance.ssh_client.run_command('rm -f {}'.format(remote))
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import io
+import os
+import socket
+import subprocess
+
+import attr
+import pytest
+
+from cfme.utils import ssh_transfer
+from cfme.utils.disk_cache import DiskCache
+from cfme.utils.ssh_transfer import FileTransfer, TransferError
+
+RANGE_SIZE = 64 * 1024
+SIZE = 5 * RANGE_SIZE + 123
+
+
+@attr.s
+class Result(object):
+    rc = attr.ib()
+    output = attr.ib()
+
+    @property
+    def failed(self):
+        return self.rc != 0
+
+
+class LocalSftpFile(io.FileIO):
+    """An SFTP file of :py:class:`LocalClient`, failing at the offsets of the client"""
+    def __init__(self, client, path, mode):
+        super(LocalSftpFile, self).__init__(path, mode.replace('b', ''))
+        self.client = client
+
+    def set_pipelined(self, pipelined=True):
+        pass
+
+    def seek(self, offset, whence=0):
+        self.client.check_offset(offset)
+        return super(LocalSftpFile, self).seek(offset, whence)
+
+    def readv(self, chunks):
+        self.client.check_offset(chunks[0][0])
+        for offset, length in chunks:
+            super(LocalSftpFile, self).seek(offset)
+            yield self.read(length)
+
+
+@attr.s
+class LocalSftp(object):
+    client = attr.ib()
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def open(self, path, mode='r'):
+        return LocalSftpFile(self.client, path, mode)
+
+    def truncate(self, path, size):
+        with open(path, 'r+b') as f:
+            f.truncate(size)
+
+    def close(self):
+        pass
+
+
+class LocalChannel(object):
+    """An exec channel of :py:class:`LocalClient`, breaking off after the bytes of the client"""
+    def __init__(self, client, command):
+        self.client = client
+        self.process = subprocess.Popen(
+            command, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+
+    def sendall(self, data):
+        self.client.check_bytes(len(data))
+        self.process.stdin.write(data)
+
+    def shutdown_write(self):
+        self.process.stdin.close()
+
+    def recv(self, size):
+        data = os.read(self.process.stdout.fileno(), size)
+        self.client.check_bytes(len(data))
+        return data
+
+    def recv_stderr(self, size):
+        return self.process.stderr.read(size)
+
+    def recv_exit_status(self):
+        return self.process.wait()
+
+    def close(self):
+        # like sshd, the command gets the end of its input and runs to its end
+        if not self.process.stdin.closed:
+            self.process.stdin.close()
+        self.process.stdout.close()
+        self.process.wait()
+        self.process.stderr.close()
+
+
+@attr.s
+class LocalClient(object):
+    """A :py:class:`cfme.utils.ssh.SSHClient` running the commands and SFTP here
+
+    The SFTP files fail to seek or read at the ``failing_offsets``, the channels break off once
+    ``break_after`` bytes went through them, ``breaks`` times.
+    """
+    username = 'root'
+    is_container = False
+    is_pod = False
+    _container = None
+    _connect_kwargs = {'hostname': 'localhost'}
+
+    failing_offsets = attr.ib(default=attr.Factory(set))
+    break_after = attr.ib(default=None)
+    breaks = attr.ib(default=0)
+    commands = attr.ib(default=attr.Factory(list))
+    _streamed = attr.ib(default=0)
+
+    def check_offset(self, offset):
+        if offset in self.failing_offsets:
+            raise EOFError('Channel closed at {}'.format(offset))
+
+    def check_bytes(self, length):
+        self._streamed += length
+        if self.breaks and self.break_after is not None and self._streamed > self.break_after:
+            self.breaks -= 1
+            self._streamed = 0
+            raise socket.error('Connection reset by peer')
+
+    def run_command(self, command):
+        process = subprocess.Popen(
+            command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+        return Result(process.returncode, output.decode('utf-8'))
+
+    def open_sftp(self):
+        return LocalSftp(self)
+
+    def exec_channel(self, command):
+        self.commands.append(command)
+        return LocalChannel(self, command)
+
+
+@pytest.fixture
+def data(tmpdir):
+    source = tmpdir.join('source.bin')
+    # compressible, but not too much
+    source.write_binary(b''.join(
+        hashlib.sha256(str(i).encode('ascii')).hexdigest()[:8].encode('ascii')
+        for i in range(SIZE // 8 + 1))[:SIZE])
+    return source
+
+
+@pytest.fixture
+def client():
+    return LocalClient()
+
+
+@pytest.fixture
+def journals(tmpdir):
+    return DiskCache(tmpdir.join('journals').strpath)
+
+
+@pytest.fixture
+def transfer(client, journals, monkeypatch):
+    monkeypatch.setattr(ssh_transfer, 'PROGRESS_INTERVAL', 0)
+    # the streams break off between the blocks
+    monkeypatch.setattr(ssh_transfer, 'BLOCK_SIZE', 4096)
+
+    def transfer(**kwargs):
+        progress = []
+        return FileTransfer(client, range_size=RANGE_SIZE, journals=journals,
+                            progress=progress.append, **kwargs), progress
+    return transfer
+
+
+def journal_key(transfer, direction, source, destination):
+    stat = os.stat(source)
+    return transfer._journal_key(
+        direction, source, destination, stat.st_size, int(stat.st_mtime))
+
+
+@pytest.mark.parametrize('compress', [False, True], ids=['ranges', 'stream'])
+def test_put_and_get(tmpdir, data, transfer, compress):
+    file_transfer, progress = transfer(compress=compress)
+    tmpdir.mkdir('remote')
+    remote = file_transfer.put(data.strpath, tmpdir.join('remote').strpath)
+    assert remote == tmpdir.join('remote', 'source.bin').strpath
+    local = file_transfer.get(remote, tmpdir.join('back.bin').strpath)
+    assert tmpdir.join('back.bin').read_binary() == data.read_binary()
+    assert local == tmpdir.join('back.bin').strpath
+    assert not tmpdir.join('back.bin.part').check()
+    assert progress[-1].done == progress[-1].size == SIZE
+    assert progress[-1].resumed == 0
+
+
+def test_get_ranges_resumed(tmpdir, data, client, transfer):
+    local = tmpdir.join('local.bin')
+    part = tmpdir.join('local.bin.part')
+    file_transfer, progress = transfer()
+    client.failing_offsets.add(2 * RANGE_SIZE)
+    with pytest.raises(TransferError):
+        file_transfer.get(data.strpath, local.strpath)
+    key = journal_key(file_transfer, 'get', data.strpath, local.strpath)
+    finished = {0, RANGE_SIZE, 3 * RANGE_SIZE, 4 * RANGE_SIZE, 5 * RANGE_SIZE}
+    assert file_transfer.journals.get(key) == finished
+    assert not local.check()
+    assert part.size() == SIZE
+    assert part.read_binary()[:2 * RANGE_SIZE] == data.read_binary()[:2 * RANGE_SIZE]
+
+    # a later transfer only gets the range missing
+    client.failing_offsets.clear()
+    file_transfer, progress = transfer()
+    file_transfer.get(data.strpath, local.strpath)
+    assert local.read_binary() == data.read_binary()
+    assert not part.check()
+    assert progress[-1].resumed == SIZE - RANGE_SIZE
+    assert file_transfer.journals.get(key) is None
+
+
+def test_put_ranges_resumed(tmpdir, data, client, transfer):
+    remote = tmpdir.join('remote.bin')
+    file_transfer, progress = transfer()
+    client.failing_offsets.add(0)
+    with pytest.raises(TransferError):
+        file_transfer.put(data.strpath, remote.strpath)
+    key = journal_key(file_transfer, 'put', data.strpath, remote.strpath)
+    assert file_transfer.journals.get(key) == {
+        RANGE_SIZE * i for i in range(1, SIZE // RANGE_SIZE + 1)}
+    assert tmpdir.join('remote.bin.part').size() == SIZE
+
+    client.failing_offsets.clear()
+    file_transfer, progress = transfer()
+    file_transfer.put(data.strpath, remote.strpath)
+    assert remote.read_binary() == data.read_binary()
+    assert progress[-1].resumed == SIZE - RANGE_SIZE
+
+
+def test_part_without_journal_is_not_trusted(tmpdir, data, transfer):
+    local = tmpdir.join('local.bin')
+    tmpdir.join('local.bin.part').write_binary(b'\0' * SIZE)
+    file_transfer, progress = transfer()
+    file_transfer.get(data.strpath, local.strpath)
+    assert local.read_binary() == data.read_binary()
+    assert progress[-1].resumed == 0
+
+
+@pytest.mark.parametrize('compress', [False, True], ids=['container', 'compressed'])
+def test_get_stream_resumed(tmpdir, data, client, transfer, compress):
+    local = tmpdir.join('local.bin')
+    part = tmpdir.join('local.bin.part')
+    # the files of a container are streamed too
+    client.is_container = not compress
+    file_transfer, progress = transfer(compress=compress)
+    client.break_after = RANGE_SIZE // 4
+    client.breaks = ssh_transfer.NUM_OF_TRIES
+    with pytest.raises(TransferError):
+        file_transfer.get(data.strpath, local.strpath)
+    key = journal_key(file_transfer, 'get', data.strpath, local.strpath)
+    assert file_transfer.journals.get(key) == 'stream'
+    assert not local.check()
+    got = part.size()
+    assert 0 < got < SIZE
+    assert part.read_binary() == data.read_binary()[:got]
+    # each try went on where the previous one broke off
+    offsets = [int(command.split()[2]) for command in client.commands]
+    assert 1 == offsets[0] < offsets[1] < offsets[2] <= got + 1
+
+    file_transfer, progress = transfer(compress=compress)
+    file_transfer.get(data.strpath, local.strpath)
+    assert local.read_binary() == data.read_binary()
+    assert not part.check()
+    assert progress[-1].resumed == got
+    assert client.commands[-1].startswith('tail -c +{} '.format(got + 1))
+    assert file_transfer.journals.get(key) is None
+
+
+def test_put_stream_resumed(tmpdir, data, client, transfer):
+    remote = tmpdir.join('remote.bin')
+    file_transfer, progress = transfer(compress=True)
+    client.break_after = RANGE_SIZE
+    client.breaks = 1
+    file_transfer.put(data.strpath, remote.strpath)
+    assert remote.read_binary() == data.read_binary()
+    assert not tmpdir.join('remote.bin.part').check()
+    assert [command.split()[:3] for command in client.commands] == [
+        ['gzip', '-dc', '>'], ['gzip', '-dc', '>>']]
+    assert progress[-1].resumed > 0
@@ -0,0 +1,159 @@
+import hashlib
+import re
+import threading
+from time import time
+
+import pytest
+from six.moves import BaseHTTPServer, socketserver
+
+from cfme.utils.template.base import TemplateUploadException
+from cfme.utils.template.image_cache import ImageCache, NUM_OF_TRIES
+from cfme.utils.template.orchestrator import UploadOrchestrator
+
+IMAGE = b''.join(str(i).encode('ascii') for i in range(100000))
+
+
+class ImageHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves the image and its checksum, breaks off the first download halfway if asked"""
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.headers.get('Range')))
+        etag = '"{}"'.format(hashlib.sha256(server.image).hexdigest()[:16])
+        if self.path.endswith('/SHA256SUM'):
+            body = '{}  cfme-ec2.vhd\n'.format(server.digest).encode('ascii')
+            self.send_response(200)
+        else:
+            start = 0
+            match = re.match(r'bytes=(\d+)-', self.headers.get('Range') or '')
+            if match and self.headers.get('If-Range') in (None, etag):
+                start = int(match.group(1))
+                self.send_response(206)
+            else:
+                self.send_response(200)
+            self.send_header('ETag', etag)
+            body = server.image[start:]
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if server.break_off and not self.path.endswith('/SHA256SUM'):
+            server.break_off -= 1
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.connection.close()
+        else:
+            self.wfile.write(body)
+
+
+class ImageServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def image_server():
+    server = ImageServer(('127.0.0.1', 0), ImageHandler)
+    server.requests = []
+    server.image = IMAGE
+    server.digest = hashlib.sha256(IMAGE).hexdigest()
+    server.break_off = False
+    server.url = 'http://127.0.0.1:{}/builds/cfme-ec2.vhd'.format(server.server_port)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_once_and_resume(image_server, tmpdir):
+    image_server.break_off = True
+    cache = ImageCache(tmpdir.join('images'), chunk_size=4096)
+    path = cache.fetch(image_server.url)
+    assert path.read_binary() == IMAGE
+    assert path.basename == image_server.digest
+    image_requests = [request for request in image_server.requests if request[0].endswith('vhd')]
+    assert image_requests[0][1] is None and image_requests[1][1].startswith('bytes=')
+    # cached, not downloaded again
+    assert cache.fetch(image_server.url) == path
+    assert len([request for request in image_server.requests
+                if request[0].endswith('vhd')]) == 2
+
+
+def test_fetch_changed_image_from_the_start(image_server, tmpdir):
+    # every attempt breaks off, the partial download stays
+    image_server.break_off = NUM_OF_TRIES
+    cache = ImageCache(tmpdir.join('images'), chunk_size=4096)
+    with pytest.raises(TemplateUploadException):
+        cache.fetch(image_server.url)
+    assert tmpdir.join('images', 'partial').listdir(fil='*.part')
+
+    image_server.image = b'new' + IMAGE
+    path = cache.fetch(image_server.url, hashlib.sha256(image_server.image).hexdigest())
+    assert path.read_binary() == image_server.image
+    # the resume sent the validator of the old image, the server sent the whole new one
+    assert image_server.requests[-1][1].startswith('bytes=')
+    assert not tmpdir.join('images', 'partial').listdir()
+
+
+def test_evict(tmpdir):
+    cache = ImageCache(tmpdir.join('images'), max_age=3600, max_size=250)
+    images = cache.path.join('sha256').ensure(dir=True)
+    for digest, size, age in (('old', 10, 7200), ('lru', 100, 60), ('mru', 100, 30),
+                              ('used', 100, 7200)):
+        images.join(digest).write(b'x' * size, 'wb')
+        images.join(digest).setmtime(time() - age)
+    stale_part = cache.path.join('partial', 'stale.part').ensure()
+    stale_part.setmtime(time() - 7200)
+    fresh_part = cache.path.join('partial', 'fresh.part').ensure()
+    assert cache._hand_out('used') == images.join('used')
+    removed = cache.evict()
+    assert sorted(path.basename for path in removed) == ['lru', 'old', 'stale.part']
+    assert sorted(path.basename for path in images.listdir()) == ['mru', 'used']
+    assert fresh_part.check()
+
+
+def test_fetch_checksum_mismatch(image_server, tmpdir):
+    image_server.digest = hashlib.sha256(b'another image').hexdigest()
+    cache = ImageCache(tmpdir.join('images'))
+    with pytest.raises(TemplateUploadException):
+        cache.fetch(image_server.url)
+    assert not tmpdir.join('images', 'sha256').check()
+
+
+class FakeUploader(object):
+    log_name = 'EC2'
+    provider_type = 'ec2'
+    needs_local_image = True
+
+    def __init__(self, provider, image_url):
+        self.provider = provider
+        self.image_url = image_url
+        self.template_name = 'cfme-5910-0101'
+        self.local_image = None
+        self.timings = {}
+        self.ran = 0
+
+    def main(self):
+        self.ran += 1
+        self.timings['upload'] = 0.1
+        return True
+
+
+def test_orchestrator_skips_finished_uploads(image_server, tmpdir):
+    orchestrator = UploadOrchestrator(cache=ImageCache(tmpdir.join('images')), limits={'ec2': 1})
+    uploaders = [FakeUploader('ec2-east', image_server.url),
+                 FakeUploader('ec2-west', image_server.url)]
+    results = orchestrator.run(uploaders)
+    assert [result.status for result in results] == ['uploaded', 'uploaded']
+    assert uploaders[0].local_image == uploaders[1].local_image
+    assert list(results[0].timings)[:2] == ['checksum', 'download to cache']
+    assert 'upload' in results[0].timings
+
+    again = [FakeUploader('ec2-east', image_server.url),
+             FakeUploader('ec2-south', image_server.url)]
+    assert [result.status for result in orchestrator.run(again)] == ['skipped', 'uploaded']
+    assert (again[0].ran, again[1].ran) == (0, 1)
+    # one download for all the uploads
+    assert len([request for request in image_server.requests
+                if request[0].endswith('vhd')]) == 1
@@ -0,0 +1,80 @@
+from cfme.utils.disk_cache import DiskCache
+from cfme.utils.trackerbot import depaginate, get_page, iter_objects
+
+
+class FakeListing(object):
+    """Serves a listing the way the trackerbot API (slumber) does, recording the offsets"""
+    def __init__(self, count):
+        self.objects = [{'id': i} for i in range(count)]
+        self.offsets = []
+
+    @property
+    def template(self):
+        return self
+
+    def get(self, limit=20, offset=0, **params):
+        offset, limit = int(offset), int(limit)
+        self.offsets.append(offset)
+        end = offset + limit
+        return {
+            'meta': {
+                'limit': limit, 'offset': offset, 'total_count': len(self.objects),
+                'next': '/api/template/?limit={}&offset={}'.format(limit, end)
+                if end < len(self.objects) else None},
+            'objects': self.objects[offset:end]}
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, data=None, headers=None):
+        self.status_code = status_code
+        self.data = data
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+class FakeSession(object):
+    def __init__(self):
+        self.requests = []
+
+    def get(self, url, params=None, headers=None):
+        self.requests.append(headers)
+        if headers.get('if-none-match') == '"v1"':
+            return FakeResponse(304)
+        return FakeResponse(200, {'objects': [1, 2]}, {'etag': '"v1"'})
+
+
+class FakeResource(object):
+    def __init__(self):
+        self._store = {'session': FakeSession()}
+
+    def url(self):
+        return 'http://trackerbot/api/template/'
+
+
+def test_iter_objects_in_order():
+    api = FakeListing(95)
+    assert [obj['id'] for obj in iter_objects(api, 'template', limit=10, workers=3)] == list(
+        range(95))
+    assert sorted(api.offsets) == list(range(0, 95, 10))
+
+
+def test_depaginate_concurrently():
+    api = FakeListing(45)
+    result = depaginate(api, api.get(limit=20))
+    assert [obj['id'] for obj in result['objects']] == list(range(45))
+    assert result['meta']['next'] is None and result['meta']['total_count'] == 45
+
+
+def test_get_page_revalidates(tmpdir):
+    cache = DiskCache(tmpdir.join('cache'))
+    resource = FakeResource()
+    assert get_page(resource, cache, limit=10) == {'objects': [1, 2]}
+    assert get_page(resource, cache, limit=10) == {'objects': [1, 2]}
+    first, second = resource._store['session'].requests
+    assert 'if-none-match' not in first
+    assert second['if-none-match'] == '"v1"'
@@ -0,0 +1,153 @@
+import gc
+
+import attr
+import pytest
+from selenium.common.exceptions import UnexpectedAlertPresentException, WebDriverException
+
+from cfme.modeling.base import BaseCollection, BaseEntity
+from cfme.utils.appliance.implementations.ui import (
+    CFMENavigateStep, MiqBrowserPlugin, NavigationShortcuts, PageHealth)
+
+HEALTHY = {'sparkle_off': True, 'blocked': False, 'modal': False, 'jquery': True,
+           'rails_error': None}
+
+
+class FakeSelenium(object):
+    """The widgetastic browser, running the scripts with the given results in order"""
+    def __init__(self, *results):
+        self.results = list(results)
+        self.dismissed = 0
+
+    def execute_script(self, script, silent=False):
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def dismiss_any_alerts(self):
+        self.dismissed += 1
+
+
+class FakeAppliance(object):
+    is_miqqe_patch_candidate = False
+
+    def __init__(self, widgetastic):
+        self.appliance = self.browser = self
+        self.widgetastic = widgetastic
+        widgetastic.plugin = MiqBrowserPlugin(widgetastic)
+
+    @property
+    def ssh_client(self):
+        raise AssertionError('the workers should not be restarted')
+
+    def quit_browser(self):
+        raise AssertionError('the browser should not be recycled')
+
+
+@attr.s
+class Thing(BaseEntity):
+    name = attr.ib()
+
+
+@attr.s
+class ThingCollection(BaseCollection):
+    ENTITY = Thing
+
+
+class Appliance(object):
+    hostname = '10.0.0.1'
+
+
+def navigate_step(widgetastic=None, obj=None, name='Details'):
+    step = CFMENavigateStep.__new__(CFMENavigateStep)
+    step.obj = FakeAppliance(widgetastic) if obj is None else obj
+    step._name = name
+    step.go = lambda *args, **kwargs: pytest.fail('navigated again')
+    return step
+
+
+def test_page_health():
+    health = MiqBrowserPlugin(FakeSelenium(HEALTHY)).page_health()
+    assert health == PageHealth(elapsed=health.elapsed, **HEALTHY)
+
+
+def test_page_health_unknown():
+    plugin = MiqBrowserPlugin(FakeSelenium(
+        WebDriverException('javascript error: document unloaded while waiting for result')))
+    health = plugin.page_health()
+    assert health == PageHealth.unknown(elapsed=health.elapsed)
+
+
+def test_page_health_alert():
+    plugin = MiqBrowserPlugin(FakeSelenium(UnexpectedAlertPresentException('Abandon changes?')))
+    with pytest.raises(UnexpectedAlertPresentException):
+        plugin.page_health()
+
+
+@pytest.mark.parametrize('results', [
+    [HEALTHY],
+    [WebDriverException('script timeout')],
+    [UnexpectedAlertPresentException('Abandon changes?'), WebDriverException('no such window')],
+], ids=['healthy', 'unknown', 'alert-unknown'])
+def test_pre_badness_check_acts_on_known_health(results):
+    widgetastic = FakeSelenium(*results)
+    navigate_step(widgetastic).pre_badness_check(3)
+    assert not widgetastic.results
+    assert widgetastic.dismissed == sum(
+        isinstance(result, UnexpectedAlertPresentException) for result in results)
+
+
+def test_shortcut_keys_of_collections():
+    shortcuts = NavigationShortcuts()
+    appliance = Appliance()
+
+    def key(obj):
+        return shortcuts.key(navigate_step(obj=obj, name='All'))
+
+    # a new collection object for the same collection
+    assert key(ThingCollection(appliance)) == key(ThingCollection(appliance))
+    assert key(ThingCollection(appliance)) != key(ThingCollection(appliance, {'name': 'a'}))
+    assert (key(ThingCollection(appliance, {'name': 'a'})) ==
+            key(ThingCollection(appliance, {'name': 'a'})))
+
+    # the collections of an entity, like those of its CollectionProperty
+    parent = Thing(ThingCollection(appliance), 'a')
+    other = Thing(ThingCollection(appliance), 'a')
+    assert (key(ThingCollection.for_entity_with_filter(parent, {'parent': parent})) ==
+            key(ThingCollection.for_entity_with_filter(parent, {'parent': parent})))
+    assert (key(ThingCollection.for_entity_with_filter(parent, {'parent': parent})) !=
+            key(ThingCollection.for_entity_with_filter(other, {'parent': other})))
+    # an id known already identifies the entity
+    parent.id = other.id = 12
+    assert key(ThingCollection(parent)) == key(ThingCollection(other))
+
+
+def test_shortcuts_forgotten_with_the_object():
+    shortcuts = NavigationShortcuts()
+    parent = Thing(ThingCollection(Appliance()), 'a')
+    key = shortcuts.key(navigate_step(obj=ThingCollection(parent), name='All'))
+    shortcuts.learn(key, 'https://10.0.0.1/thing/show_list', 2)
+    assert shortcuts.get(key) == ('https://10.0.0.1/thing/show_list', 2)
+    del parent
+    gc.collect()
+    assert shortcuts.get(key) is None
+    assert not shortcuts._refs
+    assert not shortcuts._dependents
+
+
+def test_explorer_urls_not_learned():
+    shortcuts = NavigationShortcuts()
+    thing = Thing(ThingCollection(Appliance()), 'a')
+    thing.id = 12
+    key = shortcuts.key(navigate_step(obj=thing))
+    shortcuts.learn(key, 'https://10.0.0.1/vm_infra/explorer', 2)
+    assert shortcuts.get(key) is None
+    # not with any other URL later either
+    shortcuts.learn(key, 'https://10.0.0.1/vm_infra/show/12', 2)
+    assert shortcuts.get(key) is None
+    assert shortcuts.stats['learned'] == 0
+
+    key = shortcuts.key(navigate_step(obj=ThingCollection(thing.appliance), name='All'))
+    shortcuts.learn(key, 'https://10.0.0.1/ems_infra/show_list', 2)
+    assert shortcuts.get(key) == ('https://10.0.0.1/ems_infra/show_list', 2)
+    assert shortcuts.stats['learned'] == 1
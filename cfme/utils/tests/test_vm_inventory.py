@@ -0,0 +1,77 @@
+from collections import namedtuple
+from datetime import datetime
+
+import pytz
+
+from cfme.utils import vm_inventory
+from cfme.utils.vm_inventory import Inventory
+
+Instance = namedtuple('Instance', 'id, tags, launch_time, state, instance_type')
+
+
+class EC2System(object):
+    """Lists the instances with their details, like wrapanapi does"""
+    def __init__(self, instances):
+        self.instances = instances
+        self.calls = []
+
+    def _get_all_instances(self):
+        self.calls.append('_get_all_instances')
+        return self.instances
+
+
+class VMWareSystem(object):
+    """Lists the names only, the details are looked up per VM"""
+    def __init__(self, vms):
+        self.vms = vms
+        self.calls = []
+
+    def list_vm(self):
+        self.calls.append('list_vm')
+        return list(self.vms)
+
+    def vm_creation_time(self, vm_name):
+        self.calls.append(('vm_creation_time', vm_name))
+        if self.vms[vm_name] is None:
+            raise Exception('no events')
+        return self.vms[vm_name]
+
+    def vm_status(self, vm_name):
+        self.calls.append(('vm_status', vm_name))
+        return 'poweredOn'
+
+
+def test_bulk_snapshot_reused(tmpdir, monkeypatch):
+    mgmt = EC2System([
+        Instance('i-1', {'Name': 'test_old'}, '2018-01-01T10:00:00.000Z', 'running', 't2.micro'),
+        Instance('i-2', {}, '2018-01-02T10:00:00.000Z', 'stopped', 't2.small')])
+    monkeypatch.setattr(vm_inventory, 'get_mgmt', lambda key: mgmt)
+    snapshot = Inventory(tmpdir.join('inventory')).snapshot('ec2')
+    assert snapshot.bulk
+    assert snapshot.vms['test_old'].creation_time == datetime(2018, 1, 1, 10, tzinfo=pytz.UTC)
+    assert (snapshot.vms['i-2'].status, snapshot.vms['i-2'].vm_type) == ('stopped', 't2.small')
+
+    # the delete run after a dry run
+    again = Inventory(tmpdir.join('inventory')).snapshot('ec2')
+    assert list(again.vms) == ['test_old', 'i-2']
+    assert mgmt.calls == ['_get_all_instances']
+
+
+def test_fallback_scans_matching_vms(tmpdir, monkeypatch):
+    created = datetime(2018, 1, 1, tzinfo=pytz.UTC)
+    mgmt = VMWareSystem({'test_a': created, 'test_b': None, 'keep': created})
+    monkeypatch.setattr(vm_inventory, 'get_mgmt', lambda key: mgmt)
+    inventory = Inventory(tmpdir.join('inventory'))
+    snapshot = inventory.snapshot('vsphere', names=lambda name: name.startswith('test_'))
+    assert not snapshot.bulk
+    assert snapshot.vms['test_a'].creation_time == created
+    assert snapshot.vms['test_b'].error and snapshot.vms['test_b'].status == 'poweredOn'
+    assert not snapshot.vms['keep'].scanned
+    assert ('vm_creation_time', 'keep') not in mgmt.calls
+
+    # only the failed VM is looked up again, the deleted one is gone
+    del mgmt.calls[:]
+    inventory.forget('vsphere', ['test_a'])
+    snapshot = inventory.snapshot('vsphere', names=lambda name: name.startswith('test_'))
+    assert list(snapshot.vms) == ['test_b', 'keep']
+    assert mgmt.calls == [('vm_creation_time', 'test_b'), ('vm_status', 'test_b')]
@@ -4,13 +4,27 @@ import time
 import requests
 import slumber
 
-from collections import defaultdict
-from six.moves.urllib_parse import urlparse, parse_qs
+from collections import defaultdict, deque
+from concurrent import futures
+from requests.adapters import HTTPAdapter
+from six.moves.urllib_parse import urlencode, urlparse, parse_qs
 
 from cfme.utils.conf import env
+from cfme.utils.disk_cache import DiskCache
+from cfme.utils.path import log_path
 from cfme.utils.providers import providers_data
 
+#: Threads fetching the pages of a listing
+PAGE_WORKERS = 8
+#: Objects per page of the listings
+PAGE_SIZE = 100
+#: Seconds the cached pages are kept for, they are revalidated on every request anyway
+PAGE_CACHE_TTL = 7 * 24 * 3600
+
 session = requests.Session()
+# one connection per page fetching thread
+session.mount('http://', HTTPAdapter(pool_maxsize=PAGE_WORKERS))
+session.mount('https://', HTTPAdapter(pool_maxsize=PAGE_WORKERS))
 
 
 conf = env.get('trackerbot', {})
@@ -55,7 +69,7 @@ def active_streams(api, force=False):
 
 def provider_templates(api):
     provider_templates = defaultdict(list)
-    for template in depaginate(api, api.template.get())['objects']:
+    for template in iter_objects(api, 'template', cache=page_cache()):
         for provider in template['providers']:
             provider_templates[provider].append(template['name'])
     return provider_templates
@@ -140,9 +154,9 @@ def templates_to_test(api, limit=1, request_type=None):
 
     """
     templates = []
-    for pt in api.untestedtemplate.get(
-            limit=limit, tested=False, provider__type=request_type).get(
-            'objects', []):
+    for pt in get_page(
+            api.untestedtemplate, cache=page_cache(),
+            limit=limit, tested=False, provider__type=request_type).get('objects', []):
         name = pt['template']['name']
         group = pt['template']['group']['name']
         provider = pt['provider']['key']
@@ -238,11 +252,9 @@ def post_jenkins_result(job_name, number, stream, date, template,
 
 def trackerbot_add_provider_template(stream, provider, template_name, custom_data=None):
     try:
-        existing_provider_templates = [
-            pt['id']
-            for pt in depaginate(
-                api(), api().providertemplate.get(provider=provider))['objects']]
-        if '{}_{}'.format(template_name, provider) in existing_provider_templates:
+        provider_template_id = '{}_{}'.format(template_name, provider)
+        if any(pt['id'] == provider_template_id
+               for pt in iter_objects(api(), 'providertemplate', provider=provider)):
             print('Template {} already tracked for provider {}'.format(
                 template_name, provider))
         else:
@@ -255,7 +267,92 @@ def trackerbot_add_provider_template(stream, provider, template_name, custom_dat
         print('{}: Error occured while template sync to trackerbot'.format(provider))
 
 
-def depaginate(api, result):
+def page_cache():
+    """Cache of the pages of the listings, shared by the processes"""
+    return DiskCache(log_path.join('trackerbot_cache'), ttl=PAGE_CACHE_TTL)
+
+
+def get_page(resource, cache=None, **params):
+    """GET a page of a trackerbot resource, revalidating the cached copy
+
+    With a cache, the page is requested with the ``ETag`` and ``Last-Modified`` validators of the
+    cached copy, an unchanged page is then answered with a 304 and read from the cache.
+
+    Args:
+        resource: the slumber resource, e.g. ``api.template``
+        cache: :py:class:`cfme.utils.disk_cache.DiskCache` of the pages, None to not cache
+        params: query parameters
+    """
+    store = getattr(resource, '_store', None)
+    if cache is None or store is None:
+        return resource.get(**params)
+    url = resource.url()
+    key = '{}?{}'.format(url, urlencode(sorted(params.items())))
+    cached = cache.get(key)
+    headers = {'accept': 'application/json'}
+    if cached is not None:
+        if cached['etag']:
+            headers['if-none-match'] = cached['etag']
+        if cached['last_modified']:
+            headers['if-modified-since'] = cached['last_modified']
+    resp = store['session'].get(url, params=params, headers=headers)
+    if resp.status_code == 304 and cached is not None:
+        return cached['data']
+    resp.raise_for_status()
+    data = resp.json()
+    etag, last_modified = resp.headers.get('etag'), resp.headers.get('last-modified')
+    if etag or last_modified:
+        cache.set(key, {'etag': etag, 'last_modified': last_modified, 'data': data})
+    return data
+
+
+def _following_pages(resource, params, meta, workers=PAGE_WORKERS, cache=None):
+    """The pages after the one described by meta, fetched concurrently and returned in order"""
+    limit = int(meta['limit'] or 0)
+    if not meta['next'] or not limit:
+        return
+    next_offset = int(meta['offset']) + limit
+    total = int(meta['total_count'])
+    with futures.ThreadPoolExecutor(workers) as executor:
+        # only a few pages ahead of the consumer are fetched
+        pending = deque()
+        while next_offset < total or pending:
+            while next_offset < total and len(pending) < 2 * workers:
+                page_params = dict(params, limit=limit, offset=next_offset)
+                pending.append(executor.submit(get_page, resource, cache, **page_params))
+                next_offset += limit
+            page = pending.popleft().result()
+            # objects added meanwhile are on more pages
+            total = max(total, int(page['meta']['total_count']))
+            yield page
+
+
+def iter_objects(api, endpoint, workers=PAGE_WORKERS, cache=None, **params):
+    """Streams the objects of all the pages of a listing
+
+    The first page tells how many objects there are, the other pages are then fetched
+    concurrently. The objects are yielded in order as their pages arrive.
+
+    Args:
+        api: the trackerbot API
+        endpoint: name of the listing, e.g. ``providertemplate``
+        workers: number of threads fetching the pages
+        cache: :py:class:`cfme.utils.disk_cache.DiskCache` revalidating the pages, see
+            :py:func:`get_page`
+        params: query parameters, ``limit`` sets the page size
+    """
+    resource = getattr(api, endpoint)
+    params.setdefault('limit', PAGE_SIZE)
+    first = get_page(resource, cache, **params)
+    for obj in first['objects']:
+        yield obj
+    params.pop('offset', None)
+    for page in _following_pages(resource, params, first['meta'], workers, cache):
+        for obj in page['objects']:
+            yield obj
+
+
+def depaginate(api, result, workers=PAGE_WORKERS, cache=None):
     """Depaginate the first (or only) page of a paginated result"""
     meta = result['meta']
     if meta['next'] is None:
@@ -263,21 +360,17 @@ def depaginate(api, result):
         return result
 
     # make a copy of meta that we'll mess with and eventually return
-    # since we'll be chewing on the 'meta' object with every new GET
     # same thing for objects, since we'll just be appending to it
     # while we pull more records
     ret_meta = meta.copy()
-    ret_objects = result['objects']
-    while meta['next']:
-        # parse out url bits for constructing the new api req
-        next_url = urlparse(meta['next'])
-        # ugh...need to find the word after 'api/' in the next URL to
-        # get the resource endpoint name; not sure how to make this better
-        next_endpoint = next_url.path.strip('/').split('/')[-1]
-        next_params = {k: v[0] for k, v in parse_qs(next_url.query).items()}
-        result = getattr(api, next_endpoint).get(**next_params)
-        ret_objects.extend(result['objects'])
-        meta = result['meta']
+    ret_objects = list(result['objects'])
+    # the next URL tells the resource endpoint name and the query of the listing
+    next_url = urlparse(meta['next'])
+    next_endpoint = next_url.path.strip('/').split('/')[-1]
+    next_params = {k: v[0] for k, v in parse_qs(next_url.query).items() if k != 'offset'}
+    for page in _following_pages(
+            getattr(api, next_endpoint), next_params, meta, workers, cache):
+        ret_objects.extend(page['objects'])
 
     # fix meta up to not tell lies
     ret_meta['total_count'] = len(ret_objects)
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""Snapshots of the VMs on the providers, for the scripts listing and cleaning them up
+
+A :py:class:`ProviderSnapshot` holds the names, creation times and power states of the VMs on a
+provider. Where the mgmt API can list all of them with their details (EC2, OpenStack, RHEV, GCE,
+SCVMM), taking the snapshot is one bulk call. The other providers list the VM names, the VMs are
+then looked up one by one, in a bounded number of threads, and only the ones the script asks for.
+
+The snapshots are stored in a :py:class:`cfme.utils.disk_cache.DiskCache`, so a dry run of
+``scripts/cleanup_old_vms.py`` followed by the delete run, or ``scripts/list_provider_vms.py``,
+reuse the snapshot while it is fresh instead of scanning the providers again. A snapshot only
+tells which VMs to look at: the delete pass looks each VM up again with :py:func:`scan_vm`
+before deleting it.
+"""
+import threading
+from collections import OrderedDict
+from concurrent import futures
+from datetime import datetime
+from time import time
+
+import attr
+import iso8601
+import pytz
+import tzlocal
+from lxml import etree
+
+from cfme.utils.disk_cache import DiskCache
+from cfme.utils.log import logger
+from cfme.utils.path import log_path
+from cfme.utils.providers import get_mgmt
+
+#: Threads looking up the VMs of a provider without a bulk call
+SCAN_WORKERS = 8
+#: Seconds a snapshot is reused for by default
+SNAPSHOT_TTL = 6 * 3600
+
+
+@attr.s(frozen=True)
+class VmRecord(object):
+    """What a snapshot knows about a VM
+
+    ``scanned`` is False for the VMs which were only listed, ``error`` tells why the details of a
+    scanned VM are missing. ``vm_type`` is only known when the bulk listing has it.
+    """
+    name = attr.ib()
+    creation_time = attr.ib(default=None)
+    status = attr.ib(default=None)
+    error = attr.ib(default=None)
+    scanned = attr.ib(default=False)
+    vm_type = attr.ib(default=None)
+
+    def age(self, now=None):
+        if self.creation_time is None:
+            return None
+        return (now or datetime.now(tz=pytz.UTC)) - self.creation_time
+
+
+def _ec2_records(mgmt):
+    for instance in mgmt._get_all_instances():
+        # Example instance.launch_time: 2014-08-13T22:09:40.000Z
+        launch_time = datetime.strptime(instance.launch_time, '%Y-%m-%dT%H:%M:%S.%fZ')
+        yield VmRecord(instance.tags.get('Name', instance.id), launch_time.replace(tzinfo=pytz.UTC),
+                       instance.state, scanned=True, vm_type=instance.instance_type)
+
+
+def _openstack_records(mgmt):
+    for instance in mgmt._get_all_instances():
+        # Example instance.created: 2014-08-14T23:29:30Z
+        created = datetime.strptime(instance.created, '%Y-%m-%dT%H:%M:%SZ')
+        yield VmRecord(instance.name, created.replace(tzinfo=pytz.UTC), instance.status,
+                       scanned=True)
+
+
+def _rhevm_records(mgmt):
+    for vm in mgmt._vms_service.list():
+        yield VmRecord(vm.name, vm.creation_time.astimezone(pytz.UTC), vm.status.value,
+                       scanned=True)
+
+
+def _google_records(mgmt):
+    # the VMs of the zone of the provider, like list_vm
+    for instance in mgmt._get_zone_instances(mgmt._zone).get('items', []):
+        yield VmRecord(instance['name'],
+                       iso8601.parse_date(instance['creationTimestamp']).astimezone(pytz.UTC),
+                       instance.get('status'), scanned=True,
+                       vm_type=instance.get('machineType', '').split('/')[-1] or None)
+
+
+def _scvmm_records(mgmt):
+    data = mgmt.run_script(
+        "Get-SCVirtualMachine -All -VMMServer $scvmm_server | "
+        "Select Name, CreationTime, StatusString | ConvertTo-Xml -as String")
+    for vm in etree.fromstring(data):
+        props = {prop.get('Name'): prop.text for prop in vm.xpath('./Property')}
+        creation_time = datetime.strptime(props['CreationTime'], '%m/%d/%Y %I:%M:%S %p')
+        yield VmRecord(
+            props['Name'],
+            creation_time.replace(tzinfo=tzlocal.get_localzone()).astimezone(pytz.UTC),
+            props.get('StatusString'), scanned=True)
+
+
+#: mgmt class name to the function listing all its VMs with their details in one call
+BULK_RECORDS = {
+    'EC2System': _ec2_records,
+    'OpenstackSystem': _openstack_records,
+    'RHEVMSystem': _rhevm_records,
+    'GoogleCloudSystem': _google_records,
+    'SCVMMSystem': _scvmm_records,
+}
+
+
+def bulk_records(mgmt):
+    """Records of all the VMs of the mgmt system, or None if there is no bulk call for it"""
+    for cls in type(mgmt).__mro__:
+        if cls.__name__ in BULK_RECORDS:
+            return list(BULK_RECORDS[cls.__name__](mgmt))
+    return None
+
+
+def scan_vm(mgmt, vm_name):
+    """Looks up the creation time and the status of a VM"""
+    try:
+        creation_time = mgmt.vm_creation_time(vm_name)
+    except Exception as e:
+        logger.exception('Exception getting creation time for %r', vm_name)
+        creation_time, error = None, 'creation time: {}'.format(e)
+    else:
+        error = None
+    try:
+        status = mgmt.vm_status(vm_name)
+    except Exception as e:
+        logger.exception('Exception getting status for %r', vm_name)
+        status, error = None, error or 'status: {}'.format(e)
+    return VmRecord(vm_name, creation_time, status, error=error, scanned=True)
+
+
+@attr.s
+class ProviderSnapshot(object):
+    """The VMs of a provider, by name"""
+    provider_key = attr.ib()
+    vms = attr.ib(default=attr.Factory(OrderedDict))
+    taken = attr.ib(default=attr.Factory(time))
+    #: whether the details came with the listing
+    bulk = attr.ib(default=False)
+
+    @classmethod
+    def take(cls, provider_key, mgmt=None):
+        mgmt = mgmt or get_mgmt(provider_key)
+        records = None
+        try:
+            records = bulk_records(mgmt)
+        except Exception:
+            logger.exception('%r: bulk listing of the VMs failed, listing the names', provider_key)
+        bulk = records is not None
+        if not bulk:
+            records = [VmRecord(name) for name in mgmt.list_vm()]
+        snapshot = cls(provider_key, bulk=bulk)
+        for record in records:
+            snapshot.vms[record.name] = record
+        logger.info('%r: %d VMs in the snapshot, %s', provider_key, len(snapshot.vms),
+                    'with their details' if snapshot.bulk else 'names only')
+        return snapshot
+
+    def scan(self, names=None, workers=SCAN_WORKERS):
+        """Looks up the VMs of the snapshot which were only listed, or failed to be looked up
+
+        Args:
+            names: names of the VMs to look up, all of them if None
+            workers: number of threads looking up the VMs, each with its own mgmt client
+
+        Returns:
+            number of VMs looked up
+        """
+        names = [name for name in (self.vms if names is None else names)
+                 if name in self.vms and (not self.vms[name].scanned or self.vms[name].error)]
+        if not names:
+            return 0
+        local = threading.local()
+
+        def _scan(vm_name):
+            if not hasattr(local, 'mgmt'):
+                local.mgmt = get_mgmt(self.provider_key)
+            return scan_vm(local.mgmt, vm_name)
+
+        logger.info('%r: scanning %d VMs', self.provider_key, len(names))
+        with futures.ThreadPoolExecutor(min(workers, len(names))) as executor:
+            for record in executor.map(_scan, names):
+                self.vms[record.name] = record
+        return len(names)
+
+
+@attr.s
+class Inventory(object):
+    """Snapshots of the providers, kept on disk
+
+    Args:
+        path: directory of the stored snapshots
+        ttl: seconds a stored snapshot is reused for
+        refresh: take new snapshots even if there are stored ones
+    """
+    path = attr.ib(default=log_path.join('vm_inventory'))
+    ttl = attr.ib(default=SNAPSHOT_TTL)
+    refresh = attr.ib(default=False)
+
+    @property
+    def cache(self):
+        return DiskCache(self.path, ttl=self.ttl)
+
+    def snapshot(self, provider_key, names=None, workers=SCAN_WORKERS):
+        """Snapshot of the provider, with the VMs of the names scanned
+
+        Args:
+            provider_key: the provider key from yaml
+            names: callable filtering the names of the VMs to scan, all of them if None
+            workers: number of threads looking up the VMs if the provider has no bulk call
+        """
+        snapshot = None if self.refresh else self.cache.get(provider_key)
+        # scanning VMs rewrites the snapshot, it is only as fresh as the listing though
+        if snapshot is None or time() - snapshot.taken > self.ttl:
+            snapshot = ProviderSnapshot.take(provider_key)
+            changed = True
+        else:
+            logger.info('%r: reusing the snapshot taken at %s', provider_key,
+                        datetime.fromtimestamp(snapshot.taken))
+            changed = False
+        wanted = [name for name in snapshot.vms if names is None or names(name)]
+        if snapshot.scan(wanted, workers=workers):
+            changed = True
+        if changed:
+            self.store(snapshot)
+        return snapshot
+
+    def store(self, snapshot):
+        self.cache.set(snapshot.provider_key, snapshot)
+
+    def forget(self, provider_key, vm_names):
+        """Drops deleted VMs from the stored snapshot of the provider"""
+        snapshot = self.cache.get(provider_key)
+        if snapshot is None:
+            return
+        for vm_name in vm_names:
+            snapshot.vms.pop(vm_name, None)
+        self.store(snapshot)
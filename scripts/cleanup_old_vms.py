@@ -5,6 +5,8 @@ from datetime import timedelta
 import re
 import sys
 from collections import namedtuple
+from concurrent import futures
+from functools import partial
 from operator import attrgetter
 from multiprocessing import Manager, Pool
 
@@ -14,10 +16,12 @@ from tabulate import tabulate
 from cfme.utils.log import logger, add_stdout_handler
 from cfme.utils.path import log_path
 from cfme.utils.providers import get_mgmt, list_providers, ProviderFilter
+from cfme.utils.vm_inventory import SCAN_WORKERS, SNAPSHOT_TTL, Inventory, scan_vm
 
 # Constant strings for the report
 PASS = 'PASS'
 FAIL = 'FAIL'
+SKIP = 'SKIP'
 NULL = '--'
 
 VmProvider = namedtuple('VmProvider', 'provider_key, name')
@@ -47,6 +51,16 @@ def parse_cmd_line():
     parser.add_argument('--outfile', dest='outfile',
                         default=log_path.join('cleanup_old_vms.log').strpath,
                         help='outfile to list ')
+    parser.add_argument('--dry-run', default=False, action='store_true',
+                        help='Only list the VMs which would be deleted')
+    parser.add_argument('--refresh', default=False, action='store_true',
+                        help='Scan the providers even if there is a recent inventory snapshot')
+    parser.add_argument('--snapshot-hours', default=SNAPSHOT_TTL / 3600, type=float,
+                        help='Hours an inventory snapshot of a provider is reused for '
+                             '(default %(default)s)')
+    parser.add_argument('--workers', default=SCAN_WORKERS, type=int,
+                        help='Threads looking up the VMs of providers without a bulk listing '
+                             '(default %(default)s)')
     parser.add_argument('text_to_match', nargs='*', default=['^test_', '^jenkins', '^i-'],
                         help='Regex in the name of vm to be affected, can be use multiple times'
                              ' (Defaults to \'^test_\' and \'^jenkins\')')
@@ -110,102 +124,82 @@ def pool_manager(func, arg_list):
     return results
 
 
-def scan_provider(provider_key, matchers, match_queue, scan_failure_queue):
+def scan_provider(inventory, provider_key, matchers, delta, workers=SCAN_WORKERS):
     """
     Process the VMs on a given provider, comparing name and creation time.
-    Append vms meeting criteria to vms_to_delete
+
+    The VMs come from the inventory snapshot of the provider, only the VMs matching the name are
+    looked up when the provider has no bulk listing.
 
     Args:
+        inventory (Inventory): the inventory to take or reuse the snapshot from
         provider_key (string): the provider key from yaml
         matchers (list): A list of regex objects with match() method
-        match_queue (Queue.Queue): MP queue to hold VMs matching age requirement
-        scan_failure_queue (Queue.Queue): MP queue to hold vms that we could not compare age
+        delta (datetime.timedelta) The timedelta to compare age against for matches
+        workers (int): threads looking up the VMs
     Returns:
-        None: Uses the Queues to 'return' data
+        tuple of the list of VmData matching age requirement and the list of VmReport for the
+        vms that we could not compare age
     """
     logger.info('%r: Start scan for vm text matches', provider_key)
     try:
-        vm_list = get_mgmt(provider_key).list_vm()
+        snapshot = inventory.snapshot(
+            provider_key, names=partial(match, matchers), workers=workers)
     except Exception:  # noqa
-        scan_failure_queue.put(VmReport(provider_key, FAIL, NULL, NULL, NULL))
         logger.exception('%r: Exception listing vms', provider_key)
-        return
+        return [], [VmReport(provider_key, FAIL, NULL, NULL, NULL)]
 
-    text_matched_vms = [name for name in vm_list if match(matchers, name)]
-    for name in text_matched_vms:
-        match_queue.put(VmProvider(provider_key, name))
-
-    non_text_matching = set(vm_list) - set(text_matched_vms)
+    text_matched_vms = [vm for vm in snapshot.vms.values() if match(matchers, vm.name)]
+    non_text_matching = set(snapshot.vms) - {vm.name for vm in text_matched_vms}
     logger.info('%r: NOT matching text filters: %r', provider_key, non_text_matching)
-    logger.info('%r: MATCHED text filters: %r', provider_key, text_matched_vms)
-
-
-def scan_vm(provider_key, vm_name, delta, match_queue, scan_failure_queue):
-    """Scan an individual VM for age
-
-    Args:
-        provider_key (string): the provider key from yaml
-        vm_name (string): name of the VM to scan
-        delta (datetime.timedelta) The timedelta to compare age against for matches
-        match_queue (Queue.Queue): MP queue to hold VMs matching age requirement
-        scan_failure_queue (Queue.Queue): MP queue to hold vms that we could not compare age
+    logger.info('%r: MATCHED text filters: %r', provider_key, [vm.name for vm in text_matched_vms])
 
-    Returns:
-        None: Uses the Queues to 'return' data
-    """
-    provider_mgmt = get_mgmt(provider_key)
     now = datetime.datetime.now(tz=pytz.UTC)
-    # Nested exceptions to try and be safe about the scanned values and to get complete results
-    failure = False
-    status = NULL
-    logger.info('%r: Scan VM %r...', provider_key, vm_name)
-    try:
-        # Localize to UTC
-        vm_creation_time = provider_mgmt.vm_creation_time(vm_name)
-    except Exception:  # noqa
-        failure = True
-        logger.exception('%r: Exception getting creation time for %r', provider_key, vm_name)
-        # This VM must have some problem, include in report even though we can't delete
-        try:
-            status = provider_mgmt.vm_status(vm_name)
-        except Exception:  # noqa
-            failure = True
-            logger.exception('%r: Exception getting status for %r', provider_key, vm_name)
-            status = NULL
-    finally:
-        if failure:
-            scan_failure_queue.put(VmReport(provider_key, vm_name, FAIL, status, NULL))
-            return
-
-    vm_delta = now - vm_creation_time
-    logger.info('%r: VM %r age: %r', provider_key, vm_name, vm_delta)
-    data = VmData(provider_key, vm_name, str(vm_delta))
-
-    # test age to determine which queue it goes in
-    if delta < vm_delta:
-        match_queue.put(data)
-    else:
-        logger.info('%r: VM %r did not match age requirement', provider_key, vm_name)
+    age_matched = []
+    scan_failures = []
+    for vm in text_matched_vms:
+        if vm.creation_time is None:
+            # This VM must have some problem, include in report even though we can't delete
+            logger.error('%r: No creation time for %r: %s', provider_key, vm.name, vm.error)
+            scan_failures.append(VmReport(provider_key, vm.name, FAIL, vm.status or NULL, NULL))
+            continue
+        vm_delta = vm.age(now)
+        logger.info('%r: VM %r age: %r', provider_key, vm.name, vm_delta)
+        # test age to determine which list it goes in
+        if delta < vm_delta:
+            age_matched.append(VmData(provider_key, vm.name, str(vm_delta)))
+        else:
+            logger.info('%r: VM %r did not match age requirement', provider_key, vm.name)
+    return age_matched, scan_failures
 
 
-def delete_vm(provider_key, vm_name, age, result_queue):
+def delete_vm(provider_key, vm_name, age, delta, result_queue):
     """ Delete the given vm_name from the provider via REST interface
 
+    The age of the VM comes from an inventory snapshot which may be hours old, the VM is looked up
+    again and only deleted if it is still older than ``delta``. A VM created since under the same
+    name is skipped.
+
     Args:
         provider_key (string): name of the provider from yaml
         vm_name (string): name of the vm to delete
         age (string): age of the VM to delete
+        delta (datetime.timedelta): age the VM has to be older than
         result_queue (Queue.Queue): MP Queue to store the VmReport tuple on delete result
     Returns:
         None: Uses the Queues to 'return' data
     """
     # diaper exceptions here to handle anything and continue.
     provider_mgmt = get_mgmt(provider_key)
-    try:
-        status = provider_mgmt.vm_status(vm_name)
-    except Exception:  # noqa
-        status = FAIL
-        logger.exception('%r: Exception getting status for %r', provider_key, vm_name)
+    vm = scan_vm(provider_mgmt, vm_name)
+    status = vm.status or FAIL
+    vm_delta = vm.age()
+    if vm_delta is None or vm_delta <= delta:
+        logger.warning('%r: Not deleting %r, age in the snapshot: %r, age now: %r (%s)',
+                       provider_key, vm_name, age, vm_delta, vm.error)
+        result_queue.put(VmReport(provider_key, vm_name, str(vm_delta or NULL), status, SKIP))
+        return
+    age = str(vm_delta)
 
     logger.info("%r: Deleting %r, age: %r, status: %r", provider_key, vm_name, age, status)
     try:
@@ -229,13 +223,14 @@ def delete_vm(provider_key, vm_name, age, result_queue):
         result_queue.put(VmReport(provider_key, vm_name, age, status, result))
 
 
-def cleanup_vms(texts, max_hours=24, providers=None, tags=None, prompt=True):
+def cleanup_vms(texts, max_hours=24, providers=None, tags=None, prompt=True, dry_run=False,
+                inventory=None, workers=SCAN_WORKERS):
     """
     Main method for the cleanup process
     Generates regex match objects
     Checks providers for cleanup boolean in yaml
     Checks provider connectivity (using ping)
-    Threads process_provider_vms to build list of vms to delete
+    Threads scan_provider to build list of vms to delete from the inventory snapshots
     Prompts user to continue with delete
     Threads deleting of the vms
 
@@ -245,6 +240,9 @@ def cleanup_vms(texts, max_hours=24, providers=None, tags=None, prompt=True):
         providers (list): List of provider keys to scan and cleanup
         tags (list): List of tags to filter providers by
         prompt (bool): Whether or not to prompt the user before deleting vms
+        dry_run (bool): Only list the vms to delete
+        inventory (Inventory): where to keep the inventory snapshots of the providers
+        workers (int): threads looking up the VMs of a provider without a bulk listing
     Returns:
         int: return code, 0 on success, otherwise raises exception
     """
@@ -266,34 +264,26 @@ def cleanup_vms(texts, max_hours=24, providers=None, tags=None, prompt=True):
     logger.info('Potential providers for cleanup, filtered with given tags and provider keys: \n%s',
                 '\n'.join(providers_to_scan))
 
-    # scan providers for vms with name matches
-    # manager = Manager()
-    text_match_queue = manager.Queue()
-    scan_fail_queue = manager.Queue()
-    provider_scan_args = [
-        (provider_key, matchers, text_match_queue, scan_fail_queue)
-        for provider_key in providers_to_scan]
-    pool_manager(scan_provider, provider_scan_args)
-
-    text_matched = []
-    while not text_match_queue.empty():
-        text_matched.append(text_match_queue.get())
-
-    # scan vms for age matches
-    age_match_queue = manager.Queue()
-    vm_scan_args = [
-        (provider_key, vm_name, timedelta(hours=int(max_hours)), age_match_queue, scan_fail_queue)
-        for provider_key, vm_name in text_matched]
-    pool_manager(scan_vm, vm_scan_args)
-
+    # scan providers for vms with name and age matches, reusing recent snapshots
+    inventory = inventory or Inventory()
+    delta = timedelta(hours=int(max_hours))
     vms_to_delete = []
-    while not age_match_queue.empty():
-        vms_to_delete.append(age_match_queue.get())
-
-    scan_fail_vms = []
     # add the scan failures into deleted vms for reporting sake
-    while not scan_fail_queue.empty():
-        scan_fail_vms.append(scan_fail_queue.get())
+    scan_fail_vms = []
+    if providers_to_scan:
+        with futures.ThreadPoolExecutor(min(8, len(providers_to_scan))) as executor:
+            scans = [
+                executor.submit(scan_provider, inventory, provider_key, matchers, delta, workers)
+                for provider_key in providers_to_scan]
+            for scan in scans:
+                age_matched, scan_failures = scan.result()
+                vms_to_delete.extend(age_matched)
+                scan_fail_vms.extend(scan_failures)
+
+    if dry_run:
+        logger.info('Dry run, these VMs would be deleted:\n%s', tabulate(
+            sorted(vms_to_delete), headers=['Provider', 'Name', 'Age'], tablefmt='orgtbl'))
+        return 0
 
     if vms_to_delete and prompt:
         yesno = raw_input('Delete these VMs? [y/N]: ')
@@ -305,13 +295,20 @@ def cleanup_vms(texts, max_hours=24, providers=None, tags=None, prompt=True):
     deleted_vms = []
     if vms_to_delete:
         delete_queue = manager.Queue()
-        delete_vm_args = [(provider_key, vm_name, age, delete_queue)
+        delete_vm_args = [(provider_key, vm_name, age, delta, delete_queue)
                           for provider_key, vm_name, age in vms_to_delete]
         pool_manager(delete_vm, delete_vm_args)
 
         while not delete_queue.empty():
             deleted_vms.append(delete_queue.get())  # Each item is a VmReport tuple
 
+        # the next run reuses the snapshots, without the deleted vms and the ones they had
+        # outdated
+        deleted = [vm for vm in deleted_vms if vm.result in (PASS, SKIP)]
+        for provider_key in {vm.provider_key for vm in deleted}:
+            inventory.forget(
+                provider_key, [vm.name for vm in deleted if vm.provider_key == provider_key])
+
     else:
         logger.info('No VMs to delete.')
 
@@ -331,4 +328,6 @@ def cleanup_vms(texts, max_hours=24, providers=None, tags=None, prompt=True):
 if __name__ == "__main__":
     args = parse_cmd_line()
     sys.exit(cleanup_vms(args.text_to_match, args.max_hours, args.providers, args.tags,
-                         args.prompt))
+                         args.prompt, dry_run=args.dry_run,
+                         inventory=Inventory(ttl=args.snapshot_hours * 3600, refresh=args.refresh),
+                         workers=args.workers))
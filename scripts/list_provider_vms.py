@@ -1,12 +1,13 @@
 #!/usr/bin/env python2
 import argparse
+import threading
+from concurrent import futures
 from tabulate import tabulate
 from multiprocessing import Process, Queue
 
-from wrapanapi.exceptions import VMError
-
 from cfme.utils.path import log_path
 from cfme.utils.providers import get_mgmt, ProviderFilter, list_providers
+from cfme.utils.vm_inventory import SCAN_WORKERS, SNAPSHOT_TTL, Inventory
 
 
 # Constant for report
@@ -33,64 +34,72 @@ def parse_cmd_line():
                         action='append',
                         help='Provider keys, can be user multiple times. If none are given '
                              'the script will use all providers from cfme_data or match tags')
+    parser.add_argument('--refresh', default=False, action='store_true',
+                        help='Scan the providers even if there is a recent inventory snapshot')
+    parser.add_argument('--snapshot-hours', default=SNAPSHOT_TTL / 3600, type=float,
+                        help='Hours an inventory snapshot of a provider is reused for '
+                             '(default %(default)s)')
+    parser.add_argument('--workers', default=SCAN_WORKERS, type=int,
+                        help='Threads looking up the VMs of providers without a bulk listing '
+                             '(default %(default)s)')
 
     args = parser.parse_args()
     return args
 
 
-def list_vms(provider_key, output_queue):
+def get_vm_type(provider, vm_name):
+    # different provider types implement different methods to get instance type info
+    try:
+        return provider.vm_type(vm_name)
+    except (AttributeError, NotImplementedError):
+        return provider.vm_hardware_configuration(vm_name)
+
+
+def list_vms(provider_key, output_queue, inventory, workers=SCAN_WORKERS):
     """
     List all the vms/instances on the given provider key
     Build list of lists with basic vm info: [[provider, vm, status, age, type], [etc]]
+    Name, status and age come from the inventory snapshot of the provider
     :param provider_key: string provider key
     :param output_queue: a multiprocessing.Queue object to add results to
+    :param inventory: the Inventory to take or reuse the snapshot from
+    :param workers: number of threads collecting the VM metadata
     :return: list of lists of vms and basic statistics
     """
     output_list = []
 
     print('Listing VMS on provider {}'.format(provider_key))
-    provider = get_mgmt(provider_key)
     try:
-        vm_list = provider.list_vm()
+        snapshot = inventory.snapshot(provider_key, workers=workers)
     except NotImplementedError:
         print('Provider does not support list_vm: {}'.format(provider_key))
         output_list.append([provider_key, 'Not Supported', NULL, NULL, NULL])
         return
-    else:
-        # TODO thread metadata collection for further speed improvements
-        for vm_name in vm_list:
-            # Init these meta values in case they fail to query
-            status, creation, vm_type = None, None, None
-            try:
-                print('Collecting metadata for VM {} on provider {}'.format(vm_name, provider_key))
-                # VMError raised for some vms in bad status
-                # exception message contains useful information about VM status
-                try:
-                    status = provider.vm_status(vm_name)
-                except VMError as ex:
-                    status = ex.message
-
-                creation = provider.vm_creation_time(vm_name)
-
-                # different provider types implement different methods to get instance type info
-                try:
-                    vm_type = provider.vm_type(vm_name)
-                except (AttributeError, NotImplementedError):
-                    vm_type = provider.vm_hardware_configuration(vm_name)
-                finally:
-                    vm_type = vm_type or '--'
-
-            except Exception as ex:
-                print('Exception during provider processing on {}: {}'
-                      .format(provider_key, ex.message))
-                continue
-            finally:
-                # Add the VM to the list anyway, we just might not have all metadata
-                output_list.append([provider_key,
-                                    vm_name,
-                                    status or NULL,
-                                    creation or NULL,
-                                    str(vm_type) or NULL])
+
+    local = threading.local()
+
+    def _vm_type(vm):
+        if vm.vm_type:
+            return vm.vm_type
+        if not hasattr(local, 'provider'):
+            local.provider = get_mgmt(provider_key)
+        try:
+            print('Collecting metadata for VM {} on provider {}'.format(vm.name, provider_key))
+            return get_vm_type(local.provider, vm.name)
+        except Exception as ex:
+            print('Exception during provider processing on {}: {}'.format(provider_key, ex))
+            return None
+
+    vms = list(snapshot.vms.values())
+    with futures.ThreadPoolExecutor(max(1, min(workers, len(vms)))) as executor:
+        vm_types = list(executor.map(_vm_type, vms))
+    for vm, vm_type in zip(vms, vm_types):
+        # Add the VM to the list anyway, we just might not have all metadata
+        output_list.append([provider_key,
+                            vm.name,
+                            vm.status or vm.error or NULL,
+                            vm.creation_time or NULL,
+                            str(vm_type or NULL)])
 
     output_queue.put(output_list)
     return
@@ -109,8 +118,10 @@ if __name__ == "__main__":
     providers = [prov.key for prov in list_providers(filters, use_global_filters=False)]
 
     queue = Queue()  # for MP output
+    inventory = Inventory(ttl=args.snapshot_hours * 3600, refresh=args.refresh)
     proc_list = [
-        Process(target=list_vms, args=(provider, queue), name='list_vms:{}'.format(provider))
+        Process(target=list_vms, args=(provider, queue, inventory, args.workers),
+                name='list_vms:{}'.format(provider))
         for provider in providers
     ]
     for proc in proc_list:
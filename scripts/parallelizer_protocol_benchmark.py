@@ -0,0 +1,114 @@
+#!/usr/bin/env python2
+"""parallelizer protocol micro-benchmark
+
+Replays the master/slave event stream of a parallelized run of ``parallelizer_tester.py`` over
+the real zmq channels, once per protocol mode, and reports the events per second the master
+was able to process. No appliance or pytest session is needed::
+
+    python scripts/parallelizer_protocol_benchmark.py --slaves 4
+
+"""
+import argparse
+import shutil
+import tempfile
+import threading
+import time
+from os import path
+
+from cfme.fixtures.parallelizer import parallelizer_tester
+from cfme.fixtures.parallelizer.protocol import MasterChannel, PROTOCOLS, SlaveChannel
+
+
+def tester_node_ids():
+    """The node ids a collection of ``parallelizer_tester.py`` yields"""
+    params = range(10, 10 * parallelizer_tester.num_copies)
+    tests = sorted(name for name in dir(parallelizer_tester) if name.startswith('test_'))
+    return ['parallelizer_tester.py::{}[{}]'.format(test, param)
+            for param in params for test in tests]
+
+
+def fake_report(nodeid, when):
+    # shaped like the output of remote.serialize_report
+    return {
+        'nodeid': nodeid,
+        'location': ['parallelizer_tester.py', 42, nodeid.split('::')[1]],
+        'keywords': {nodeid.split('::')[1]: 1, 'parallelizer_tester.py': 1},
+        'outcome': 'passed',
+        'longrepr': None,
+        'when': when,
+        'sections': [],
+        'duration': 0.0012,
+        'user_properties': [],
+    }
+
+
+def run_slave(endpoint, slaveid, protocol):
+    channel = SlaveChannel(endpoint, slaveid, protocol)
+    channel.send_event('collectionfinish', node_ids=[])
+    while True:
+        node_ids = channel.send_event('need_tests')
+        if not node_ids:
+            break
+        for nodeid in node_ids:
+            location = ['parallelizer_tester.py', 42, nodeid.split('::')[1]]
+            channel.send_event('runtest_logstart', nodeid=nodeid, location=location)
+            for when in ('setup', 'call', 'teardown'):
+                channel.send_event('runtest_logreport', report=fake_report(nodeid, when))
+            channel.flush()
+    channel.send_event('shutdown')
+    channel.close()
+
+
+def run_master(endpoint, protocol, node_ids, num_slaves, group_size):
+    channel = MasterChannel(endpoint, protocol)
+    groups = [node_ids[i:i + group_size] for i in range(0, len(node_ids), group_size)]
+    slaves = [
+        threading.Thread(target=run_slave, args=(endpoint, 'slave{:02d}'.format(i), protocol))
+        for i in range(num_slaves)]
+    start = time.time()
+    for slave in slaves:
+        slave.start()
+    events = 0
+    running = num_slaves
+    while running:
+        slave_id, event_data, event_name = channel.recv()
+        if event_name is None:
+            continue
+        events += 1
+        if event_name == 'need_tests':
+            channel.send(slave_id, groups.pop() if groups else [])
+            continue
+        if event_name == 'shutdown':
+            running -= 1
+        if channel.needs_ack(event_name):
+            channel.send(slave_id, 'ack {}'.format(event_name))
+    elapsed = time.time() - start
+    for slave in slaves:
+        slave.join()
+    channel.close()
+    return events, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--slaves', type=int, default=4, help='number of simulated slaves')
+    parser.add_argument('--group-size', type=int, default=7, help='tests sent per need_tests')
+    parser.add_argument('--protocol', action='append', choices=PROTOCOLS,
+                        help='protocol to benchmark, may be repeated (default: all)')
+    args = parser.parse_args()
+
+    node_ids = tester_node_ids()
+    tmpdir = tempfile.mkdtemp(prefix='parallelizer-bench')
+    try:
+        for protocol in args.protocol or PROTOCOLS:
+            endpoint = 'ipc://{}'.format(path.join(tmpdir, protocol))
+            events, elapsed = run_master(
+                endpoint, protocol, node_ids, args.slaves, args.group_size)
+            print('{:>8}: {} tests, {} events in {:.2f}s, {:.0f} events/s'.format(
+                protocol, len(node_ids), events, elapsed, events / elapsed))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
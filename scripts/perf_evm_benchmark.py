@@ -0,0 +1,497 @@
+#!/usr/bin/env python2
+"""Benchmark the streaming evm.log analyzer against the original parsers
+
+Parses the given evm.log (or a generated one) with the original two pass implementation, kept
+below as evm_to_messages/evm_to_workers, and with
+:py:func:`cfme.utils.perf_message_stats.analyze_evm_log`, in one process and in a pool of parser
+processes. Each run is done in a fresh process, the wall time and peak memory of each are reported
+and the runs must agree on the lines, messages, hourly buckets and workers::
+
+    scripts/perf_evm_benchmark.py --generate 200000 --processes 4
+    scripts/perf_evm_benchmark.py /path/to/evm.log.gz --processes 8
+
+The per command statistics are not compared: the original took a dequeue and a total time sample
+of every message, 0 for the messages still on the queue at the end of the log, the analyzer only
+samples the messages which were taken off the queue, respectively delivered. For the same reason
+the minimum dequeue time of the hourly buckets is not compared: the 0 of a message never taken off
+the queue reset the original's minimum, which then depended on the order of its message dict.
+"""
+import argparse
+import gzip
+import os
+import random
+import re
+import resource
+import shutil
+import subprocess
+import tempfile
+from concurrent import futures
+from datetime import datetime, timedelta
+from time import time
+
+from cfme.utils import perf_message_stats as stats
+
+MSG_FILTERS = {
+    '-hourly': r'\"[0-9\-]*T[0-9\:]*Z\",\s\"hourly\"',
+    '-daily': r'\"[0-9\-]*T[0-9\:]*Z\",\s\"daily\"',
+    '-EmsVmware': r'\[\[\"EmsVmware\"\,\s[0-9]*\]\]',
+}
+COMMANDS = ['MiqEvent.raise_evm_event', 'Metric::Rollup.rollup_realtime',
+            'VmVmware.perf_capture_realtime', 'EmsRefresh.refresh']
+PREFIX = '[----] I, [{ts} #{pid}:2ac8a0a1f3f4]  INFO -- : '
+
+
+def generate_log(path, num_messages):
+    """Write an evm.log with ``num_messages`` messages going through put/get/delivered"""
+    rnd = random.Random(42)
+    now = datetime(2017, 11, 1, 22, 0)
+    in_flight = []
+
+    def line(text, pid=1000):
+        return PREFIX.format(ts=now.strftime('%Y-%m-%dT%H:%M:%S.%f'), pid=pid) + text + '\n'
+
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'wb') as log:
+        for worker_id in range(1, 11):
+            log.write(line('MIQ(MiqPriorityWorker) ID [{}], PID [{}], GUID [x], Zone [default], '
+                           'Active Roles [], Assigned Roles [], Configuration:'.format(
+                               worker_id, 2000 + worker_id)).encode('utf-8'))
+        for msg_id in range(1, num_messages + 1):
+            now += timedelta(milliseconds=rnd.randint(1, 200))
+            args = rnd.choice(['[["EmsVmware", 1]]', '[]', '["2017-11-01T22:00:00Z", "hourly"]'])
+            log.write(line(
+                'MIQ(MiqQueue.put) Message id: [{}],  id: [], Zone: [default], Role: [ems], '
+                'Server: [], Ident: [generic], Target id: [], Instance id: [{}], Task id: [], '
+                'Command: [{}], Timeout: [600], Priority: [100], State: [ready], '
+                'Deliver On: [], Data: [], Args: [{}]'.format(
+                    msg_id, msg_id % 97, rnd.choice(COMMANDS), args)).encode('utf-8'))
+            for _ in range(rnd.randint(2, 6)):
+                log.write(line('MIQ(ManageIQ::Providers::Vmware::InfraManager::Refresher#refresh)'
+                               ' Refreshing all targets...').encode('utf-8'))
+            in_flight.append(msg_id)
+            if len(in_flight) > 20:
+                done = in_flight.pop(rnd.randrange(len(in_flight)))
+                log.write(line(
+                    'MIQ(MiqQueue.get_via_drb) Message id: [{}], MiqWorker id: [3], Zone: '
+                    '[default], Role: [ems], Server: [], Ident: [generic], Target id: [], '
+                    'Instance id: [], Task id: [], Command: [x], Timeout: [600], '
+                    'Priority: [100], State: [dequeue], Deliver On: [], Data: [], Args: [], '
+                    'Dequeued in: [{:.6f}] seconds'.format(done, rnd.random() * 5),
+                    pid=1200).encode('utf-8'))
+                log.write(line(
+                    'MIQ(MiqQueue.delivered) Message id: [{}], State: [ok], Delivered in '
+                    '[{:.6f}] seconds'.format(done, rnd.random() * 20), pid=1200).encode('utf-8'))
+        log.write(line('MIQ(MiqServer#stop_worker) Worker exiting. ID [3]').encode('utf-8'))
+
+
+# The original parsers, as perf_message_stats had them before analyze_evm_log
+# [----] .* MIQ( * )
+miqmsg = re.compile(r'\[----\].*MIQ\(([a-zA-Z0-9\._]*)\)')
+# Command: [ * ]
+miqmsg_cmd = re.compile(r'Command:\s\[([a-zA-Z0-9\._\:]*)\]')
+# Message id: [ * ]
+miqmsg_id = re.compile(r'Message\sid:\s\[([0-9]*)\]')
+# Args: [ *]
+miqmsg_args = re.compile(
+    r'Args:\s\[([A-Za-z0-9\{\}\(\)\[\]\s\\\-\:\"\'\,\=\<\>\_\/\.\@\?\%\&\#]*)\]')
+# Dequeued in: [ * ] seconds
+miqmsg_deq = re.compile(r'Dequeued\sin:\s\[([0-9\.]*)\]\sseconds')
+# Delivered in [ * ] seconds
+miqmsg_del = re.compile(r'Delivered\sin\s\[([0-9\.]*)\]\sseconds')
+
+
+def evm_to_messages(evm_file, filters):
+    test_start = ''
+    test_end = ''
+    line_count = 0
+    messages = {}
+    msg_cmds = {}
+
+    runningtime = time()
+    evmlogfile = open(evm_file, 'r')
+    evm_log_line = evmlogfile.readline()
+    while evm_log_line:
+        line_count += 1
+        evm_log_line = evm_log_line.strip()
+
+        miqmsg_result = miqmsg.search(evm_log_line)
+        if miqmsg_result:
+
+            # Obtains the first timestamp in the log file
+            if test_start == '':
+                ts, pid = stats.get_msg_timestamp_pid(evm_log_line)
+                test_start = ts
+
+            # A message was first put on the queue, this starts its queuing time
+            if (miqmsg_result.group(1) == 'MiqQueue.put'):
+
+                msg_cmd = get_msg_cmd(evm_log_line)
+                msg_id = get_msg_id(evm_log_line)
+                if msg_id:
+                    ts, pid = stats.get_msg_timestamp_pid(evm_log_line)
+                    test_end = ts
+                    messages[msg_id] = stats.MiqMsgStat()
+                    messages[msg_id].msg_id = msg_id
+                    messages[msg_id].msg_id = '\'' + msg_id + '\''
+                    messages[msg_id].msg_cmd = msg_cmd
+                    messages[msg_id].pid_put = pid
+                    messages[msg_id].puttime = ts
+                    msg_args = get_msg_args(evm_log_line)
+                    if msg_args is False:
+                        stats.logger.debug('Could not obtain message args line #: %s', line_count)
+                    else:
+                        messages[msg_id].msg_args = msg_args
+                else:
+                    stats.logger.error('Could not obtain message id, line #: %s', line_count)
+
+            elif (miqmsg_result.group(1) == 'MiqQueue.get_via_drb'):
+                msg_id = get_msg_id(evm_log_line)
+                if msg_id:
+                    if msg_id in messages:
+                        ts, pid = stats.get_msg_timestamp_pid(evm_log_line)
+                        test_end = ts
+                        messages[msg_id].pid_get = pid
+                        messages[msg_id].gettime = ts
+                        messages[msg_id].deq_time = get_msg_deq(evm_log_line)
+                    else:
+                        stats.logger.error('Message ID not in dictionary: %s', msg_id)
+                else:
+                    stats.logger.error('Could not obtain message id, line #: %s', line_count)
+
+            elif (miqmsg_result.group(1) == 'MiqQueue.delivered'):
+                msg_id = get_msg_id(evm_log_line)
+                if msg_id:
+                    ts, pid = stats.get_msg_timestamp_pid(evm_log_line)
+                    test_end = ts
+                    if msg_id in messages:
+                        messages[msg_id].del_time = get_msg_del(evm_log_line)
+                        messages[msg_id].total_time = messages[msg_id].deq_time + \
+                            messages[msg_id].del_time
+                    else:
+                        stats.logger.error('Message ID not in dictionary: %s', msg_id)
+                else:
+                    stats.logger.error('Could not obtain message id, line #: %s', line_count)
+
+        if (line_count % 100000) == 0:
+            timediff = time() - runningtime
+            runningtime = time()
+            stats.logger.info('Count {} : Parsed 100000 lines in %s', line_count, timediff)
+
+        evm_log_line = evmlogfile.readline()
+
+    # I tried to avoid two loops but this reduced the complexity of filtering on messages.
+    # By filtering over messages, we can better display what is occuring under the covers, as a
+    # daily rollup is picked up off the queue different than a hourly rollup, etc
+    for msg in sorted(messages.keys()):
+        msg_args = messages[msg].msg_args
+        # Determine if the pattern matches and append to the command if it does
+        for p_filter in filters:
+            results = filters[p_filter].search(msg_args.strip())
+            if results:
+                messages[msg].msg_cmd = '{}{}'.format(messages[msg].msg_cmd, p_filter)
+                break
+        msg_cmd = messages[msg].msg_cmd
+        if msg_cmd not in msg_cmds:
+            msg_cmds[msg_cmd] = {}
+            msg_cmds[msg_cmd]['total'] = []
+            msg_cmds[msg_cmd]['queue'] = []
+            msg_cmds[msg_cmd]['execute'] = []
+        if messages[msg].total_time != 0:
+            msg_cmds[msg_cmd]['total'].append(round(messages[msg].total_time, 2))
+            msg_cmds[msg_cmd]['queue'].append(round(messages[msg].deq_time, 2))
+            msg_cmds[msg_cmd]['execute'].append(round(messages[msg].del_time, 2))
+
+    return messages, msg_cmds, test_start, test_end, line_count
+
+
+def evm_to_workers(evm_file):
+    # Use grep to reduce # of lines to sort through
+    p = subprocess.Popen(['grep', 'Interrupt\\|MIQ([A-Za-z]*) ID\\|"evm_worker_uptime_exceeded\\|'
+            '"evm_worker_memory_exceeded\\|"evm_worker_stop\\|Worker exiting.', evm_file],
+            stdout=subprocess.PIPE, universal_newlines=True)
+    greppedevmlog, err = p.communicate()
+    greppedevmlog = greppedevmlog.strip()
+
+    evmlines = greppedevmlog.split('\n')
+
+    workers = {}
+    wkr_upt_exc = 0
+    wkr_mem_exc = 0
+    wkr_stp = 0
+    wkr_int = 0
+    wkr_ext = 0
+    for evm_log_line in evmlines:
+        ts, pid = stats.get_msg_timestamp_pid(evm_log_line)
+
+        miqwkr_result = stats.miqwkr.search(evm_log_line)
+        if miqwkr_result:
+            workerid = int(miqwkr_result.group(2))
+            if workerid not in workers:
+                workers[workerid] = stats.MiqWorker()
+                workers[workerid].worker_type = miqwkr_result.group(1)
+                workers[workerid].pid = miqwkr_result.group(3)
+                workers[workerid].worker_id = int(workerid)
+                workers[workerid].start_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
+        elif 'evm_worker_uptime_exceeded' in evm_log_line:
+            miqwkr_id_result = stats.miqwkr_id.search(evm_log_line)
+            if miqwkr_id_result:
+                workerid = int(miqwkr_id_result.group(1))
+                if workerid in workers:
+                    if not workers[workerid].terminated:
+                        wkr_upt_exc += 1
+                        workers[workerid].terminated = 'evm_worker_uptime_exceeded'
+                        workers[workerid].end_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
+        elif 'evm_worker_memory_exceeded' in evm_log_line:
+            miqwkr_id_result = stats.miqwkr_id.search(evm_log_line)
+            if miqwkr_id_result:
+                workerid = int(miqwkr_id_result.group(1))
+                if workerid in workers:
+                    if not workers[workerid].terminated:
+                        wkr_mem_exc += 1
+                        workers[workerid].terminated = 'evm_worker_memory_exceeded'
+                        workers[workerid].end_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
+        elif 'evm_worker_stop' in evm_log_line:
+            miqwkr_id_result = stats.miqwkr_id.search(evm_log_line)
+            if miqwkr_id_result:
+                workerid = int(miqwkr_id_result.group(1))
+                if workerid in workers:
+                    if not workers[workerid].terminated:
+                        wkr_stp += 1
+                        workers[workerid].terminated = 'evm_worker_stop'
+                        workers[workerid].end_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
+        elif 'Interrupt' in evm_log_line:
+            for workerid in workers:
+                if not workers[workerid].end_ts:
+                    wkr_int += 1
+                    workers[workerid].terminated = 'Interrupted'
+                    workers[workerid].end_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
+        elif 'Worker exiting.' in evm_log_line:
+            miqwkr_id_2_result = stats.miqwkr_id_2.search(evm_log_line)
+            if miqwkr_id_2_result:
+                workerid = int(miqwkr_id_2_result.group(1))
+                if workerid in workers:
+                    if not workers[workerid].terminated:
+                        wkr_ext += 1
+                        workers[workerid].terminated = 'Worker Exited'
+                        workers[workerid].end_ts = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S.%f')
+
+    return workers, wkr_mem_exc, wkr_upt_exc, wkr_stp, wkr_int, wkr_ext, len(evmlines)
+
+
+# Streaming analysis
+# evm_to_messages/evm_to_workers keep every message as an object, grep the log a second time and
+# bucket the messages in a third pass. The functions below scan each line of the log once and
+# keep the messages in array backed columns. The scan is stateless, so a log can be split into
+# chunks parsed in a process pool, the records are then fed to a MessageAnalyzer in log order.
+
+# Everything evm_to_messages needs from a MiqQueue line, in one regex
+miqqueue_line = re.compile(
+    r'\[----\]\s[IWE],\s\[([0-9\-]+)T([0-9\:\.]+)\s#([0-9]+):[0-9a-z]+\]'
+    r'.*?MIQ\(MiqQueue\.(?:'
+    r'(put)\)\sMessage\sid:\s\[([0-9]*)\](?:.*?Command:\s\[([a-zA-Z0-9\._\:]*)\])?'
+    r'(?:.*Args:\s\[([A-Za-z0-9\{\}\(\)\[\]\s\\\-\:\"\'\,\=\<\>\_\/\.\@\?\%\&\#]*)\])?'
+    r'|(get_via_drb)\)\sMessage\sid:\s\[([0-9]*)\].*Dequeued\sin:\s\[([0-9\.]*)\]\sseconds'
+    r'|(delivered)\)\sMessage\sid:\s\[([0-9]*)\].*Delivered\sin\s\[([0-9\.]*)\]\sseconds)')
+
+# Record kinds yielded by parse_evm_lines
+MSG_PUT, MSG_GET, MSG_DELIVERED, WORKER_START, WORKER_END, WORKER_INTERRUPT = range(6)
+# Worker termination reasons, in the order evm_to_workers checks them
+WORKER_REASONS = ('evm_worker_uptime_exceeded', 'evm_worker_memory_exceeded', 'evm_worker_stop')
+# Bytes of (decompressed) log per chunk handed to a parser process
+EVM_CHUNK_SIZE = 16 * 1024 * 1024
+
+_EPOCH = datetime(1970, 1, 1)
+_HOUR_US = 3600 * 1000000
+# caches of date -> days since the epoch and of hours since the epoch -> (date, hour)
+_epoch_days = {}
+_epoch_hours = {}
+
+
+def messages_to_hourly_buckets(messages, test_start, test_end):
+    hr_bkt = {}
+    # Hour buckets look like: hr_bkt[msg_cmd][msg_date][msg_hour] = MiqMsgBucket()
+    for msg in messages:
+        # put on queue, deals with queuing:
+        msg_cmd = messages[msg].msg_cmd
+        putdate = messages[msg].puttime[:10]
+        puthour = messages[msg].puttime[11:13]
+        if msg_cmd not in hr_bkt:
+            hr_bkt[msg_cmd] = stats.provision_hour_buckets(test_start, test_end)
+
+        hr_bkt[msg_cmd][putdate][puthour].total_put += 1
+        hr_bkt[msg_cmd][putdate][puthour].sum_deq += messages[msg].deq_time
+        if (hr_bkt[msg_cmd][putdate][puthour].min_deq == 0 or
+                hr_bkt[msg_cmd][putdate][puthour].min_deq > messages[msg].deq_time):
+            hr_bkt[msg_cmd][putdate][puthour].min_deq = messages[msg].deq_time
+        if (hr_bkt[msg_cmd][putdate][puthour].max_deq == 0 or
+                hr_bkt[msg_cmd][putdate][puthour].max_deq < messages[msg].deq_time):
+            hr_bkt[msg_cmd][putdate][puthour].max_deq = messages[msg].deq_time
+        hr_bkt[msg_cmd][putdate][puthour].avg_deq = \
+            hr_bkt[msg_cmd][putdate][puthour].sum_deq / hr_bkt[msg_cmd][putdate][puthour].total_put
+
+        # Get time is when the message is delivered
+        getdate = messages[msg].gettime[:10]
+        gethour = messages[msg].gettime[11:13]
+
+        hr_bkt[msg_cmd][getdate][gethour].total_get += 1
+        hr_bkt[msg_cmd][getdate][gethour].sum_del += messages[msg].del_time
+        if (hr_bkt[msg_cmd][getdate][gethour].min_del == 0 or
+                hr_bkt[msg_cmd][getdate][gethour].min_del > messages[msg].del_time):
+            hr_bkt[msg_cmd][getdate][gethour].min_del = messages[msg].del_time
+        if (hr_bkt[msg_cmd][getdate][gethour].max_del == 0 or
+                hr_bkt[msg_cmd][getdate][gethour].max_del < messages[msg].del_time):
+            hr_bkt[msg_cmd][getdate][gethour].max_del = messages[msg].del_time
+
+        hr_bkt[msg_cmd][getdate][gethour].avg_del = \
+            hr_bkt[msg_cmd][getdate][gethour].sum_del / hr_bkt[msg_cmd][getdate][gethour].total_get
+    return hr_bkt
+
+
+def get_msg_args(log_line):
+    miqmsg_args_result = miqmsg_args.search(log_line)
+    if miqmsg_args_result:
+        return miqmsg_args_result.group(1)
+    else:
+        return False
+
+
+def get_msg_cmd(log_line):
+    miqmsg_cmd_result = miqmsg_cmd.search(log_line)
+    if miqmsg_cmd_result:
+        return miqmsg_cmd_result.group(1)
+    else:
+        return False
+
+
+def get_msg_del(log_line):
+    miqmsg_del_result = miqmsg_del.search(log_line)
+    if miqmsg_del_result:
+        return float(miqmsg_del_result.group(1))
+    else:
+        return False
+
+
+def get_msg_deq(log_line):
+    miqmsg_deq_result = miqmsg_deq.search(log_line)
+    if miqmsg_deq_result:
+        return float(miqmsg_deq_result.group(1))
+    else:
+        return False
+
+
+def get_msg_id(log_line):
+    miqmsg_id_result = miqmsg_id.search(log_line)
+    if miqmsg_id_result:
+        return miqmsg_id_result.group(1)
+    else:
+        return False
+
+
+def run_original(evm_file, processes):
+    filters = {key: re.compile(value) for key, value in MSG_FILTERS.items()}
+    messages, msg_cmds, test_start, test_end, line_count = evm_to_messages(evm_file, filters)
+    hr_bkt = messages_to_hourly_buckets(messages, test_start, test_end)
+    workers = evm_to_workers(evm_file)
+    return messages.values(), hr_bkt, workers, line_count
+
+
+def summarize_original(result):
+    messages, hr_bkt, workers, line_count = result
+    workers, wkr_mem_exc, wkr_upt_exc, wkr_stp, wkr_int, wkr_ext = workers[:6]
+    worker_counts = {
+        'evm_worker_memory_exceeded': wkr_mem_exc, 'evm_worker_uptime_exceeded': wkr_upt_exc,
+        'evm_worker_stop': wkr_stp, 'Interrupted': wkr_int, 'Worker Exited': wkr_ext}
+    return summarize(messages, hr_bkt, workers, worker_counts, line_count)
+
+
+def run_streaming(evm_file, processes):
+    filters = {key: stats.re.compile(value) for key, value in MSG_FILTERS.items()}
+    analyzer = stats.analyze_evm_log(evm_file, filters, processes=processes)
+    return analyzer, analyzer.hourly_buckets()
+
+
+def summarize_streaming(result):
+    analyzer, hr_bkt = result
+    return summarize(analyzer.iter_messages(), hr_bkt, analyzer.workers, analyzer.worker_counts,
+                     analyzer.line_count)
+
+
+def rounded(values):
+    # the timings are summed up in a different order
+    return tuple(round(value, 6) if isinstance(value, float) else value for value in values)
+
+
+def summarize(messages, hr_bkt, workers, worker_counts, line_count):
+    """What the runs must agree on"""
+    buckets = {}
+    for cmd, dates in hr_bkt.items():
+        for date, hours in dates.items():
+            for hour, bucket in hours.items():
+                # the two provision the empty hours from slightly different start times
+                if bucket.total_put or bucket.total_get:
+                    buckets[cmd, date, hour] = rounded(
+                        value for key, value in bucket if key != 'min_deq')
+    return {
+        'lines': line_count,
+        'messages': sorted(rounded(value for _, value in msg) for msg in messages),
+        'buckets': buckets,
+        'workers': {worker_id: tuple(worker) for worker_id, worker in workers.items()},
+        'worker_counts': worker_counts,
+    }
+
+
+RUNS = {
+    'original': (run_original, summarize_original),
+    'streaming': (run_streaming, summarize_streaming),
+}
+
+
+def measure(name, evm_file, processes):
+    run, summarize_run = RUNS[name]
+    starttime = time()
+    result = run(evm_file, processes)
+    elapsed = time() - starttime
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return summarize_run(result), elapsed, max_rss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('evm_file', nargs='?', help='evm.log to parse')
+    parser.add_argument('--generate', type=int, default=100000,
+                        help='number of messages in the generated log if no file is given')
+    parser.add_argument('--processes', type=int, default=4, help='parser processes')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='perf-evm-bench')
+    try:
+        evm_file = args.evm_file
+        if evm_file is None:
+            evm_file = os.path.join(tmpdir, 'evm.log')
+            generate_log(evm_file, args.generate)
+        runs = [('original', 1), ('streaming', 1), ('streaming', args.processes)]
+        if evm_file.endswith('.gz'):
+            # the original implementation only reads plain logs
+            runs = runs[1:]
+        reference = None
+        for name, processes in runs:
+            # a fresh process each, so the peak memory is not shared
+            with futures.ProcessPoolExecutor(1) as executor:
+                summary, elapsed, max_rss = executor.submit(
+                    measure, name, evm_file, processes).result()
+            print('{:>10} x{}: {} lines, {} messages, {} workers in {:.2f}s, '
+                  'peak RSS {:.0f} MiB'.format(name, processes, summary['lines'],
+                                               len(summary['messages']), len(summary['workers']),
+                                               elapsed, max_rss / 1024.))
+            if reference is None:
+                reference = name, summary
+                continue
+            for key, value in reference[1].items():
+                assert summary[key] == value, '{} x{} and {} disagree on the {}'.format(
+                    name, processes, reference[0], key)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python2
+"""Benchmark list_providers filtering the way test collection does it
+
+Multiplies the providers of ``cfme_data`` into a large generated provider list and filters it
+for many parametrized test functions, with the original crud-per-provider filtering and with
+:py:class:`cfme.utils.providers.ProviderCatalog`::
+
+    scripts/provider_filter_benchmark.py --providers 500 --tests 2000
+"""
+import argparse
+import random
+from collections import OrderedDict
+from time import time
+
+from cfme.common.provider import BaseProvider, base_types
+from cfme.utils import providers
+from cfme.utils.providers import ProviderFilter, get_crud, global_filters, list_providers
+
+
+def generate_providers(count):
+    """Clones of the configured providers, with shuffled tags and excluded test flags"""
+    rnd = random.Random(42)
+    originals = list(providers.providers_data.items())
+    if not originals:
+        raise SystemExit('No providers in cfme_data to generate the provider list from')
+    data = OrderedDict()
+    for i in range(count):
+        key, prov_data = originals[i % len(originals)]
+        prov_data = prov_data.copy()
+        prov_data['name'] = '{} {}'.format(prov_data.get('name', key), i)
+        prov_data['tags'] = rnd.sample(['default', 'disabled', 'complete', 'ha', 'smoke'], 2)
+        if rnd.random() < 0.3:
+            prov_data['excluded_test_flags'] = 'provision'
+        data['{}-{}'.format(key, i)] = prov_data
+    return data
+
+
+def generate_filters(count):
+    """Filters of the parametrized tests, many tests share the same ones"""
+    rnd = random.Random(0)
+    classes = list(base_types().values()) + [BaseProvider]
+    flags = [[], ['provision'], ['retire'], ['provision', 'retire']]
+    return [
+        [ProviderFilter(classes=[rnd.choice(classes)]),
+         ProviderFilter(required_flags=rnd.choice(flags))]
+        for _ in range(count)]
+
+
+def original_list_providers(filters):
+    filters = filters + list(global_filters.values())
+    provs = [get_crud(prov_key) for prov_key in providers.providers_data]
+    for prov_filter in filters:
+        provs = list(filter(prov_filter, provs))
+    return provs
+
+
+def measure(name, func, test_filters):
+    starttime = time()
+    keys = [[prov.key for prov in func(filters)] for filters in test_filters]
+    elapsed = time() - starttime
+    print('{:>10}: {} list_providers calls in {:.2f}s'.format(name, len(test_filters), elapsed))
+    return keys
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--providers', type=int, default=500, help='number of providers')
+    parser.add_argument('--tests', type=int, default=2000,
+                        help='number of parametrized test functions')
+    args = parser.parse_args()
+
+    providers.providers_data = generate_providers(args.providers)
+    global_filters['use_provider'] = ProviderFilter(
+        keys=['complete'], required_tags=['complete'], conjunctive=False)
+    test_filters = generate_filters(args.tests)
+    original = measure('original', original_list_providers, test_filters)
+    catalog = measure('catalog', list_providers, test_filters)
+    assert original == catalog, 'the catalog lists different providers'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python2
+"""Benchmark the setup and teardown of the REST fixtures against a local stub of the REST API
+
+Serves a stub of the ManageIQ REST API with a ``categories`` collection already holding many
+resources. New resources only show up a while after they are created, like on an appliance. The
+fixtures create a few resources and delete them again, with the original serial waiting and
+collection reloading and with the batched helpers of :py:mod:`cfme.utils.rest`::
+
+    scripts/rest_fixture_benchmark.py --existing 2000 --entities 5 --visible-after 1.5
+"""
+import argparse
+import json
+import re
+import threading
+from time import sleep, time
+
+from manageiq_client.api import ManageIQClient as MiqApi
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import parse_qs, urlparse
+
+from cfme.utils.rest import create_resource, delete_resources_by_id
+from cfme.utils.wait import wait_for
+
+FILTER_RE = re.compile(r'^(or )?(\w+) = ["\']?(.*?)["\']?$')
+
+
+class StubApi(object):
+    """State of the stub, a collection of categories"""
+    def __init__(self, existing, visible_after, latency):
+        self.visible_after = visible_after
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.resources = {}
+        self.last_id = 0
+        for i in range(existing):
+            self.add({'name': 'category_{}'.format(i), 'description': 'category {}'.format(i)})
+
+    def add(self, data, visible_at=0):
+        self.last_id += 1
+        data = dict(data, id=str(self.last_id))
+        self.resources[data['id']] = (visible_at, data)
+        return data
+
+    def visible(self):
+        now = time()
+        return [data for visible_at, data in self.resources.values() if visible_at <= now]
+
+    def matching(self, filters):
+        resources = self.visible()
+        if not filters:
+            return resources
+        matched = []
+        for resource in resources:
+            result = None
+            for expr in filters:
+                is_or, attr, value = FILTER_RE.match(expr).groups()
+                pattern = re.escape(value).replace('\\%', '.*').replace('%', '.*')
+                found = re.match('^{}$'.format(pattern), str(resource.get(attr, ''))) is not None
+                result = found if result is None else (
+                    result or found if is_or else result and found)
+            if result:
+                matched.append(resource)
+        return matched
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, data):
+        sleep(self.server.api.latency)
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _href(self, *parts):
+        return '/'.join(['http://{}:{}/api'.format(*self.server.server_address)] + list(parts))
+
+    def _resource(self, data, attributes=None):
+        if attributes:
+            resource = {key: data[key] for key in attributes if key in data}
+        else:
+            resource = dict(data)
+        resource.update(id=data['id'], href=self._href('categories', data['id']))
+        return resource
+
+    def do_GET(self):
+        api = self.server.api
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        with api.lock:
+            api.requests += 1
+            if url.path == '/api':
+                return self._reply({'version': '2.5.0', 'collections': [
+                    {'name': 'categories', 'href': self._href('categories'),
+                     'description': 'Categories'}]})
+            if url.path.startswith('/api/categories/'):
+                visible_at, data = api.resources[url.path.rsplit('/', 1)[-1]]
+                return self._reply(self._resource(data))
+            resources = api.matching(params.get('filter[]'))
+            attributes = params['attributes'][0].split(',') if 'attributes' in params else None
+            if 'expand' in params:
+                resources = [self._resource(data, attributes) for data in resources]
+            else:
+                resources = [{'href': self._href('categories', data['id'])}
+                             for data in resources]
+            return self._reply({
+                'name': 'categories', 'count': len(api.resources), 'subcount': len(resources),
+                'resources': resources,
+                'actions': [{'name': name, 'method': 'post', 'href': self._href('categories')}
+                            for name in ('create', 'delete')]})
+
+    def do_POST(self):
+        api = self.server.api
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with api.lock:
+            api.requests += 1
+            results = []
+            for resource in payload.get('resources', []):
+                if payload['action'] == 'create':
+                    data = api.add(resource, visible_at=time() + api.visible_after)
+                    results.append(self._resource(data))
+                else:
+                    resource_id = resource.get('id') or resource['href'].rsplit('/', 1)[-1]
+                    found = api.resources.pop(str(resource_id), None) is not None
+                    results.append({'success': found, 'message': 'deleted'})
+            return self._reply({'results': results})
+
+
+class StubServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class FakeRequest(object):
+    def __init__(self):
+        self.finalizers = []
+
+    def addfinalizer(self, finalizer):
+        self.finalizers.append(finalizer)
+
+    def teardown(self):
+        for finalizer in reversed(self.finalizers):
+            finalizer()
+
+
+def original_create_resource(rest_api, col_name, col_data):
+    collection = getattr(rest_api.collections, col_name)
+    entities = collection.action.create(*col_data)
+    for entity in col_data:
+        wait_for(lambda: collection.find_by(name=entity.get('name')) or False,
+                 num_sec=180, delay=10)
+    return entities
+
+
+def original_creating_skeleton(request, rest_api, col_name, col_data):
+    entities = original_create_resource(rest_api, col_name, col_data)
+    original_entities = list(entities)
+
+    @request.addfinalizer
+    def _finished():
+        collection = getattr(rest_api.collections, col_name)
+        collection.reload()
+        ids = [e.id for e in original_entities]
+        delete_entities = [e for e in collection if e.id in ids]
+        if delete_entities:
+            collection.action.delete(*delete_entities)
+
+    return entities
+
+
+def batched_creating_skeleton(request, rest_api, col_name, col_data):
+    entities = create_resource(rest_api, col_name, col_data)
+    original_entities = list(entities)
+
+    @request.addfinalizer
+    def _finished():
+        collection = getattr(rest_api.collections, col_name)
+        delete_resources_by_id(collection, [e.id for e in original_entities])
+
+    return entities
+
+
+def measure(name, skeleton, api, rest_api, entities):
+    requests_before = api.requests
+    col_data = [{'name': 'test_category_{}_{}'.format(name, i),
+                 'description': 'test category {}'.format(i)} for i in range(entities)]
+    request = FakeRequest()
+    starttime = time()
+    skeleton(request, rest_api, 'categories', col_data)
+    setup = time() - starttime
+    starttime = time()
+    request.teardown()
+    teardown = time() - starttime
+    left = [data for data in api.visible() if data['name'].startswith('test_category_')]
+    assert not left, 'the fixture left resources behind'
+    print('{:>10}: setup {:.2f}s, teardown {:.2f}s, {} requests'.format(
+        name, setup, teardown, api.requests - requests_before))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--existing', type=int, default=2000,
+                        help='number of resources already in the collection')
+    parser.add_argument('--entities', type=int, default=5,
+                        help='number of resources created by the fixture')
+    parser.add_argument('--visible-after', type=float, default=1.5,
+                        help='seconds before a created resource shows up')
+    parser.add_argument('--latency', type=float, default=0.01,
+                        help='seconds the stub takes to answer a request')
+    args = parser.parse_args()
+
+    api = StubApi(args.existing, args.visible_after, args.latency)
+    server = StubServer(('127.0.0.1', 0), StubHandler)
+    server.api = api
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        rest_api = MiqApi('http://{}:{}/api'.format(*server.server_address),
+                          {'user': 'admin', 'password': 'smartvm'})
+        measure('original', original_creating_skeleton, api, rest_api, args.entities)
+        measure('batched', batched_creating_skeleton, api, rest_api, args.entities)
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -46,10 +46,9 @@ def main(trackerbot_url, mark_usable=None, selected_provider=None):
     else:
         usable = {'usable': mark_usable}
 
-    existing_provider_templates = [
-        pt['id']
-        for pt
-        in trackerbot.depaginate(api, api.providertemplate.get())['objects']]
+    page_cache = trackerbot.page_cache()
+    existing_provider_templates = {
+        pt['id'] for pt in trackerbot.iter_objects(api, 'providertemplate', cache=page_cache)}
 
     # Find some templates and update the API
     for template_name, providers in template_providers.items():
@@ -90,7 +89,7 @@ def main(trackerbot_url, mark_usable=None, selected_provider=None):
 
     # Remove provider relationships where they no longer exist, skipping unresponsive providers,
     # and providers not known to this environment
-    for pt in trackerbot.depaginate(api, api.providertemplate.get())['objects']:
+    for pt in list(trackerbot.iter_objects(api, 'providertemplate', cache=page_cache)):
         key, template_name = pt['provider']['key'], pt['template']['name']
         if key not in template_providers[template_name] and key not in unresponsive_providers:
             if key in all_providers:
@@ -101,7 +100,7 @@ def main(trackerbot_url, mark_usable=None, selected_provider=None):
                             template_name, key)
 
     # Remove templates that aren't on any providers anymore
-    for template in trackerbot.depaginate(api, api.template.get())['objects']:
+    for template in list(trackerbot.iter_objects(api, 'template', cache=page_cache)):
         if not template['providers']:
             logger.info("Deleting template %s (no providers)", template['name'])
             api.template(template['name']).delete()
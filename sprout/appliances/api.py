@@ -262,6 +262,33 @@ def request_check(user, request_id):
     }
 
 
+@jsonapi.authenticated_method
+def request_ready_appliances(user, request_id, known=None):
+    """Return the appliances of the pool which became ready since the previous call
+
+    Pass the ids of the appliances received so far in ``known``, only the other ready appliances
+    are returned, so the tests can start on the first ready appliance of the pool.
+    """
+    request = AppliancePool.objects.get(id=request_id)
+    if user != request.owner and not user.is_staff:
+        raise Exception("This pool belongs to a different user!")
+    known = set(known or [])
+    appliances = list(request.appliances)
+    return {
+        "fulfilled": all(appliance.ready for appliance in appliances),
+        "finished": request.finished,
+        "progress": int(round(request.percent_finished * 100)),
+        "total_count": request.total_count,
+        "pending": [appliance.id for appliance in appliances if not appliance.ready],
+        "appliances": [
+            appliance.serialized
+            for appliance
+            in appliances
+            if appliance.ready and appliance.id not in known
+        ],
+    }
+
+
 @jsonapi.authenticated_method
 def prolong_appliance_lease(user, id, minutes=60):
     """Prolongs the appliance's lease time by specified amount of minutes from current time."""
@@ -396,6 +423,22 @@ def destroy_appliance(user, appliance):
         return None
 
 
+@jsonapi.authenticated_method
+def replace_appliance(user, appliance, minutes=60):
+    """Destroy the appliance and provision another one into its pool.
+
+    You can specify appliance by IP address, id or name. If the kill task was called, id is
+    returned, otherwise None.
+    """
+    appliance = get_appliance(appliance, user)
+    if appliance.appliance_pool is None:
+        raise Exception("Appliance {} is not in a pool!".format(appliance.name))
+    try:
+        return Appliance.kill(appliance, replace_in_pool=True, minutes=minutes).task_id
+    except AttributeError:  # None was returned
+        return None
+
+
 @jsonapi.method
 def power_state(appliance):
     """Return appliance's current power state.
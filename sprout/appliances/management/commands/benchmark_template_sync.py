@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the trackerbot template synchronization against a fake trackerbot.
+
+Everything is done in a transaction that is rolled back at the end, so the database is left as it
+was::
+
+    ./manage.py benchmark_template_sync --templates 10000
+"""
+import logging
+import random
+from datetime import date, timedelta
+from time import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from appliances.models import Provider
+from appliances.template_sync import TemplateSync
+from cfme.utils.trackerbot import iter_objects
+
+
+class FakeTrackerbot(object):
+    """Serves a generated provider template list the way the trackerbot API (slumber) does"""
+    def __init__(self, objects):
+        self.objects = objects
+
+    @property
+    def providertemplate(self):
+        return self
+
+    def get(self, limit=100, offset=0):
+        offset, limit = int(offset), int(limit)
+        end = offset + limit
+        return {
+            'meta': {
+                'limit': limit, 'offset': offset, 'total_count': len(self.objects),
+                'next': '/api/providertemplate/?limit={}&offset={}'.format(limit, end)
+                if end < len(self.objects) else None},
+            'objects': self.objects[offset:end]}
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the trackerbot template synchronization on a fake trackerbot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--templates', type=int, default=10000,
+                            help='Number of provider templates trackerbot knows about')
+        parser.add_argument('--providers', type=int, default=20)
+        parser.add_argument('--groups', type=int, default=5)
+        parser.add_argument('--changed', type=float, default=0.01,
+                            help='Fraction of the templates changed for the incremental run')
+
+    def generate(self, templates, providers, groups):
+        rnd = random.Random(42)
+        provider_keys = ['bench-provider-{}'.format(i) for i in range(providers)]
+        per_provider = {key: [] for key in provider_keys}
+        objects = []
+        for i in range(templates):
+            provider_key = provider_keys[i % providers]
+            datestamp = date(2017, 1, 1) + timedelta(days=(i // providers) % 365)
+            name = 'cfme-58{:03d}-{:%Y%m%d}'.format((i // providers) // 365, datestamp)
+            per_provider[provider_key].append(name)
+            objects.append({
+                'provider': {'key': provider_key},
+                'usable': True,
+                'template': {
+                    'name': name,
+                    'group': {'name': 'bench-group-{}'.format(rnd.randrange(groups))},
+                    'datestamp': datestamp.isoformat(),
+                    'ga_released': False,
+                    'custom_data': '{}'}})
+        for provider_key, names in per_provider.items():
+            provider = Provider(id=provider_key, working=True)
+            provider.metadata = {
+                'provider_data': {'type': 'rhevm', 'use_for_sprout': True, 'sprout': {}},
+                'templates': names}
+            provider.save()
+        return objects, provider_keys
+
+    def measure(self, label, api, provider_keys):
+        logger = logging.getLogger('benchmark_template_sync')
+        starttime = time()
+        with CaptureQueriesContext(connection) as queries:
+            objects = list(iter_objects(api, 'providertemplate', limit=100))
+            sync = TemplateSync(objects, logger, management_systems=provider_keys)
+            preconfigured = sync.run()
+        self.stdout.write(
+            '{:>12}: {:.2f}s, {} queries, {} preconfigured to create, {}'.format(
+                label, time() - starttime, len(queries), len(preconfigured), dict(sync.stats)))
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            objects, provider_keys = self.generate(
+                options['templates'], options['providers'], options['groups'])
+            api = FakeTrackerbot(objects)
+            self.measure('initial', api, provider_keys)
+            self.measure('unchanged', api, provider_keys)
+            rnd = random.Random(0)
+            for obj in rnd.sample(objects, int(len(objects) * options['changed'])):
+                if rnd.random() < 0.5:
+                    obj['usable'] = not obj['usable']
+                else:
+                    obj['template']['ga_released'] = not obj['template']['ga_released']
+            self.measure('incremental', api, provider_keys)
+            transaction.set_rollback(True)
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import base64
 import re
+import threading
 import yaml
 import six
 
@@ -18,8 +19,8 @@ from datetime import timedelta, date
 from django.contrib.auth.models import User, Group as DjangoGroup
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import models, transaction
-from django.db.models import Q
-from django.db.models.signals import pre_save
+from django.db.models import Case, Count, Q, Sum, When
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
 from json_field import JSONField
@@ -198,15 +199,29 @@ class Provider(MetadataMixin):
         else:
             return get_mgmt(self.id)
 
+    @property
+    def capacity(self):
+        """:py:class:`ProviderCapacity` of this provider from the current
+        :py:class:`CapacitySnapshot`, None outside of a snapshot"""
+        snapshot = CapacitySnapshot.current()
+        if snapshot is None:
+            return None
+        return snapshot[self.id]
+
     @property
     def num_currently_provisioning(self):
-        return len(
-            Appliance.objects.filter(
-                ready=False, marked_for_deletion=False, template__provider=self, ip_address=None))
+        capacity = self.capacity
+        if capacity is None:
+            return Appliance.objects.filter(
+                template__provider=self, **Appliance.PROVISIONING_FILTER).count()
+        return capacity.provisioning
 
     @property
     def num_templates_preparing(self):
-        return len(Template.objects.filter(provider=self, ready=False))
+        capacity = self.capacity
+        if capacity is None:
+            return Template.objects.filter(provider=self, ready=False).count()
+        return capacity.templates_preparing
 
     @property
     def remaining_configuring_slots(self):
@@ -226,7 +241,10 @@ class Provider(MetadataMixin):
 
     @property
     def num_currently_managing(self):
-        return len(Appliance.objects.filter(template__provider=self))
+        capacity = self.capacity
+        if capacity is None:
+            return Appliance.objects.filter(template__provider=self).count()
+        return capacity.managing
 
     @property
     def currently_managed_appliances(self):
@@ -731,6 +749,9 @@ class Appliance(MetadataMixin):
         Power.UNKNOWN, Power.ORPHANED, Power.CREATION_FAILED, Power.CUSTOMIZATION_FAILED,
         Power.ERROR}
 
+    # Appliances taking up a provisioning slot of their provider
+    PROVISIONING_FILTER = {'ready': False, 'marked_for_deletion': False, 'ip_address': None}
+
     POWER_STATES_MAPPING = {
         # Common to vsphere + rhev
         "suspended": Power.SUSPENDED,
@@ -1036,7 +1057,7 @@ class Appliance(MetadataMixin):
         return len(appliances)
 
     @classmethod
-    def kill(cls, appliance_or_id, force_delete=False):
+    def kill(cls, appliance_or_id, force_delete=False, replace_in_pool=False, minutes=60):
         # Completely delete appliance from provider
         from appliances.tasks import kill_appliance
         if isinstance(appliance_or_id, cls):
@@ -1050,7 +1071,8 @@ class Appliance(MetadataMixin):
                 if not self.marked_for_deletion or force_delete:
                     self.marked_for_deletion = True
                     self.save()
-                    return kill_appliance.delay(self.id)
+                    return kill_appliance.delay(
+                        self.id, replace_in_pool=replace_in_pool, minutes=minutes)
 
     def delete(self, *args, **kwargs):
         # Intercept delete and lessen the number of appliances in the pool
@@ -1137,6 +1159,178 @@ class Appliance(MetadataMixin):
             return None
 
 
+class ProviderCapacity(object):
+    """Appliance and template counts of one provider, see :py:class:`CapacitySnapshot`"""
+    def __init__(self, managing=0, provisioning=0, templates_preparing=0):
+        self.managing = managing
+        self.provisioning = provisioning
+        self.templates_preparing = templates_preparing
+
+
+class CapacitySnapshot(object):
+    """Appliance and template counts of the providers, taken with one aggregate query per table.
+
+    While a snapshot is entered (``with CapacitySnapshot():``), the capacity properties of
+    :py:class:`Provider` (``free``, ``appliance_load``, ``remaining_provisioning_slots``, ...) read
+    from it instead of querying the database on every access. Outside of a snapshot each of them
+    runs the one count it needs. Appliances and templates created, saved in another state (an
+    appliance done provisioning, a template done preparing) or deleted meanwhile in the same
+    thread are counted in, so the decisions made within one task take each other into account.
+    Changes made with ``QuerySet.update`` bypass the model signals and are not.
+
+    Args:
+        provider_ids: Only count these providers. All of them by default.
+    """
+    _local = threading.local()
+
+    def __init__(self, provider_ids=None):
+        self.provider_ids = provider_ids
+
+    @classmethod
+    def current(cls):
+        """The innermost entered snapshot of this thread or ``None``"""
+        stack = getattr(cls._local, 'stack', None)
+        return stack[-1] if stack else None
+
+    def __enter__(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        self._local.stack.append(self)
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self._local.stack.remove(self)
+
+    def _grouped(self, queryset, provider_field):
+        if self.provider_ids is not None:
+            queryset = queryset.filter(**{provider_field + '__in': self.provider_ids})
+        # Clear the ordering, otherwise the default ordering ends up in GROUP BY
+        return queryset.values(provider_field).order_by()
+
+    @cached_property
+    def counts(self):
+        counts = {}
+        appliances = self._grouped(Appliance.objects, 'template__provider').annotate(
+            managing=Count('id'),
+            provisioning=Sum(Case(
+                When(then=1, **Appliance.PROVISIONING_FILTER),
+                default=0, output_field=models.IntegerField())))
+        for row in appliances:
+            counts[row['template__provider']] = ProviderCapacity(
+                managing=row['managing'], provisioning=row['provisioning'])
+        templates = self._grouped(Template.objects.filter(ready=False), 'provider').annotate(
+            preparing=Count('id'))
+        for row in templates:
+            counts.setdefault(row['provider'], ProviderCapacity()).templates_preparing = \
+                row['preparing']
+        return counts
+
+    def __getitem__(self, provider_id):
+        if provider_id not in self.counts:
+            self.counts[provider_id] = ProviderCapacity()
+        return self.counts[provider_id]
+
+    def appliance_changed(self, state, delta):
+        """Count an appliance in (``delta=1``) or out (``delta=-1``)
+
+        Args:
+            state: the ``(template id, provisioning)`` of :py:func:`appliance_capacity_state`
+        """
+        template_id, provisioning = state
+        try:
+            provider_id = Template.objects.values_list('provider', flat=True).get(id=template_id)
+        except ObjectDoesNotExist:
+            # deleted together with its template
+            return
+        capacity = self[provider_id]
+        capacity.managing += delta
+        if provisioning:
+            capacity.provisioning += delta
+
+    def template_changed(self, state, delta):
+        """Count a template in (``delta=1``) or out (``delta=-1``)
+
+        Args:
+            state: the ``(provider id, preparing)`` of :py:func:`template_capacity_state`
+        """
+        provider_id, preparing = state
+        if preparing:
+            self[provider_id].templates_preparing += delta
+
+
+def appliance_capacity_state(appliance):
+    """What the appliance adds to the capacity of its provider, None if not loaded"""
+    fields = appliance.__dict__
+    if any(field not in fields for field in (
+            'template_id', 'ready', 'marked_for_deletion', 'ip_address')):
+        # deferred fields, reading them would query the database
+        return None
+    return appliance.template_id, (
+        not appliance.ready and not appliance.marked_for_deletion and
+        appliance.ip_address is None)
+
+
+def template_capacity_state(template):
+    """What the template adds to the capacity of its provider, None if not loaded"""
+    fields = template.__dict__
+    if 'provider_id' not in fields or 'ready' not in fields:
+        return None
+    return template.provider_id, not template.ready
+
+
+def count_changed(count, state, old_state, created):
+    """Counts a saved instance in, or its change of state, unless its state is unknown"""
+    if created:
+        count(state, 1)
+    elif state != old_state and None not in (state, old_state):
+        count(old_state, -1)
+        count(state, 1)
+
+
+@receiver(post_init, sender=Appliance)
+def remember_appliance_state(sender, instance, **kwargs):
+    instance._capacity_state = appliance_capacity_state(instance)
+
+
+@receiver(post_save, sender=Appliance)
+def count_saved_appliance(sender, instance, created, **kwargs):
+    state = appliance_capacity_state(instance)
+    old_state, instance._capacity_state = instance._capacity_state, state
+    snapshot = CapacitySnapshot.current()
+    if snapshot is not None:
+        count_changed(snapshot.appliance_changed, state, old_state, created)
+
+
+@receiver(post_delete, sender=Appliance)
+def count_deleted_appliance(sender, instance, **kwargs):
+    snapshot = CapacitySnapshot.current()
+    state = appliance_capacity_state(instance)
+    if snapshot is not None and state is not None:
+        snapshot.appliance_changed(state, -1)
+
+
+@receiver(post_init, sender=Template)
+def remember_template_state(sender, instance, **kwargs):
+    instance._capacity_state = template_capacity_state(instance)
+
+
+@receiver(post_save, sender=Template)
+def count_saved_template(sender, instance, created, **kwargs):
+    state = template_capacity_state(instance)
+    old_state, instance._capacity_state = instance._capacity_state, state
+    snapshot = CapacitySnapshot.current()
+    if snapshot is not None:
+        count_changed(snapshot.template_changed, state, old_state, created)
+
+
+@receiver(post_delete, sender=Template)
+def count_deleted_template(sender, instance, **kwargs):
+    snapshot = CapacitySnapshot.current()
+    state = template_capacity_state(instance)
+    if snapshot is not None and state is not None:
+        snapshot.template_changed(state, -1)
+
+
 class AppliancePool(MetadataMixin):
     total_count = models.IntegerField(help_text="How many appliances should be in this pool.")
     group = models.ForeignKey(
@@ -28,17 +28,16 @@ import socket
 
 from appliances.models import (
     Provider, Group, Template, Appliance, AppliancePool, DelayedProvisionTask,
-    MismatchVersionMailer, User, GroupShepherd)
+    MismatchVersionMailer, User, GroupShepherd, CapacitySnapshot)
+from appliances.template_sync import TemplateSync
 from miq_version import Version, TemplateName
 from sprout import settings, redis
 from sprout.irc_bot import send_message
 from sprout.log import create_logger
 
-from cfme.utils import conf
 from cfme.utils.appliance import Appliance as CFMEAppliance
 from cfme.utils.path import project_path
-from cfme.utils.timeutil import parsetime
-from cfme.utils.trackerbot import api, depaginate
+from cfme.utils.trackerbot import api, iter_objects, page_cache
 from cfme.utils.wait import wait_for
 
 
@@ -208,166 +207,16 @@ def kill_appliance_delete(self, appliance_id, _delete_already_issued=False):
 def poke_trackerbot(self):
     """This beat-scheduled task periodically polls the trackerbot if there are any new templates.
     """
-    template_usability = []
     # Extract data from trackerbot
     tbapi = trackerbot()
-    objects = depaginate(tbapi, tbapi.providertemplate().get(limit=TRACKERBOT_PAGINATE))["objects"]
-    per_group = {}
-    for obj in objects:
-        if obj["template"]["group"]["name"] == 'unknown':
-            continue
-        if obj["template"]["group"]["name"] not in per_group:
-            per_group[obj["template"]["group"]["name"]] = []
-
-        per_group[obj["template"]["group"]["name"]].append(obj)
-    # Sort them using the build date
-    for group in per_group.keys():
-        per_group[group] = sorted(
-            per_group[group],
-            reverse=True, key=lambda o: o["template"]["datestamp"])
-    objects = []
-    # And interleave the the groups
-    while any(per_group.values()):
-        for key in per_group.keys():
-            if per_group[key]:
-                objects.append(per_group[key].pop(0))
-    for template in objects:
-        if template["provider"]["key"] not in conf.cfme_data.management_systems.keys():
-            # If we don't use that provider in yamls, set the template as not usable
-            # 1) It will prevent adding this template if not added
-            # 2) It'll mark the template as unusable if it already exists
-            template["usable"] = False
-        template_usability.append(
-            (
-                template["provider"]["key"],
-                template["template"]["name"],
-                template["usable"]
-            )
-        )
-        if not template["usable"]:
-            continue
-        group, create = Group.objects.get_or_create(id=template["template"]["group"]["name"])
-        # Check if the template is already obsolete
-        if group.template_obsolete_days is not None:
-            build_date = parsetime.from_iso_date(template["template"]["datestamp"])
-            if build_date <= (parsetime.today() - timedelta(days=group.template_obsolete_days)):
-                # It is already obsolete, so ignore it
-                continue
-        provider, create = Provider.objects.get_or_create(id=template["provider"]["key"])
-        if not provider.is_working:
-            continue
-        if "sprout" not in provider.provider_data:
-            continue
-        if not provider.provider_data.get("use_for_sprout", False):
-            continue
-        if not provider.provider_type:
-            provider.provider_type = provider.provider_data.get('type')
-            provider.save(update_fields=['provider_type'])
-        template_name = template["template"]["name"]
-        ga_released = template['template']['ga_released']
-        date = TemplateName.parse_template(template_name).datestamp
-
-        # nasty trackerbot slightly corrupts json data and it is parsed in wrong way
-        # as a result
-        custom_data = template['template'].get('custom_data', "{}")
-        processed_custom_data = custom_data.replace("u'", '"').replace("'", '"')
-        processed_custom_data = yaml.safe_load(processed_custom_data)
-
-        if not date:
-            # Not a CFME/MIQ template, ignore it.
-            continue
-        # Original one
-        original_template = None
-        try:
-            original_template = Template.objects.get(
-                provider=provider, template_group=group, original_name=template_name,
-                name=template_name, preconfigured=False)
-            if original_template.ga_released != ga_released:
-                original_template.ga_released = ga_released
-                original_template.save(update_fields=['ga_released'])
-            if provider.provider_type == 'openshift':
-                if original_template.custom_data != custom_data:
-                    original_template.custom_data = processed_custom_data
-                original_template.template_type = Template.OPENSHIFT_POD
-                original_template.container = 'cloudforms-0'
-                original_template.save(update_fields=['custom_data',
-                                                      'container',
-                                                      'template_type'])
-        except ObjectDoesNotExist:
-            if template_name in provider.templates:
-                date = TemplateName.parse_template(template_name).datestamp
-                if date is None:
-                    self.logger.warning(
-                        "Ignoring template {} because it does not have a date!".format(
-                            template_name))
-                    continue
-                template_version = TemplateName.parse_template(template_name).version
-                if template_version is None:
-                    # Make up a faux version
-                    # First 3 fields of version get parsed as a zstream
-                    # therefore ... makes it a "nil" stream
-                    template_version = "...{}".format(date.strftime("%Y%m%d"))
-                with transaction.atomic():
-                    tpl = Template(
-                        provider=provider, template_group=group, original_name=template_name,
-                        name=template_name, preconfigured=False, date=date, ready=True, exists=True,
-                        usable=True, version=template_version)
-                    tpl.save()
-                    if provider.provider_type == 'openshift':
-                        tpl.custom_data = processed_custom_data
-                        tpl.container = 'cloudforms-0'
-                        tpl.template_type = Template.OPENSHIFT_POD
-                        tpl.save(update_fields=['container', 'template_type', 'custom_data'])
-                    original_template = tpl
-                    self.logger.info("Created a new template #{}".format(tpl.id))
-        # If the provider is set to not preconfigure templates, do not bother even doing it.
-        if provider.num_simultaneous_configuring > 0:
-            # Preconfigured one
-            try:
-                # openshift providers don't have preconfigured templates.
-                # so regular template should be used
-                if provider.provider_type != 'openshift':
-                    preconfigured_template = Template.objects.get(
-                        provider=provider, template_group=group, original_name=template_name,
-                        preconfigured=True)
-                else:
-                    preconfigured_template = Template.objects.get(
-                        provider=provider, template_group=group, name=template_name,
-                        preconfigured=True)
-                    preconfigured_template.custom_data = processed_custom_data
-                    preconfigured_template.container = 'cloudforms-0'
-                    preconfigured_template.template_type = Template.OPENSHIFT_POD
-                    preconfigured_template.save(update_fields=['container',
-                                                               'template_type',
-                                                               'custom_data'])
-                if preconfigured_template.ga_released != ga_released:
-                    preconfigured_template.ga_released = ga_released
-                    preconfigured_template.save(update_fields=['ga_released'])
-
-            except ObjectDoesNotExist:
-                if template_name in provider.templates and provider.provider_type != 'openshift':
-                    original_id = original_template.id if original_template is not None else None
-                    create_appliance_template.delay(
-                        provider.id, group.id, template_name, source_template_id=original_id)
-    # If any of the templates becomes unusable, let sprout know about it
-    # Similarly if some of them becomes usable ...
-    for provider_id, template_name, usability in template_usability:
-        provider, create = Provider.objects.get_or_create(id=provider_id)
-        if not provider.working or provider.disabled:
-            continue
-        with transaction.atomic():
-            for template in Template.objects.filter(provider=provider, original_name=template_name):
-                template.usable = usability
-                template.save(update_fields=['usable'])
-                # Kill all shepherd appliances if they were accidentally spun up
-                if not usability:
-                    for appliance in Appliance.objects.filter(
-                            template=template, marked_for_deletion=False,
-                            appliance_pool=None):
-                        self.logger.info(
-                            'Killing an appliance {}/{} because its template was marked as unusable'
-                            .format(appliance.id, appliance.name))
-                        Appliance.kill(appliance)
+    objects = list(iter_objects(
+        tbapi, 'providertemplate', limit=TRACKERBOT_PAGINATE, cache=page_cache()))
+    sync = TemplateSync(objects, self.logger)
+    for provider_id, group_id, template_name, original_id in sync.run():
+        create_appliance_template.delay(
+            provider_id, group_id, template_name, source_template_id=original_id)
+    self.logger.info("Synchronized {} provider templates from trackerbot: {}".format(
+        len(objects), dict(sync.stats)))
 
 
 @logged_task()
@@ -633,15 +482,16 @@ def request_appliance_pool(self, appliance_pool_id, time_minutes):
         "Appliance pool {} requested for {} minutes.".format(appliance_pool_id, time_minutes))
     pool = AppliancePool.objects.get(id=appliance_pool_id)
     n = Appliance.give_to_pool(pool)
-    for i in range(pool.total_count - n):
-        tpls = pool.possible_provisioning_templates
-        if tpls:
-            template_id = tpls[0].id
-            clone_template_to_pool(template_id, pool.id, time_minutes)
-        else:
-            with transaction.atomic():
-                task = DelayedProvisionTask(pool=pool, lease_time=time_minutes)
-                task.save()
+    with CapacitySnapshot():
+        for i in range(pool.total_count - n):
+            tpls = pool.possible_provisioning_templates
+            if tpls:
+                template_id = tpls[0].id
+                clone_template_to_pool(template_id, pool.id, time_minutes)
+            else:
+                with transaction.atomic():
+                    task = DelayedProvisionTask(pool=pool, lease_time=time_minutes)
+                    task.save()
     apply_lease_times_after_pool_fulfilled.delay(appliance_pool_id, time_minutes)
 
 
@@ -686,40 +536,42 @@ def process_delayed_provision_tasks(self):
     Goes one task by one and when some of them can be provisioned, it starts the provisioning and
     then deletes the task.
     """
-    for task in DelayedProvisionTask.objects.order_by("id"):
-        if task.pool.not_needed_anymore:
-            task.delete()
-            continue
-        # Try retrieve from shepherd
-        appliances_given = Appliance.give_to_pool(task.pool, 1)
-        if appliances_given == 0:
-            # No free appliance in shepherd, so do it on our own
-            tpls = task.pool.possible_provisioning_templates
-            if task.provider_to_avoid is not None:
-                filtered_tpls = filter(lambda tpl: tpl.provider != task.provider_to_avoid, tpls)
-                if filtered_tpls:
-                    # There are other providers to provision on, so try one of them
-                    tpls = filtered_tpls
-                # If there is no other provider to provision on, we will use the original list.
-                # This will cause additional rejects until the provider quota is met
-            if tpls:
-                clone_template_to_pool(tpls[0].id, task.pool.id, task.lease_time)
+    with CapacitySnapshot():
+        for task in DelayedProvisionTask.objects.order_by("id"):
+            if task.pool.not_needed_anymore:
                 task.delete()
+                continue
+            # Try retrieve from shepherd
+            appliances_given = Appliance.give_to_pool(task.pool, 1)
+            if appliances_given == 0:
+                # No free appliance in shepherd, so do it on our own
+                tpls = task.pool.possible_provisioning_templates
+                if task.provider_to_avoid is not None:
+                    filtered_tpls = filter(lambda tpl: tpl.provider != task.provider_to_avoid, tpls)
+                    if filtered_tpls:
+                        # There are other providers to provision on, so try one of them
+                        tpls = filtered_tpls
+                    # If there is no other provider to provision on, we will use the original list.
+                    # This will cause additional rejects until the provider quota is met
+                if tpls:
+                    clone_template_to_pool(tpls[0].id, task.pool.id, task.lease_time)
+                    task.delete()
+                else:
+                    # Try freeing up some space in provider
+                    for provider in task.pool.possible_providers:
+                        appliances = provider.free_shepherd_appliances.exclude(
+                            **task.pool.appliance_filter_params)
+                        if appliances:
+                            appl = random.choice(appliances)
+                            self.logger.info(
+                                'Freeing some space in provider by killing appliance {}/{}'
+                                .format(appl.id, appl.name))
+                            Appliance.kill(appl)
+                            break  # Just one
             else:
-                # Try freeing up some space in provider
-                for provider in task.pool.possible_providers:
-                    appliances = provider.free_shepherd_appliances.exclude(
-                        **task.pool.appliance_filter_params)
-                    if appliances:
-                        appl = random.choice(appliances)
-                        self.logger.info(
-                            'Freeing some space in provider by killing appliance {}/{}'
-                            .format(appl.id, appl.name))
-                        Appliance.kill(appl)
-                        break  # Just one
-        else:
-            # There was a free appliance in shepherd, so we took it and we don't need this task more
-            task.delete()
+                # There was a free appliance in shepherd, so we took it and we don't need this
+                # task more
+                task.delete()
 
 
 @logged_task()
@@ -1243,6 +1095,12 @@ def generic_shepherd(self, preconfigured):
     appliances. For each template group, it keeps the last template's appliances spinned up in
     required quantity. If new template comes out of the door, it automatically kills the older
     running template's appliances and spins up new ones. Sorts the groups by the fulfillment."""
+    # Capacity of the providers is counted once, the appliances added meanwhile are counted in
+    with CapacitySnapshot():
+        _generic_shepherd(self, preconfigured)
+
+
+def _generic_shepherd(self, preconfigured):
     for gs in sorted(
             GroupShepherd.objects.all(), key=lambda g: g.get_fulfillment_percentage(preconfigured)):
         prov_filter = {'provider__user_groups': gs.user_group}
@@ -1285,7 +1143,7 @@ def generic_shepherd(self, preconfigured):
         possible_templates = list(
             Template.objects.filter(
                 usable=True, ready=True, template_group=gs.template_group,
-                preconfigured=preconfigured, **filter_keep).all())
+                preconfigured=preconfigured, **filter_keep).select_related('provider'))
         # If it can be deployed, it must exist
         possible_templates_for_provision = filter(lambda tpl: tpl.exists, possible_templates)
         appliances = []
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""Synchronization of the trackerbot provider templates into Sprout's :py:class:`Template` rows.
+
+The provider template list is diffed in memory against the local rows. Groups, providers and
+templates are each loaded with one query. Only the differences are written, using bulk inserts
+and one ``UPDATE`` per changed value, all in a single transaction.
+"""
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+
+import yaml
+from django.db import IntegrityError, transaction
+from miq_version import TemplateName
+
+from appliances.models import Appliance, Group, Provider, Template
+
+from cfme.utils import conf
+from cfme.utils.timeutil import parsetime
+
+#: Most values passed in one ``IN (...)`` clause, stays below SQLite's variable limit
+IN_CHUNK = 500
+
+
+def chunks(values, size=IN_CHUNK):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def interleave_by_group(objects):
+    """Sort the provider templates by build date and interleave the groups, newest first"""
+    per_group = OrderedDict()
+    for obj in objects:
+        if obj["template"]["group"]["name"] == 'unknown':
+            continue
+        per_group.setdefault(obj["template"]["group"]["name"], []).append(obj)
+    for group in per_group.keys():
+        per_group[group] = sorted(
+            per_group[group],
+            reverse=True, key=lambda o: o["template"]["datestamp"])
+    result = []
+    while any(per_group.values()):
+        for key in per_group.keys():
+            if per_group[key]:
+                result.append(per_group[key].pop(0))
+    return result
+
+
+class TemplateSync(object):
+    """Applies one trackerbot provider template list to the database.
+
+    Args:
+        objects: provider templates as returned by trackerbot
+        logger: logger of the calling task
+        management_systems: keys of the providers templates can be usable on, defaults to the
+            providers in ``cfme_data``
+    """
+    OPENSHIFT_CONTAINER = 'cloudforms-0'
+
+    def __init__(self, objects, logger, management_systems=None):
+        if management_systems is None:
+            management_systems = conf.cfme_data.management_systems.keys()
+        self.objects = interleave_by_group(objects)
+        self.logger = logger
+        self.management_systems = set(management_systems)
+        self.stats = defaultdict(int)
+
+    def _get_or_create(self, model, ids):
+        objs = {}
+        for chunk in chunks(ids):
+            objs.update(model.objects.in_bulk(chunk))
+        missing = sorted(set(ids) - set(objs))
+        if not missing:
+            return objs
+        try:
+            # A savepoint, so that a failed insert does not break the transaction of the sync
+            with transaction.atomic():
+                model.objects.bulk_create([model(id=obj_id) for obj_id in missing])
+            created = len(missing)
+        except IntegrityError:
+            # Some of them were created meanwhile (another sync, a provider refresh)
+            self.logger.info('{}s were created concurrently, creating them one by one'.format(
+                model.__name__))
+            created = sum(model.objects.get_or_create(id=obj_id)[1] for obj_id in missing)
+        for chunk in chunks(missing):
+            objs.update(model.objects.in_bulk(chunk))
+        self.stats['created_{}s'.format(model.__name__.lower())] += created
+        return objs
+
+    def _usable_for_sprout(self, provider):
+        if not provider.is_working:
+            return False
+        provider_data = provider.provider_data
+        if "sprout" not in provider_data or not provider_data.get("use_for_sprout", False):
+            return False
+        if not provider.provider_type:
+            provider.provider_type = provider_data.get('type')
+            provider.save(update_fields=['provider_type'])
+        return True
+
+    def _openshift_changes(self, template, custom_data):
+        changes = {}
+        if template.custom_data != custom_data:
+            changes['custom_data'] = custom_data
+        if template.container != self.OPENSHIFT_CONTAINER:
+            changes['container'] = self.OPENSHIFT_CONTAINER
+        if template.template_type != Template.OPENSHIFT_POD:
+            changes['template_type'] = Template.OPENSHIFT_POD
+        return changes
+
+    def run(self):
+        """Synchronize the templates.
+
+        Returns:
+            A list of ``(provider_id, group_id, template_name, source_template_id)`` of the
+            preconfigured templates that should be created, in the order they should be created.
+        """
+        usability = OrderedDict()
+        records = []
+        for obj in self.objects:
+            provider_id = obj["provider"]["key"]
+            template_name = obj["template"]["name"]
+            # If we don't use that provider in yamls, set the template as not usable
+            # 1) It will prevent adding this template if not added
+            # 2) It'll mark the template as unusable if it already exists
+            usable = obj["usable"] and provider_id in self.management_systems
+            usability[(provider_id, template_name)] = usable
+            if usable:
+                records.append(obj)
+
+        with transaction.atomic():
+            groups = self._get_or_create(
+                Group, {obj["template"]["group"]["name"] for obj in records})
+            providers = self._get_or_create(Provider, {key[0] for key in usability})
+            working = [
+                provider.id for provider in providers.values()
+                if provider.working and not provider.disabled]
+            # templates on the providers used by sprout, checked when the first template gets there
+            sprout_providers = {}
+
+            # Index the local templates the same way they used to be looked up one by one
+            originals = {}
+            preconfigured_by_original = {}
+            preconfigured_by_name = {}
+            by_original_name = defaultdict(list)
+
+            def index(tpl):
+                key = (tpl.provider_id, tpl.template_group_id)
+                if tpl.preconfigured:
+                    preconfigured_by_original.setdefault(key + (tpl.original_name, ), tpl)
+                    preconfigured_by_name.setdefault(key + (tpl.name, ), tpl)
+                elif tpl.original_name == tpl.name:
+                    originals.setdefault(key + (tpl.name, ), tpl)
+                by_original_name[(tpl.provider_id, tpl.original_name)].append(tpl)
+
+            for tpl in Template.objects.filter(provider__in=working).order_by('id'):
+                index(tpl)
+
+            updates = defaultdict(set)
+            openshift_updates = {}
+            new_templates = OrderedDict()
+            preconfigured_wanted = []
+            today = parsetime.today()
+            for obj in records:
+                group = groups[obj["template"]["group"]["name"]]
+                # Check if the template is already obsolete
+                if group.template_obsolete_days is not None:
+                    build_date = parsetime.from_iso_date(obj["template"]["datestamp"])
+                    if build_date <= today - timedelta(days=group.template_obsolete_days):
+                        continue
+                provider = providers[obj["provider"]["key"]]
+                if provider.id not in sprout_providers:
+                    sprout_providers[provider.id] = (
+                        set(provider.templates) if self._usable_for_sprout(provider) else None)
+                provider_templates = sprout_providers[provider.id]
+                if provider_templates is None:
+                    continue
+                template_name = obj["template"]["name"]
+                ga_released = obj['template']['ga_released']
+                parsed_name = TemplateName.parse_template(template_name)
+                date = parsed_name.datestamp
+                if not date:
+                    # Not a CFME/MIQ template, ignore it.
+                    continue
+                openshift = provider.provider_type == 'openshift'
+                # nasty trackerbot slightly corrupts json data and it is parsed in wrong way
+                # as a result
+                custom_data = obj['template'].get('custom_data', "{}")
+                custom_data = yaml.safe_load(custom_data.replace("u'", '"').replace("'", '"'))
+
+                key = (provider.id, group.id, template_name)
+                original_template = originals.get(key)
+                if original_template is not None:
+                    if original_template.ga_released != ga_released:
+                        updates[('ga_released', ga_released)].add(original_template.pk)
+                    if openshift:
+                        openshift_updates.setdefault(original_template.pk, {}).update(
+                            self._openshift_changes(original_template, custom_data))
+                elif template_name in provider_templates and key not in new_templates:
+                    template_version = parsed_name.version
+                    if template_version is None:
+                        # Make up a faux version
+                        # First 3 fields of version get parsed as a zstream
+                        # therefore ... makes it a "nil" stream
+                        template_version = "...{}".format(date.strftime("%Y%m%d"))
+                    tpl = Template(
+                        provider=provider, template_group=group, original_name=template_name,
+                        name=template_name, preconfigured=False, date=date, ready=True,
+                        exists=True, usable=True, version=template_version)
+                    if openshift:
+                        tpl.custom_data = custom_data
+                        tpl.container = self.OPENSHIFT_CONTAINER
+                        tpl.template_type = Template.OPENSHIFT_POD
+                    new_templates[key] = tpl
+
+                # If the provider is set to not preconfigure templates, do not bother even doing it
+                if provider.num_simultaneous_configuring <= 0:
+                    continue
+                # openshift providers don't have preconfigured templates,
+                # so regular template should be used
+                if openshift:
+                    preconfigured_template = preconfigured_by_name.get(key)
+                else:
+                    preconfigured_template = preconfigured_by_original.get(key)
+                if preconfigured_template is not None:
+                    if openshift:
+                        openshift_updates.setdefault(preconfigured_template.pk, {}).update(
+                            self._openshift_changes(preconfigured_template, custom_data))
+                    if preconfigured_template.ga_released != ga_released:
+                        updates[('ga_released', ga_released)].add(preconfigured_template.pk)
+                elif template_name in provider_templates and not openshift:
+                    if key not in preconfigured_wanted:
+                        preconfigured_wanted.append(key)
+
+            if new_templates:
+                Template.objects.bulk_create(new_templates.values())
+                # bulk_create does not set the primary keys, so fetch the new rows back
+                new_providers = list({key[0] for key in new_templates})
+                for names in chunks({key[2] for key in new_templates}):
+                    for tpl in Template.objects.filter(
+                            provider__in=new_providers, preconfigured=False,
+                            name__in=names).order_by('id'):
+                        key = (tpl.provider_id, tpl.template_group_id, tpl.name)
+                        if key in new_templates and key not in originals:
+                            index(tpl)
+                            self.logger.info("Created a new template #{}".format(tpl.id))
+                self.stats['created_templates'] += len(new_templates)
+
+            # If any of the templates becomes unusable, let sprout know about it
+            # Similarly if some of them becomes usable ...
+            unusable = set()
+            for (provider_id, template_name), usable in usability.items():
+                provider = providers[provider_id]
+                if not provider.working or provider.disabled:
+                    continue
+                for tpl in by_original_name[(provider_id, template_name)]:
+                    if tpl.usable != usable:
+                        updates[('usable', usable)].add(tpl.pk)
+                    if not usable:
+                        unusable.add(tpl.pk)
+
+            for (field, value), pks in updates.items():
+                for chunk in chunks(pks):
+                    self.stats['updated_{}'.format(field)] += Template.objects.filter(
+                        pk__in=chunk).update(**{field: value})
+            for pk, changes in openshift_updates.items():
+                if changes:
+                    Template.objects.filter(pk=pk).update(**changes)
+                    self.stats['updated_openshift'] += 1
+
+        # Kill all shepherd appliances if they were accidentally spun up
+        for chunk in chunks(unusable):
+            for appliance in Appliance.objects.filter(
+                    template__in=chunk, marked_for_deletion=False, appliance_pool=None):
+                self.logger.info(
+                    'Killing an appliance {}/{} because its template was marked as unusable'
+                    .format(appliance.id, appliance.name))
+                Appliance.kill(appliance)
+
+        result = []
+        for key in preconfigured_wanted:
+            original_template = originals.get(key)
+            result.append(
+                key + (original_template.id if original_template is not None else None, ))
+        return result
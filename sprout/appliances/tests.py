@@ -1,4 +1,367 @@
 # -*- coding: utf-8 -*-
-# from django.test import TestCase
+import copy
+import logging
+from datetime import date, timedelta
 
-# Create your tests here.
+import yaml
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.test import TestCase
+from miq_version import TemplateName
+
+from appliances.models import Appliance, CapacitySnapshot, Group, Provider, Template
+from appliances.template_sync import TemplateSync, interleave_by_group
+from cfme.utils.timeutil import parsetime
+
+
+class CapacitySnapshotTestCase(TestCase):
+    def setUp(self):
+        self.provider = Provider.objects.create(
+            id='rhv', num_simultaneous_provisioning=4, appliance_limit=6)
+        self.group = Group.objects.create(id='downstream-59z')
+        self.template = self.create_template(ready=True)
+        self.provisioning = [self.create_appliance() for _ in range(2)]
+        self.create_appliance(ready=True, ip_address='10.0.0.1')
+        self.preparing = self.create_template()
+
+    def create_template(self, **kwargs):
+        return Template.objects.create(
+            provider=self.provider, template_group=self.group, date=date.today(),
+            original_name='cfme-59', name='cfme-59-{}'.format(Template.objects.count()), **kwargs)
+
+    def create_appliance(self, **kwargs):
+        return Appliance.objects.create(
+            template=self.template, name='test-{}'.format(Appliance.objects.count()), **kwargs)
+
+    def counts(self, provider=None):
+        provider = provider or self.provider
+        return (provider.num_currently_managing, provider.num_currently_provisioning,
+                provider.num_templates_preparing)
+
+    def db_counts(self):
+        # a snapshot not entered counts from the database
+        capacity = CapacitySnapshot(provider_ids=[self.provider.id])[self.provider.id]
+        return capacity.managing, capacity.provisioning, capacity.templates_preparing
+
+    def test_counts_outside_snapshot(self):
+        self.assertEqual(self.counts(), (3, 2, 1))
+        with self.assertNumQueries(1):
+            self.assertEqual(self.provider.num_currently_managing, 3)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.provider.remaining_provisioning_slots, 2)
+
+    def test_counts_inside_snapshot(self):
+        with self.assertNumQueries(2):
+            with CapacitySnapshot():
+                self.assertEqual(self.counts(), (3, 2, 1))
+                self.assertEqual(self.provider.remaining_provisioning_slots, 2)
+                self.assertTrue(self.provider.free)
+                self.assertEqual(self.provider.appliance_load, 0.5)
+        self.assertIsNone(CapacitySnapshot.current())
+
+    def test_snapshot_follows_changes(self):
+        with CapacitySnapshot():
+            self.assertEqual(self.counts(), (3, 2, 1))
+            # provisioning -> ready
+            appliance = self.provisioning[0]
+            appliance.ip_address = '10.0.0.2'
+            appliance.ready = True
+            appliance.save()
+            self.assertEqual(self.counts(), (3, 1, 1))
+            # loaded anew and saved without a change
+            Appliance.objects.get(id=appliance.id).save()
+            self.assertEqual(self.counts(), (3, 1, 1))
+            # template preparing -> ready
+            template = Template.objects.get(id=self.preparing.id)
+            template.ready = True
+            template.save()
+            self.assertEqual(self.counts(), (3, 1, 0))
+            self.create_appliance()
+            self.create_template()
+            self.assertEqual(self.counts(), (4, 2, 1))
+            self.provisioning[1].delete()
+            self.assertEqual(self.counts(), (3, 1, 1))
+            self.assertEqual(self.counts(), self.db_counts())
+
+
+def legacy_sync(objects, logger, management_systems, queue):
+    """The per-object synchronization poke_trackerbot did before :py:class:`TemplateSync`
+
+    Kept as it was, to compare the results with. The preconfigured templates to create are
+    appended to ``queue``.
+    """
+    template_usability = []
+    for template in interleave_by_group(copy.deepcopy(objects)):
+        if template["provider"]["key"] not in management_systems:
+            template["usable"] = False
+        template_usability.append(
+            (template["provider"]["key"], template["template"]["name"], template["usable"]))
+        if not template["usable"]:
+            continue
+        group, create = Group.objects.get_or_create(id=template["template"]["group"]["name"])
+        if group.template_obsolete_days is not None:
+            build_date = parsetime.from_iso_date(template["template"]["datestamp"])
+            if build_date <= (parsetime.today() - timedelta(days=group.template_obsolete_days)):
+                continue
+        provider, create = Provider.objects.get_or_create(id=template["provider"]["key"])
+        if not provider.is_working:
+            continue
+        if "sprout" not in provider.provider_data:
+            continue
+        if not provider.provider_data.get("use_for_sprout", False):
+            continue
+        if not provider.provider_type:
+            provider.provider_type = provider.provider_data.get('type')
+            provider.save(update_fields=['provider_type'])
+        template_name = template["template"]["name"]
+        ga_released = template['template']['ga_released']
+        date = TemplateName.parse_template(template_name).datestamp
+        custom_data = template['template'].get('custom_data', "{}")
+        processed_custom_data = custom_data.replace("u'", '"').replace("'", '"')
+        processed_custom_data = yaml.safe_load(processed_custom_data)
+        if not date:
+            continue
+        original_template = None
+        try:
+            original_template = Template.objects.get(
+                provider=provider, template_group=group, original_name=template_name,
+                name=template_name, preconfigured=False)
+            if original_template.ga_released != ga_released:
+                original_template.ga_released = ga_released
+                original_template.save(update_fields=['ga_released'])
+            if provider.provider_type == 'openshift':
+                if original_template.custom_data != custom_data:
+                    original_template.custom_data = processed_custom_data
+                original_template.template_type = Template.OPENSHIFT_POD
+                original_template.container = 'cloudforms-0'
+                original_template.save(update_fields=['custom_data', 'container', 'template_type'])
+        except ObjectDoesNotExist:
+            if template_name in provider.templates:
+                template_version = TemplateName.parse_template(template_name).version
+                if template_version is None:
+                    template_version = "...{}".format(date.strftime("%Y%m%d"))
+                with transaction.atomic():
+                    tpl = Template(
+                        provider=provider, template_group=group, original_name=template_name,
+                        name=template_name, preconfigured=False, date=date, ready=True, exists=True,
+                        usable=True, version=template_version)
+                    tpl.save()
+                    if provider.provider_type == 'openshift':
+                        tpl.custom_data = processed_custom_data
+                        tpl.container = 'cloudforms-0'
+                        tpl.template_type = Template.OPENSHIFT_POD
+                        tpl.save(update_fields=['container', 'template_type', 'custom_data'])
+                    original_template = tpl
+        if provider.num_simultaneous_configuring > 0:
+            try:
+                if provider.provider_type != 'openshift':
+                    preconfigured_template = Template.objects.get(
+                        provider=provider, template_group=group, original_name=template_name,
+                        preconfigured=True)
+                else:
+                    preconfigured_template = Template.objects.get(
+                        provider=provider, template_group=group, name=template_name,
+                        preconfigured=True)
+                    preconfigured_template.custom_data = processed_custom_data
+                    preconfigured_template.container = 'cloudforms-0'
+                    preconfigured_template.template_type = Template.OPENSHIFT_POD
+                    preconfigured_template.save(
+                        update_fields=['container', 'template_type', 'custom_data'])
+                if preconfigured_template.ga_released != ga_released:
+                    preconfigured_template.ga_released = ga_released
+                    preconfigured_template.save(update_fields=['ga_released'])
+            except ObjectDoesNotExist:
+                if template_name in provider.templates and provider.provider_type != 'openshift':
+                    original_id = original_template.id if original_template is not None else None
+                    queue.append((provider.id, group.id, template_name, original_id))
+    for provider_id, template_name, usability in template_usability:
+        provider, create = Provider.objects.get_or_create(id=provider_id)
+        if not provider.working or provider.disabled:
+            continue
+        with transaction.atomic():
+            for template in Template.objects.filter(provider=provider, original_name=template_name):
+                template.usable = usability
+                template.save(update_fields=['usable'])
+                if not usability:
+                    for appliance in Appliance.objects.filter(
+                            template=template, marked_for_deletion=False,
+                            appliance_pool=None):
+                        Appliance.kill(appliance)
+
+
+class TemplateSyncTestCase(TestCase):
+    """Compares :py:class:`TemplateSync` with the per-object sync it replaced"""
+    management_systems = ['rhv', 'rhv-configuring', 'ocp', 'broken']
+
+    def setUp(self):
+        self.killed = []
+        kill = Appliance.__dict__['kill']
+        Appliance.kill = classmethod(lambda cls, appliance: self.killed.append(appliance.name))
+        self.addCleanup(setattr, Appliance, 'kill', kill)
+        self.objects = []
+        self.group = Group.objects.create(id='downstream-59z')
+        # its templates older than a month are ignored
+        Group.objects.create(id='downstream-58z', template_obsolete_days=30)
+        self.rhv = self.create_provider('rhv', 'rhevm', num_simultaneous_configuring=0)
+        self.configuring = self.create_provider('rhv-configuring', 'rhevm')
+        self.ocp = self.create_provider('ocp', 'openshift')
+        self.create_provider('broken', 'rhevm', working=False)
+
+    def create_provider(self, key, provider_type, **kwargs):
+        kwargs.setdefault('working', True)
+        provider = Provider(id=key, **kwargs)
+        provider.metadata = {
+            'provider_data': {'type': provider_type, 'use_for_sprout': True, 'sprout': {}},
+            'templates': []}
+        provider.save()
+        return provider
+
+    def trackerbot(self, provider, name, group='downstream-59z', usable=True, ga_released=False,
+                   custom_data="{}", on_provider=True, datestamp=None):
+        """Adds a provider template trackerbot knows about"""
+        datestamp = datestamp or TemplateName.parse_template(name).datestamp
+        self.objects.append({
+            'provider': {'key': provider.id},
+            'usable': usable,
+            'template': {
+                'name': name, 'group': {'name': group}, 'datestamp': datestamp.isoformat(),
+                'ga_released': ga_released, 'custom_data': custom_data}})
+        if on_provider:
+            provider.templates = provider.templates + [name]
+
+    def template(self, provider, name, **kwargs):
+        kwargs.setdefault('original_name', name)
+        kwargs.setdefault('preconfigured', False)
+        return Template.objects.create(
+            provider=provider, template_group=self.group, name=name,
+            date=TemplateName.parse_template(kwargs['original_name']).datestamp, ready=True,
+            **kwargs)
+
+    def state(self, queue):
+        names = dict(Template.objects.values_list('id', 'name'))
+        templates = sorted(
+            (tpl.provider_id, tpl.template_group_id, tpl.name, tpl.original_name,
+             tpl.preconfigured, tpl.usable, tpl.ga_released, tpl.ready, tpl.exists, tpl.version,
+             tpl.date, tpl.custom_data, tpl.container, tpl.template_type)
+            for tpl in Template.objects.all())
+        queue = [key[:3] + (names.get(key[3]), ) for key in queue]
+        return {
+            'templates': templates, 'queue': queue, 'killed': sorted(self.killed),
+            'groups': sorted(Group.objects.values_list('id', flat=True)),
+            'provider_types': dict(Provider.objects.values_list('id', 'provider_type'))}
+
+    maxDiff = None
+
+    def sync(self):
+        """Runs both syncs from the same database and checks they end up the same"""
+        logger = logging.getLogger('template_sync')
+        savepoint = transaction.savepoint()
+        queue = []
+        legacy_sync(self.objects, logger, self.management_systems, queue)
+        legacy = self.state(queue)
+        transaction.savepoint_rollback(savepoint)
+        del self.killed[:]
+        sync = TemplateSync(self.objects, logger, management_systems=self.management_systems)
+        state = self.state(sync.run())
+        self.assertEqual(state, legacy)
+        return state
+
+    def test_new_templates(self):
+        today = date.today()
+        recent = 'cfme-58100-{:%Y%m%d}'.format(today - timedelta(days=2))
+        self.trackerbot(self.configuring, recent, group='downstream-58z')
+        self.trackerbot(self.configuring, 'cfme-58100-20170101', group='downstream-58z')
+        for day in range(1, 4):
+            self.trackerbot(self.configuring, 'cfme-59030-2018010{}'.format(day))
+            self.trackerbot(self.rhv, 'cfme-59030-2018010{}'.format(day))
+        # not on the provider, not a CFME template, provider not in the yamls, not working
+        self.trackerbot(self.rhv, 'cfme-59040-20180105', on_provider=False)
+        self.trackerbot(self.rhv, 'rhel-7-template', datestamp=date(2018, 1, 1))
+        self.trackerbot(self.create_provider('gone', 'rhevm'), 'cfme-59030-20180101')
+        self.trackerbot(Provider.objects.get(id='broken'), 'cfme-59030-20180101')
+        # a new group
+        self.trackerbot(self.rhv, 'miq-fine-20180101', group='upstream-fine')
+        self.template(self.configuring, 'cfme-59030-20180102-abcd',
+                      original_name='cfme-59030-20180102', preconfigured=True)
+        state = self.sync()
+        self.assertEqual(len(state['templates']), 9)
+        self.assertIn('upstream-fine', state['groups'])
+        self.assertEqual(state['provider_types']['rhv'], 'rhevm')
+        # interleaved newest first, the ones configured already left out
+        self.assertEqual(state['queue'], [
+            ('rhv-configuring', 'downstream-58z', recent, recent),
+            ('rhv-configuring', 'downstream-59z', 'cfme-59030-20180103', 'cfme-59030-20180103'),
+            ('rhv-configuring', 'downstream-59z', 'cfme-59030-20180101', 'cfme-59030-20180101')])
+        # nothing to do the second time
+        self.assertEqual(self.sync()['templates'], state['templates'])
+
+    def test_usable_flips(self):
+        for name in ['cfme-59010-20180101', 'cfme-59020-20180101']:
+            self.trackerbot(self.rhv, name, usable=False)
+            self.trackerbot(self.ocp, name)
+            self.template(self.rhv, name, usable=True)
+            self.template(self.rhv, '{}-abcd'.format(name), original_name=name, usable=True,
+                          preconfigured=True)
+            self.template(self.ocp, name, usable=False)
+        self.trackerbot(self.rhv, 'cfme-59030-20180101')
+        self.template(self.rhv, 'cfme-59030-20180101', usable=False)
+        # the provider is not in the yamls anymore
+        self.management_systems = ['rhv']
+        template = self.template(self.rhv, 'cfme-59010-20180101-efgh',
+                                 original_name='cfme-59010-20180101', usable=True)
+        Appliance.objects.create(template=template, name='shepherd')
+        Appliance.objects.create(template=template, name='killed', marked_for_deletion=True)
+        state = self.sync()
+        self.assertEqual(state['killed'], ['shepherd'])
+        usable = {(tpl[0], tpl[2]): tpl[5] for tpl in state['templates']}
+        self.assertEqual(usable, {
+            ('ocp', 'cfme-59010-20180101'): False, ('ocp', 'cfme-59020-20180101'): False,
+            ('rhv', 'cfme-59010-20180101'): False, ('rhv', 'cfme-59010-20180101-abcd'): False,
+            ('rhv', 'cfme-59010-20180101-efgh'): False, ('rhv', 'cfme-59020-20180101'): False,
+            ('rhv', 'cfme-59020-20180101-abcd'): False, ('rhv', 'cfme-59030-20180101'): True})
+
+    def test_ga_released(self):
+        self.trackerbot(self.configuring, 'cfme-59010-20180101', ga_released=True)
+        self.trackerbot(self.configuring, 'cfme-59020-20180101')
+        for name in ['cfme-59010-20180101', 'cfme-59020-20180101']:
+            self.template(self.configuring, name, usable=True)
+            self.template(self.configuring, '{}-abcd'.format(name), original_name=name,
+                          usable=True, ga_released=True, preconfigured=True)
+        state = self.sync()
+        self.assertEqual([tpl[6] for tpl in state['templates']], [True, True, False, False])
+        self.assertEqual(state['queue'], [])
+
+    def test_openshift_fields(self):
+        custom_data = "{u'TAGS': {u'cfme-openshift-app': u'5.9.0.1'}}"
+        self.trackerbot(self.ocp, 'cfme-59010-20180101', custom_data=custom_data)
+        self.trackerbot(self.ocp, 'cfme-59020-20180101', custom_data=custom_data)
+        self.trackerbot(self.ocp, 'cfme-59030-20180101', custom_data=custom_data)
+        self.template(self.ocp, 'cfme-59010-20180101', usable=True)
+        self.template(self.ocp, 'cfme-59020-20180101', usable=True, preconfigured=True,
+                      container='cloudforms-0', template_type=Template.OPENSHIFT_POD)
+        state = self.sync()
+        self.assertEqual(
+            [tpl[11:] for tpl in state['templates']],
+            [({'TAGS': {'cfme-openshift-app': '5.9.0.1'}}, 'cloudforms-0',
+              Template.OPENSHIFT_POD)] * 4)
+        # openshift templates are not preconfigured
+        self.assertEqual(state['queue'], [])
+
+    def test_concurrently_created_group(self):
+        in_bulk = Group.objects.in_bulk
+        lookups = []
+
+        def stale_in_bulk(ids):
+            # the first lookup misses a group created meanwhile
+            lookups.append(ids)
+            return {} if len(lookups) == 1 else in_bulk(ids)
+
+        Group.objects.in_bulk = stale_in_bulk
+        self.addCleanup(delattr, Group.objects, 'in_bulk')
+        sync = TemplateSync([], logging.getLogger('template_sync'), management_systems=[])
+        groups = sync._get_or_create(Group, {'downstream-59z', 'upstream-fine'})
+        self.assertEqual(sorted(groups), ['downstream-59z', 'upstream-fine'])
+        self.assertEqual(groups['downstream-59z'], self.group)
+        self.assertEqual(sync.stats['created_groups'], 1)
+        # the transaction goes on
+        self.assertEqual(Group.objects.count(), 3)
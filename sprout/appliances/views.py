@@ -18,7 +18,7 @@ from django.shortcuts import render, redirect
 from appliances.api import json_response
 from appliances.models import (
     Provider, AppliancePool, Appliance, Group, Template, MismatchVersionMailer, User, BugQuery,
-    GroupShepherd)
+    GroupShepherd, CapacitySnapshot)
 from appliances.tasks import (appliance_power_on, appliance_power_off, appliance_suspend,
     anyvm_power_on, anyvm_power_off, anyvm_suspend, anyvm_delete, delete_template_from_provider,
     appliance_rename, wait_appliance_ready, mark_appliance_ready, appliance_reboot,
@@ -99,7 +99,8 @@ def providers(request, provider_id=None):
             messages.warning(request, "Provider '{}' does not exist.".format(provider_id))
             return redirect("providers")
     providers = Provider.objects.filter(hidden=False, **user_filter).order_by("id").distinct()
-    return render(request, 'appliances/providers.html', locals())
+    with CapacitySnapshot():
+        return render(request, 'appliances/providers.html', locals())
 
 
 def provider_usage(request):
@@ -268,6 +269,7 @@ def date_for_group_and_version(request):
 
 @only_authenticated
 def providers_for_date_group_and_version(request):
+    capacity = CapacitySnapshot()
     total_provisioning_slots = 0
     total_appliance_slots = 0
     total_shepherd_slots = 0
@@ -343,14 +345,16 @@ def providers_for_date_group_and_version(request):
                 shepherd_appliances[provider.id] = len(
                     Appliance.objects.filter(**appl_filter))
                 total_shepherd_slots += shepherd_appliances[provider.id]
-                total_appliance_slots += provider.remaining_appliance_slots
-                total_provisioning_slots += provider.remaining_provisioning_slots
+                with capacity:
+                    total_appliance_slots += provider.remaining_appliance_slots
+                    total_provisioning_slots += provider.remaining_provisioning_slots
 
             render_providers = {}
             for provider in providers:
                 render_providers[provider.id] = {
                     "shepherd_count": shepherd_appliances[provider.id], "object": provider}
-    return render(request, 'appliances/_providers.html', locals())
+    with capacity:
+        return render(request, 'appliances/_providers.html', locals())
 
 
 @only_authenticated